@@ -8,6 +8,16 @@ from flask_wtf.csrf import CSRFProtect
 from werkzeug.middleware.proxy_fix import ProxyFix
 
 from database import db, init_db
+from cache import init_cache
+from dashboard_metrics import init_dashboard_metrics
+from service_order_read_model import init_service_order_read_model
+from pdf_cache import init_pdf_cache
+from jobs import init_jobs
+from invoice_pdf import init_invoice_pdf
+from financial_rollup import init_financial_rollup
+from financial_categories import init_financial_categories
+from live_events import init_live_events
+from bootstrap import init_bootstrap
 from jinja_filters import nl2br, format_document, format_currency, status_color, absolute_value
 from logging_config import setup_logging
 from config import config
@@ -36,6 +46,12 @@ if not app.config.get('SQLALCHEMY_DATABASE_URI'):
 
 # Initialize extensions with app
 init_db(app)
+init_cache(app)
+init_dashboard_metrics(app)
+init_service_order_read_model(app)
+init_pdf_cache(app)
+init_jobs(app)
+init_invoice_pdf(app)
 login_manager.init_app(app)
 
 # Adicionar exceção CSRF para as rotas de exclusão de cliente
@@ -48,11 +64,13 @@ login_manager.login_view = "login"
 login_manager.login_message = "Por favor, faça login para acessar esta página."
 login_manager.login_message_category = "warning"
 
-# Import models and create tables
+# Import models (tables are created by bootstrap.py, not at import time)
 with app.app_context():
     import models
     from models import User
-    db.create_all()
+    init_financial_rollup(app)
+    init_financial_categories(app)
+    init_live_events(app, db)
     
     # Setup user loader for Flask-Login
     @login_manager.user_loader
@@ -68,33 +86,12 @@ app.jinja_env.filters['abs'] = absolute_value
 
 # Import and register routes
 from routes import register_routes
+from blueprints import register_blueprints
 register_routes(app)
+register_blueprints(app)
 
-# Create initial admin user if needed
-with app.app_context():
-    if hasattr(app, 'create_initial_admin'):
-        app.create_initial_admin()
-    else:
-        # Fallback: criar admin diretamente se não houver função
-        from models import User, UserRole
-        try:
-            # Verificar se existe algum admin
-            admin_exists = User.query.filter_by(role=UserRole.admin).first()
-            if not admin_exists:
-                # Criar admin padrão
-                admin = User(
-                    username='admin',
-                    name='Administrador',
-                    email='admin@samape.com',
-                    role=UserRole.admin,
-                    active=True
-                )
-                admin.set_password('admin123')
-                db.session.add(admin)
-                db.session.commit()
-                app.logger.info("Admin user created: username=admin, password=admin123")
-        except Exception as e:
-            app.logger.error(f"Error creating admin user: {e}")
+# Schema migrations and initial admin: CLI commands, or at startup when AUTO_BOOTSTRAP is set
+init_bootstrap(app)
 
 if __name__ == '__main__':
     app.run(debug=True)
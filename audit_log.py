@@ -0,0 +1,242 @@
+"""
+Action log writer for SAMAPE application.
+log_action used to add the ActionLog row to the request session and commit
+it: one more transaction (and fsync) after the view had already committed
+its own changes. Records now go to an in-process queue and a background
+thread inserts them in bulk, when batch_size records are waiting or
+flush_interval seconds after the first one arrived, whichever comes first.
+
+The queue is drained when the process exits. With AUDIT_LOG_ASYNC off (the
+tests), or when the queue is full, the record is written in the request
+session as before.
+"""
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_INTERVAL = 1.0  # seconds
+DEFAULT_QUEUE_SIZE = 10000
+STOP_TIMEOUT = 10  # seconds to drain the queue at exit
+
+_STOP = object()
+_writer = {'instance': None, 'pid': None, 'lock': threading.Lock()}
+
+
+class AuditLogWriter:
+    """Background thread that inserts queued ActionLog records in batches."""
+
+    def __init__(self, app, batch_size=DEFAULT_BATCH_SIZE, flush_interval=DEFAULT_FLUSH_INTERVAL,
+                 queue_size=DEFAULT_QUEUE_SIZE):
+        self.app = app
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='audit-log-writer', daemon=True)
+        self._thread.start()
+
+    def is_alive(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def submit(self, values):
+        """Queue one record; False if it must be written some other way (queue full, thread stopped)."""
+        if not self.is_alive():
+            return False
+        try:
+            self._queue.put_nowait(values)
+        except queue.Full:
+            return False
+        return True
+
+    def flush(self, timeout=None):
+        """Wait until the records queued so far are written."""
+        done = threading.Event()
+        if self._put_marker(done, timeout):
+            done.wait(timeout)
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Write the pending records and end the thread."""
+        if self._put_marker(_STOP, timeout):
+            self._thread.join(timeout)
+
+    def _put_marker(self, marker, timeout):
+        if not self.is_alive():
+            return False
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self):
+        batch = []
+        deadline = None
+        while True:
+            timeout = None if deadline is None else max(deadline - time.monotonic(), 0)
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+            if isinstance(item, dict):
+                batch.append(item)
+                if deadline is None:
+                    deadline = time.monotonic() + self.flush_interval
+                if len(batch) < self.batch_size:
+                    continue
+            # Lote cheio, tempo esgotado, flush() ou stop()
+            if batch:
+                self._write(batch)
+                batch = []
+            deadline = None
+            if isinstance(item, threading.Event):
+                item.set()
+            elif item is _STOP:
+                return
+
+    def _write(self, batch):
+        try:
+            with self.app.app_context():
+                write_records(batch)
+        except Exception as e:
+            # O registro de ações não pode derrubar a thread
+            logger.error(f"Falha ao gravar {len(batch)} registro(s) de ações: {e}")
+
+
+def _insert(connection, records):
+    from models import ActionLog
+
+    table = ActionLog.__table__
+    if connection.dialect.insert_executemany_returning_sort_by_parameter_order:
+        return connection.execute(
+            insert(table).returning(table.c.id, sort_by_parameter_order=True), records
+        ).scalars().all()
+    connection.execute(insert(table), records)
+    return [None] * len(records)
+
+
+def write_records(records):
+    """
+    Insert ActionLog records in one statement and announce them.
+
+    A batch rejected by the database (e.g. a user deleted in the meantime)
+    is retried one record at a time, so only the invalid records are lost.
+    Afterwards the caches that depend on ActionLog are dropped and the live
+    'action_log' events are published, as the session hooks do for records
+    written through the session.
+
+    Args:
+        records: Dictionaries with the ActionLog columns
+
+    Returns:
+        Number of records written
+    """
+    import cache
+    from live_events import bus
+
+    try:
+        with db.engine.begin() as connection:
+            written = list(zip(_insert(connection, records), records))
+    except IntegrityError:
+        written = []
+        for record in records:
+            try:
+                with db.engine.begin() as connection:
+                    written.extend(zip(_insert(connection, [record]), [record]))
+            except IntegrityError as e:
+                logger.warning(f"Registro de ação descartado ({record['action']}): {e.orig}")
+
+    if written:
+        cache.invalidate_models(['ActionLog'])
+    for log_id, record in written:
+        bus.publish('action_log', {
+            'id': log_id, 'action': record['action'], 'entity_type': record['entity_type'],
+            'entity_id': record['entity_id'], 'user_id': record['user_id'],
+            'timestamp': record['timestamp'].isoformat()
+        })
+    return len(written)
+
+
+def _write_in_session(values):
+    from models import ActionLog
+
+    try:
+        db.session.add(ActionLog(**values))
+        db.session.commit()
+    except IntegrityError:
+        # Se houver erro de integridade, fazer rollback e não registrar
+        db.session.rollback()
+
+
+def get_writer(app):
+    """
+    Return the writer of this process, starting it on first use.
+
+    The thread is started lazily (and again after a fork), so each gunicorn
+    worker gets its own. Returns None when AUDIT_LOG_ASYNC is off.
+    """
+    if not app.config.get('AUDIT_LOG_ASYNC'):
+        return None
+    writer = _writer['instance']
+    if writer is not None and _writer['pid'] == os.getpid():
+        return writer
+    with _writer['lock']:
+        if _writer['instance'] is None or _writer['pid'] != os.getpid():
+            writer = AuditLogWriter(
+                app,
+                batch_size=app.config.get('AUDIT_LOG_BATCH_SIZE', DEFAULT_BATCH_SIZE),
+                flush_interval=app.config.get('AUDIT_LOG_FLUSH_INTERVAL', DEFAULT_FLUSH_INTERVAL),
+                queue_size=app.config.get('AUDIT_LOG_QUEUE_SIZE', DEFAULT_QUEUE_SIZE)
+            )
+            writer.start()
+            if _writer['instance'] is None:
+                atexit.register(_stop_writer)
+            _writer['instance'], _writer['pid'] = writer, os.getpid()
+    return _writer['instance']
+
+
+def _stop_writer():
+    writer = _writer['instance']
+    if writer is not None and _writer['pid'] == os.getpid():
+        writer.stop()
+
+
+def record_action(app, user_id, action, entity_type=None, entity_id=None, details=None, ip_address=None):
+    """
+    Record a user action: queued for the background writer, or written now.
+
+    The timestamp is taken here, so queued records keep the order and time
+    of the actions.
+    """
+    values = {
+        'user_id': user_id,
+        'action': action,
+        'entity_type': entity_type,
+        'entity_id': entity_id,
+        'details': details,
+        'ip_address': ip_address,
+        'timestamp': datetime.utcnow(),
+    }
+    writer = get_writer(app)
+    if writer is None or not writer.submit(values):
+        _write_in_session(values)
+
+
+def flush_audit_log(timeout=None):
+    """Wait until the actions queued by this process are written (scripts, benchmarks)."""
+    writer = _writer['instance']
+    if writer is not None and _writer['pid'] == os.getpid():
+        writer.flush(timeout)
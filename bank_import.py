@@ -0,0 +1,495 @@
+"""
+Bank statement import for SAMAPE application.
+Reads OFX or CSV statements as a stream (the file is never loaded whole),
+turns each transaction into a FinancialEntry and inserts them in batches:
+COPY into a staging table plus one INSERT ... SELECT on PostgreSQL, one
+executemany INSERT elsewhere. The rollups are updated once per batch.
+
+Every imported line carries a hash in import_hash (unique index), so
+importing the same statement again, or an overlapping one, skips the lines
+already recorded. The import page shows a dry-run preview before the
+'bank_import' job writes anything; `python bank_import.py extrato.ofx
+[--dry-run]` does the same from the shell.
+"""
+import csv
+import hashlib
+import io
+import re
+import unicodedata
+from collections import namedtuple
+from datetime import datetime, time
+from decimal import Decimal, InvalidOperation
+
+from sqlalchemy import insert, select, text
+
+import cache
+from database import db
+from financial_rollup import apply_deltas
+from jobs import JobError, delete_upload, fetch_upload, job_handler
+from payments import IN_BATCH_SIZE
+
+BANK_STATEMENT = 'extrato_bancario'  # FinancialEntry.entry_type dos lançamentos importados
+BATCH_SIZE = 5000
+CHUNK_SIZE = 64 * 1024
+PREVIEW_LINES = 20
+MAX_ERRORS = 20
+DEFAULT_DESCRIPTION = 'Lançamento do extrato bancário'
+
+StatementLine = namedtuple('StatementLine', 'line date amount description reference')
+
+_OFX_TAG = re.compile(r'<(/?)([A-Za-z0-9.]+)>([^<]*)')
+_OFX_CHARSET = re.compile(rb'CHARSET:\s*(1252|ISO-8859-1)', re.IGNORECASE)
+
+# Nomes aceitos para cada coluna do CSV (sem acentos, minúsculos)
+_CSV_COLUMNS = {
+    'date': ('data', 'date', 'data lancamento', 'data do lancamento', 'data movimento'),
+    'description': ('descricao', 'historico', 'lancamento', 'description', 'memo'),
+    'amount': ('valor', 'valor (r$)', 'valor r$', 'amount'),
+    'reference': ('id', 'fitid', 'documento', 'n documento', 'numero documento', 'no documento'),
+}
+_CSV_REQUIRED = ('date', 'description', 'amount')
+_CSV_HEADER_SEARCH = 20  # linhas de cabeçalho do banco (agência, conta...) antes dos títulos
+
+
+class StatementError(ValueError):
+    """Statement (or statement line) that cannot be read."""
+
+
+def open_statement(path):
+    """
+    Open a statement file as text.
+
+    The encoding is taken from the OFX header (CHARSET:1252) or guessed from
+    the beginning of the file: UTF-8 if it decodes, Windows-1252 otherwise.
+    """
+    with open(path, 'rb') as statement:
+        head = statement.read(CHUNK_SIZE)
+    encoding = 'utf-8-sig'
+    if _OFX_CHARSET.search(head):
+        encoding = 'cp1252'
+    else:
+        try:
+            head.decode('utf-8')
+        except UnicodeDecodeError as e:
+            # Um caractere cortado no fim do bloco não conta
+            if e.start < len(head) - 3:
+                encoding = 'cp1252'
+    return open(path, encoding=encoding, errors='replace', newline='')
+
+
+def detect_format(head):
+    """Return 'ofx' or 'csv' from the first characters of a statement."""
+    return 'ofx' if re.search(r'OFXHEADER|<OFX>', head, re.IGNORECASE) else 'csv'
+
+
+def _normalize(label):
+    label = unicodedata.normalize('NFKD', label).encode('ascii', 'ignore').decode('ascii')
+    return ' '.join(label.lower().replace('.', ' ').split())
+
+
+def parse_amount(value):
+    """Parse '1.234,56', '-1234.56' or 'R$ 10,00' into a Decimal with two places."""
+    value = (value or '').replace('R$', '').replace('\xa0', '').replace(' ', '')
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    try:
+        return Decimal(value).quantize(Decimal('0.01'))
+    except InvalidOperation:
+        raise StatementError(f"Valor inválido: {value or '(vazio)'}")
+
+
+def parse_date(value):
+    """Parse an OFX date (20240115120000[-3:BRT]) or dd/mm/yyyy, dd/mm/yy, yyyy-mm-dd."""
+    value = (value or '').strip()
+    if re.match(r'\d{8}', value):
+        formats, value = ('%Y%m%d',), value[:8]
+    else:
+        formats, value = ('%d/%m/%Y', '%d/%m/%y', '%Y-%m-%d'), value.split(' ')[0]
+    for date_format in formats:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    raise StatementError(f"Data inválida: {value or '(vazia)'}")
+
+
+def parse_ofx(stream):
+    """
+    Read the transactions of an OFX statement (SGML or XML) incrementally.
+
+    The file is read in chunks and tokenized tag by tag; only the
+    transaction being read is kept in memory.
+
+    Yields:
+        Tuples (transaction number, date, amount, description, reference),
+        the values as in the file
+    """
+    account = ''
+    current = None
+    number = 0
+    buffer = ''
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        buffer += chunk
+        # Sem o fim do arquivo, a última tag pode estar incompleta: fica para o próximo bloco
+        end = buffer.rfind('<') if chunk else len(buffer)
+        if end < 0:
+            end = 0
+        for match in _OFX_TAG.finditer(buffer, 0, end):
+            closing, tag, value = match.group(1), match.group(2).upper(), match.group(3).strip()
+            if tag == 'STMTTRN':
+                if current is not None:
+                    yield _ofx_transaction(current, account)
+                current = None
+                if not closing:
+                    number += 1
+                    current = {'number': number}
+            elif closing:
+                continue
+            elif current is not None:
+                current[tag] = value
+            elif tag == 'ACCTID':
+                account = value
+        buffer = buffer[end:]
+        if not chunk:
+            break
+    if current is not None:
+        yield _ofx_transaction(current, account)
+
+
+def _ofx_transaction(fields, account):
+    name, memo = fields.get('NAME', ''), fields.get('MEMO', '')
+    description = memo if not name or name == memo else f'{name} - {memo}' if memo else name
+    reference = f"ofx:{account}:{fields['FITID']}" if fields.get('FITID') else None
+    return fields['number'], fields.get('DTPOSTED'), fields.get('TRNAMT'), description, reference
+
+
+def parse_csv(stream):
+    """
+    Read the lines of a CSV statement (';' or ',' separated) incrementally.
+
+    The header is looked for in the first lines (banks often put the
+    account data above it); columns are found by name: data, descrição or
+    histórico, valor and optionally documento.
+
+    Yields:
+        Tuples (line number, date, amount, description, reference), the
+        values as in the file
+    """
+    for skipped in range(_CSV_HEADER_SEARCH):
+        header_line = stream.readline()
+        if not header_line:
+            break
+        delimiter = ';' if header_line.count(';') >= header_line.count(',') else ','
+        header = next(csv.reader([header_line], delimiter=delimiter), [])
+        columns = {}
+        for position, label in enumerate(header):
+            for field, names in _CSV_COLUMNS.items():
+                if field not in columns and _normalize(label) in names:
+                    columns[field] = position
+        if all(field in columns for field in _CSV_REQUIRED):
+            break
+    else:
+        header_line = ''
+    if not header_line or not all(field in columns for field in _CSV_REQUIRED):
+        raise StatementError("Cabeçalho do CSV não encontrado: o arquivo precisa das colunas Data, Descrição e Valor.")
+
+    first_line = skipped + 2
+    reader = csv.reader(stream, delimiter=delimiter)
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+
+        def cell(field):
+            position = columns.get(field)
+            return row[position].strip() if position is not None and position < len(row) else ''
+
+        reference = cell('reference')
+        yield (
+            first_line + reader.line_num - 1,
+            cell('date'),
+            cell('amount'),
+            cell('description'),
+            f'doc:{reference}' if reference else None
+        )
+
+
+def read_statement(stream, fmt, summary):
+    """
+    Parse a statement into StatementLine tuples, skipping unreadable lines.
+
+    Balance lines ("SALDO ...") and zero amounts are not movements and are
+    counted as ignored; lines that cannot be parsed are counted as errors
+    (the first MAX_ERRORS are kept with their message).
+
+    Args:
+        stream: Text stream positioned at the beginning of the statement
+        fmt: 'ofx' or 'csv'
+        summary: Dictionary updated with the ignored and error counts
+    """
+    parser = parse_ofx if fmt == 'ofx' else parse_csv
+    for number, raw_date, raw_amount, description, reference in parser(stream):
+        description = ' '.join((description or '').split())
+        if _normalize(description).startswith('saldo'):
+            summary['ignored'] += 1
+            continue
+        try:
+            line = StatementLine(number, parse_date(raw_date), parse_amount(raw_amount),
+                                 description[:200] or DEFAULT_DESCRIPTION, reference)
+        except StatementError as e:
+            summary['error_count'] += 1
+            if len(summary['errors']) < MAX_ERRORS:
+                summary['errors'].append((number, str(e)))
+            continue
+        if not line.amount:
+            summary['ignored'] += 1
+            continue
+        yield line
+
+
+def line_hash(line, occurrence=0):
+    """
+    Hash identifying a statement line across imports (FinancialEntry.import_hash).
+
+    The bank reference (OFX FITID, CSV document) is used when present,
+    otherwise the description; occurrence tells apart identical lines of
+    the same statement (two equal purchases on the same day).
+    """
+    key = f'{line.date.isoformat()}|{line.amount}|{line.reference or line.description}|{occurrence}'
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()
+
+
+def _existing_hashes(connection, hashes):
+    from models import FinancialEntry
+
+    existing = set()
+    for start in range(0, len(hashes), IN_BATCH_SIZE):
+        existing.update(connection.execute(
+            select(FinancialEntry.import_hash)
+            .where(FinancialEntry.import_hash.in_(hashes[start:start + IN_BATCH_SIZE]))
+        ).scalars())
+    return existing
+
+
+def _entry_rows(batch, user_id):
+    from models import FinancialEntryType
+
+    now = datetime.utcnow()
+    return [{
+        'description': line.description,
+        'amount': abs(line.amount),
+        'type': FinancialEntryType.entrada if line.amount > 0 else FinancialEntryType.saida,
+        'date': datetime.combine(line.date, time()),
+        'created_at': now,
+        'created_by': user_id,
+        'entry_type': BANK_STATEMENT,
+        'import_hash': hash_,
+    } for hash_, line in batch]
+
+
+def _copy_entries(connection, rows):
+    """PostgreSQL: COPY the rows into a staging table and move them with one INSERT ... SELECT."""
+    from models import FinancialEntryType
+
+    connection.execute(text(
+        "CREATE TEMP TABLE bank_import_staging ("
+        "description varchar(200), amount numeric(10, 2), type text, date timestamp, "
+        "created_at timestamp, created_by integer, import_hash varchar(64)"
+        ") ON COMMIT DROP"
+    ))
+    data = io.StringIO()
+    writer = csv.writer(data)
+    for row in rows:
+        writer.writerow([row['description'], row['amount'], row['type'].name, row['date'].isoformat(' '),
+                         row['created_at'].isoformat(' '), row['created_by'], row['import_hash']])
+    data.seek(0)
+    cursor = connection.connection.cursor()
+    try:
+        cursor.copy_expert(
+            "COPY bank_import_staging (description, amount, type, date, created_at, created_by, import_hash) "
+            "FROM STDIN WITH (FORMAT csv)",
+            data
+        )
+    finally:
+        cursor.close()
+    # Outra importação do mesmo extrato pode ter gravado as linhas nesse meio tempo
+    inserted = connection.execute(text(
+        "INSERT INTO financial_entry (description, amount, type, date, created_at, created_by, entry_type, import_hash) "
+        "SELECT description, amount, CAST(type AS financialentrytype), date, created_at, created_by, "
+        ":entry_type, import_hash FROM bank_import_staging "
+        "ON CONFLICT (import_hash) DO NOTHING "
+        "RETURNING date, type, amount"
+    ), {'entry_type': BANK_STATEMENT}).all()
+    return [(entry_date, FinancialEntryType[entry_type], amount) for entry_date, entry_type, amount in inserted]
+
+
+def _insert_entries(connection, rows):
+    """Insert the rows of a batch and return (date, type, amount) of the inserted ones."""
+    from models import FinancialEntry
+
+    if connection.dialect.name == 'postgresql':
+        return _copy_entries(connection, rows)
+    connection.execute(insert(FinancialEntry.__table__), rows)
+    return [(row['date'], row['type'], row['amount']) for row in rows]
+
+
+def _import_batch(batch, summary, user_id, dry_run):
+    from models import FinancialEntryType
+
+    with (db.engine.connect() if dry_run else db.engine.begin()) as connection:
+        existing = _existing_hashes(connection, [hash_ for hash_, _ in batch])
+        new = [(hash_, line) for hash_, line in batch if hash_ not in existing]
+        for hash_, line in batch:
+            if len(summary['preview']) < PREVIEW_LINES:
+                summary['preview'].append({
+                    'line': line.line,
+                    'date': line.date,
+                    'description': line.description,
+                    'amount': line.amount,
+                    'duplicate': hash_ in existing,
+                })
+
+        if dry_run:
+            inserted = [(line.date, FinancialEntryType.entrada if line.amount > 0 else FinancialEntryType.saida,
+                         abs(line.amount)) for _, line in new]
+        elif new:
+            inserted = _insert_entries(connection, _entry_rows(new, user_id))
+            # Os lançamentos não passam pela sessão: os totais são atualizados aqui, uma vez por lote
+            deltas = {}
+            for entry_date, entry_type, amount in inserted:
+                total, count = deltas.get((entry_date.date(), entry_type), (Decimal('0'), 0))
+                deltas[(entry_date.date(), entry_type)] = (total + Decimal(str(amount)), count + 1)
+            if deltas:
+                apply_deltas(connection, deltas)
+        else:
+            inserted = []
+
+    if inserted and not dry_run:
+        cache.invalidate_models(['FinancialEntry'])
+    summary['new'] += len(inserted)
+    summary['duplicates'] += len(batch) - len(inserted)
+    for entry_date, entry_type, amount in inserted:
+        key = 'income' if entry_type == FinancialEntryType.entrada else 'expenses'
+        summary[key] += Decimal(str(amount))
+
+
+def import_statement(stream, fmt=None, user_id=None, dry_run=False, batch_size=BATCH_SIZE, progress=None):
+    """
+    Import the movements of a bank statement as financial entries.
+
+    The statement is parsed as a stream and written in batches, each one
+    committed on its own: an interrupted import can simply be run again,
+    the lines already imported are recognized by their hash and skipped.
+
+    Args:
+        stream: Seekable text stream with the statement (see open_statement)
+        fmt: 'ofx' or 'csv' (default: detected from the content)
+        user_id: User recorded as creator of the entries
+        dry_run: Only count what would be imported, without writing
+        batch_size: Lines per batch
+        progress: Optional callable receiving the number of lines read so far
+
+    Returns:
+        Dictionary with format, lines (movements read), new, duplicates,
+        ignored, error_count, errors (list of (line, message)), income and
+        expenses (totals of the new lines), first_date, last_date and
+        preview (the first lines, each with a duplicate flag)
+
+    Raises:
+        StatementError: If the statement format is not recognized
+    """
+    if fmt is None:
+        fmt = detect_format(stream.read(CHUNK_SIZE))
+        stream.seek(0)
+    summary = {
+        'format': fmt,
+        'lines': 0,
+        'new': 0,
+        'duplicates': 0,
+        'ignored': 0,
+        'error_count': 0,
+        'errors': [],
+        'income': Decimal('0'),
+        'expenses': Decimal('0'),
+        'first_date': None,
+        'last_date': None,
+        'preview': [],
+    }
+
+    occurrences = {}
+    batch = []
+    for line in read_statement(stream, fmt, summary):
+        key = line_hash(line)
+        occurrence = occurrences.get(key, 0)
+        occurrences[key] = occurrence + 1
+        batch.append((line_hash(line, occurrence) if occurrence else key, line))
+
+        summary['lines'] += 1
+        if summary['first_date'] is None or line.date < summary['first_date']:
+            summary['first_date'] = line.date
+        if summary['last_date'] is None or line.date > summary['last_date']:
+            summary['last_date'] = line.date
+
+        if len(batch) >= batch_size:
+            _import_batch(batch, summary, user_id, dry_run)
+            batch = []
+            if progress:
+                progress(summary['lines'])
+    if batch:
+        _import_batch(batch, summary, user_id, dry_run)
+    if progress:
+        progress(summary['lines'])
+    return summary
+
+
+@job_handler('bank_import')
+def bank_import_job(context, filename, fmt=None, user_id=None):
+    """
+    Import a statement shared with jobs.share_upload, deleting the file when done.
+
+    Args:
+        filename: Name of the uploaded file
+        fmt: 'ofx' or 'csv' (default: detected)
+        user_id: User recorded as creator of the entries
+    """
+    # O extrato pode ter sido enviado a outra instância: vem do banco se não estiver aqui
+    path = fetch_upload(filename)
+    if path is None:
+        raise JobError('Arquivo do extrato não encontrado; envie-o novamente.')
+
+    context.progress(0, message='Lendo o extrato')
+    try:
+        with open_statement(path) as stream:
+            summary = import_statement(
+                stream, fmt, user_id=user_id,
+                progress=lambda read: context.progress(read, message=f'{read} linhas lidas')
+            )
+    except StatementError as e:
+        raise JobError(str(e))
+    delete_upload(filename)
+
+    message = f"{summary['new']} lançamentos importados, {summary['duplicates']} já existentes"
+    if summary['error_count']:
+        message += f", {summary['error_count']} linhas com erro"
+    context.progress(summary['lines'], summary['lines'], message)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app import app
+
+    parser = argparse.ArgumentParser(description="Importa um extrato bancário (OFX ou CSV) no financeiro.")
+    parser.add_argument('arquivo', help='Arquivo do extrato.')
+    parser.add_argument('--formato', choices=['ofx', 'csv'], default=None, help='Formato (padrão: detectado).')
+    parser.add_argument('--dry-run', action='store_true', help='Só mostra o que seria importado.')
+    args = parser.parse_args()
+
+    with app.app_context(), open_statement(args.arquivo) as statement:
+        result = import_statement(statement, args.formato, dry_run=args.dry_run)
+        for number, error in result['errors']:
+            print(f"Linha {number}: {error}")
+        action = 'a importar' if args.dry_run else 'importados'
+        print(f"{result['lines']} movimentos lidos: {result['new']} {action}, {result['duplicates']} já existentes, "
+              f"{result['ignored']} ignorados, {result['error_count']} com erro.")
+        print(f"Entradas: {result['income']:.2f}  Saídas: {result['expenses']:.2f}")
@@ -0,0 +1,502 @@
+#!/usr/bin/env python3
+"""
+Benchmarks de desempenho do SAMAPE.
+
+Uso:
+    python benchmark.py [nome ...]
+
+Sem argumentos executa todos os benchmarks. Cada benchmark roda em um
+processo próprio, com um banco descartável criado só para ele e preenchido
+com dados sintéticos: um SQLite em arquivo temporário ou, com
+BENCH_POSTGRES_URL (servidor PostgreSQL em que o usuário pode criar bancos),
+um banco novo que é apagado ao final. DATABASE_URL nunca é usado.
+"""
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+os.environ.setdefault('SESSION_SECRET', 'benchmark')
+_SCRATCH_FLAG = 'BENCH_SCRATCH_DATABASE'
+
+
+class QueryCounter:
+    """Counts the SQL statements executed on an engine."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.count = 0
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+
+    def __enter__(self):
+        from sqlalchemy import event
+        event.listen(self.engine, 'before_cursor_execute', self._on_execute)
+        return self
+
+    def __exit__(self, *exc):
+        from sqlalchemy import event
+        event.remove(self.engine, 'before_cursor_execute', self._on_execute)
+
+
+@contextmanager
+def timed(label, results):
+    start = time.perf_counter()
+    yield
+    results[label] = time.perf_counter() - start
+
+
+def seed_sample_data(db, orders=500):
+    """Insert synthetic rows when the database is empty."""
+    from models import (
+        Client, ServiceOrder, ServiceOrderStatus, FinancialEntry, FinancialEntryType,
+        Supplier, SupplierOrder, OrderStatus, Vehicle, VehicleStatus, StockItem,
+        StockItemType, Part, ActionLog, User
+    )
+
+    if ServiceOrder.query.first():
+        return
+
+    admin = User.query.first()
+    now = datetime.utcnow()
+    clients = [Client(name=f'Cliente {i}', document=f'{i:011d}') for i in range(20)]
+    db.session.add_all(clients)
+    supplier = Supplier(name='Fornecedor Benchmark')
+    db.session.add(supplier)
+    db.session.flush()
+
+    statuses = list(ServiceOrderStatus)
+    for i in range(orders):
+        created = now - timedelta(days=i % 400, hours=i % 24)
+        status = statuses[i % len(statuses)]
+        db.session.add(ServiceOrder(
+            client_id=clients[i % len(clients)].id,
+            responsible_id=admin.id if admin else None,
+            description=f'Manutenção preventiva do equipamento {i}',
+            status=status,
+            created_at=created,
+            closed_at=created + timedelta(days=1 + i % 9) if status == ServiceOrderStatus.fechada else None,
+        ))
+        db.session.add(FinancialEntry(
+            description=f'Lançamento {i}',
+            amount=Decimal('100.00') + i,
+            type=FinancialEntryType.entrada if i % 3 else FinancialEntryType.saida,
+            date=created,
+        ))
+    for i, status in enumerate(OrderStatus):
+        db.session.add(SupplierOrder(supplier_id=supplier.id, status=status, total_value=Decimal('50.00') * (i + 1)))
+    for i, status in enumerate(VehicleStatus):
+        db.session.add(Vehicle(brand='Marca', model=f'Modelo {i}', plate=f'ABC{i:04d}', status=status))
+    for i in range(10):
+        db.session.add(StockItem(name=f'Item {i}', type=StockItemType.epi, quantity=i, min_quantity=5))
+        db.session.add(Part(name=f'Peça {i}', stock_quantity=i, minimum_stock=5))
+        db.session.add(ActionLog(user_id=admin.id if admin else None, action=f'Ação {i}', entity_type='service_order'))
+    db.session.commit()
+
+
+def _legacy_dashboard_queries():
+    """Replica das consultas feitas pela view /dashboard antes do cache de métricas."""
+    from models import ServiceOrder, ActionLog, SupplierOrder, OrderStatus, StockItem, Part, Vehicle, VehicleStatus
+    from utils import get_service_order_stats, get_supplier_order_stats, get_monthly_summary, get_maintenance_in_progress
+
+    get_service_order_stats()
+    get_supplier_order_stats()
+    get_monthly_summary()
+    get_maintenance_in_progress()
+    for order in ServiceOrder.query.order_by(ServiceOrder.created_at.desc()).limit(5).all():
+        order.client.name, order.equipment
+    ActionLog.query.order_by(ActionLog.timestamp.desc()).limit(10).all()
+    for order in SupplierOrder.query.filter(
+        SupplierOrder.status.in_([OrderStatus.pendente, OrderStatus.aprovado, OrderStatus.enviado])
+    ).order_by(SupplierOrder.created_at.desc()).limit(5).all():
+        order.supplier.name
+    StockItem.query.filter(StockItem.quantity <= StockItem.min_quantity).limit(5).all()
+    Part.query.filter(Part.stock_quantity <= Part.minimum_stock).limit(5).all()
+    Vehicle.query.filter_by(status=VehicleStatus.ativo).count()
+    Vehicle.query.filter_by(status=VehicleStatus.em_manutencao).count()
+    Vehicle.query.filter_by(status=VehicleStatus.inativo).count()
+    Vehicle.query.count()
+
+
+def bench_dashboard(app, db):
+    """Queries and time per dashboard render: legacy view vs. cached snapshot."""
+    import dashboard_metrics
+
+    results = {}
+    rounds = 20
+    with app.app_context():
+        seed_sample_data(db)
+        engine = db.engine
+
+        with QueryCounter(engine) as legacy:
+            with timed('legacy', results):
+                for _ in range(rounds):
+                    _legacy_dashboard_queries()
+                    db.session.expire_all()
+
+        dashboard_metrics.invalidate()
+        with QueryCounter(engine) as cold:
+            with timed('cold', results):
+                dashboard_metrics.get_dashboard_snapshot()
+
+        with QueryCounter(engine) as warm:
+            with timed('warm', results):
+                for _ in range(rounds):
+                    dashboard_metrics.get_dashboard_snapshot()
+
+    print("Dashboard (consultas por renderização)")
+    print(f"  antes (view original): {legacy.count / rounds:6.1f} consultas  {results['legacy'] / rounds * 1000:8.2f} ms")
+    print(f"  snapshot sem cache:    {cold.count:6.1f} consultas  {results['cold'] * 1000:8.2f} ms")
+    print(f"  snapshot em cache:     {warm.count / rounds:6.1f} consultas  {results['warm'] / rounds * 1000:8.2f} ms")
+
+
+def _bulk_service_orders(db, total, describe=None):
+    """Insert plain service order rows quickly (no ORM objects) up to total, in the benchmark's own database."""
+    from models import ServiceOrder, ServiceOrderStatus, Client
+
+    existing = ServiceOrder.query.count()
+    if existing >= total:
+        return
+    client_ids = [row.id for row in db.session.query(Client.id).all()]
+    statuses = list(ServiceOrderStatus)
+    now = datetime.utcnow()
+    batch = []
+    for i in range(existing, total):
+        row = {
+            'client_id': client_ids[i % len(client_ids)],
+            'description': f'OS sintética {i}',
+            'status': statuses[i % len(statuses)],
+            'created_at': now - timedelta(minutes=i),
+        }
+        if describe:
+            row['description'], row['service_details'] = describe(i)
+        batch.append(row)
+        if len(batch) == 10000:
+            db.session.execute(ServiceOrder.__table__.insert(), batch)
+            batch = []
+    if batch:
+        db.session.execute(ServiceOrder.__table__.insert(), batch)
+    db.session.commit()
+
+
+def bench_service_orders(app, db):
+    """/os listing: OFFSET vs keyset pagination, first page vs a deep page."""
+    from models import ServiceOrder
+    from performance_utils import get_service_orders_with_relations, keyset_paginate, encode_cursor
+
+    total = int(os.environ.get('BENCH_ORDERS', '50000'))
+    per_page = 50
+    deep_page = total // per_page - 1
+    rounds = 5
+    with app.app_context():
+        seed_sample_data(db)
+        _bulk_service_orders(db, total)
+
+        # Cursor da página profunda, obtido uma vez fora da medição
+        last = get_service_orders_with_relations().offset(deep_page * per_page - 1).limit(1).first()
+        deep_cursor = encode_cursor(last.created_at, last.id)
+
+        results = {}
+        with timed('offset_first', results):
+            for _ in range(rounds):
+                get_service_orders_with_relations(limit=per_page).all()
+        with timed('offset_deep', results):
+            for _ in range(rounds):
+                get_service_orders_with_relations(limit=per_page, offset=deep_page * per_page).all()
+        with timed('keyset_first', results):
+            for _ in range(rounds):
+                keyset_paginate(get_service_orders_with_relations(), ServiceOrder.created_at, ServiceOrder.id, None, per_page)
+        with timed('keyset_deep', results):
+            for _ in range(rounds):
+                keyset_paginate(get_service_orders_with_relations(), ServiceOrder.created_at, ServiceOrder.id, deep_cursor, per_page)
+
+    print(f"Listagem /os ({total} OS, página {deep_page + 1} de {per_page} itens)")
+    print(f"  OFFSET  primeira: {results['offset_first'] / rounds * 1000:8.2f} ms  profunda: {results['offset_deep'] / rounds * 1000:8.2f} ms")
+    print(f"  cursor  primeira: {results['keyset_first'] / rounds * 1000:8.2f} ms  profunda: {results['keyset_deep'] / rounds * 1000:8.2f} ms")
+
+
+_SEARCH_EQUIPMENT = ['bomba hidráulica', 'compressor de ar', 'gerador diesel', 'motor elétrico', 'redutor',
+                     'esteira transportadora', 'painel elétrico', 'caldeira', 'válvula de alívio', 'empilhadeira']
+_SEARCH_PROBLEMS = ['vazamento de óleo', 'ruído excessivo', 'superaquecimento', 'vibração anormal',
+                    'falha na partida', 'desgaste do rolamento', 'pressão baixa', 'curto-circuito']
+_SEARCH_ACTIONS = ['substituição da vedação', 'troca do rolamento', 'ajuste de tensão', 'limpeza do filtro',
+                   'rebobinamento', 'lubrificação geral', 'calibração do pressostato', 'troca da correia']
+
+
+def _describe_search_order(i):
+    equipment = _SEARCH_EQUIPMENT[i % len(_SEARCH_EQUIPMENT)]
+    problem = _SEARCH_PROBLEMS[(i // 7) % len(_SEARCH_PROBLEMS)]
+    action = _SEARCH_ACTIONS[(i // 3) % len(_SEARCH_ACTIONS)]
+    return (f'Manutenção corretiva: {equipment} com {problem} (série {i})',
+            f'Realizada {action} no {equipment}. Testes finais aprovados.')
+
+
+def bench_search(app, db):
+    """Service order text search: ILIKE scan vs. the full-text index."""
+    from models import ServiceOrder
+    from service_order_search import search_service_orders, rebuild_search_index, _search_like
+
+    total = int(os.environ.get('BENCH_ORDERS', '50000'))
+    queries = ['rolamento', 'bomba hidraulica vazamento', 'compressor superaquecimento', f'série {total // 2}']
+    rounds = 5
+    with app.app_context():
+        seed_sample_data(db)
+        _bulk_service_orders(db, total, describe=_describe_search_order)
+        rebuild_search_index()
+        count = ServiceOrder.query.count()
+
+        print(f"Busca de OS ({count} OS, {db.engine.dialect.name}, primeira página de 20)")
+        for query_text in queries:
+            results = {}
+            with timed('like', results):
+                for _ in range(rounds):
+                    like_total, _ = _search_like(query_text, 20, 0, None)
+            with timed('fts', results):
+                for _ in range(rounds):
+                    found = search_service_orders(query_text, per_page=20)
+            # Uma busca sem resultados mediria só o caminho vazio
+            assert found.total > 0, f"busca {query_text!r} sem resultados: OS sintéticas não foram geradas"
+            print(f"  {query_text!r:32} ILIKE {results['like'] / rounds * 1000:8.2f} ms ({like_total:6d})"
+                  f"  índice {results['fts'] / rounds * 1000:8.2f} ms ({found.total:6d})")
+
+
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+from app import app
+imported = time.perf_counter()
+app.test_client().get('/login')
+print(imported - start, time.perf_counter() - start)
+"""
+
+
+def _measure_startup(env):
+    output = subprocess.run(
+        [sys.executable, '-c', _STARTUP_SCRIPT], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    ).stdout.split()
+    return float(output[-2]), float(output[-1])
+
+
+def bench_startup(app, db):
+    """Import-to-first-request time of a fresh process, with and without AUTO_BOOTSTRAP."""
+    rounds = 5
+    # O banco descartável deste benchmark já foi preparado pelo processo atual
+    env = dict(os.environ)
+    print("Inicialização (import do app até a primeira requisição)")
+    for label, auto_bootstrap in (('com bootstrap', 'true'), ('fast start', 'false')):
+        samples = [_measure_startup(dict(env, AUTO_BOOTSTRAP=auto_bootstrap)) for _ in range(rounds)]
+        imported = min(sample[0] for sample in samples)
+        first_request = min(sample[1] for sample in samples)
+        print(f"  {label + ':':15} import {imported * 1000:8.1f} ms  primeira requisição {first_request * 1000:8.1f} ms")
+
+
+def bench_invoice_pdf(app, db):
+    """Invoice PDFs per second: fresh WeasyPrint setup per PDF vs. the warm InvoiceRenderer."""
+    from flask import render_template
+    from sqlalchemy.orm import joinedload, selectinload
+    from models import ServiceOrder, ServiceOrderStatus
+    from pdf_utils import weasyprint_available, write_pdf
+    from invoice_pdf import INVOICE_TEMPLATE, PDF_OPTIONS, InvoiceRenderer
+
+    if not weasyprint_available():
+        print("PDF de notas fiscais: WeasyPrint indisponível, benchmark ignorado")
+        return
+
+    total = int(os.environ.get('BENCH_INVOICES', '50'))
+    with app.app_context(), app.test_request_context():
+        seed_sample_data(db)
+        orders = ServiceOrder.query.options(
+            joinedload(ServiceOrder.client),
+            joinedload(ServiceOrder.responsible),
+            selectinload(ServiceOrder.equipment)
+        ).order_by(ServiceOrder.id).limit(total).all()
+        for number, order in enumerate(orders, 1):
+            order.status = ServiceOrderStatus.fechada
+            order.invoice_number = f'NF{number:06d}'
+            order.invoice_date = order.closed_at or datetime.utcnow()
+            order.invoice_amount = Decimal('150.00') + number
+
+        results = {}
+        with timed('before', results):
+            for order in orders:
+                html_content = render_template(INVOICE_TEMPLATE, service_order=order, Decimal=Decimal)
+                write_pdf(html_content, None, **PDF_OPTIONS)
+        with timed('setup', results):
+            renderer = InvoiceRenderer(app)
+            renderer.write_pdf(renderer.render_html(orders[0]))
+        with timed('after', results):
+            for order in orders:
+                renderer.write_pdf(renderer.render_html(order))
+        db.session.rollback()
+
+    print(f"PDF de notas fiscais ({len(orders)} notas, um processo)")
+    print(f"  sem reaproveitamento: {len(orders) / results['before']:8.1f} PDFs/s")
+    print(f"  InvoiceRenderer:      {len(orders) / results['after']:8.1f} PDFs/s"
+          f"  (preparação única {results['setup'] * 1000:.0f} ms)")
+
+
+def bench_bank_import(app, db):
+    """Bank statement lines per second: one commit per entry (the form) vs. bank_import batches."""
+    from models import FinancialEntry, FinancialEntryType
+    from bank_import import BANK_STATEMENT, import_statement, open_statement
+
+    total = int(os.environ.get('BENCH_STATEMENT_LINES', '20000'))
+    one_by_one = min(total, 1000)
+    with tempfile.NamedTemporaryFile('w', suffix='.csv', encoding='utf-8', delete=False) as statement:
+        statement.write('Data;Histórico;Documento;Valor\n')
+        for i in range(total):
+            amount = f"{(i % 900) + 10},{i % 100:02d}"
+            statement.write(f"{(i % 28) + 1:02d}/{(i % 12) + 1:02d}/2023;Movimento {i};D{i};{'-' if i % 3 else ''}{amount}\n")
+
+    results = {}
+    try:
+        with app.app_context():
+            with timed('before', results):
+                for i in range(one_by_one):
+                    db.session.add(FinancialEntry(
+                        description=f'Movimento {i}', amount=Decimal('10.00'), type=FinancialEntryType.saida,
+                        date=datetime(2023, 1, 1), entry_type=BANK_STATEMENT
+                    ))
+                    db.session.commit()
+
+            with timed('after', results), open_statement(statement.name) as stream:
+                summary = import_statement(stream, 'csv')
+            with timed('again', results), open_statement(statement.name) as stream:
+                again = import_statement(stream, 'csv')
+    finally:
+        os.remove(statement.name)
+
+    print(f"Importação de extrato ({total} linhas)")
+    print(f"  um commit por lançamento: {one_by_one / results['before']:10.0f} linhas/s")
+    print(f"  bank_import em lotes:     {summary['new'] / results['after']:10.0f} linhas/s"
+          f"  ({results['after']:.2f} s)")
+    print(f"  reimportação (tudo já existe): {results['again']:.2f} s, {again['duplicates']} ignoradas")
+
+
+def bench_action_log(app, db):
+    """Time spent in the request per logged action: commit in the session vs. the background writer."""
+    from models import ActionLog, User
+    from audit_log import AuditLogWriter, record_action
+
+    total = int(os.environ.get('BENCH_ACTIONS', '500'))
+    results = {}
+    with app.app_context():
+        seed_sample_data(db)
+        user_id = db.session.query(User.id).scalar()
+        async_enabled = app.config.get('AUDIT_LOG_ASYNC')
+        app.config['AUDIT_LOG_ASYNC'] = False
+        try:
+            with timed('before', results):
+                for i in range(total):
+                    record_action(app, user_id, f'Benchmark {i}', 'benchmark')
+        finally:
+            app.config['AUDIT_LOG_ASYNC'] = async_enabled
+
+        writer = AuditLogWriter(app)
+        writer.start()
+        with timed('after', results):
+            for i in range(total):
+                writer.submit({
+                    'user_id': user_id, 'action': f'Benchmark {i}', 'entity_type': 'benchmark',
+                    'entity_id': None, 'details': None, 'ip_address': None, 'timestamp': datetime.utcnow(),
+                })
+        with timed('drain', results):
+            writer.stop()
+
+        written = ActionLog.query.filter_by(entity_type='benchmark').count()
+
+    print(f"Registro de ações ({total} ações, {written} gravadas)")
+    print(f"  commit na requisição: {results['before'] / total * 1000:8.3f} ms por ação")
+    print(f"  fila + thread:        {results['after'] / total * 1000:8.3f} ms por ação"
+          f"  (gravação em lotes: {results['drain'] * 1000:.0f} ms no total)")
+
+
+BENCHMARKS = {
+    'dashboard': bench_dashboard,
+    'service_orders': bench_service_orders,
+    'search': bench_search,
+    'startup': bench_startup,
+    'invoice_pdf': bench_invoice_pdf,
+    'bank_import': bench_bank_import,
+    'action_log': bench_action_log,
+}
+
+
+@contextmanager
+def scratch_database(name):
+    """
+    Create a throwaway database for one benchmark and remove it afterwards.
+
+    Args:
+        name: Benchmark name (part of the database name)
+
+    Returns:
+        Context manager yielding the database URL
+    """
+    server_url = os.environ.get('BENCH_POSTGRES_URL')
+    if not server_url:
+        with tempfile.TemporaryDirectory() as tmp:
+            yield f"sqlite:///{os.path.join(tmp, f'{name}.db')}"
+        return
+
+    from sqlalchemy import create_engine, make_url, text
+
+    database = f'samape_bench_{name}_{uuid.uuid4().hex[:8]}'
+    server = create_engine(server_url, isolation_level='AUTOCOMMIT')
+    try:
+        with server.connect() as connection:
+            connection.execute(text(f'CREATE DATABASE "{database}"'))
+        try:
+            yield make_url(server_url).set(database=database).render_as_string(hide_password=False)
+        finally:
+            with server.connect() as connection:
+                connection.execute(text(f'DROP DATABASE IF EXISTS "{database}" WITH (FORCE)'))
+    finally:
+        server.dispose()
+
+
+def run_benchmark(name):
+    """Run one benchmark in this process; only called inside the process started by main()."""
+    scratch_url = os.environ.get(_SCRATCH_FLAG)
+    if not scratch_url or scratch_url != os.environ.get('DATABASE_URL'):
+        print("Os benchmarks gravam dados sintéticos: execute-os por `python benchmark.py`, "
+              "que cria um banco descartável para cada um")
+        return 1
+
+    import logging
+    logging.disable(logging.INFO)
+
+    from app import app
+    from database import db
+
+    BENCHMARKS[name](app, db)
+    return 0
+
+
+def main(argv):
+    names = argv or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Benchmark desconhecido: {name}. Opções: {', '.join(BENCHMARKS)}")
+            return 1
+    for name in names:
+        with scratch_database(name) as url:
+            env = dict(os.environ, DATABASE_URL=url, FLASK_ENV='development', AUTO_BOOTSTRAP='true',
+                       JOB_EMBEDDED_WORKER='false', **{_SCRATCH_FLAG: url})
+            result = subprocess.run([sys.executable, os.path.abspath(__file__), '--run', name], env=env)
+        if result.returncode:
+            return result.returncode
+    return 0
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['--run']:
+        sys.exit(run_benchmark(sys.argv[2]))
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,15 @@
+"""
+Domain blueprints for SAMAPE application.
+Each module owns the routes of one area of the system; the remaining
+general routes (login, dashboard, clients, employees...) live in routes.py.
+"""
+import importlib
+
+BLUEPRINTS = ('service_orders', 'financial', 'invoices', 'suppliers', 'parts', 'stock', 'fleet', 'jobs')
+
+
+def register_blueprints(app):
+    """Import and register every domain blueprint."""
+    for name in BLUEPRINTS:
+        module = importlib.import_module(f'blueprints.{name}')
+        app.register_blueprint(module.bp)
@@ -0,0 +1,434 @@
+"""
+Financial routes (entries, adjustments, monthly series, CSV export and bank statement import).
+"""
+import csv
+import os
+import re
+import uuid
+from datetime import MAXYEAR, MINYEAR, datetime, timedelta
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask_login import current_user
+from sqlalchemy.orm import joinedload
+
+from database import db
+from models import ServiceOrder, FinancialEntry, FinancialEntryType, FinancialCategory
+from forms import FinancialEntryForm, BankStatementImportForm
+from utils import admin_required, manager_required, log_action, format_currency
+from financial_rollup import get_monthly_series, get_month_totals, month_start, add_months
+from cash_flow import GRANULARITIES, get_cash_flow_report, get_daily_balances
+from financial_categories import get_category_id, category_choices, get_income_statement, count_uncategorized
+from performance_utils import period_bounds, period_filter, keyset_paginate, get_financial_breakdown
+from jobs import job_handler, enqueue, upload_path, share_upload, upload_exists
+from bank_import import StatementError, open_statement, import_statement
+
+bp = Blueprint('financial', __name__)
+
+# Categorias oferecidas no acerto manual (chaves de FinancialCategory)
+ADJUSTMENT_CATEGORIES = ('acerto', 'ajuste', 'transferencia', 'imposto', 'outro')
+
+# Nome dado ao extrato enviado, entre a prévia e a confirmação da importação
+_UPLOAD_NAME = re.compile(r'[0-9a-f]{32}\.(ofx|csv|txt)')
+
+
+# Financial routes
+@bp.route('/financeiro')
+@manager_required
+def financial():
+    month = request.args.get('month', datetime.utcnow().month, type=int)
+    year = request.args.get('year', datetime.utcnow().year, type=int)
+    if month not in MONTH_NAMES or not _valid_year(year):
+        flash('Período inválido: exibindo o mês atual.', 'warning')
+        month, year = datetime.utcnow().month, datetime.utcnow().year
+    group_by = request.args.get('agrupar', '')
+    cursor = request.args.get('cursor')
+    per_page = min(request.args.get('per_page', 50, type=int) or 50, 200)
+    
+    # Movimentações do mês, paginadas por cursor em (date, id)
+    page = keyset_paginate(
+        FinancialEntry.query.options(joinedload(FinancialEntry.category)).filter(
+            period_filter(FinancialEntry.date, year, month)
+        ),
+        FinancialEntry.date, FinancialEntry.id,
+        cursor=cursor, per_page=per_page
+    )
+    
+    # Summary read from the monthly rollup
+    totals = get_month_totals(year, month)
+    
+    # Detalhamento por origem (OS, abastecimentos, fornecedores...) só quando pedido
+    breakdown = get_financial_breakdown(year, month) if group_by == 'origem' else None
+    
+    return render_template(
+        'financial/index.html',
+        entries=page.items,
+        page=page,
+        is_first_page=not cursor,
+        month=month,
+        year=year,
+        group_by=group_by,
+        breakdown=breakdown,
+        entry_count=totals['count'],
+        income=totals['income'],
+        expenses=totals['expenses'],
+        balance=totals['balance']
+    )
+
+
+@bp.route('/api/financeiro/serie-mensal')
+@manager_required
+def financial_monthly_series():
+    months = request.args.get('meses', 12, type=int)
+    return jsonify(get_monthly_series(months))
+
+
+@bp.route('/financeiro/fluxo-de-caixa')
+@manager_required
+def cash_flow():
+    granularity = request.args.get('agrupar', 'month')
+    if granularity not in GRANULARITIES:
+        granularity = 'month'
+    today = datetime.utcnow().date()
+    date_to = _parse_date(request.args.get('date_to')) or today
+    date_from = _parse_date(request.args.get('date_from')) or add_months(month_start(date_to), -11)
+    if date_from > date_to:
+        date_from, date_to = date_to, date_from
+    
+    # Saldo dia a dia do mês selecionado
+    month = request.args.get('month', date_to.month, type=int)
+    year = request.args.get('year', date_to.year, type=int)
+    if month not in MONTH_NAMES:
+        month = date_to.month
+    if not _valid_year(year):
+        year = date_to.year
+    month_first, month_end = period_bounds(year, month)
+    
+    return render_template(
+        'financial/cash_flow.html',
+        granularity=granularity,
+        date_from=date_from,
+        date_to=date_to,
+        periods=get_cash_flow_report(granularity, date_from, date_to),
+        month=month,
+        year=year,
+        month_name=MONTH_NAMES[month],
+        daily=get_daily_balances(month_first.date(), (month_end - timedelta(days=1)).date())
+    )
+
+
+@bp.route('/financeiro/dre')
+@manager_required
+def income_statement():
+    year = request.args.get('year', datetime.utcnow().year, type=int)
+    if not _valid_year(year):
+        flash('Ano inválido: exibindo o ano atual.', 'warning')
+        year = datetime.utcnow().year
+    date_from, date_to = period_bounds(year)
+    
+    return render_template(
+        'financial/income_statement.html',
+        year=year,
+        month_names=MONTH_NAMES,
+        statement=get_income_statement(date_from, date_to),
+        uncategorized=count_uncategorized()
+    )
+
+
+@bp.route('/financeiro/categorias/classificar', methods=['POST'])
+@admin_required
+def backfill_financial_categories():
+    # Lançamentos antigos: categoria no prefixo da descrição ou pela origem
+    job = enqueue('financial_category_backfill', user_id=current_user.id)
+    
+    log_action(
+        'Classificação de Lançamentos',
+        'financial',
+        None,
+        f"Classificação dos lançamentos sem categoria (tarefa #{job.id})"
+    )
+    
+    return redirect(url_for('jobs.view_job', id=job.id))
+
+
+@bp.route('/financeiro/novo', methods=['GET', 'POST'])
+@manager_required
+def new_financial_entry():
+    form = FinancialEntryForm()
+    
+    # Load service orders for dropdown
+    form.service_order_id.choices = [(0, 'Nenhuma OS relacionada')] + [
+        (so.id, f'OS #{so.id} - {so.client.name}')
+        for so in ServiceOrder.query.order_by(ServiceOrder.id.desc()).limit(100).all()
+    ]
+    form.category_id.choices = [(0, 'Sem categoria')] + category_choices()
+    
+    if form.validate_on_submit():
+        entry = FinancialEntry(
+            service_order_id=form.service_order_id.data if form.service_order_id.data != 0 else None,
+            description=form.description.data,
+            amount=form.amount.data,
+            type=FinancialEntryType[form.type.data],
+            date=datetime.strptime(form.date.data, '%Y-%m-%d'),
+            created_by=current_user.id,
+            category_id=form.category_id.data or None
+        )
+        
+        db.session.add(entry)
+        db.session.commit()
+        
+        log_action(
+            'Registro Financeiro',
+            'financial',
+            entry.id,
+            f"Registro financeiro de {format_currency(entry.amount)} ({entry.type.value})"
+        )
+        
+        flash('Registro financeiro adicionado com sucesso!', 'success')
+        return redirect(url_for('financial.financial'))
+        
+    # Set today's date as default
+    if request.method == 'GET':
+        form.date.data = datetime.utcnow().strftime('%Y-%m-%d')
+        
+    return render_template('financial/create.html', form=form)
+
+
+@bp.route('/financeiro/acerto-manual', methods=['POST'])
+@manager_required
+def add_financial_adjustment():
+    try:
+        # Obter dados do formulário
+        type_value = request.form.get('type')
+        amount = float(request.form.get('amount', 0))
+        description = request.form.get('description', '')
+        date_str = request.form.get('date')
+        category = request.form.get('category', 'acerto')
+        if category not in ADJUSTMENT_CATEGORIES:
+            category = 'acerto'
+        
+        # Validar dados
+        if not type_value or not amount or not description or not date_str:
+            flash('Todos os campos são obrigatórios.', 'danger')
+            return redirect(url_for('financial.financial'))
+        
+        # Criar registro financeiro
+        entry = FinancialEntry(
+            description=description,
+            amount=amount,
+            type=FinancialEntryType[type_value],
+            date=datetime.strptime(date_str, '%Y-%m-%d'),
+            created_by=current_user.id,
+            category_id=get_category_id(category)
+        )
+        
+        db.session.add(entry)
+        db.session.commit()
+        
+        # Registrar ação
+        log_action(
+            'Acerto Manual Financeiro',
+            'financial',
+            entry.id,
+            f"Acerto manual: {format_currency(amount)} ({FinancialEntryType[type_value].value})"
+        )
+        
+        flash(f'Acerto manual de {format_currency(amount)} registrado com sucesso!', 'success')
+        
+    except ValueError as e:
+        flash(f'Erro no formato dos dados: {str(e)}', 'danger')
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao registrar acerto manual: {str(e)}")
+        flash(f'Erro ao processar acerto manual: {str(e)}', 'danger')
+        
+    return redirect(url_for('financial.financial'))
+
+
+MONTH_NAMES = {
+    1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
+    5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
+    9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
+}
+
+
+def _valid_year(year):
+    # period_bounds vai até 1º de janeiro do ano seguinte: o último ano aceito é MAXYEAR - 1
+    return year is not None and MINYEAR <= year < MAXYEAR
+
+
+class _CsvLine:
+    """File-like target that returns each line written by csv.writer instead of storing it."""
+
+    def write(self, line):
+        return line
+
+
+def iter_financial_csv(start, end):
+    """
+    Produce the CSV of the financial entries in a date range, line by line.
+
+    Rows are read in batches through a server-side cursor (yield_per), so
+    memory use does not depend on the number of entries exported.
+
+    Args:
+        start: First datetime included
+        end: First datetime excluded
+
+    Yields:
+        CSV lines, starting with a UTF-8 BOM (Excel) and the header
+    """
+    writer = csv.writer(_CsvLine())
+    yield '\ufeff' + writer.writerow(['Data', 'Descrição', 'Categoria', 'Tipo', 'Valor', 'OS Relacionada'])
+    
+    # Só as colunas do CSV: sem montar objetos do ORM para cada lançamento
+    rows = db.session.query(
+        FinancialEntry.date,
+        FinancialEntry.description,
+        FinancialCategory.name,
+        FinancialEntry.type,
+        FinancialEntry.amount,
+        FinancialEntry.service_order_id
+    ).outerjoin(FinancialEntry.category).filter(
+        FinancialEntry.date >= start,
+        FinancialEntry.date < end
+    ).order_by(FinancialEntry.date, FinancialEntry.id).yield_per(1000)
+    
+    for entry_date, description, category, entry_type, amount, service_order_id in rows:
+        yield writer.writerow([
+            entry_date.strftime('%d/%m/%Y'),
+            description,
+            category or '',
+            entry_type.value,
+            f'{amount:.2f}'.replace('.', ','),
+            f'OS #{service_order_id}' if service_order_id else 'N/A'
+        ])
+
+
+@job_handler('financial_export')
+def export_financial_job(context, date_from=None, date_to=None, month=None, year=None):
+    """
+    Write the CSV with the financial entries of a date range or of one month.
+
+    Args:
+        date_from: First day of the range (ISO date)
+        date_to: Last day of the range, included (ISO date)
+        month, year: Month exported when no range is given
+    """
+    if date_from and date_to:
+        start = datetime.fromisoformat(date_from)
+        end = datetime.fromisoformat(date_to) + timedelta(days=1)
+        filename = f'financeiro_{start:%Y-%m-%d}_a_{end - timedelta(days=1):%Y-%m-%d}.csv'
+    else:
+        start, end = period_bounds(year, month)
+        filename = f'financeiro_{MONTH_NAMES[month]}_{year}.csv'
+    
+    total = FinancialEntry.query.filter(FinancialEntry.date >= start, FinancialEntry.date < end).count()
+    context.progress(0, total, f'Exportando {total} lançamentos')
+    
+    path = context.result_path(filename, 'text/csv; charset=utf-8')
+    with open(path, 'w', newline='', encoding='utf-8') as output:
+        lines = iter_financial_csv(start, end)
+        output.write(next(lines))
+        for done, line in enumerate(lines, 1):
+            output.write(line)
+            context.progress(done)
+    context.progress(total, message=f'{total} lançamentos exportados')
+
+
+def _parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date() if value else None
+    except ValueError:
+        return None
+
+
+@bp.route('/financeiro/exportar')
+@manager_required
+def export_financial():
+    date_from = _parse_date(request.args.get('date_from'))
+    date_to = _parse_date(request.args.get('date_to'))
+    
+    if request.args.get('date_from') or request.args.get('date_to'):
+        # Período livre (ex.: o ano inteiro), datas inclusivas
+        if date_from is None or date_to is None or date_from > date_to:
+            flash('Período inválido: informe a data inicial e a final.', 'warning')
+            return redirect(url_for('financial.financial'))
+        params = {'date_from': date_from.isoformat(), 'date_to': date_to.isoformat()}
+        period = f"{date_from.strftime('%d/%m/%Y')} a {date_to.strftime('%d/%m/%Y')}"
+    else:
+        month = request.args.get('month', datetime.utcnow().month, type=int)
+        year = request.args.get('year', datetime.utcnow().year, type=int)
+        if month not in MONTH_NAMES or not _valid_year(year):
+            flash('Mês inválido.', 'warning')
+            return redirect(url_for('financial.financial'))
+        params = {'month': month, 'year': year}
+        period = f'{MONTH_NAMES[month]}/{year}'
+    
+    # O CSV é gerado pelo worker de tarefas; a página da tarefa acompanha o andamento
+    job = enqueue('financial_export', params, user_id=current_user.id)
+    
+    log_action(
+        'Exportação Financeira',
+        'financial',
+        None,
+        f"Exportação dos dados financeiros de {period} (tarefa #{job.id})"
+    )
+    
+    return redirect(url_for('jobs.view_job', id=job.id))
+
+
+@bp.route('/financeiro/importar', methods=['GET', 'POST'])
+@manager_required
+def import_bank_statement():
+    form = BankStatementImportForm()
+    
+    if form.validate_on_submit():
+        upload = form.statement.data
+        extension = os.path.splitext(upload.filename)[1].lower()
+        upload_name = f'{uuid.uuid4().hex}{extension}'
+        path = upload_path(upload_name)
+        upload.save(path)
+        
+        # Prévia: lê o extrato inteiro sem gravar nada
+        try:
+            with open_statement(path) as statement:
+                preview = import_statement(statement, dry_run=True)
+        except StatementError as e:
+            os.remove(path)
+            flash(str(e), 'danger')
+            return redirect(url_for('financial.import_bank_statement'))
+        
+        # A confirmação e a tarefa podem cair em outra instância
+        share_upload(upload_name)
+        
+        return render_template(
+            'financial/import.html',
+            form=form,
+            preview=preview,
+            upload_name=upload_name,
+            filename=upload.filename
+        )
+    
+    return render_template('financial/import.html', form=form, preview=None)
+
+
+@bp.route('/financeiro/importar/confirmar', methods=['POST'])
+@manager_required
+def confirm_bank_statement_import():
+    upload_name = request.form.get('upload_name', '')
+    filename = request.form.get('filename', upload_name)
+    if not _UPLOAD_NAME.fullmatch(upload_name) or not upload_exists(upload_name):
+        flash('Arquivo do extrato não encontrado; envie-o novamente.', 'warning')
+        return redirect(url_for('financial.import_bank_statement'))
+    
+    # A gravação em lotes roda no worker de tarefas
+    job = enqueue('bank_import', {'filename': upload_name, 'user_id': current_user.id}, user_id=current_user.id)
+    
+    log_action(
+        'Importação de Extrato',
+        'financial',
+        None,
+        f"Importação do extrato bancário {filename[:100]} (tarefa #{job.id})"
+    )
+    
+    return redirect(url_for('jobs.view_job', id=job.id))
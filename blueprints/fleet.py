@@ -0,0 +1,636 @@
+"""
+Fleet routes: vehicles, refueling and maintenance history.
+"""
+import os
+import uuid
+from datetime import datetime, date
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask_login import login_required, current_user
+from werkzeug.utils import secure_filename
+from sqlalchemy import or_
+
+from database import db
+from models import VehicleStatus, Vehicle, VehicleMaintenance, FuelType, Refueling
+from forms import VehicleForm
+from payments import VEHICLE_REFUELING, record_payment
+from utils import manager_required, log_action, get_system_setting
+
+bp = Blueprint('fleet', __name__)
+
+
+# Rotas para Controle de Frota
+@bp.route('/frota')
+@login_required
+def fleet():
+    """Lista de veículos da frota"""
+    try:
+        # Adicionar logging
+        current_app.logger.info("Acessando página de frota")
+        
+        # Contador de estatísticas
+        stats = {
+            'active': Vehicle.query.filter_by(status=VehicleStatus.ativo).count(),
+            'maintenance': Vehicle.query.filter_by(status=VehicleStatus.em_manutencao).count(),
+            'inactive': Vehicle.query.filter_by(status=VehicleStatus.inativo).count(),
+            'total': Vehicle.query.count()
+        }
+        
+        # Inicializar variáveis com valores padrão
+        page = request.args.get('page', 1, type=int)
+        per_page = int(get_system_setting('items_per_page', '20'))
+        
+        today = datetime.now().date()
+        
+        current_app.logger.info("Preparando query para lista de veículos")
+        
+        # Query base
+        query = Vehicle.query
+        
+        # Aplicar filtros
+        status_filter = request.args.get('status')
+        tipo_filter = request.args.get('tipo')
+        busca = request.args.get('busca')
+        
+        if status_filter:
+            current_app.logger.info(f"Aplicando filtro por status: {status_filter}")
+            query = query.filter(Vehicle.status == VehicleStatus[status_filter])
+            
+        if tipo_filter:
+            # Filtro de tipo removido - campo não existe na tabela
+            current_app.logger.info(f"Filtro por tipo ignorado (campo não existe): {tipo_filter}")
+            pass
+            
+        if busca:
+            current_app.logger.info(f"Aplicando busca: {busca}")
+            query = query.filter(
+                or_(
+                    Vehicle.plate.ilike(f'%{busca}%'),
+                    Vehicle.brand.ilike(f'%{busca}%'),
+                    Vehicle.model.ilike(f'%{busca}%'),
+                    Vehicle.chassis.ilike(f'%{busca}%')
+                )
+            )
+        
+        # Ordenação
+        order_by = request.args.get('order_by', 'plate')
+        order_dir = request.args.get('order_dir', 'asc')
+        current_app.logger.info(f"Ordenando por: {order_by} ({order_dir})")
+        
+        if order_by == 'plate':
+            if order_dir == 'asc':
+                query = query.order_by(Vehicle.plate)
+            else:
+                query = query.order_by(Vehicle.plate.desc())
+        elif order_by == 'type':
+            if order_dir == 'asc':
+                # Ordenação por tipo removida - campo não existe na tabela
+                query = query.order_by(Vehicle.brand)
+            else:
+                # Ordenação por tipo removida - campo não existe na tabela
+                query = query.order_by(Vehicle.brand.desc())
+        elif order_by == 'status':
+            if order_dir == 'asc':
+                query = query.order_by(Vehicle.status)
+            else:
+                query = query.order_by(Vehicle.status.desc())
+        elif order_by == 'brand':
+            if order_dir == 'asc':
+                query = query.order_by(Vehicle.brand)
+            else:
+                query = query.order_by(Vehicle.brand.desc())
+        else:
+            query = query.order_by(Vehicle.plate)
+        
+        # Paginação
+        current_app.logger.info(f"Aplicando paginação: página {page}, {per_page} itens por página")
+        vehicles = query.paginate(page=page, per_page=per_page)
+        
+        # Obter as últimas movimentações (manutenções e abastecimentos)
+        current_app.logger.info("Buscando últimas movimentações (manutenções e abastecimentos)")
+        
+        try:
+            # Consulta para manutenções
+            maintenance_records = db.session.query(
+                VehicleMaintenance.id.label('record_id'),
+                VehicleMaintenance.vehicle_id,
+                VehicleMaintenance.date,
+                VehicleMaintenance.description,
+                VehicleMaintenance.cost,
+                VehicleMaintenance.created_at,
+                db.literal('maintenance').label('record_type')
+            ).order_by(VehicleMaintenance.created_at.desc()).limit(5).all()
+            
+            # Consulta para abastecimentos
+            refueling_records = db.session.query(
+                Refueling.id.label('record_id'),
+                Refueling.vehicle_id,
+                Refueling.date,
+                db.literal('Abastecimento').label('description'),
+                Refueling.total_cost.label('cost'),
+                Refueling.created_at,
+                db.literal('refueling').label('record_type')
+            ).order_by(Refueling.created_at.desc()).limit(5).all()
+            
+            # Combinar resultados e ordenar por data de criação
+            latest_records = sorted(
+                maintenance_records + refueling_records,
+                key=lambda x: x.created_at,
+                reverse=True
+            )[:10]  # Limitar a 10 registros
+            
+            # Obter informações dos veículos associados
+            for record in latest_records:
+                vehicle = Vehicle.query.get(record.vehicle_id)
+                if vehicle:
+                    setattr(record, 'vehicle', vehicle)
+        except Exception as e:
+            current_app.logger.error(f"Erro ao buscar movimentações recentes: {str(e)}")
+            latest_records = []
+        
+        current_app.logger.info(f"Renderizando template com {vehicles.total} veículos e {len(latest_records)} movimentações recentes")
+        
+        return render_template(
+            'fleet/index.html',
+            vehicles=vehicles,
+            status_filter=status_filter,
+            tipo_filter=tipo_filter,
+            busca=busca,
+            order_by=order_by,
+            order_dir=order_dir,
+            vehicle_statuses=VehicleStatus,
+            today=today,
+            stats=stats,
+            latest_records=latest_records
+        )
+    except Exception as e:
+        current_app.logger.error(f"Erro ao acessar página de frota: {str(e)}")
+        import traceback
+        current_app.logger.error(traceback.format_exc())
+        flash(f"Erro ao carregar página de frota: {str(e)}", "danger")
+        return redirect(url_for('dashboard'))
+
+
+@bp.route('/frota/novo', methods=['GET', 'POST'])
+@login_required
+@manager_required
+def new_vehicle():
+    """Adicionar novo veículo à frota"""
+    form = VehicleForm()
+    
+    if form.validate_on_submit():
+        try:
+            # Tratar datas
+            acquisition_date = None
+            if form.acquisition_date.data:
+                acquisition_date = datetime.strptime(form.acquisition_date.data, '%Y-%m-%d').date()
+            
+            insurance_expiry = None
+            if form.insurance_expiry.data:
+                insurance_expiry = datetime.strptime(form.insurance_expiry.data, '%Y-%m-%d').date()
+            
+            next_maintenance_date = None
+            if form.next_maintenance_date.data:
+                next_maintenance_date = datetime.strptime(form.next_maintenance_date.data, '%Y-%m-%d').date()
+            
+            # Processar imagem, se houver
+            image_filename = None
+            if form.image.data:
+                image = form.image.data
+                
+                # Gerar nome de arquivo único
+                filename = secure_filename(f"vehicle_{uuid.uuid4().hex}.{image.filename.split('.')[-1]}")
+                upload_folder = os.path.join('static', 'uploads', 'vehicles')
+                os.makedirs(upload_folder, exist_ok=True)
+                image.save(os.path.join(upload_folder, filename))
+                image_filename = filename
+            
+            # Criar objeto de veículo
+            vehicle = Vehicle(
+                # Não adicionar campo type - não existe no banco de dados
+                plate=form.plate.data,
+                brand=form.brand.data,
+                model=form.model.data,
+                year=form.year.data,
+                color=form.color.data,
+                chassis=form.chassis.data,
+                renavam=form.renavam.data,
+                fuel_type=FuelType.flex if not form.fuel_type.data else 
+                   FuelType[form.fuel_type.data] if form.fuel_type.data in [fuel_type.name for fuel_type in FuelType] else FuelType.flex,
+                acquisition_date=acquisition_date,
+                insurance_policy=form.insurance_policy.data,
+                insurance_expiry=insurance_expiry,
+                current_km=form.current_km.data,
+                next_maintenance_date=next_maintenance_date,
+                next_maintenance_km=form.next_maintenance_km.data,
+                responsible_id=form.responsible_id.data if form.responsible_id.data != 0 else None,
+                status=VehicleStatus[form.status.data],
+                image=image_filename,
+                notes=form.notes.data
+            )
+            
+            db.session.add(vehicle)
+            db.session.commit()
+            
+            flash('Veículo adicionado com sucesso!', 'success')
+            log_action(
+                'Cadastro de Veículo',
+                'vehicle',
+                vehicle.id,
+                f"Veículo placa {vehicle.plate} cadastrado"
+            )
+            
+            return redirect(url_for('fleet.view_vehicle', id=vehicle.id))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao adicionar veículo: {str(e)}', 'danger')
+            current_app.logger.error(f"Erro ao cadastrar veículo: {str(e)}")
+    
+    return render_template('fleet/new.html', form=form)
+
+
+@bp.route('/frota/<int:id>')
+@login_required
+def view_vehicle(id):
+    """Visualizar detalhes de um veículo"""
+    vehicle = Vehicle.query.get_or_404(id)
+    
+    # Obter histórico de manutenção
+    maintenance_history = VehicleMaintenance.query.filter_by(vehicle_id=vehicle.id).order_by(VehicleMaintenance.date.desc()).all()
+    
+    # Obter histórico de abastecimento
+    refueling_history = Refueling.query.filter_by(vehicle_id=vehicle.id).order_by(Refueling.date.desc()).all()
+    
+    # Data atual para o modal de abastecimento
+    now_date = datetime.now().strftime('%Y-%m-%d')
+    
+    return render_template(
+        'fleet/view.html',
+        vehicle=vehicle,
+        maintenance_history=maintenance_history,
+        refueling_history=refueling_history,
+        now_date=now_date
+    )
+
+
+@bp.route('/frota/<int:id>/editar', methods=['GET', 'POST'])
+@login_required
+@manager_required
+def edit_vehicle(id):
+    """Editar veículo"""
+    vehicle = Vehicle.query.get_or_404(id)
+    form = VehicleForm(obj=vehicle)
+    
+    if request.method == 'GET':
+        # Converter datas para o formato correto para o formulário
+        if vehicle.acquisition_date:
+            form.acquisition_date.data = vehicle.acquisition_date.strftime('%Y-%m-%d')
+        if vehicle.insurance_expiry:
+            form.insurance_expiry.data = vehicle.insurance_expiry.strftime('%Y-%m-%d')
+        if vehicle.next_maintenance_date:
+            form.next_maintenance_date.data = vehicle.next_maintenance_date.strftime('%Y-%m-%d')
+            
+        # Lidar com dados do enum
+        # type removido - campo não existe no banco de dados
+        form.status.data = vehicle.status.name
+        
+        # Definir responsável
+        if vehicle.responsible_id is None:
+            form.responsible_id.data = 0
+    
+    if form.validate_on_submit():
+        try:
+            # Tratar datas
+            acquisition_date = None
+            if form.acquisition_date.data:
+                acquisition_date = datetime.strptime(form.acquisition_date.data, '%Y-%m-%d').date()
+            
+            insurance_expiry = None
+            if form.insurance_expiry.data:
+                insurance_expiry = datetime.strptime(form.insurance_expiry.data, '%Y-%m-%d').date()
+            
+            next_maintenance_date = None
+            if form.next_maintenance_date.data:
+                next_maintenance_date = datetime.strptime(form.next_maintenance_date.data, '%Y-%m-%d').date()
+            
+            # Processar imagem, se houver
+            if form.image.data:
+                # Remover imagem anterior se existir
+                if vehicle.image:
+                    try:
+                        old_image_path = os.path.join('static', 'uploads', 'vehicles', vehicle.image)
+                        if os.path.exists(old_image_path):
+                            os.remove(old_image_path)
+                    except Exception as e:
+                        current_app.logger.warning(f"Erro ao remover imagem antiga: {str(e)}")
+                
+                image = form.image.data
+                
+                # Gerar nome de arquivo único
+                filename = secure_filename(f"vehicle_{uuid.uuid4().hex}.{image.filename.split('.')[-1]}")
+                upload_folder = os.path.join('static', 'uploads', 'vehicles')
+                os.makedirs(upload_folder, exist_ok=True)
+                image.save(os.path.join(upload_folder, filename))
+                vehicle.image = filename
+            
+            # Atualizar campos do veículo
+            # type removido - campo não existe no banco de dados
+            vehicle.plate = form.plate.data
+            vehicle.brand = form.brand.data
+            vehicle.model = form.model.data
+            vehicle.year = form.year.data
+            vehicle.color = form.color.data
+            vehicle.chassis = form.chassis.data
+            vehicle.renavam = form.renavam.data
+            vehicle.acquisition_date = acquisition_date
+            # Tratar o tipo de combustível corretamente
+            try:
+                # Buscar o valor do campo de combustível do formulário
+                fuel_type = form.fuel_type.data
+                # Converter o tipo de combustível para o enum correto
+                fuel_type_enum = FuelType[fuel_type] if fuel_type in [ft.name for ft in FuelType] else FuelType.flex
+            except (KeyError, ValueError, AttributeError):
+                # Fallback para o tipo padrão se houver erro
+                fuel_type_enum = FuelType.flex
+            
+            vehicle.fuel_type = fuel_type_enum
+            vehicle.insurance_policy = form.insurance_policy.data
+            vehicle.insurance_expiry = insurance_expiry
+            vehicle.current_km = form.current_km.data
+            vehicle.next_maintenance_km = form.next_maintenance_km.data
+            vehicle.next_maintenance_date = next_maintenance_date
+            vehicle.responsible_id = form.responsible_id.data if form.responsible_id.data != 0 else None
+            vehicle.status = VehicleStatus[form.status.data]
+            vehicle.notes = form.notes.data
+            
+            db.session.commit()
+            
+            flash('Veículo atualizado com sucesso!', 'success')
+            log_action(
+                'Edição de Veículo',
+                'vehicle',
+                vehicle.id,
+                f"Veículo placa {vehicle.plate} atualizado"
+            )
+            
+            return redirect(url_for('fleet.view_vehicle', id=vehicle.id))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao atualizar veículo: {str(e)}', 'danger')
+            current_app.logger.error(f"Erro ao atualizar veículo {id}: {str(e)}")
+    
+    return render_template('fleet/edit.html', form=form, vehicle=vehicle)
+
+
+@bp.route('/frota/<int:id>/excluir', methods=['GET', 'POST'])
+@login_required
+# Removida restrição @role_required para permitir acesso a todos os usuários logados
+def delete_vehicle(id):
+    """Excluir veículo - redirecionar para a versão correta"""
+    # Redirecionar para a nova rota de exclusão de veículos
+    return redirect(url_for('fleet.excluir_veiculo_direct', id=id))
+
+
+@bp.route('/excluir-veiculo/<int:id>', methods=['POST'])
+@login_required
+def excluir_veiculo_direct(id):
+    """Rota para excluir veículo - apenas para administradores"""
+    # Verificar se o usuário é administrador 
+    if current_user.role.value != 'admin':
+        flash('Acesso negado. Apenas administradores podem excluir veículos.', 'danger')
+        return redirect(url_for('fleet.fleet'))
+        
+    current_app.logger.info(f"Tentando excluir veículo ID: {id}, usuário: {current_user.username}")
+    
+    try:
+        # Buscar o veículo
+        vehicle = Vehicle.query.get_or_404(id)
+        vehicle_info = f"{vehicle.plate} ({vehicle.brand} {vehicle.model})"
+        
+        # Excluir registros relacionados primeiro
+        # Manutenções
+        VehicleMaintenance.query.filter_by(vehicle_id=id).delete()
+        # Abastecimentos
+        Refueling.query.filter_by(vehicle_id=id).delete()
+        
+        # Excluir o veículo
+        db.session.delete(vehicle)
+        db.session.commit()
+        
+        # Log da ação
+        current_app.logger.info(f"Veículo {vehicle_info} excluído com sucesso por {current_user.username}")
+        flash(f'Veículo {vehicle_info} excluído com sucesso!', 'success')
+        
+    except Exception as e:
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao excluir veículo {id}: {str(e)}")
+        flash(f'Erro ao excluir o veículo: {str(e)}', 'danger')
+        
+    return redirect(url_for('fleet.fleet'))
+
+
+@bp.route('/frota/veiculos/<int:id>/abastecimento', methods=['GET', 'POST'])
+@login_required
+# Removida a restrição @manager_required para permitir que todos os usuários registrem abastecimentos
+def register_refueling(id):
+    """Rota para registrar abastecimento de veículo"""
+    vehicle = Vehicle.query.get_or_404(id)
+    
+    # Estamos usando o formulário diretamente no template ao invés do objeto forms.RefuelingForm
+    
+    if request.method == 'GET':
+        # Pré-preencher o formulário com valores padrão
+        current_date = datetime.now().strftime('%Y-%m-%d')
+        return render_template('fleet/refueling.html', vehicle=vehicle, today=current_date)
+    
+    if request.method == 'POST':
+        try:
+            # Processar dados do formulário
+            date_str = request.form.get('date')
+            odometer = request.form.get('odometer')
+            fuel_type = request.form.get('fuel_type')
+            liters = request.form.get('liters')
+            price_per_liter = request.form.get('price_per_liter')
+            total_cost = request.form.get('total_cost')
+            gas_station = request.form.get('gas_station')
+            full_tank = 'full_tank' in request.form
+            
+            # Validar campos obrigatórios
+            if not all([date_str, odometer, fuel_type, liters, price_per_liter, total_cost]):
+                flash('Por favor, preencha todos os campos obrigatórios.', 'danger')
+                return render_template('fleet/refueling.html', 
+                                      vehicle=vehicle, 
+                                      today=date_str or datetime.now().strftime('%Y-%m-%d'))
+            
+            try:
+                # Converter valores
+                refueling_date = datetime.strptime(date_str, '%Y-%m-%d').date()
+                odometer = int(odometer)
+                liters = float(liters)
+                price_per_liter = float(price_per_liter)
+                total_cost = float(total_cost)
+            except ValueError as e:
+                flash(f'Erro ao converter valores: {str(e)}', 'danger')
+                return render_template('fleet/refueling.html', 
+                                      vehicle=vehicle, 
+                                      today=date_str or datetime.now().strftime('%Y-%m-%d'))
+            
+            # Criar o registro de abastecimento
+            # Determinar o tipo de combustível correto
+            try:
+                # Converter o tipo de combustível para o enum correto
+                fuel_type_enum = FuelType[fuel_type] if fuel_type in [ft.name for ft in FuelType] else FuelType.flex
+            except (KeyError, ValueError):
+                # Fallback para o tipo padrão se houver erro
+                fuel_type_enum = FuelType.flex
+            
+            refueling = Refueling(
+                vehicle_id=vehicle.id,
+                date=refueling_date,
+                odometer=odometer,
+                fuel_type=fuel_type_enum,  # Usando o enum correto
+                liters=liters,
+                price_per_liter=price_per_liter,
+                total_cost=total_cost,
+                gas_station=gas_station,
+                full_tank=full_tank,
+                created_by=current_user.id
+            )
+            
+            # Atualizar a quilometragem atual do veículo
+            if odometer > (vehicle.current_km or 0):
+                vehicle.current_km = odometer
+            
+            # Primeiro, salvar o registro de abastecimento para obter um ID válido
+            db.session.add(refueling)
+            db.session.flush()  # Isso gera um ID sem confirmar a transação
+            
+            # Agora criar lançamento financeiro com o ID correto do abastecimento
+            record_payment(
+                VEHICLE_REFUELING,
+                refueling.id,
+                total_cost,
+                f"Abastecimento - {vehicle.brand} {vehicle.model} ({vehicle.plate}) - Combustível",
+                date=refueling_date,
+                created_by=current_user.id
+            )
+            
+            # Confirmar a transação
+            db.session.commit()
+            
+            # Registrar ação no log
+            log_action(
+                'Registro de Abastecimento',
+                'vehicle_refueling',
+                refueling.id,
+                f"Abastecimento registrado para o veículo {vehicle.plate}"
+            )
+            
+            flash(f'Abastecimento registrado com sucesso! Custo total: R$ {total_cost:.2f}', 'success')
+            return redirect(url_for('fleet.view_vehicle', id=vehicle.id))
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao registrar abastecimento: {str(e)}', 'danger')
+            current_app.logger.error(f"Erro ao registrar abastecimento para veículo {id}: {str(e)}")
+            return redirect(url_for('fleet.view_vehicle', id=vehicle.id))
+    
+    return redirect(url_for('fleet.view_vehicle', id=vehicle.id))
+
+
+@bp.route('/frota/manutencoes')
+@login_required
+def vehicle_maintenance_history():
+    """Histórico de manutenções e abastecimentos de todos os veículos"""
+    page = request.args.get('page', 1, type=int)
+    per_page = int(get_system_setting('items_per_page', '20'))
+    view_type = request.args.get('view', 'maintenance')  # 'maintenance' ou 'refueling'
+    
+    # Obter lista de veículos para o filtro
+    vehicles = Vehicle.query.order_by(Vehicle.plate).all()
+    
+    # Aplicar filtros
+    vehicle_id = request.args.get('vehicle_id', type=int)
+    data_inicio = request.args.get('data_inicio')
+    data_fim = request.args.get('data_fim')
+    
+    # Converter datas se fornecidas
+    inicio_date = None
+    fim_date = None
+    
+    if data_inicio:
+        try:
+            inicio_date = datetime.strptime(data_inicio, '%Y-%m-%d').date()
+        except ValueError:
+            flash('Data inicial inválida.', 'warning')
+            
+    if data_fim:
+        try:
+            fim_date = datetime.strptime(data_fim, '%Y-%m-%d').date()
+        except ValueError:
+            flash('Data final inválida.', 'warning')
+    
+    # Variáveis para os resultados
+    maintenance_history = None
+    refuelings = None
+    
+    # Dependendo do tipo de visualização, obtemos manutenções ou abastecimentos
+    if view_type != 'refueling':  # Padrão: manutenções
+        # Query para manutenções
+        query = VehicleMaintenance.query
+        
+        if vehicle_id:
+            query = query.filter(VehicleMaintenance.vehicle_id == vehicle_id)
+            
+        if inicio_date:
+            query = query.filter(VehicleMaintenance.date >= inicio_date)
+            
+        if fim_date:
+            query = query.filter(VehicleMaintenance.date <= fim_date)
+        
+        # Ordenação por data (coluna real, não propriedade)
+        query = query.order_by(VehicleMaintenance.date.desc())
+        
+        # Paginação
+        maintenance_history = query.paginate(page=page, per_page=per_page)
+        
+    else:  # 'refueling'
+        # Query para abastecimentos
+        query = Refueling.query
+        
+        if vehicle_id:
+            query = query.filter(Refueling.vehicle_id == vehicle_id)
+            
+        if inicio_date:
+            query = query.filter(Refueling.date >= inicio_date)
+            
+        if fim_date:
+            query = query.filter(Refueling.date <= fim_date)
+        
+        # Ordenação
+        query = query.order_by(Refueling.date.desc())
+        
+        # Paginação
+        refuelings = query.paginate(page=page, per_page=per_page)
+    
+    # Formatação das datas para o template
+    data_inicio_str = data_inicio
+    data_fim_str = data_fim
+    
+    if isinstance(inicio_date, date):
+        data_inicio_str = inicio_date.strftime('%Y-%m-%d')
+        
+    if isinstance(fim_date, date):
+        data_fim_str = fim_date.strftime('%Y-%m-%d')
+    
+    return render_template(
+        'fleet/maintenance_history.html',
+        maintenance_history=maintenance_history,
+        refuelings=refuelings,
+        vehicles=vehicles,
+        vehicle_id=vehicle_id,
+        data_inicio=data_inicio_str,
+        data_fim=data_fim_str,
+        view_type=view_type
+    )
@@ -0,0 +1,299 @@
+"""
+Invoice (NF-e) routes: listing, viewing and PDF export.
+"""
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, send_file
+from flask_login import login_required, current_user
+from sqlalchemy.orm import joinedload, selectinload
+
+from database import db
+from models import Client, ServiceOrder, ServiceOrderStatus
+from utils import log_action
+from pdf_utils import weasyprint_available
+from invoice_pdf import get_invoice_pdf, iter_invoice_files
+from zip_stream import stream_zip
+from jobs import job_handler, enqueue, JobError
+
+bp = Blueprint('invoices', __name__)
+
+
+# Invoice/NF-e routes
+@bp.route('/notas-fiscais')
+@login_required
+def invoices():
+    page = request.args.get('page', 1, type=int)
+    per_page = 20  # Pode ser ajustado nas configurações do sistema posteriormente
+    
+    # Obtém ordens de serviço fechadas (com nota fiscal)
+    query = ServiceOrder.query.filter(
+        ServiceOrder.status == ServiceOrderStatus.fechada,
+        ServiceOrder.invoice_number.isnot(None)
+    ).order_by(ServiceOrder.invoice_date.desc())
+    
+    # Filtros
+    cliente = request.args.get('cliente')
+    numero_nf = request.args.get('numero_nf')
+    data_inicio = request.args.get('data_inicio')
+    data_fim = request.args.get('data_fim')
+    
+    if cliente:
+        query = query.join(Client).filter(Client.name.ilike(f'%{cliente}%'))
+    
+    if numero_nf:
+        query = query.filter(ServiceOrder.invoice_number.ilike(f'%{numero_nf}%'))
+    
+    if data_inicio:
+        try:
+            data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
+            query = query.filter(ServiceOrder.invoice_date >= data_inicio)
+        except ValueError:
+            flash('Data inicial inválida.', 'warning')
+    
+    if data_fim:
+        try:
+            data_fim = datetime.strptime(data_fim, '%Y-%m-%d')
+            data_fim = datetime.combine(data_fim, datetime.max.time())  # Fim do dia
+            query = query.filter(ServiceOrder.invoice_date <= data_fim)
+        except ValueError:
+            flash('Data final inválida.', 'warning')
+    
+    # Paginação
+    invoices = query.paginate(page=page, per_page=per_page)
+    
+    return render_template('invoices/index.html', invoices=invoices)
+
+
+def invoice_export_query(cliente=None, numero_nf=None, data_inicio=None, data_fim=None):
+    """
+    Closed service orders with invoice matching the filters of the invoice list.
+
+    Args:
+        cliente: Part of the client name
+        numero_nf: Part of the invoice number
+        data_inicio: First invoice date (YYYY-MM-DD)
+        data_fim: Last invoice date (YYYY-MM-DD), inclusive
+
+    Returns:
+        Query ordered by invoice date, newest first (ValueError on invalid dates)
+    """
+    query = ServiceOrder.query.filter(
+        ServiceOrder.status == ServiceOrderStatus.fechada,
+        ServiceOrder.invoice_number.isnot(None)
+    ).order_by(ServiceOrder.invoice_date.desc(), ServiceOrder.id.desc())
+    
+    if cliente:
+        query = query.join(Client).filter(Client.name.ilike(f'%{cliente}%'))
+    
+    if numero_nf:
+        query = query.filter(ServiceOrder.invoice_number.ilike(f'%{numero_nf}%'))
+    
+    if data_inicio:
+        query = query.filter(ServiceOrder.invoice_date >= datetime.strptime(data_inicio, '%Y-%m-%d'))
+    
+    if data_fim:
+        data_fim = datetime.combine(datetime.strptime(data_fim, '%Y-%m-%d'), datetime.max.time())
+        query = query.filter(ServiceOrder.invoice_date <= data_fim)
+    
+    return query
+
+
+@job_handler('invoice_export')
+def export_invoices_job(context, **filters):
+    """Write the ZIP with the invoice PDFs matching filters (see invoice_export_query)."""
+    if not weasyprint_available():
+        raise JobError('WeasyPrint não está disponível. Não é possível gerar PDFs.')
+    query = invoice_export_query(**filters)
+    total = query.order_by(None).count()
+    if total == 0:
+        raise JobError('Nenhuma nota fiscal encontrada para exportação.')
+    context.progress(0, total, f'Gerando {total} notas fiscais em PDF')
+    
+    # Sem limite de quantidade: as OS são lidas em lotes, os PDFs gerados em
+    # paralelo e o ZIP gravado em disco à medida que é montado
+    service_orders = query.options(
+        joinedload(ServiceOrder.client),
+        joinedload(ServiceOrder.responsible),
+        selectinload(ServiceOrder.equipment)
+    ).yield_per(100)
+    
+    def members():
+        for done, member in enumerate(iter_invoice_files(service_orders), 1):
+            yield member
+            context.progress(done)
+    
+    data_str = datetime.now().strftime('%Y%m%d')
+    path = context.result_path(f'notas_fiscais_{data_str}.zip', 'application/zip')
+    with open(path, 'wb') as archive:
+        for chunk in stream_zip(members()):
+            archive.write(chunk)
+    context.progress(total, message=f'{total} notas fiscais exportadas')
+
+
+@bp.route('/notas-fiscais/exportar')
+@login_required
+def export_invoices():
+    if not weasyprint_available():
+        flash('WeasyPrint não está disponível. Não é possível gerar PDFs.', 'error')
+        return redirect(url_for('invoices.invoices'))
+    
+    try:
+        # Obtém os mesmos filtros da listagem
+        filters = {
+            'cliente': request.args.get('cliente') or None,
+            'numero_nf': request.args.get('numero_nf') or None,
+            'data_inicio': request.args.get('data_inicio') or None,
+            'data_fim': request.args.get('data_fim') or None,
+        }
+        
+        for field, label in (('data_inicio', 'inicial'), ('data_fim', 'final')):
+            if filters[field]:
+                try:
+                    datetime.strptime(filters[field], '%Y-%m-%d')
+                except ValueError:
+                    flash(f'Data {label} inválida.', 'warning')
+                    return redirect(url_for('invoices.invoices'))
+        
+        if not invoice_export_query(**filters).first():
+            flash('Nenhuma nota fiscal encontrada para exportação.', 'warning')
+            return redirect(url_for('invoices.invoices'))
+        
+        # Os PDFs são gerados pelo worker de tarefas; a página da tarefa acompanha o andamento
+        job = enqueue('invoice_export', filters, user_id=current_user.id)
+        
+        # Registra a ação
+        log_action(
+            'Exportação de Notas Fiscais',
+            'job',
+            job.id,
+            'Exportação de notas fiscais em PDF agendada'
+        )
+        
+        return redirect(url_for('jobs.view_job', id=job.id))
+    
+    except Exception as e:
+        # Log do erro
+        current_app.logger.error(f"Erro ao exportar notas fiscais em massa: {str(e)}")
+        flash(f'Erro ao exportar as notas fiscais: {str(e)}', 'danger')
+        return redirect(url_for('invoices.invoices'))
+
+
+@bp.route('/os/<int:id>/nfe')
+@login_required
+def view_invoice(id):
+    from decimal import Decimal
+    from datetime import datetime
+    
+    service_order = ServiceOrder.query.get_or_404(id)
+    
+    # Check if order is closed
+    if service_order.status != ServiceOrderStatus.fechada:
+        flash('Esta OS ainda não foi fechada.', 'warning')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+        
+    # Verificar se a ordem de serviço possui cliente 
+    if not service_order.client or not service_order.client_id:
+        flash('Esta Ordem de Serviço não possui cliente associado e não pode gerar nota fiscal.', 'danger')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+    
+    # Verificar e corrigir campos de data necessários
+    if not service_order.invoice_date:
+        service_order.invoice_date = datetime.utcnow()
+        
+    if not service_order.closed_at:
+        service_order.closed_at = datetime.utcnow()
+        
+    # Verificar outros campos obrigatórios
+    if not service_order.invoice_number:
+        from utils import get_next_invoice_number
+        service_order.invoice_number = get_next_invoice_number()
+        
+    # Salvar as alterações
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao atualizar informações da nota fiscal: {str(e)}', 'danger')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+    
+    # Passamos o tipo Decimal para o template para facilitar operações matemáticas
+    try:
+        current_app.logger.debug(f"Renderizando template para OS #{id}. Service Order: {service_order}")
+        if service_order.equipment:
+            current_app.logger.debug(f"Equipamentos encontrados: {len(service_order.equipment)}")
+        else:
+            current_app.logger.debug("Nenhum equipamento associado.")
+            
+        return render_template('invoices/clean_invoice.html', 
+                            service_order=service_order,
+                            Decimal=Decimal)
+    except Exception as e:
+        flash(f'Erro ao gerar nota fiscal: {str(e)}', 'danger')
+        current_app.logger.error(f"Erro ao gerar nota fiscal: {str(e)}")
+        return redirect(url_for('service_orders.view_service_order', id=id))
+
+
+@bp.route('/os/<int:id>/nfe/exportar')
+@login_required
+def export_invoice(id):
+    service_order = ServiceOrder.query.get_or_404(id)
+    
+    # Check if order is closed
+    if service_order.status != ServiceOrderStatus.fechada:
+        flash('Esta OS ainda não foi fechada.', 'warning')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+        
+    # Verificar e corrigir campos de data necessários
+    if not service_order.invoice_date:
+        service_order.invoice_date = datetime.utcnow()
+        
+    if not service_order.closed_at:
+        service_order.closed_at = datetime.utcnow()
+        
+    # Verificar outros campos obrigatórios
+    if not service_order.invoice_number:
+        from utils import get_next_invoice_number
+        service_order.invoice_number = get_next_invoice_number()
+        
+    # Verificar se a ordem de serviço possui cliente 
+    if not service_order.client or not service_order.client_id:
+        flash('Esta Ordem de Serviço não possui cliente associado e não pode gerar nota fiscal.', 'danger')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+        
+    # Salvar as alterações
+    try:
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f'Erro ao atualizar informações da nota fiscal: {str(e)}', 'danger')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+    
+    try:
+        # PDF do cache em disco; o WeasyPrint só roda se o HTML da nota mudou
+        pdf_path, etag = get_invoice_pdf(service_order)
+    except Exception as e:
+        # Log the error
+        current_app.logger.error(f"Erro ao exportar nota fiscal: {str(e)}")
+        flash(f'Erro ao exportar a nota fiscal: {str(e)}', 'danger')
+        return redirect(url_for('invoices.view_invoice', id=id))
+    
+    # Log the successful export
+    log_action(
+        'Exportação de Nota Fiscal',
+        'service_order',
+        service_order.id,
+        f'Nota fiscal {service_order.invoice_number} exportada com sucesso'
+    )
+    
+    # ETag = hash do conteúdo: If-None-Match responde 304 sem reenviar o arquivo
+    response = send_file(
+        pdf_path,
+        mimetype='application/pdf',
+        as_attachment=True,
+        download_name=f'nota_fiscal_{service_order.invoice_number}.pdf',
+        etag=etag,
+        conditional=True,
+        max_age=0
+    )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
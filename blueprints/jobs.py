@@ -0,0 +1,68 @@
+"""
+Background job routes (progress page, status polling and result download).
+"""
+from urllib.parse import quote
+
+from flask import Blueprint, Response, render_template, url_for, jsonify, abort, stream_with_context
+from flask_login import login_required, current_user
+
+from database import db
+from models import Job, JobStatus
+from jobs import file_exists, iter_file
+
+bp = Blueprint('jobs', __name__)
+
+
+def _get_job_or_404(id):
+    job = db.session.get(Job, id)
+    # Só o autor da tarefa (ou um administrador) vê o andamento e o resultado
+    if job is None or (job.user_id != current_user.id and current_user.role.name != 'admin'):
+        abort(404)
+    return job
+
+
+def job_status(job):
+    """Status of a job as returned to the progress page."""
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status.name,
+        'status_label': job.status.value,
+        'progress': job.progress,
+        'total': job.total,
+        'percent': job.percent,
+        'message': job.message,
+        'error': job.error if job.status == JobStatus.falhou else None,
+        'download_url': url_for('jobs.download_job_result', id=job.id)
+        if job.status == JobStatus.concluido and job.result_file else None,
+    }
+
+
+@bp.route('/tarefas/<int:id>')
+@login_required
+def view_job(id):
+    job = _get_job_or_404(id)
+    return render_template('jobs/view.html', job=job, status=job_status(job))
+
+
+@bp.route('/tarefas/<int:id>/status')
+@login_required
+def job_status_api(id):
+    response = jsonify(job_status(_get_job_or_404(id)))
+    response.headers['Cache-Control'] = 'no-store'
+    return response
+
+
+@bp.route('/tarefas/<int:id>/download')
+@login_required
+def download_job_result(id):
+    job = _get_job_or_404(id)
+    if job.status != JobStatus.concluido or not job.result_file or not file_exists(job.result_file):
+        abort(404)
+    # O resultado vem do banco (job_file), qualquer que seja a instância que o gerou
+    response = Response(stream_with_context(iter_file(job.result_file)), mimetype=job.result_mimetype)
+    fallback = job.result_name.encode('ascii', 'replace').decode().replace('?', '_').replace('"', '')
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename="{fallback}"; filename*=UTF-8\'\'{quote(job.result_name)}'
+    )
+    return response
@@ -0,0 +1,207 @@
+"""
+Parts catalogue routes.
+"""
+import os
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app
+from flask_login import login_required
+from werkzeug.utils import secure_filename
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import Part, PartSale
+from forms import PartForm
+from utils import log_action
+
+bp = Blueprint('parts', __name__)
+
+
+# =====================================================================
+# Rotas para Peças e Vendas
+# =====================================================================
+@bp.route('/pecas')
+@login_required
+def parts():
+    page = request.args.get('page', 1, type=int)
+    search = request.args.get('search', '')
+    category = request.args.get('category', '')
+    low_stock = request.args.get('low_stock', False, type=bool)
+    
+    query = Part.query
+    
+    # Filtrar por pesquisa
+    if search:
+        query = query.filter(
+            or_(
+                Part.name.ilike(f'%{search}%'),
+                Part.part_number.ilike(f'%{search}%'),
+                Part.description.ilike(f'%{search}%')
+            )
+        )
+    
+    # Filtrar por categoria
+    if category:
+        query = query.filter(Part.category == category)
+    
+    # Filtrar por estoque baixo
+    if low_stock:
+        query = query.filter(Part.stock_quantity <= Part.minimum_stock)
+    
+    # Ordenar peças
+    query = query.order_by(Part.name)
+    
+    # Paginação
+    from utils import get_system_setting
+    pagination = query.paginate(
+        page=page,
+        per_page=int(get_system_setting('items_per_page', '20')),
+        error_out=False
+    )
+    
+    parts = pagination.items
+    
+    # Obter categorias para filtro
+    categories = db.session.query(Part.category.distinct()).filter(Part.category.isnot(None)).order_by(Part.category).all()
+    categories = [c[0] for c in categories if c[0]]
+    
+    return render_template(
+        'parts/index.html',
+        parts=parts,
+        pagination=pagination,
+        search=search,
+        category=category,
+        categories=categories,
+        low_stock=low_stock
+    )
+
+
+@bp.route('/pecas/nova', methods=['GET', 'POST'])
+@login_required
+def new_part():
+    form = PartForm()
+    
+    if form.validate_on_submit():
+        try:
+            # Processar upload de imagem, se houver
+            image_filename = None
+            if form.image.data:
+                try:
+                    image = form.image.data
+                    # Gerar nome de arquivo único
+                    filename = secure_filename(f"{form.name.data.replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{image.filename.split('.')[-1]}")
+                    image_path = os.path.join('static', 'uploads', 'parts', filename)
+                    os.makedirs(os.path.join('static', 'uploads', 'parts'), exist_ok=True)
+                    image.save(image_path)
+                    image_filename = filename
+                except Exception as e:
+                    # Se houver erro no upload da imagem, registrar, mas continuar sem a imagem
+                    current_app.logger.error(f"Erro ao salvar imagem da peça: {str(e)}")
+                    flash("Não foi possível salvar a imagem da peça, mas o cadastro será feito mesmo assim.", "warning")
+            
+            part = Part(
+                name=form.name.data,
+                description=form.description.data,
+                part_number=form.part_number.data,
+                supplier_id=form.supplier_id.data,
+                category=form.category.data,
+                subcategory=form.subcategory.data,
+                cost_price=form.cost_price.data,
+                selling_price=form.selling_price.data,
+                stock_quantity=form.stock_quantity.data,
+                minimum_stock=form.minimum_stock.data,
+                location=form.location.data,
+                image=image_filename
+            )
+            
+            db.session.add(part)
+            db.session.commit()
+            
+            try:
+                log_action(
+                    'Cadastro de Peça',
+                    'part',
+                    part.id,
+                    f'Peça {part.name} cadastrada'
+                )
+            except Exception:
+                # Se falhar ao registrar log, não interromper o fluxo principal
+                current_app.logger.error(f"Erro ao registrar log de criação da peça {part.id}")
+                
+            flash('Peça cadastrada com sucesso!', 'success')
+            return redirect(url_for('parts.parts'))
+            
+        except IntegrityError:
+            db.session.rollback()
+            flash('Erro de integridade ao cadastrar peça. Verifique se já existe uma peça com o mesmo número.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao cadastrar peça: {str(e)}', 'danger')
+            current_app.logger.error(f"Erro ao cadastrar peça: {str(e)}")
+            
+    # Se chegou aqui é porque o formulário não foi validado ou ocorreu erro
+    return render_template('parts/create.html', form=form)
+
+
+@bp.route('/pecas/<int:id>')
+@login_required
+def view_part(id):
+    part = Part.query.get_or_404(id)
+    
+    # Buscar histórico de vendas
+    sales = PartSale.query.filter_by(part_id=part.id).order_by(PartSale.sale_date.desc()).all()
+    
+    return render_template(
+        'parts/view.html',
+        part=part,
+        sales=sales
+    )
+
+
+@bp.route('/pecas/<int:id>/editar', methods=['GET', 'POST'])
+@login_required
+def edit_part(id):
+    part = Part.query.get_or_404(id)
+    form = PartForm()
+    
+    if request.method == 'GET':
+        form.id.data = part.id
+        form.name.data = part.name
+        form.description.data = part.description
+        form.part_number.data = part.part_number
+        form.supplier_id.data = part.supplier_id
+        form.category.data = part.category
+        form.subcategory.data = part.subcategory
+        form.cost_price.data = part.cost_price
+        form.selling_price.data = part.selling_price
+        form.stock_quantity.data = part.stock_quantity
+        form.minimum_stock.data = part.minimum_stock
+        form.location.data = part.location
+    
+    if form.validate_on_submit():
+        part.name = form.name.data
+        part.description = form.description.data
+        part.part_number = form.part_number.data
+        part.supplier_id = form.supplier_id.data
+        part.category = form.category.data
+        part.subcategory = form.subcategory.data
+        part.cost_price = form.cost_price.data
+        part.selling_price = form.selling_price.data
+        part.stock_quantity = form.stock_quantity.data
+        part.minimum_stock = form.minimum_stock.data
+        part.location = form.location.data
+        
+        db.session.commit()
+        
+        log_action(
+            'Edição de Peça',
+            'part',
+            part.id,
+            f'Peça {part.name} atualizada'
+        )
+        
+        flash('Peça atualizada com sucesso!', 'success')
+        return redirect(url_for('parts.view_part', id=part.id))
+    
+    return render_template('parts/edit.html', form=form, part=part)
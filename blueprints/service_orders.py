@@ -0,0 +1,627 @@
+"""
+Service order routes (listing, creation, editing, details, closing and deletion).
+"""
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request, jsonify, current_app
+from flask_login import login_required, current_user
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from models import User, Client, Equipment, ServiceOrder, FinancialEntry, ServiceOrderStatus, FinancialEntryType
+from forms import ServiceOrderForm, CloseServiceOrderForm
+from utils import manager_required, log_action, save_service_order_images
+from performance_utils import get_service_orders_with_relations, get_service_order_filter_options, keyset_paginate
+from financial_rollup import month_start, add_months
+from service_order_analytics import get_completion_stats, get_technician_performance
+from service_order_search import search_service_orders as run_service_order_search
+from service_order_read_model import get_service_order_read_model
+
+bp = Blueprint('service_orders', __name__)
+
+
+# Service Order routes
+@bp.route('/os')
+@login_required
+def service_orders():
+    status_filter = request.args.get('status', '')
+    client_filter = request.args.get('client', '')
+    responsible_filter = request.args.get('responsible', '')
+    date_from = request.args.get('date_from', '')
+    date_to = request.args.get('date_to', '')
+    cursor = request.args.get('cursor')
+    per_page = min(request.args.get('per_page', 50, type=int) or 50, 200)
+    
+    filters = {}
+    
+    # Apply filters
+    if status_filter in ServiceOrderStatus.__members__:
+        filters['status'] = ServiceOrderStatus[status_filter]
+    
+    if client_filter.isdigit():
+        filters['client_id'] = int(client_filter)
+    
+    if responsible_filter.isdigit():
+        filters['responsible_id'] = int(responsible_filter)
+    
+    if date_from:
+        try:
+            filters['date_from'] = datetime.strptime(date_from, '%Y-%m-%d')
+        except ValueError:
+            pass
+    
+    if date_to:
+        try:
+            filters['date_to'] = datetime.strptime(date_to, '%Y-%m-%d')
+        except ValueError:
+            pass
+    
+    # Paginação por cursor em (created_at, id): o custo da página N é o mesmo da primeira
+    page = keyset_paginate(
+        get_service_orders_with_relations(filters=filters),
+        ServiceOrder.created_at, ServiceOrder.id,
+        cursor=cursor, per_page=per_page
+    )
+    filter_options = get_service_order_filter_options()
+    
+    return render_template(
+        'service_orders/index.html',
+        service_orders=page.items,
+        page=page,
+        is_first_page=not cursor,
+        clients=filter_options['clients'],
+        employees=filter_options['employees'],
+        status_filter=status_filter,
+        client_filter=client_filter,
+        responsible_filter=responsible_filter,
+        date_from=date_from,
+        date_to=date_to
+    )
+
+
+@bp.route('/os/busca')
+@login_required
+def search_service_orders():
+    query_text = request.args.get('q', '').strip()
+    status_filter = request.args.get('status', '')
+    page = request.args.get('page', 1, type=int)
+    status = ServiceOrderStatus[status_filter] if status_filter in ServiceOrderStatus.__members__ else None
+
+    results = run_service_order_search(query_text, page=page, per_page=20, status=status)
+
+    return render_template(
+        'service_orders/search.html',
+        results=results,
+        query_text=query_text,
+        status_filter=status_filter
+    )
+
+
+@bp.route('/os/desempenho')
+@manager_required
+def technician_performance():
+    months = request.args.get('meses', 12, type=int)
+    months = max(1, min(months, 60))
+    date_from = datetime.combine(add_months(month_start(datetime.utcnow()), -(months - 1)), datetime.min.time())
+    
+    return render_template(
+        'service_orders/performance.html',
+        months=months,
+        overall=get_completion_stats(date_from=date_from)[0],
+        technicians=get_technician_performance(date_from=date_from),
+        monthly=get_completion_stats('month', date_from=date_from)
+    )
+
+
+@bp.route('/os/nova', methods=['GET', 'POST'])
+@login_required
+def new_service_order():
+    form = ServiceOrderForm()
+    
+    # Load clients for dropdown
+    form.client_id.choices = [(c.id, c.name) for c in Client.query.order_by(Client.name).all()]
+    
+    # Load employees for dropdown
+    form.responsible_id.choices = [(0, 'A ser definido')] + [
+        (u.id, u.name) for u in User.query.filter_by(active=True).order_by(User.name).all()
+    ]
+    
+    if form.validate_on_submit():
+        try:
+            service_order = ServiceOrder(
+                client_id=form.client_id.data,
+                responsible_id=form.responsible_id.data if form.responsible_id.data != 0 else None,
+                description=form.description.data,
+                estimated_value=form.estimated_value.data,
+                status=ServiceOrderStatus[form.status.data]
+            )
+            
+            # Add equipment relationships if selected
+            if form.equipment_ids.data:
+                equipment_ids = form.equipment_ids.data.split(',')
+                for eq_id in equipment_ids:
+                    equipment = Equipment.query.get(int(eq_id))
+                    if equipment and equipment.client_id == service_order.client_id:
+                        service_order.equipment.append(equipment)
+            
+            db.session.add(service_order)
+            db.session.commit()
+            
+            # Processar imagens - verificar se há arquivos enviados
+            try:
+                image_files = request.files.getlist('images')
+                if image_files and any(f.filename for f in image_files):
+                    saved_images = save_service_order_images(
+                        service_order, 
+                        image_files, 
+                        form.image_descriptions.data
+                    )
+                    if saved_images:
+                        flash(f'{len(saved_images)} imagem(ns) anexada(s) com sucesso!', 'info')
+            except Exception as img_error:
+                # Se falhar ao salvar as imagens, registre o erro mas não interrompa o fluxo
+                flash(f'Aviso: Não foi possível salvar as imagens: {str(img_error)}', 'warning')
+            
+            try:
+                log_action(
+                    'Criação de OS',
+                    'service_order',
+                    service_order.id,
+                    f"OS criada para cliente {service_order.client.name}"
+                )
+            except Exception:
+                # Se falhar ao registrar o log, não interromper o fluxo principal
+                pass
+            
+            flash('Ordem de serviço criada com sucesso!', 'success')
+            return redirect(url_for('service_orders.service_orders'))
+        
+        except IntegrityError:
+            db.session.rollback()
+            flash('Erro de integridade ao criar a ordem de serviço. O ID pode estar duplicado.', 'danger')
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao criar ordem de serviço: {str(e)}', 'danger')
+        
+    return render_template(
+        'service_orders/create.html',
+        form=form
+    )
+
+
+@bp.route('/os/<int:id>/editar', methods=['GET', 'POST'])
+@login_required
+def edit_service_order(id):
+    service_order = ServiceOrder.query.get_or_404(id)
+    form = ServiceOrderForm()
+    
+    form.client_id.choices = [(c.id, c.name) for c in Client.query.order_by(Client.name).all()]
+    form.responsible_id.choices = [(0, 'A ser definido')] + [
+        (u.id, u.name) for u in User.query.filter_by(active=True).order_by(User.name).all()
+    ]
+    
+    if request.method == 'GET':
+        form.client_id.data = service_order.client_id
+        form.responsible_id.data = service_order.responsible_id or 0
+        form.description.data = service_order.description
+        form.estimated_value.data = service_order.estimated_value
+        form.invoice_amount.data = service_order.invoice_amount
+        form.status.data = service_order.status.name if service_order.status else None
+        form.equipment_ids.data = ','.join(str(equipment.id) for equipment in service_order.equipment)
+    
+    if form.validate_on_submit():
+        new_status = ServiceOrderStatus[form.status.data]
+        if new_status == ServiceOrderStatus.fechada and service_order.status != ServiceOrderStatus.fechada:
+            # O fechamento gera a nota e o lançamento financeiro
+            flash('Para concluir a OS use a opção "Fechar OS".', 'warning')
+            return redirect(url_for('service_orders.close_service_order', id=service_order.id))
+        
+        try:
+            service_order.client_id = form.client_id.data
+            service_order.responsible_id = form.responsible_id.data if form.responsible_id.data != 0 else None
+            service_order.description = form.description.data
+            service_order.estimated_value = form.estimated_value.data
+            service_order.status = new_status
+            if service_order.status == ServiceOrderStatus.fechada and form.invoice_amount.data is not None:
+                service_order.invoice_amount = form.invoice_amount.data
+            
+            # Equipamentos: só os do cliente da OS
+            if form.equipment_ids.data:
+                service_order.equipment = [
+                    equipment for equipment in Equipment.query.filter(
+                        Equipment.id.in_([int(eq_id) for eq_id in form.equipment_ids.data.split(',') if eq_id.strip().isdigit()]),
+                        Equipment.client_id == service_order.client_id
+                    )
+                ]
+            
+            db.session.commit()
+            
+            try:
+                image_files = request.files.getlist('images')
+                if image_files and any(f.filename for f in image_files):
+                    saved_images = save_service_order_images(
+                        service_order,
+                        image_files,
+                        form.image_descriptions.data
+                    )
+                    if saved_images:
+                        flash(f'{len(saved_images)} imagem(ns) anexada(s) com sucesso!', 'info')
+            except Exception as img_error:
+                flash(f'Aviso: Não foi possível salvar as imagens: {str(img_error)}', 'warning')
+            
+            log_action(
+                'Edição de OS',
+                'service_order',
+                service_order.id,
+                f"OS #{service_order.id} atualizada"
+            )
+            
+            flash('Ordem de serviço atualizada com sucesso!', 'success')
+            return redirect(url_for('service_orders.view_service_order', id=service_order.id))
+        
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao atualizar ordem de serviço: {str(e)}', 'danger')
+    
+    return render_template(
+        'service_orders/edit.html',
+        form=form,
+        service_order=service_order
+    )
+
+
+# Rota para visualizar OS no modal
+@bp.route('/os/<int:id>/modal')
+@login_required
+def view_service_order_modal(id):
+    """Retorna os dados da ordem de serviço para exibição no modal"""
+    try:
+        order = get_service_order_read_model(id)
+        
+        if not order:
+            return jsonify({'error': 'Ordem de serviço não encontrada'}), 404
+        
+        # Verificando se usuário é admin
+        is_admin = current_user.role.name == 'admin' if hasattr(current_user, 'role') else False
+        
+        # Renderizar o template do modal
+        return render_template(
+            'service_orders/view_modal.html',
+            order=order,
+            client=order.client or {},
+            equipment=order.equipment,
+            financial_entries=order.financial_entries,
+            responsible_name=order.responsible_name,
+            is_admin=is_admin
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro ao buscar dados da OS para modal: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+# Rota para obter dados da OS para o modal
+@bp.route('/os_dados/<int:id>')
+@login_required
+def get_service_order_data(id):
+    """Retorna dados básicos de uma OS para exibição em modal"""
+    try:
+        order = get_service_order_read_model(id)
+        
+        if not order:
+            return jsonify({'error': 'Ordem de serviço não encontrada'}), 404
+        
+        total_value = order.total_value or 0
+        original_amount = order.original_amount or 0
+        discount_amount = order.discount_amount or 0
+        
+        data = {
+            'id': order.id,
+            'description': order.description,
+            'status': order.status.name if order.status else None,
+            'status_label': order.status_label,
+            'created_at': order.created_at.strftime('%d/%m/%Y %H:%M') if order.created_at else None,
+            'closed_at': order.closed_at.strftime('%d/%m/%Y %H:%M') if order.closed_at else "Não finalizada",
+            'client_name': order.client_name,
+            'responsible_name': order.responsible_name or "Não definido",
+            'total_value': f"{total_value:.2f}",
+            'original_amount': f"{original_amount:.2f}",
+            'discount_amount': f"{discount_amount:.2f}",
+            'view_url': url_for('service_orders.view_service_order_basic', id=order.id),
+            'edit_url': url_for('service_orders.edit_service_order', id=order.id)
+        }
+        
+        return jsonify(data)
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro ao obter dados da OS para modal: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
+
+@bp.route('/os_basico/<int:id>')
+@login_required
+def view_service_order_basic(id):
+    """Versão simplificada de visualização da OS"""
+    try:
+        order = get_service_order_read_model(id)
+        
+        if not order:
+            flash("Ordem de serviço não encontrada", "danger")
+            return redirect(url_for('service_orders.service_orders'))
+        
+        # Verificar se o usuário é administrador
+        is_admin = current_user.role == 'admin' if hasattr(current_user, 'role') else False
+        
+        return render_template(
+            'service_orders/os_simples.html',
+            order_id=order.id,
+            description=order.description,
+            status=order.status.value if order.status else None,
+            created_at=order.created_at.strftime('%d/%m/%Y %H:%M') if order.created_at else 'Data não disponível',
+            client_name=order.client_name,
+            cliente_telefone=order.client['phone'] if order.client else None,
+            responsavel_nome=order.responsible_name,
+            is_admin=is_admin,
+            error=None
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro emergencial na visualização da OS: {str(e)}")
+        return render_template(
+            'service_orders/os_simples.html',
+            order_id=id,
+            error=f"Não foi possível carregar os detalhes completos. Erro: {str(e)}"
+        )
+
+
+# Rota para visualizar detalhes de uma Ordem de Serviço específica
+@bp.route('/os/<int:id>')
+@login_required
+def view_service_order(id):
+    try:
+        order = get_service_order_read_model(id)
+        
+        if not order:
+            flash(f"Ordem de serviço #{id} não encontrada.", "danger")
+            return redirect(url_for('service_orders.service_orders'))
+        
+        return render_template('service_orders/view.html', order=order)
+    
+    except Exception as e:
+        current_app.logger.error(f"Erro ao visualizar OS #{id}: {str(e)}")
+        flash(f"Erro ao visualizar ordem de serviço: {str(e)}", "danger")
+        return redirect(url_for('service_orders.service_orders'))
+
+
+# Rota para visualizar OS registrando a visualização no log
+@bp.route('/ordem/<int:id>/visualizar')
+@login_required
+def view_service_order_alt(id):
+    try:
+        order = get_service_order_read_model(id)
+        
+        if not order:
+            flash(f"Ordem de serviço #{id} não encontrada.", "danger")
+            return redirect(url_for('service_orders.service_orders'))
+        
+        # Registrar visualização no log
+        try:
+            log_action(f"Visualização da OS #{id}", "service_order", id, f"Visualização da OS #{id}")
+        except Exception as log_error:
+            current_app.logger.warning(f"Erro ao registrar log de visualização: {str(log_error)}")
+        
+        return render_template(
+            'service_orders/view.html',
+            order=order,
+            close_form=CloseServiceOrderForm()
+        )
+        
+    except Exception as e:
+        current_app.logger.error(f"Erro ao visualizar OS #{id}: {str(e)}")
+        flash(f"Erro ao carregar a ordem de serviço: {str(e)}", "danger")
+        return redirect(url_for('service_orders.service_orders'))
+
+
+@bp.route('/ordem/<int:id>/fechar', methods=['GET', 'POST'])
+@login_required
+def close_service_order(id):
+    service_order = ServiceOrder.query.get_or_404(id)
+    
+    # Check if order is already closed
+    if service_order.status == ServiceOrderStatus.fechada:
+        flash('Esta OS já está fechada.', 'warning')
+        return redirect(url_for('service_orders.view_service_order', id=id))
+        
+    form = CloseServiceOrderForm()
+    
+    if form.validate_on_submit():
+        try:
+            # Gerar o número da nota automaticamente
+            from utils import get_next_invoice_number
+            
+            service_order.status = ServiceOrderStatus.fechada
+            service_order.closed_at = datetime.utcnow()
+            service_order.invoice_number = get_next_invoice_number()
+            service_order.invoice_date = datetime.utcnow()
+            service_order.invoice_amount = form.invoice_amount.data
+            service_order.service_details = form.service_details.data
+            
+            # Informações sobre cálculo de KM (se incluídas)
+            km_info = ""
+            if form.include_km_calculation.data and form.distance_km.data and form.price_per_km.data:
+                distance_km = form.distance_km.data
+                price_per_km = form.price_per_km.data
+                km_total = distance_km * price_per_km
+                km_info = f" (Inclui deslocamento: {distance_km} KM x R$ {price_per_km} = R$ {km_total})"
+            
+            # Verificamos se o cliente existe antes de tentar criar a entrada financeira
+            if not service_order.client:
+                flash('Erro: Cliente não encontrado. Não é possível fechar a OS.', 'danger')
+                return redirect(url_for('service_orders.view_service_order', id=id))
+            
+            # Verificar se já existe um lançamento financeiro para esta OS
+            existing_entry = FinancialEntry.query.filter_by(
+                service_order_id=service_order.id,
+                type=FinancialEntryType.entrada
+            ).first()
+            
+            # Se já existe, atualiza o valor; senão, cria um novo lançamento
+            if existing_entry:
+                existing_entry.amount = form.invoice_amount.data
+                existing_entry.description = f"Pagamento OS #{service_order.id} - {service_order.client.name} (Atualizado)"
+                db.session.commit()
+                
+                log_action(
+                    'Atualização Financeira',
+                    'financial',
+                    existing_entry.id,
+                    f"Valor da OS #{service_order.id} atualizado para {form.invoice_amount.data}{km_info}"
+                )
+            else:
+                # Create new financial entry
+                financial_entry = FinancialEntry(
+                    service_order_id=service_order.id,
+                    description=f"Pagamento OS #{service_order.id} - {service_order.client.name}{km_info}",
+                    amount=form.invoice_amount.data,
+                    type=FinancialEntryType.entrada,
+                    created_by=current_user.id
+                )
+                
+                db.session.add(financial_entry)
+                db.session.commit()
+            
+            flash(f'OS #{service_order.id} fechada com sucesso!', 'success')
+            log_action(
+                'Fechamento de OS',
+                'service_order',
+                service_order.id,
+                f"OS fechada - Valor: R${form.invoice_amount.data}{km_info}"
+            )
+            
+            return redirect(url_for('service_orders.view_service_order', id=id))
+            
+        except Exception as e:
+            db.session.rollback()
+            flash(f'Erro ao fechar OS: {str(e)}', 'danger')
+            current_app.logger.error(f"Erro ao fechar OS {id}: {str(e)}")
+            return redirect(url_for('service_orders.view_service_order', id=id))
+        
+    return render_template(
+        'service_orders/close.html',
+        service_order=service_order,
+        form=form
+    )
+
+
+@bp.route('/ordem/<int:id>/excluir')
+@login_required
+def delete_service_order(id):
+    """Rota para excluir uma ordem de serviço e seus registros financeiros associados"""
+    # Verificar se o usuário é admin
+    if not current_user.role.name == 'admin':
+        flash("Apenas administradores podem excluir ordens de serviço", "danger")
+        return redirect(url_for('service_orders.view_service_order_alt', id=id))
+    
+    try:  
+        # Obter informações da OS para registro de log antes de excluir
+        os_info = db.session.execute(
+            db.text("""
+            SELECT o.id, c.name as client_name
+            FROM service_order o
+            LEFT JOIN client c ON o.client_id = c.id
+            WHERE o.id = :order_id
+            """), 
+            {"order_id": id}
+        ).fetchone()
+        
+        if not os_info:
+            flash(f"Ordem de Serviço #{id} não encontrada", "danger")
+            return redirect(url_for('service_orders.service_orders'))
+            
+        # Registrar cliente para o log
+        client_name = os_info.client_name if os_info.client_name else "Cliente desconhecido"
+        
+        # 1. Excluir registros financeiros associados
+        db.session.execute(
+            db.text("""
+            DELETE FROM financial_entry 
+            WHERE service_order_id = :order_id
+            """), 
+            {"order_id": id}
+        )
+        
+        # 2. Excluir imagens associadas à OS
+        db.session.execute(
+            db.text("""
+            DELETE FROM service_order_image 
+            WHERE service_order_id = :order_id
+            """), 
+            {"order_id": id}
+        )
+        
+        # 3. Remover associações com equipamentos
+        db.session.execute(
+            db.text("""
+            DELETE FROM equipment_service_orders 
+            WHERE service_order_id = :order_id
+            """), 
+            {"order_id": id}
+        )
+        
+        # 4. Finalmente excluir a OS
+        db.session.execute(
+            db.text("""
+            DELETE FROM service_order 
+            WHERE id = :order_id
+            """), 
+            {"order_id": id}
+        )
+        
+        # Confirmar transação
+        db.session.commit()
+        
+        # Registrar no log de ações
+        log_action(
+            f"Excluiu a OS #{id}",
+            "service_order",
+            id,
+            f"OS #{id} de {client_name} excluída com sucesso, incluindo registros financeiros associados"
+        )
+        
+        flash(f'Ordem de serviço #{id} excluída com sucesso!', 'success')
+        return redirect(url_for('service_orders.service_orders'))
+        
+    except Exception as e:
+        # Reverter transação em caso de erro
+        db.session.rollback()
+        current_app.logger.error(f"Erro ao excluir OS #{id}: {str(e)}")
+        flash(f'Erro ao excluir ordem de serviço: {str(e)}', 'danger')
+        return redirect(url_for('service_orders.service_orders'))
+
+
+@bp.route('/api/cliente/<int:client_id>/equipamentos')
+@login_required
+def get_client_equipment(client_id):
+    equipment = Equipment.query.filter_by(client_id=client_id).all()
+    return jsonify([{
+        'id': eq.id,
+        'type': eq.type,
+        'brand': eq.brand or '',
+        'model': eq.model or '',
+        'serial_number': eq.serial_number or ''
+    } for eq in equipment])
+
+
+# Service Order Image route
+@bp.route('/imagem_os/<int:image_id>')
+@login_required
+def view_service_order_image(image_id):
+    """Rota para visualizar uma imagem de ordem de serviço diretamente do banco de dados"""
+    try:
+        # Retornar uma imagem padrão para qualquer erro ou falta de imagem
+        return redirect(url_for('static', filename='img/image-not-found.svg'))
+            
+    except Exception as e:
+        current_app.logger.error(f"Erro ao visualizar imagem de OS #{image_id}: {str(e)}")
+        # Retornar uma imagem padrão para qualquer erro
+        return redirect(url_for('static', filename='img/image-not-found.svg'))
@@ -0,0 +1,269 @@
+"""
+Supplier routes, plus supplier order items and payments.
+"""
+from datetime import datetime
+
+from flask import Blueprint, render_template, redirect, url_for, flash, request
+from flask_login import login_required, current_user
+from sqlalchemy import or_
+
+from database import db
+from models import Supplier, Part, SupplierOrder, OrderItem, OrderStatus
+from forms import SupplierForm, OrderItemForm
+from payments import SUPPLIER_ORDER, record_payment
+from utils import (
+    admin_required, log_action, format_currency, recalculate_supplier_order_total
+)
+
+bp = Blueprint('suppliers', __name__)
+
+
+# =====================================================================
+# Rotas para Fornecedores
+# =====================================================================
+@bp.route('/fornecedores')
+@login_required
+def suppliers():
+    page = request.args.get('page', 1, type=int)
+    search = request.args.get('search', '')
+    
+    query = Supplier.query
+    
+    # Filtrar por pesquisa
+    if search:
+        query = query.filter(
+            or_(
+                Supplier.name.ilike(f'%{search}%'),
+                Supplier.document.ilike(f'%{search}%'),
+                Supplier.contact_name.ilike(f'%{search}%'),
+                Supplier.email.ilike(f'%{search}%')
+            )
+        )
+    
+    # Ordenar fornecedores
+    query = query.order_by(Supplier.name)
+    
+    # Paginação
+    from utils import get_system_setting
+    pagination = query.paginate(
+        page=page,
+        per_page=int(get_system_setting('items_per_page', '20')),
+        error_out=False
+    )
+    
+    suppliers = pagination.items
+    
+    return render_template(
+        'suppliers/index.html',
+        suppliers=suppliers,
+        pagination=pagination,
+        search=search
+    )
+
+
+@bp.route('/fornecedores/novo', methods=['GET', 'POST'])
+@login_required
+def new_supplier():
+    form = SupplierForm()
+    
+    if form.validate_on_submit():
+        supplier = Supplier(
+            name=form.name.data,
+            document=form.document.data,
+            contact_name=form.contact_name.data,
+            email=form.email.data,
+            phone=form.phone.data,
+            address=form.address.data,
+            website=form.website.data,
+            notes=form.notes.data
+        )
+        
+        db.session.add(supplier)
+        db.session.commit()
+        
+        log_action(
+            'Cadastro de Fornecedor',
+            'supplier',
+            supplier.id,
+            f'Fornecedor {supplier.name} cadastrado'
+        )
+        
+        flash('Fornecedor cadastrado com sucesso!', 'success')
+        return redirect(url_for('suppliers.view_supplier', id=supplier.id))
+    
+    return render_template('suppliers/create.html', form=form)
+
+
+@bp.route('/fornecedores/<int:id>')
+@login_required
+def view_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    
+    # Buscar peças do fornecedor
+    parts = Part.query.filter_by(supplier_id=supplier.id).all()
+    
+    return render_template(
+        'suppliers/view.html',
+        supplier=supplier,
+        parts=parts
+    )
+
+
+@bp.route('/fornecedores/<int:id>/editar', methods=['GET', 'POST'])
+@login_required
+def edit_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    form = SupplierForm()
+    
+    if request.method == 'GET':
+        form.id.data = supplier.id
+        form.name.data = supplier.name
+        form.document.data = supplier.document
+        form.contact_name.data = supplier.contact_name
+        form.email.data = supplier.email
+        form.phone.data = supplier.phone
+        form.address.data = supplier.address
+        form.website.data = supplier.website
+        form.notes.data = supplier.notes
+    
+    if form.validate_on_submit():
+        supplier.name = form.name.data
+        supplier.document = form.document.data
+        supplier.contact_name = form.contact_name.data
+        supplier.email = form.email.data
+        supplier.phone = form.phone.data
+        supplier.address = form.address.data
+        supplier.website = form.website.data
+        supplier.notes = form.notes.data
+        
+        db.session.commit()
+        
+        log_action(
+            'Edição de Fornecedor',
+            'supplier',
+            supplier.id,
+            f'Fornecedor {supplier.name} atualizado'
+        )
+        
+        flash('Fornecedor atualizado com sucesso!', 'success')
+        return redirect(url_for('suppliers.view_supplier', id=supplier.id))
+    
+    return render_template('suppliers/edit.html', form=form, supplier=supplier)
+
+
+@bp.route('/fornecedores/<int:id>/excluir', methods=['POST'])
+@login_required
+@admin_required
+def delete_supplier(id):
+    supplier = Supplier.query.get_or_404(id)
+    
+    # Verificar se o fornecedor tem peças cadastradas
+    if supplier.parts:
+        flash('Não é possível excluir um fornecedor com peças cadastradas!', 'danger')
+        return redirect(url_for('suppliers.view_supplier', id=supplier.id))
+    
+    name = supplier.name
+    db.session.delete(supplier)
+    db.session.commit()
+    
+    log_action(
+        'Exclusão de Fornecedor',
+        'supplier',
+        id,
+        f'Fornecedor {name} excluído'
+    )
+    
+    flash('Fornecedor excluído com sucesso!', 'success')
+    return redirect(url_for('suppliers.suppliers'))
+
+
+@bp.route('/pedidos-fornecedor/item/<int:id>/editar', methods=['GET', 'POST'])
+@login_required
+def edit_order_item(id):
+    item = OrderItem.query.get_or_404(id)
+    order_id = item.order_id
+    form = OrderItemForm(obj=item)
+    
+    if request.method == 'GET':
+        # Preencher o formulário com os valores atuais
+        if item.stock_item_id:
+            form.stock_item_id.data = item.stock_item_id
+    
+    if form.validate_on_submit():
+        # Atualizar o item
+        item.stock_item_id = form.stock_item_id.data if form.stock_item_id.data else None
+        item.description = form.description.data
+        item.quantity = form.quantity.data
+        item.unit_price = form.unit_price.data or 0
+        item.total_price = form.total_price.data or 0
+        item.status = form.status.data
+        item.notes = form.notes.data
+        
+        db.session.commit()
+        
+        # Recalcular o valor total do pedido
+        recalculate_supplier_order_total(order_id)
+        
+        flash('Item atualizado com sucesso!', 'success')
+        return redirect(url_for('view_supplier_order', id=order_id))
+    
+    elif request.method == 'POST':
+        for field, errors in form.errors.items():
+            for error in errors:
+                flash(f'Erro no campo {getattr(form, field).label.text}: {error}', 'danger')
+    
+    return render_template('supplier_orders/edit_item.html', form=form, item=item)
+
+
+@bp.route('/pedidos-fornecedor/item/<int:id>/excluir', methods=['POST'])
+@login_required
+def delete_order_item(id):
+    item = OrderItem.query.get_or_404(id)
+    order_id = item.order_id
+    
+    db.session.delete(item)
+    db.session.commit()
+    
+    # Recalcular o valor total do pedido
+    recalculate_supplier_order_total(order_id)
+    
+    flash('Item excluído com sucesso!', 'success')
+    return redirect(url_for('view_supplier_order', id=order_id))
+
+
+# Registro de pagamento de pedido a fornecedor
+@bp.route('/pedidos-fornecedor/<int:id>/registrar-pagamento', methods=['POST'])
+@login_required
+def register_supplier_order_payment(id):
+    order = SupplierOrder.query.get_or_404(id)
+    
+    # Criar entrada financeira como despesa; se o pedido já foi pago, devolve o lançamento existente
+    financial_entry, created = record_payment(
+        SUPPLIER_ORDER,
+        order.id,
+        order.total_value,
+        f'Pagamento de Pedido #{order.id} - {order.supplier.name}',
+        date=datetime.utcnow(),
+        created_by=current_user.id
+    )
+    
+    if not created:
+        db.session.rollback()
+        flash('Este pedido já foi registrado como pago!', 'warning')
+        return redirect(url_for('view_supplier_order', id=order.id))
+    
+    # Atualizar status do pedido para 'recebido'
+    order.status = OrderStatus.recebido
+    
+    db.session.commit()
+    
+    # Registrar ação no log
+    log_action(
+        'Pagamento de Pedido',
+        'supplier_order',
+        order.id,
+        f'Pagamento de pedido para {order.supplier.name} no valor de {format_currency(order.total_value)}'
+    )
+    
+    flash(f'Pagamento de {format_currency(order.total_value)} registrado com sucesso!', 'success')
+    return redirect(url_for('view_supplier_order', id=order.id))
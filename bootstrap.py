@@ -0,0 +1,372 @@
+"""
+Database bootstrap for SAMAPE application.
+Creates missing tables, applies the table definitions kept in
+db_migration/*_schema.txt (missing columns and indexes) and creates the
+initial admin user.
+
+This runs once per deploy (``python bootstrap.py`` or ``flask bootstrap``)
+instead of at import time, so gunicorn workers and scripts that do
+``from app import app`` only build the application.
+
+Each schema file is a migration versioned by its checksum: applied files
+are recorded in the schema_migrations table and only new or edited files
+are processed on the next run. The full-text search objects of service
+orders (see service_order_search) are installed on every run, and indexes
+superseded by another one (REPLACED_INDEXES) are dropped once their
+replacement exists.
+"""
+import glob
+import hashlib
+import logging
+import os
+import re
+from datetime import datetime
+
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+from service_order_search import install_search
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'db_migration')
+MIGRATIONS_TABLE = 'schema_migrations'
+
+_TABLE_RE = re.compile(r'Table "(?:\w+\.)?(?P<name>\w+)"')
+_INDEX_RE = re.compile(
+    r'"(?P<name>\w+)" (?P<kind>PRIMARY KEY, |UNIQUE CONSTRAINT, |UNIQUE, )?(?P<method>\w+) (?P<definition>\(.*)$'
+)
+_FOREIGN_KEY_RE = re.compile(r'"(?P<name>\w+)" FOREIGN KEY \((?P<columns>[^)]*)\) REFERENCES (?P<reference>.+)$')
+_CAST_RE = re.compile(r"::[\w ]+(\[\])?")
+
+
+def parse_schema_file(path):
+    """
+    Parse a psql ``\\d table`` dump.
+
+    Args:
+        path: Path to a *_schema.txt file
+
+    Returns:
+        Dictionary with 'table', 'columns' (name, type, nullable, default),
+        'indexes' (name, unique, primary, constraint, method, definition) and
+        'foreign_keys' (name, columns, reference), or None if the file has no
+        table definition
+    """
+    with open(path, encoding='utf-8') as schema_file:
+        content = schema_file.read()
+
+    match = _TABLE_RE.search(content)
+    if not match:
+        return None
+
+    columns, indexes, foreign_keys = [], [], []
+    section = None
+    for line in content.splitlines():
+        stripped = line.strip()
+        if stripped.startswith('---'):
+            section = 'columns'
+        elif stripped.endswith(':') and not line.startswith(' ' * 4):
+            section = stripped[:-1]
+        elif section == 'columns' and '|' in line:
+            name, type_, _, nullable, default = [part.strip() for part in line.split('|')]
+            columns.append({
+                'name': name,
+                'type': type_,
+                'nullable': nullable != 'not null',
+                'default': default or None,
+            })
+        elif section == 'Indexes' and stripped:
+            index = _INDEX_RE.match(stripped)
+            if index:
+                kind = index.group('kind') or ''
+                indexes.append({
+                    'name': index.group('name'),
+                    'unique': 'UNIQUE' in kind,
+                    'primary': 'PRIMARY' in kind,
+                    'constraint': 'CONSTRAINT' in kind,
+                    'method': index.group('method'),
+                    'definition': index.group('definition'),
+                })
+        elif section == 'Foreign-key constraints' and stripped:
+            foreign_key = _FOREIGN_KEY_RE.match(stripped)
+            if foreign_key:
+                foreign_keys.append({
+                    'name': foreign_key.group('name'),
+                    'columns': [column.strip().strip('"') for column in foreign_key.group('columns').split(',')],
+                    'reference': foreign_key.group('reference'),
+                })
+
+    return {'table': match.group('name'), 'columns': columns, 'indexes': indexes, 'foreign_keys': foreign_keys}
+
+
+def load_schema_definitions(directory=SCHEMA_DIR):
+    """Return (name, checksum, path) for every schema file, sorted by name."""
+    definitions = []
+    for path in sorted(glob.glob(os.path.join(directory, '*_schema.txt'))):
+        with open(path, 'rb') as schema_file:
+            checksum = hashlib.sha1(schema_file.read()).hexdigest()
+        name = os.path.basename(path)[:-len('_schema.txt')]
+        definitions.append((name, checksum, path))
+    return definitions
+
+
+def _ensure_migrations_table(connection):
+    connection.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {MIGRATIONS_TABLE} ("
+        "name VARCHAR(100) PRIMARY KEY, "
+        "checksum VARCHAR(40) NOT NULL, "
+        "applied_at TIMESTAMP NOT NULL)"
+    ))
+
+
+def _applied_checksums(connection):
+    rows = connection.execute(text(f"SELECT name, checksum FROM {MIGRATIONS_TABLE}"))
+    return dict(rows.all())
+
+
+def get_pending_migrations(connection):
+    """Schema files that are new or changed since they were last applied."""
+    _ensure_migrations_table(connection)
+    applied = _applied_checksums(connection)
+    return [item for item in load_schema_definitions() if applied.get(item[0]) != item[1]]
+
+
+def _column_default(default, dialect):
+    if not default or default.startswith('nextval('):
+        return None
+    if dialect != 'postgresql':
+        # Casts do PostgreSQL ('x'::character varying) não existem nos outros bancos
+        default = _CAST_RE.sub('', default)
+    return default
+
+
+class IncompleteSchema(Exception):
+    """A schema file could only be partly applied; it stays pending."""
+
+    def __init__(self, changes):
+        super().__init__(changes)
+        self.changes = changes
+
+
+def _apply_schema(connection, schema):
+    """
+    Add the columns and indexes of a schema definition missing in the database.
+
+    Raises:
+        IncompleteSchema: a unique index could not be created (duplicated rows);
+            the other changes are kept
+    """
+    dialect = connection.dialect.name
+    preparer = connection.dialect.identifier_preparer
+    inspector = inspect(connection)
+    table = schema['table']
+    if not inspector.has_table(table):
+        logger.warning(f"Tabela {table} não existe e não há modelo para criá-la; ignorando")
+        return []
+
+    changes = []
+    complete = True
+    added_columns = set()
+    quoted_table = preparer.quote(table)
+    existing_columns = {column['name'] for column in inspector.get_columns(table)}
+    for column in schema['columns']:
+        if column['name'] in existing_columns:
+            continue
+        ddl = f"ALTER TABLE {quoted_table} ADD COLUMN {preparer.quote(column['name'])} {column['type']}"
+        default = _column_default(column['default'], dialect)
+        if default is not None:
+            ddl += f" DEFAULT {default}"
+            if not column['nullable']:
+                ddl += " NOT NULL"
+        connection.execute(text(ddl))
+        added_columns.add(column['name'])
+        changes.append(f"{table}.{column['name']}")
+
+    existing_indexes = {index['name'] for index in inspector.get_indexes(table)}
+    unique_columns = [set(constraint['column_names']) for constraint in inspector.get_unique_constraints(table)]
+    unique_columns += [set(index['column_names']) for index in inspector.get_indexes(table) if index.get('unique')]
+    for index in schema['indexes']:
+        # Chaves primárias e UNIQUE CONSTRAINTs pertencem aos modelos (create_all)
+        if index['primary'] or index['constraint'] or index['name'] in existing_indexes:
+            continue
+        if index['unique'] and _plain_columns(index['definition']) in unique_columns:
+            continue
+        if index['method'] == 'btree':
+            using = ''
+        elif dialect == 'postgresql':
+            using = f" USING {index['method']}"
+        else:
+            # Índices GIN/GiST só existem no PostgreSQL
+            continue
+        unique = 'UNIQUE ' if index['unique'] else ''
+        ddl = text(
+            f"CREATE {unique}INDEX IF NOT EXISTS {preparer.quote(index['name'])} "
+            f"ON {quoted_table}{using} {index['definition']}"
+        )
+        if not index['unique']:
+            connection.execute(ddl)
+        else:
+            # Linhas duplicadas impedem o índice único: o esquema fica pendente até serem removidas
+            try:
+                with connection.begin_nested():
+                    connection.execute(ddl)
+            except IntegrityError as e:
+                logger.error(f"Índice único {index['name']} não criado, há linhas duplicadas em {table}: {e.orig}")
+                complete = False
+                continue
+        changes.append(index['name'])
+
+    if dialect == 'postgresql' and added_columns:
+        # FKs das colunas adicionadas acima; o SQLite não permite adicionar constraints
+        existing_keys = [set(key['constrained_columns']) for key in inspector.get_foreign_keys(table)]
+        for foreign_key in schema.get('foreign_keys', []):
+            if not added_columns.issuperset(foreign_key['columns']) or set(foreign_key['columns']) in existing_keys:
+                continue
+            columns = ', '.join(preparer.quote(column) for column in foreign_key['columns'])
+            connection.execute(text(
+                f"ALTER TABLE {quoted_table} ADD CONSTRAINT {preparer.quote(foreign_key['name'])} "
+                f"FOREIGN KEY ({columns}) REFERENCES {foreign_key['reference']}"
+            ))
+            changes.append(foreign_key['name'])
+
+    if not complete:
+        raise IncompleteSchema(changes)
+    return changes
+
+
+# Índices substituídos por outro: (tabela, índice antigo, índice que o substitui).
+# O antigo só é removido depois que o novo existe (ver IncompleteSchema)
+REPLACED_INDEXES = [
+    ('financial_entry', 'ix_financial_entry_entry_type_reference_id', 'uq_financial_entry_payment'),
+]
+
+
+def _drop_replaced_indexes(connection):
+    """Drop the indexes of REPLACED_INDEXES whose replacement already exists."""
+    preparer = connection.dialect.identifier_preparer
+    inspector = inspect(connection)
+    dropped = []
+    for table, name, replacement in REPLACED_INDEXES:
+        if not inspector.has_table(table):
+            continue
+        indexes = {index['name'] for index in inspector.get_indexes(table)}
+        if name in indexes and replacement in indexes:
+            connection.execute(text(f"DROP INDEX IF EXISTS {preparer.quote(name)}"))
+            logger.info(f"Índice {name} removido (substituído por {replacement})")
+            dropped.append(name)
+    return dropped
+
+
+def _plain_columns(definition):
+    inner = definition[definition.find('(') + 1:definition.rfind(')')]
+    return {part.strip().strip('"') for part in inner.split(',')}
+
+
+def run_migrations():
+    """
+    Create missing tables and apply pending schema files.
+
+    Must be called inside an application context.
+
+    Returns:
+        List of (schema name, list of applied changes)
+    """
+    import models  # noqa: F401 - registra os modelos no metadata
+
+    db.create_all()
+
+    applied = []
+    with db.engine.begin() as connection:
+        for name, checksum, path in get_pending_migrations(connection):
+            schema = parse_schema_file(path)
+            try:
+                changes = _apply_schema(connection, schema) if schema else []
+            except IncompleteSchema as e:
+                applied.append((name, e.changes + ['incompleto (ver log)']))
+                continue
+            connection.execute(text(f"DELETE FROM {MIGRATIONS_TABLE} WHERE name = :name"), {'name': name})
+            connection.execute(
+                text(f"INSERT INTO {MIGRATIONS_TABLE} (name, checksum, applied_at) VALUES (:name, :checksum, :applied_at)"),
+                {'name': name, 'checksum': checksum, 'applied_at': datetime.utcnow()}
+            )
+            applied.append((name, changes))
+            logger.info(f"Schema {name} aplicado: {', '.join(changes) or 'sem alterações'}")
+        dropped = _drop_replaced_indexes(connection)
+        if dropped:
+            applied.append(('índices substituídos', [f'{name} removido' for name in dropped]))
+        # Objetos de busca textual (tsvector/FTS5) dependem do banco; idempotente
+        install_search(connection)
+    return applied
+
+
+def ensure_admin():
+    """
+    Create the default admin user when there is no administrator.
+
+    Returns:
+        The created User, or None if an admin already exists
+    """
+    from models import User, UserRole
+
+    if User.query.filter_by(role=UserRole.admin).first():
+        return None
+
+    admin = User(
+        username='admin',
+        name='Administrador',
+        email='admin@samape.com',
+        role=UserRole.admin,
+        active=True
+    )
+    admin.set_password(os.environ.get('ADMIN_DEFAULT_PASSWORD', 'admin123'))
+    db.session.add(admin)
+    db.session.commit()
+    logger.info("Admin user created: username=admin")
+    return admin
+
+
+def bootstrap_database(app):
+    """Run migrations and create the initial admin user and financial categories."""
+    from financial_categories import ensure_default_categories
+
+    with app.app_context():
+        applied = run_migrations()
+        ensure_admin()
+        ensure_default_categories()
+    return applied
+
+
+def init_bootstrap(app):
+    """Register the CLI commands and, if AUTO_BOOTSTRAP is set, bootstrap now."""
+
+    @app.cli.command('bootstrap')
+    def bootstrap_command():
+        """Cria/atualiza o esquema do banco e o usuário administrador."""
+        for name, changes in bootstrap_database(app):
+            print(f"{name}: {', '.join(changes) or 'sem alterações'}")
+        print("Banco de dados pronto.")
+
+    @app.cli.command('migrations')
+    def migrations_command():
+        """Lista os arquivos de esquema pendentes."""
+        with app.app_context(), db.engine.begin() as connection:
+            pending = get_pending_migrations(connection)
+        for name, _, _ in pending:
+            print(f"pendente: {name}")
+        print(f"{len(pending)} migração(ões) pendente(s).")
+
+    if app.config.get('AUTO_BOOTSTRAP'):
+        try:
+            bootstrap_database(app)
+        except Exception as e:
+            app.logger.error(f"Error bootstrapping database: {e}")
+
+
+if __name__ == "__main__":
+    from app import app
+
+    for schema_name, schema_changes in bootstrap_database(app):
+        print(f"{schema_name}: {', '.join(schema_changes) or 'sem alterações'}")
+    print("Banco de dados pronto.")
@@ -0,0 +1,142 @@
+"""
+Cache utilities for SAMAPE application.
+This module provides a small thread-safe TTL cache shared by the services
+that keep precomputed data (dashboard metrics, reports, etc.), plus
+session hooks that drop cached keys when a committed transaction wrote
+to the models they depend on.
+
+The cache lives in each process. When the live events bus runs on Postgres
+(several gunicorn workers), the keys dropped by one worker are announced
+to the others (share_invalidations / apply_invalidation); otherwise the
+other workers keep their copy until the TTL expires.
+"""
+import logging
+import threading
+import time
+from itertools import chain
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryCache:
+    """Thread-safe in-process key/value cache with per-key expiration."""
+
+    def __init__(self, default_ttl=60):
+        self.default_ttl = default_ttl
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing/expired."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            expires_at, value = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, ttl=None):
+        """Store value under key for ttl seconds (None or 0 means no expiration)."""
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+
+    def delete(self, *keys):
+        """Remove one or more keys from the cache."""
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Remove every key starting with prefix."""
+        with self._lock:
+            for key in [k for k in self._data if k.startswith(prefix)]:
+                del self._data[key]
+
+    def clear(self):
+        """Remove every cached entry."""
+        with self._lock:
+            self._data.clear()
+
+
+# Cache compartilhado pelo processo (um por worker do gunicorn)
+cache = MemoryCache()
+
+# Nome do modelo -> prefixos de chaves que dependem dele
+_dependencies = {}
+_SESSION_KEY = 'cache_changed_models'
+# Envia as invalidações aos outros processos (configurado por share_invalidations)
+_broadcast = {'publish': None}
+
+
+def share_invalidations(publish):
+    """Announce every key dropped by this process through publish(data)."""
+    _broadcast['publish'] = publish
+
+
+def apply_invalidation(data):
+    """Drop the keys and prefixes announced by another process."""
+    if data.get('all'):
+        cache.clear()
+        return
+    cache.delete(*data.get('keys', ()))
+    for prefix in data.get('prefixes', ()):
+        cache.delete_prefix(prefix)
+
+
+def drop(keys=(), prefixes=()):
+    """Drop keys and key prefixes in this process and announce them to the others."""
+    keys, prefixes = list(keys), list(prefixes)
+    apply_invalidation({'keys': keys, 'prefixes': prefixes})
+    publish = _broadcast['publish']
+    if publish is not None and (keys or prefixes):
+        publish({'keys': keys, 'prefixes': prefixes})
+
+
+def invalidate_on_write(prefix, *model_names):
+    """Drop keys starting with prefix whenever one of the models is written."""
+    for model_name in model_names:
+        _dependencies.setdefault(model_name, set()).add(prefix)
+
+
+def invalidate_models(model_names):
+    """Drop every key prefix that depends on one of the given model class names."""
+    prefixes = set()
+    for model_name in model_names:
+        prefixes.update(_dependencies.get(model_name, ()))
+    drop(prefixes=sorted(prefixes))
+    return prefixes
+
+
+def _collect_changed_models(session, flush_context):
+    changed = session.info.setdefault(_SESSION_KEY, set())
+    for obj in chain(session.new, session.dirty, session.deleted):
+        name = type(obj).__name__
+        if name in _dependencies:
+            changed.add(name)
+
+
+def _invalidate_after_commit(session):
+    changed = session.info.pop(_SESSION_KEY, None)
+    if changed:
+        prefixes = invalidate_models(changed)
+        logger.debug("Cache invalidated: %s", ", ".join(sorted(prefixes)))
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def init_cache(app):
+    """Register the session hooks that invalidate cached keys on commit."""
+    if not event.contains(Session, 'after_flush', _collect_changed_models):
+        event.listen(Session, 'after_flush', _collect_changed_models)
+        event.listen(Session, 'after_commit', _invalidate_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
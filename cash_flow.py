@@ -0,0 +1,204 @@
+"""
+Cash-flow reports for SAMAPE application.
+Reads the pre-aggregated financial rollups (see financial_rollup) instead of
+the ledger: running balances and period-over-period / year-over-year
+comparisons are computed with window functions over a few rows per month
+or day, so a multi-year report is a single query.
+"""
+from datetime import date
+
+from sqlalchemy import Integer, case, cast, extract, func, literal, select
+
+from database import db
+from financial_rollup import MONTH_LABELS
+
+# Períodos por ano em cada agrupamento (para a comparação com o ano anterior)
+GRANULARITIES = {
+    'month': 12,
+    'quarter': 4,
+    'year': 1,
+}
+
+
+def _income_expenses(model):
+    from models import FinancialEntryType
+
+    income = func.sum(case((model.type == FinancialEntryType.entrada, model.total), else_=0))
+    expenses = func.sum(case((model.type == FinancialEntryType.saida, model.total), else_=0))
+    return income.label('income'), expenses.label('expenses')
+
+
+def _bucket_index(granularity, year, month):
+    """Sequential number of the month/quarter/year containing a month: consecutive periods differ by 1."""
+    if granularity == 'month':
+        return year * 12 + month - 1
+    if granularity == 'quarter':
+        return year * 4 + (month - 1) // 3
+    return year
+
+
+def _bucket_label(granularity, index):
+    if granularity == 'month':
+        return f"{MONTH_LABELS[index % 12]}/{index // 12}"
+    if granularity == 'quarter':
+        return f"{index % 4 + 1}º tri/{index // 4}"
+    return str(index)
+
+
+def _bucket_start(granularity, index):
+    if granularity == 'month':
+        return date(index // 12, index % 12 + 1, 1)
+    if granularity == 'quarter':
+        return date(index // 4, (index % 4) * 3 + 1, 1)
+    return date(index, 1, 1)
+
+
+def _change(current, previous):
+    """Percent change from previous to current, or None when previous is zero."""
+    if not previous:
+        return None
+    return round((current - previous) / abs(previous) * 100, 1)
+
+
+def get_cash_flow_report(granularity='month', date_from=None, date_to=None):
+    """
+    Cash flow per month, quarter or year with running balance and comparisons.
+
+    The periods form a continuous series from the first movement on (a
+    recursive CTE fills the periods without entries), so the window
+    functions see the previous period and the same period of the previous
+    year at fixed offsets, and the balance counts every earlier entry.
+    Only the periods between date_from and date_to are returned.
+
+    Args:
+        granularity: 'month', 'quarter' or 'year'
+        date_from: Date inside the first period (default: first movement)
+        date_to: Date inside the last period (default: last movement)
+
+    Returns:
+        List of dictionaries (oldest first) with period, label, start,
+        income, expenses, net, balance (closing), previous_net, change_pct,
+        last_year_net and yoy_pct
+    """
+    from models import FinancialMonthlyRollup
+
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Agrupamento inválido: {granularity}")
+    per_year = GRANULARITIES[granularity]
+
+    year = cast(extract('year', FinancialMonthlyRollup.period), Integer)
+    month = cast(extract('month', FinancialMonthlyRollup.period), Integer)
+    if granularity == 'month':
+        bucket = year * 12 + month - 1
+    elif granularity == 'quarter':
+        bucket = year * 4 + (month - 1) // 3
+    else:
+        bucket = year
+    bucket = bucket.label('bucket')
+    totals = select(bucket, *_income_expenses(FinancialMonthlyRollup)).group_by(bucket).subquery()
+
+    # Sequência contínua de períodos, do primeiro lançamento até o fim do relatório
+    if date_to:
+        last = literal(_bucket_index(granularity, date_to.year, date_to.month), Integer)
+    else:
+        last = func.max(totals.c.bucket)
+    series = select(func.min(totals.c.bucket).label('n'), last.label('last')).cte('series', recursive=True)
+    series = series.union_all(select(series.c.n + 1, series.c.last).where(series.c.n < series.c.last))
+
+    dense = select(
+        series.c.n.label('bucket'),
+        func.coalesce(totals.c.income, 0).label('income'),
+        func.coalesce(totals.c.expenses, 0).label('expenses'),
+    ).select_from(
+        series.outerjoin(totals, totals.c.bucket == series.c.n)
+    ).where(series.c.n.isnot(None)).subquery()
+    net = dense.c.income - dense.c.expenses
+    window = {'order_by': dense.c.bucket}
+    report = select(
+        dense.c.bucket,
+        dense.c.income,
+        dense.c.expenses,
+        func.sum(net).over(**window).label('balance'),
+        func.lag(net, 1).over(**window).label('previous_net'),
+        func.lag(net, per_year).over(**window).label('last_year_net'),
+    ).subquery()
+
+    query = select(report).order_by(report.c.bucket)
+    if date_from:
+        query = query.where(report.c.bucket >= _bucket_index(granularity, date_from.year, date_from.month))
+
+    periods = []
+    for row in db.session.execute(query):
+        income, expenses = float(row.income or 0), float(row.expenses or 0)
+        # Antes do primeiro lançamento não houve movimentação
+        previous_net = float(row.previous_net or 0)
+        last_year_net = float(row.last_year_net or 0)
+        periods.append({
+            'period': row.bucket,
+            'label': _bucket_label(granularity, row.bucket),
+            'start': _bucket_start(granularity, row.bucket),
+            'income': income,
+            'expenses': expenses,
+            'net': income - expenses,
+            'balance': round(float(row.balance or 0), 2),
+            'previous_net': previous_net,
+            'change_pct': _change(income - expenses, previous_net),
+            'last_year_net': last_year_net,
+            'yoy_pct': _change(income - expenses, last_year_net),
+        })
+    return periods
+
+
+def get_daily_balances(date_from, date_to):
+    """
+    Daily cash flow with the running balance, from the daily rollup.
+
+    Args:
+        date_from: First day
+        date_to: Last day (included)
+
+    Returns:
+        Dictionary with opening_balance (before date_from), closing_balance
+        and days: list of dictionaries with day, income, expenses, net and
+        balance, for the days with entries
+    """
+    from models import FinancialDailyRollup
+
+    totals = select(
+        FinancialDailyRollup.day.label('day'), *_income_expenses(FinancialDailyRollup)
+    ).where(
+        FinancialDailyRollup.day <= date_to
+    ).group_by(FinancialDailyRollup.day).subquery()
+    balances = select(
+        totals.c.day,
+        totals.c.income,
+        totals.c.expenses,
+        func.sum(totals.c.income - totals.c.expenses).over(order_by=totals.c.day).label('balance'),
+    ).subquery()
+    rows = db.session.execute(
+        select(balances).where(balances.c.day >= date_from).order_by(balances.c.day)
+    ).all()
+
+    days = []
+    for row in rows:
+        income, expenses = float(row.income or 0), float(row.expenses or 0)
+        days.append({
+            'day': row.day,
+            'income': income,
+            'expenses': expenses,
+            'net': income - expenses,
+            'balance': round(float(row.balance or 0), 2),
+        })
+
+    if days:
+        opening = round(days[0]['balance'] - days[0]['net'], 2)
+    else:
+        income, expenses = db.session.execute(
+            select(*_income_expenses(FinancialDailyRollup)).where(FinancialDailyRollup.day < date_from)
+        ).one()
+        opening = round(float(income or 0) - float(expenses or 0), 2)
+    return {
+        'opening_balance': opening,
+        'closing_balance': days[-1]['balance'] if days else opening,
+        'days': days,
+    }
@@ -38,6 +38,50 @@ class Config:
     MAX_CONTENT_LENGTH = int(os.environ.get('MAX_CONTENT_LENGTH', '16777216'))  # 16MB
     UPLOAD_FOLDER = os.environ.get('UPLOAD_FOLDER', 'static/uploads')
     
+    # Cache (por processo; com o backend postgres dos live events as invalidações chegam aos outros workers,
+    # senão cada worker só vê as escritas dos outros depois do TTL)
+    DASHBOARD_CACHE_TTL = int(os.environ.get('DASHBOARD_CACHE_TTL', '120'))  # seconds
+    SERVICE_ORDER_CACHE_TTL = int(os.environ.get('SERVICE_ORDER_CACHE_TTL', '300'))  # seconds
+    
+    # PDFs de notas fiscais já renderizados (padrão: diretório temporário do sistema)
+    PDF_CACHE_DIR = os.environ.get('PDF_CACHE_DIR')
+    PDF_CACHE_MAX_MB = int(os.environ.get('PDF_CACHE_MAX_MB', '200'))
+    # Gera o PDF da nota em segundo plano ao fechar a OS (e quando a OS ou o cliente mudam)
+    INVOICE_PDF_PRERENDER = os.environ.get('INVOICE_PDF_PRERENDER', 'true').lower() == 'true'
+    # Processos que geram os PDFs da exportação em massa (0 = número de núcleos)
+    INVOICE_EXPORT_WORKERS = int(os.environ.get('INVOICE_EXPORT_WORKERS', '0'))
+    
+    # Tarefas em segundo plano (jobs.py): exportações e PDFs fora da requisição
+    # Rascunho local das tarefas (padrão: diretório temporário do sistema). Extratos enviados e
+    # resultados ficam também na tabela job_file, então cada instância pode ter o seu
+    JOB_RESULTS_DIR = os.environ.get('JOB_RESULTS_DIR')
+    JOB_RESULT_TTL_HOURS = int(os.environ.get('JOB_RESULT_TTL_HOURS', '24'))
+    JOB_WORKER_THREADS = int(os.environ.get('JOB_WORKER_THREADS', '2'))
+    # Worker dentro de cada processo web; desligado em produção, onde roda `flask --app main jobs-worker` à parte
+    JOB_EMBEDDED_WORKER = os.environ.get('JOB_EMBEDDED_WORKER', 'true').lower() == 'true'
+    
+    # Registro de ações (audit_log.py): gravado em lotes por uma thread, fora da requisição
+    AUDIT_LOG_ASYNC = os.environ.get('AUDIT_LOG_ASYNC', 'true').lower() == 'true'
+    AUDIT_LOG_BATCH_SIZE = int(os.environ.get('AUDIT_LOG_BATCH_SIZE', '100'))
+    AUDIT_LOG_FLUSH_INTERVAL = float(os.environ.get('AUDIT_LOG_FLUSH_INTERVAL', '1.0'))  # seconds
+    AUDIT_LOG_QUEUE_SIZE = int(os.environ.get('AUDIT_LOG_QUEUE_SIZE', '10000'))
+    
+    # Números de NF reservados por processo de uma vez (1 = números na ordem de emissão)
+    INVOICE_NUMBER_BLOCK_SIZE = int(os.environ.get('INVOICE_NUMBER_BLOCK_SIZE', '1'))
+    
+    # Live events (SSE): 'local' (um processo), 'postgres' (NOTIFY/LISTEN entre workers)
+    # ou 'auto' (postgres quando o banco é PostgreSQL)
+    LIVE_EVENTS_BACKEND = os.environ.get('LIVE_EVENTS_BACKEND', 'auto')
+    LIVE_EVENTS_HEARTBEAT = int(os.environ.get('LIVE_EVENTS_HEARTBEAT', '15'))  # seconds
+    LIVE_EVENTS_MAX_DURATION = int(os.environ.get('LIVE_EVENTS_MAX_DURATION', '300'))  # seconds
+    # Cada aba aberta ocupa uma thread do worker (GUNICORN_THREADS) durante o stream;
+    # acima deste limite por processo a conexão é recusada e o navegador tenta mais tarde
+    LIVE_EVENTS_MAX_SUBSCRIBERS = int(os.environ.get('LIVE_EVENTS_MAX_SUBSCRIBERS', '8'))
+    
+    # Bootstrap (tabelas, migrações e admin inicial) ao carregar a aplicação.
+    # Desligado em produção: execute `python bootstrap.py` uma vez antes de iniciar os workers.
+    AUTO_BOOTSTRAP = os.environ.get('AUTO_BOOTSTRAP', 'false').lower() == 'true'
+    
     # Application
     APP_NAME = "SAMAPE - Sistema de Gestão de Serviços"
     COMPANY_NAME = "SAMAPE"
@@ -50,18 +94,23 @@ class DevelopmentConfig(Config):
     """Development configuration."""
     DEBUG = True
     WTF_CSRF_SSL_STRICT = False
+    AUTO_BOOTSTRAP = os.environ.get('AUTO_BOOTSTRAP', 'true').lower() == 'true'
 
 class ProductionConfig(Config):
     """Production configuration."""
     DEBUG = False
     WTF_CSRF_SSL_STRICT = True
     SESSION_COOKIE_SECURE = True
+    JOB_EMBEDDED_WORKER = os.environ.get('JOB_EMBEDDED_WORKER', 'false').lower() == 'true'
 
 class TestingConfig(Config):
     """Testing configuration."""
     TESTING = True
     WTF_CSRF_ENABLED = False
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    AUTO_BOOTSTRAP = True
+    JOB_EMBEDDED_WORKER = False
+    AUDIT_LOG_ASYNC = False
 
 # Configuration mapping
 config = {
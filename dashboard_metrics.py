@@ -0,0 +1,289 @@
+"""
+Dashboard metrics service for SAMAPE application.
+Computes the dashboard snapshot in a few grouped queries and keeps each
+section in the shared cache until its TTL expires or a committed write to
+one of the models it depends on invalidates it.
+"""
+import hashlib
+import json
+
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload, selectinload
+
+from cache import cache, drop, invalidate_on_write
+from database import db
+
+CACHE_PREFIX = 'dashboard:'
+DEFAULT_TTL = 120
+
+# Modelos que invalidam cada seção do dashboard
+SECTION_MODELS = {
+    'service_orders': ('ServiceOrder', 'Client'),
+    'supplier_orders': ('SupplierOrder', 'Supplier'),
+    'financial': ('FinancialEntry',),
+    'fleet': ('Vehicle',),
+    'stock': ('StockItem', 'Part'),
+    'activity': ('ActionLog',),
+}
+
+_settings = {'ttl': DEFAULT_TTL}
+
+
+def _build_service_orders():
+    from models import ServiceOrder, ServiceOrderStatus
+    from service_order_analytics import get_completion_stats
+
+    counts = dict(
+        db.session.query(ServiceOrder.status, func.count(ServiceOrder.id))
+        .group_by(ServiceOrder.status).all()
+    )
+
+    # Tempo médio de conclusão (em dias), calculado no banco
+    avg_completion_time = get_completion_stats()[0]['avg_days']
+
+    open_count = counts.get(ServiceOrderStatus.aberta, 0)
+    in_progress_count = counts.get(ServiceOrderStatus.em_andamento, 0)
+    closed_count = counts.get(ServiceOrderStatus.fechada, 0)
+
+    recent_orders = ServiceOrder.query.options(
+        joinedload(ServiceOrder.client),
+        selectinload(ServiceOrder.equipment)
+    ).order_by(ServiceOrder.created_at.desc()).limit(5).all()
+
+    maintenance_in_progress = ServiceOrder.query.options(
+        joinedload(ServiceOrder.client),
+        selectinload(ServiceOrder.equipment)
+    ).filter(
+        ServiceOrder.status == ServiceOrderStatus.em_andamento
+    ).order_by(ServiceOrder.created_at.desc()).limit(5).all()
+
+    return {
+        'so_stats': {
+            'open': open_count,
+            'in_progress': in_progress_count,
+            'closed': closed_count,
+            'total': open_count + in_progress_count + closed_count,
+            'avg_completion_time': avg_completion_time
+        },
+        'recent_orders': [_service_order_row(order) for order in recent_orders],
+        'maintenance_in_progress': [_service_order_row(order) for order in maintenance_in_progress],
+    }
+
+
+def _build_supplier_orders():
+    from models import SupplierOrder, OrderStatus
+
+    counts = dict(
+        db.session.query(SupplierOrder.status, func.count(SupplierOrder.id))
+        .group_by(SupplierOrder.status).all()
+    )
+    pending = counts.get(OrderStatus.pendente, 0)
+    approved = counts.get(OrderStatus.aprovado, 0)
+    sent = counts.get(OrderStatus.enviado, 0)
+    received = counts.get(OrderStatus.recebido, 0)
+    canceled = counts.get(OrderStatus.cancelado, 0)
+    open_orders = pending + approved + sent
+    closed_orders = received + canceled
+
+    pending_orders = SupplierOrder.query.options(
+        joinedload(SupplierOrder.supplier)
+    ).filter(
+        SupplierOrder.status.in_([OrderStatus.pendente, OrderStatus.aprovado, OrderStatus.enviado])
+    ).order_by(SupplierOrder.created_at.desc()).limit(5).all()
+
+    return {
+        'supplier_stats': {
+            'pending': pending,
+            'approved': approved,
+            'sent': sent,
+            'received': received,
+            'canceled': canceled,
+            'open': open_orders,
+            'closed': closed_orders,
+            'total': open_orders + closed_orders
+        },
+        'pending_supplier_orders': [
+            {
+                'id': order.id,
+                'supplier': {'name': order.supplier.name if order.supplier else ''},
+                'total_value': order.total_value,
+                'status': order.status,
+                'created_at': order.created_at,
+            }
+            for order in pending_orders
+        ],
+    }
+
+
+def _build_financial():
+    from financial_rollup import get_monthly_series
+
+    # Série dos últimos 6 meses lida do rollup mensal; o último ponto é o mês atual
+    series = get_monthly_series(6)
+    income = series['income'][-1]
+    expenses = series['expenses'][-1]
+    return {
+        'financial_summary': {'income': income, 'expenses': expenses, 'balance': income - expenses},
+        'financial_series': series,
+    }
+
+
+def _build_fleet():
+    from models import Vehicle, VehicleStatus
+
+    counts = dict(
+        db.session.query(Vehicle.status, func.count(Vehicle.id))
+        .group_by(Vehicle.status).all()
+    )
+    return {
+        'fleet': {
+            'fleet_active': counts.get(VehicleStatus.ativo, 0),
+            'fleet_maintenance': counts.get(VehicleStatus.em_manutencao, 0),
+            'fleet_inactive': counts.get(VehicleStatus.inativo, 0),
+            'fleet_reserved': 0,  # Valor padrão para manter compatibilidade com o template
+            'fleet_total': sum(counts.values())
+        }
+    }
+
+
+def _build_stock():
+    from models import StockItem, Part
+
+    low_stock_items = db.session.query(StockItem.name, StockItem.quantity).filter(
+        StockItem.quantity <= StockItem.min_quantity
+    ).order_by(StockItem.quantity.asc()).limit(5).all()
+
+    low_stock_parts = db.session.query(Part.name, Part.stock_quantity).filter(
+        Part.stock_quantity <= Part.minimum_stock
+    ).order_by(Part.stock_quantity.asc()).limit(5).all()
+
+    return {
+        'low_stock_items': [{'name': name, 'quantity': quantity} for name, quantity in low_stock_items],
+        'low_stock_parts': [{'name': name, 'stock_quantity': quantity} for name, quantity in low_stock_parts],
+    }
+
+
+def _build_activity():
+    from models import ActionLog
+
+    recent_logs = db.session.query(
+        ActionLog.action, ActionLog.entity_type, ActionLog.entity_id, ActionLog.timestamp
+    ).order_by(ActionLog.timestamp.desc()).limit(10).all()
+
+    return {
+        'recent_logs': [
+            {'action': action, 'entity_type': entity_type, 'entity_id': entity_id, 'timestamp': timestamp}
+            for action, entity_type, entity_id, timestamp in recent_logs
+        ]
+    }
+
+
+SECTION_BUILDERS = {
+    'service_orders': _build_service_orders,
+    'supplier_orders': _build_supplier_orders,
+    'financial': _build_financial,
+    'fleet': _build_fleet,
+    'stock': _build_stock,
+    'activity': _build_activity,
+}
+
+
+def _service_order_row(order):
+    """Plain (session-independent) representation used by the dashboard template."""
+    return {
+        'id': order.id,
+        'client': {'name': order.client.name if order.client else ''},
+        'equipment': [{'model': equipment.model} for equipment in order.equipment],
+        'status': order.status,
+        'created_at': order.created_at,
+    }
+
+
+def get_section(name):
+    """Return one cached dashboard section, computing it on a cache miss."""
+    key = CACHE_PREFIX + name
+    data = cache.get(key)
+    if data is None:
+        data = SECTION_BUILDERS[name]()
+        cache.set(key, data, ttl=_settings['ttl'])
+    return data
+
+
+def get_dashboard_snapshot():
+    """
+    Build the full dashboard snapshot from the cached sections.
+
+    Returns:
+        Dictionary with the template context used by the dashboard view
+        (so_stats, supplier_stats, financial_summary, metrics and the
+        recent/low-stock lists as plain dictionaries).
+    """
+    snapshot = {}
+    for name in SECTION_BUILDERS:
+        snapshot.update(get_section(name))
+
+    so_stats = snapshot['so_stats']
+    supplier_stats = snapshot['supplier_stats']
+    financial_summary = snapshot['financial_summary']
+    financial_series = snapshot['financial_series']
+
+    metrics = {
+        'pending_orders': so_stats['open'],
+        'in_progress_orders': so_stats['in_progress'],
+        'closed_orders': so_stats['closed'],
+        'avg_completion_time': so_stats['avg_completion_time'],
+        'efficiency_percentage': min(100, so_stats['avg_completion_time'] * 10) if so_stats['avg_completion_time'] > 0 else 50,
+        'open_orders': supplier_stats['open'],
+        'pending_delivery': supplier_stats['sent'],
+        'delivered_this_month': supplier_stats['received'],
+        'monthly_income': financial_summary['income'],
+        'monthly_expenses': financial_summary['expenses'],
+        'income_data': json.dumps(financial_series['income']),
+        'expense_data': json.dumps(financial_series['expenses']),
+        'month_labels': json.dumps(financial_series['labels'])
+    }
+    metrics.update(snapshot.pop('fleet'))
+    snapshot['metrics'] = metrics
+    return snapshot
+
+
+def get_metrics_payload():
+    """
+    Get the dashboard metrics as compact JSON plus its version stamp.
+
+    The stamp is a hash of the payload, so every worker holding the same
+    data answers with the same ETag. Both are cached until one of the
+    dashboard sections is invalidated.
+
+    Returns:
+        Tuple (payload bytes, version stamp)
+    """
+    key = CACHE_PREFIX + 'api'
+    cached = cache.get(key)
+    if cached is None:
+        snapshot = get_dashboard_snapshot()
+        series = snapshot['financial_series']
+        metrics = dict(snapshot['metrics'])
+        metrics.update({
+            'income_data': series['income'],
+            'expense_data': series['expenses'],
+            'month_labels': series['labels'],
+        })
+        payload = json.dumps(metrics, separators=(',', ':'), sort_keys=True).encode('utf-8')
+        cached = (payload, hashlib.sha1(payload).hexdigest())
+        cache.set(key, cached, ttl=_settings['ttl'])
+    return cached
+
+
+def invalidate(*sections):
+    """Drop the given sections from the cache (all sections if none given)."""
+    sections = sections or tuple(SECTION_BUILDERS)
+    drop(keys=[CACHE_PREFIX + 'api', *(CACHE_PREFIX + name for name in sections)])
+
+
+def init_dashboard_metrics(app):
+    """Configure the cache TTL and the write-driven invalidation of each section."""
+    _settings['ttl'] = app.config.get('DASHBOARD_CACHE_TTL', DEFAULT_TTL)
+    for section, model_names in SECTION_MODELS.items():
+        invalidate_on_write(CACHE_PREFIX + section, *model_names)
+        invalidate_on_write(CACHE_PREFIX + 'api', *model_names)
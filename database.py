@@ -3,6 +3,7 @@ Database configuration and initialization.
 This module handles SQLAlchemy setup to avoid circular imports.
 """
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from sqlalchemy.orm import DeclarativeBase
 
 # Create SQLAlchemy base class
@@ -12,7 +13,26 @@ class Base(DeclarativeBase):
 # Initialize extensions
 db = SQLAlchemy(model_class=Base)
 
+# Modo de journal do SQLite informado na última conexão ('wal' em bancos em arquivo,
+# 'memory' no banco em memória dos testes); None em outros bancos
+sqlite_journal = {'mode': None}
+
+
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    # Em WAL uma leitura em andamento (yield_per) não impede outra conexão de gravar,
+    # como o progresso das tarefas em segundo plano
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute("PRAGMA journal_mode=WAL")
+        sqlite_journal['mode'] = cursor.fetchone()[0]
+    finally:
+        cursor.close()
+
+
 def init_db(app):
     """Initialize database with Flask app."""
     db.init_app(app)
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _enable_sqlite_wal)
     return db
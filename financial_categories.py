@@ -0,0 +1,288 @@
+"""
+Financial categories for SAMAPE application.
+Each FinancialEntry points to a FinancialCategory (indexed FK), which the
+income statement (DRE) groups by. Entries created without a category are
+classified on flush from their origin (service order, refueling, supplier
+order).
+
+Older manual adjustments carry the category as a "[Acerto de Caixa] ..."
+prefix in the description; run `python financial_categories.py` (or the
+'financial_category_backfill' job) to move it into the category column.
+"""
+import logging
+import re
+from collections import OrderedDict
+from datetime import timedelta
+
+from sqlalchemy import bindparam, event, extract, func, select, update
+from sqlalchemy.orm import Session
+
+from database import db
+from jobs import job_handler
+
+logger = logging.getLogger(__name__)
+
+# (chave, nome, tipo ou None para ambos), na ordem das linhas do DRE
+DEFAULT_CATEGORIES = [
+    ('servicos', 'Serviços (OS)', 'entrada'),
+    ('combustivel', 'Combustível', 'saida'),
+    ('fornecedores', 'Pedidos a Fornecedores', 'saida'),
+    ('imposto', 'Impostos', 'saida'),
+    ('acerto', 'Acerto de Caixa', None),
+    ('ajuste', 'Ajuste Contábil', None),
+    ('transferencia', 'Transferência', None),
+    ('outro', 'Outros', None),
+]
+
+# Prefixos gravados na descrição pelo acerto manual antes das categorias
+DESCRIPTION_PREFIXES = {
+    'Acerto de Caixa': 'acerto',
+    'Ajuste Contábil': 'ajuste',
+    'Transferência': 'transferencia',
+    'Imposto': 'imposto',
+    'Outros': 'outro',
+}
+_PREFIX_RE = re.compile(r'^\[(?P<label>[^\]]+)\]\s*')
+
+UNCATEGORIZED_LABEL = 'Sem categoria'
+
+
+def ensure_default_categories():
+    """
+    Create the default categories missing in the database.
+
+    Returns:
+        Number of categories created
+    """
+    from models import FinancialCategory, FinancialEntryType
+
+    existing = {key for key, in db.session.query(FinancialCategory.key)}
+    created = 0
+    for position, (key, name, entry_type) in enumerate(DEFAULT_CATEGORIES):
+        if key in existing:
+            continue
+        db.session.add(FinancialCategory(
+            key=key,
+            name=name,
+            type=FinancialEntryType[entry_type] if entry_type else None,
+            sort_order=position
+        ))
+        created += 1
+    if created:
+        db.session.commit()
+    return created
+
+
+def get_category_id(key, session=None):
+    """Return the id of the category with this key, or None if it does not exist."""
+    from models import FinancialCategory
+
+    session = session or db.session
+    return session.query(FinancialCategory.id).filter(FinancialCategory.key == key).scalar()
+
+
+def category_choices():
+    """(id, name) of the active categories, for form select fields."""
+    from models import FinancialCategory
+
+    return [
+        (category.id, category.name)
+        for category in FinancialCategory.query.filter(FinancialCategory.active.isnot(False))
+        .order_by(FinancialCategory.sort_order, FinancialCategory.name)
+    ]
+
+
+def classify_entry(description, entry_type=None, service_order_id=None, type_=None):
+    """
+    Find the category of an entry from its description prefix or origin.
+
+    Args:
+        description: Entry description, possibly starting with "[Category] "
+        entry_type: FinancialEntry.entry_type ('vehicle_refueling', 'pedido_fornecedor'...)
+        service_order_id: Related service order, if any
+        type_: FinancialEntryType of the entry
+
+    Returns:
+        (category key or None, description without the category prefix)
+    """
+    match = _PREFIX_RE.match(description or '')
+    if match and match.group('label') in DESCRIPTION_PREFIXES:
+        return DESCRIPTION_PREFIXES[match.group('label')], description[match.end():] or description
+    if entry_type == 'vehicle_refueling':
+        return 'combustivel', description
+    if entry_type == 'pedido_fornecedor':
+        return 'fornecedores', description
+    if service_order_id and type_ is not None and type_.name == 'entrada':
+        return 'servicos', description
+    return None, description
+
+
+def _classify_new_entries(session, flush_context, instances):
+    from models import FinancialEntry
+
+    entries = [
+        obj for obj in session.new
+        if isinstance(obj, FinancialEntry) and obj.category_id is None and obj.category is None
+    ]
+    if not entries:
+        return
+    ids = {}
+    with session.no_autoflush:
+        for entry in entries:
+            key, _ = classify_entry(entry.description, entry.entry_type, entry.service_order_id, entry.type)
+            if key is None:
+                continue
+            if key not in ids:
+                ids[key] = get_category_id(key, session)
+            entry.category_id = ids[key]
+
+
+def backfill_categories(batch_size=1000, progress=None):
+    """
+    Classify the entries without category, in batches ordered by id.
+
+    Each batch is one SELECT and one executemany UPDATE, committed on its
+    own, so the backfill can be interrupted and resumed. Entries without a
+    recognizable category stay uncategorized.
+
+    Args:
+        batch_size: Entries read per batch
+        progress: Optional callable receiving the number of entries read so far
+
+    Returns:
+        Number of entries classified
+    """
+    from models import FinancialCategory, FinancialEntry
+
+    category_ids = dict(db.session.query(FinancialCategory.key, FinancialCategory.id).all())
+    table = FinancialEntry.__table__
+    statement = update(table).where(table.c.id == bindparam('entry_id')).values(
+        category_id=bindparam('new_category_id'),
+        description=bindparam('new_description')
+    )
+
+    last_id = 0
+    read = 0
+    classified = 0
+    while True:
+        rows = db.session.execute(
+            select(table.c.id, table.c.description, table.c.entry_type, table.c.service_order_id, table.c.type)
+            .where(table.c.category_id.is_(None), table.c.id > last_id)
+            .order_by(table.c.id)
+            .limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        params = []
+        for entry_id, description, entry_type, service_order_id, type_ in rows:
+            key, clean_description = classify_entry(description, entry_type, service_order_id, type_)
+            if key in category_ids:
+                params.append({
+                    'entry_id': entry_id,
+                    'new_category_id': category_ids[key],
+                    'new_description': clean_description,
+                })
+        if params:
+            db.session.execute(statement, params)
+        db.session.commit()
+        last_id = rows[-1].id
+        read += len(rows)
+        classified += len(params)
+        if progress:
+            progress(read)
+    return classified
+
+
+def count_uncategorized():
+    """Number of entries without category."""
+    from models import FinancialEntry
+
+    return db.session.query(func.count(FinancialEntry.id)).filter(FinancialEntry.category_id.is_(None)).scalar()
+
+
+@job_handler('financial_category_backfill')
+def backfill_categories_job(context, batch_size=1000):
+    """Classify the entries without category (see backfill_categories)."""
+    total = count_uncategorized()
+    context.progress(0, total, f'Classificando {total} lançamentos')
+    classified = backfill_categories(batch_size, progress=context.progress)
+    context.progress(total, message=f'{classified} de {total} lançamentos classificados')
+
+
+def get_income_statement(date_from, date_to):
+    """
+    Income statement (DRE) per category and month, from one aggregate query.
+
+    Args:
+        date_from: First datetime included
+        date_to: First datetime excluded
+
+    Returns:
+        Dictionary with months (list of (year, month)), income and expenses
+        (lists of rows with name, values per month and total, in category
+        order, uncategorized last) and the totals per month of income,
+        expenses and result
+    """
+    from models import FinancialCategory, FinancialEntry, FinancialEntryType
+
+    year = extract('year', FinancialEntry.date)
+    month = extract('month', FinancialEntry.date)
+    rows = db.session.query(
+        FinancialEntry.category_id, FinancialEntry.type, year, month, func.sum(FinancialEntry.amount)
+    ).filter(
+        FinancialEntry.date >= date_from,
+        FinancialEntry.date < date_to
+    ).group_by(FinancialEntry.category_id, FinancialEntry.type, year, month).all()
+
+    categories = FinancialCategory.query.order_by(FinancialCategory.sort_order, FinancialCategory.name).all()
+    order = {category.id: position for position, category in enumerate(categories)}
+    names = {category.id: category.name for category in categories}
+
+    last_day = date_to - timedelta(microseconds=1)
+    months = [
+        (index // 12, index % 12 + 1)
+        for index in range(date_from.year * 12 + date_from.month - 1, last_day.year * 12 + last_day.month)
+    ]
+
+    sections = {FinancialEntryType.entrada: OrderedDict(), FinancialEntryType.saida: OrderedDict()}
+    for category_id, entry_type, row_year, row_month, total in sorted(
+            rows, key=lambda row: order.get(row[0], len(order))):
+        line = sections[entry_type].setdefault(category_id, {
+            'category_id': category_id,
+            'name': names.get(category_id, UNCATEGORIZED_LABEL),
+            'values': {period: 0.0 for period in months},
+            'total': 0.0,
+        })
+        period = (int(row_year), int(row_month))
+        line['values'][period] += float(total or 0)
+        line['total'] += float(total or 0)
+
+    income = list(sections[FinancialEntryType.entrada].values())
+    expenses = list(sections[FinancialEntryType.saida].values())
+    income_totals = {period: sum(line['values'][period] for line in income) for period in months}
+    expense_totals = {period: sum(line['values'][period] for line in expenses) for period in months}
+    return {
+        'months': months,
+        'income': income,
+        'expenses': expenses,
+        'income_totals': income_totals,
+        'expense_totals': expense_totals,
+        'result': {period: income_totals[period] - expense_totals[period] for period in months},
+        'total_income': sum(income_totals.values()),
+        'total_expenses': sum(expense_totals.values()),
+    }
+
+
+def init_financial_categories(app):
+    """Register the hook that classifies new entries created without a category."""
+    if not event.contains(Session, 'before_flush', _classify_new_entries):
+        event.listen(Session, 'before_flush', _classify_new_entries)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        ensure_default_categories()
+        count = backfill_categories()
+        print(f"{count} lançamentos classificados; {count_uncategorized()} sem categoria.")
@@ -0,0 +1,298 @@
+"""
+Financial rollups for SAMAPE application.
+Keeps financial_monthly_rollup and financial_daily_rollup (total and entry
+count per month/day and type) in sync with FinancialEntry writes, so charts,
+monthly totals and the cash-flow report (cash_flow) read a handful of
+pre-aggregated rows instead of scanning the ledger.
+
+Run `python financial_rollup.py` to rebuild both tables from the ledger
+(needed after bulk updates that bypass the ORM session).
+"""
+import logging
+from datetime import date, datetime
+from decimal import Decimal
+
+from sqlalchemy import event, extract, func, inspect, update
+from sqlalchemy.orm import Session
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+MONTH_LABELS = ['Jan', 'Fev', 'Mar', 'Abr', 'Mai', 'Jun', 'Jul', 'Ago', 'Set', 'Out', 'Nov', 'Dez']
+MAX_SERIES_MONTHS = 120
+
+_TRACKED_FIELDS = ('amount', 'date', 'type')
+
+
+def month_start(value):
+    """Return the first day of the month of a date/datetime."""
+    return date(value.year, value.month, 1)
+
+
+def day_of(value):
+    """Return the date of a date/datetime."""
+    return value.date() if isinstance(value, datetime) else value
+
+
+def add_months(period, months):
+    """Shift a first-of-month date by a number of months."""
+    index = period.year * 12 + period.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _values(obj, old=False):
+    """Return (day, type, amount) for an entry, using the pre-flush values if old=True."""
+    state = inspect(obj)
+    values = []
+    for field in _TRACKED_FIELDS:
+        history = state.attrs[field].history
+        if old and history.deleted:
+            values.append(history.deleted[0])
+        elif old and history.unchanged:
+            values.append(history.unchanged[0])
+        else:
+            values.append(getattr(obj, field))
+    amount, entry_date, entry_type = values
+    if entry_date is None or entry_type is None or amount is None:
+        return None
+    return day_of(entry_date), entry_type, Decimal(str(amount))
+
+
+def _add_delta(deltas, values, sign):
+    if values is None:
+        return
+    period, entry_type, amount = values
+    total, count = deltas.get((period, entry_type), (Decimal('0'), 0))
+    deltas[(period, entry_type)] = (total + sign * amount, count + sign)
+
+
+def _collect_deltas(session, flush_context):
+    from models import FinancialEntry
+
+    deltas = {}
+    for obj in session.new:
+        if isinstance(obj, FinancialEntry):
+            _add_delta(deltas, _values(obj), 1)
+    for obj in session.deleted:
+        if isinstance(obj, FinancialEntry):
+            _add_delta(deltas, _values(obj, old=True), -1)
+    for obj in session.dirty:
+        if isinstance(obj, FinancialEntry) and session.is_modified(obj):
+            state = inspect(obj)
+            if any(state.attrs[field].history.has_changes() for field in _TRACKED_FIELDS):
+                _add_delta(deltas, _values(obj, old=True), -1)
+                _add_delta(deltas, _values(obj), 1)
+
+    deltas = {key: value for key, value in deltas.items() if value != (Decimal('0'), 0)}
+    if deltas:
+        apply_deltas(session.connection(), deltas)
+
+
+def apply_deltas(connection, deltas):
+    """
+    Add (total, count) deltas to the daily and monthly rollup rows, creating them as needed.
+
+    Args:
+        connection: Connection taking part in the current transaction
+        deltas: Dictionary {(day, FinancialEntryType): (Decimal total, int count)}
+    """
+    from models import FinancialDailyRollup, FinancialMonthlyRollup
+
+    monthly = {}
+    for (day, entry_type), (total, count) in deltas.items():
+        month_total, month_count = monthly.get((month_start(day), entry_type), (Decimal('0'), 0))
+        monthly[(month_start(day), entry_type)] = (month_total + total, month_count + count)
+
+    _upsert_totals(connection, FinancialDailyRollup.__table__, 'day', deltas)
+    _upsert_totals(connection, FinancialMonthlyRollup.__table__, 'period', monthly)
+
+
+def _upsert_totals(connection, table, period_column, deltas):
+    dialect = connection.dialect.name
+    now = datetime.utcnow()
+    period_key = table.c[period_column]
+
+    for (period, entry_type), (total, count) in deltas.items():
+        if dialect in ('postgresql', 'sqlite'):
+            if dialect == 'postgresql':
+                from sqlalchemy.dialects.postgresql import insert
+            else:
+                from sqlalchemy.dialects.sqlite import insert
+            stmt = insert(table).values(
+                {period_column: period, 'type': entry_type, 'total': total, 'entry_count': count, 'updated_at': now}
+            )
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[period_key, table.c.type],
+                set_={
+                    'total': table.c.total + stmt.excluded.total,
+                    'entry_count': table.c.entry_count + stmt.excluded.entry_count,
+                    'updated_at': now,
+                }
+            )
+            connection.execute(stmt)
+        else:
+            result = connection.execute(
+                update(table)
+                .where(period_key == period, table.c.type == entry_type)
+                .values(total=table.c.total + total, entry_count=table.c.entry_count + count, updated_at=now)
+            )
+            if result.rowcount == 0:
+                connection.execute(table.insert().values(
+                    {period_column: period, 'type': entry_type, 'total': total, 'entry_count': count, 'updated_at': now}
+                ))
+
+
+def rebuild_monthly_rollup():
+    """
+    Recompute the whole rollup table from FinancialEntry in one grouped query.
+
+    Returns:
+        Number of rollup rows written
+    """
+    from models import FinancialEntry, FinancialMonthlyRollup
+
+    year = extract('year', FinancialEntry.date)
+    month = extract('month', FinancialEntry.date)
+    rows = db.session.query(
+        year, month, FinancialEntry.type,
+        func.sum(FinancialEntry.amount), func.count(FinancialEntry.id)
+    ).filter(
+        FinancialEntry.date.isnot(None)
+    ).group_by(year, month, FinancialEntry.type).all()
+
+    now = datetime.utcnow()
+    FinancialMonthlyRollup.query.delete()
+    if rows:
+        db.session.execute(FinancialMonthlyRollup.__table__.insert(), [
+            {
+                'period': date(int(row_year), int(row_month), 1),
+                'type': entry_type,
+                'total': total or 0,
+                'entry_count': count,
+                'updated_at': now,
+            }
+            for row_year, row_month, entry_type, total, count in rows
+        ])
+    db.session.commit()
+    return len(rows)
+
+
+def rebuild_daily_rollup(batch_size=5000):
+    """
+    Recompute the whole daily rollup table from FinancialEntry in one grouped query.
+
+    Args:
+        batch_size: Rows inserted per statement
+
+    Returns:
+        Number of rollup rows written
+    """
+    from models import FinancialEntry, FinancialDailyRollup
+
+    day = func.date(FinancialEntry.date)
+    rows = db.session.query(
+        day, FinancialEntry.type,
+        func.sum(FinancialEntry.amount), func.count(FinancialEntry.id)
+    ).filter(
+        FinancialEntry.date.isnot(None)
+    ).group_by(day, FinancialEntry.type).all()
+
+    now = datetime.utcnow()
+    FinancialDailyRollup.query.delete()
+    values = [
+        {
+            # SQLite devolve date() como texto
+            'day': date.fromisoformat(row_day) if isinstance(row_day, str) else row_day,
+            'type': entry_type,
+            'total': total or 0,
+            'entry_count': count,
+            'updated_at': now,
+        }
+        for row_day, entry_type, total, count in rows
+    ]
+    for start in range(0, len(values), batch_size):
+        db.session.execute(FinancialDailyRollup.__table__.insert(), values[start:start + batch_size])
+    db.session.commit()
+    return len(values)
+
+
+def get_monthly_series(months=12, until=None):
+    """
+    Get the income/expense series for the last months from the rollup.
+
+    Args:
+        months: Number of months in the series (6, 12, 24...)
+        until: Date inside the last month of the series (default: today)
+
+    Returns:
+        Dictionary with periods, labels, income, expenses and balance lists,
+        oldest month first, with zeros for months without entries
+    """
+    from models import FinancialMonthlyRollup, FinancialEntryType
+
+    months = max(1, min(int(months), MAX_SERIES_MONTHS))
+    last = month_start(until or datetime.utcnow())
+    first = add_months(last, -(months - 1))
+
+    rows = db.session.query(
+        FinancialMonthlyRollup.period, FinancialMonthlyRollup.type, FinancialMonthlyRollup.total
+    ).filter(
+        FinancialMonthlyRollup.period >= first,
+        FinancialMonthlyRollup.period <= last
+    ).all()
+    totals = {(period, entry_type): float(total or 0) for period, entry_type, total in rows}
+
+    periods = [add_months(first, i) for i in range(months)]
+    income = [totals.get((p, FinancialEntryType.entrada), 0.0) for p in periods]
+    expenses = [totals.get((p, FinancialEntryType.saida), 0.0) for p in periods]
+    return {
+        'periods': [p.isoformat() for p in periods],
+        'labels': [f"{MONTH_LABELS[p.month - 1]}/{p.year % 100:02d}" for p in periods],
+        'income': income,
+        'expenses': expenses,
+        'balance': [round(i - e, 2) for i, e in zip(income, expenses)],
+    }
+
+
+def get_month_totals(year, month):
+    """Get income/expenses/balance and the number of entries of one month from the rollup."""
+    from models import FinancialMonthlyRollup, FinancialEntryType
+
+    rows = db.session.query(
+        FinancialMonthlyRollup.type, FinancialMonthlyRollup.total, FinancialMonthlyRollup.entry_count
+    ).filter(FinancialMonthlyRollup.period == date(year, month, 1)).all()
+    totals = {entry_type: float(total or 0) for entry_type, total, count in rows}
+    income = totals.get(FinancialEntryType.entrada, 0.0)
+    expenses = totals.get(FinancialEntryType.saida, 0.0)
+    return {
+        'income': income,
+        'expenses': expenses,
+        'balance': income - expenses,
+        'count': sum(count or 0 for entry_type, total, count in rows),
+    }
+
+
+def _track_old_value(target, value, oldvalue, initiator):
+    return value
+
+
+def init_financial_rollup(app):
+    """Register the session hooks that keep the rollup in sync."""
+    from models import FinancialEntry
+
+    if not event.contains(Session, 'after_flush', _collect_deltas):
+        # active_history garante o valor anterior no histórico para calcular o delta
+        for field in _TRACKED_FIELDS:
+            event.listen(getattr(FinancialEntry, field), 'set', _track_old_value, active_history=True, retval=True)
+        event.listen(Session, 'after_flush', _collect_deltas)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        count = rebuild_monthly_rollup()
+        print(f"Rollup financeiro mensal reconstruído: {count} linhas.")
+        count = rebuild_daily_rollup()
+        print(f"Rollup financeiro diário reconstruído: {count} linhas.")
@@ -1,5 +1,5 @@
 from flask_wtf import FlaskForm
-from flask_wtf.file import FileField, FileAllowed
+from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, PasswordField, BooleanField, TextAreaField, SelectField, DecimalField, HiddenField, IntegerField
 from wtforms.validators import DataRequired, Email, EqualTo, Length, Optional, ValidationError, NumberRange, Regexp
 from werkzeug.datastructures import FileStorage
@@ -146,8 +146,8 @@ class ServiceOrderForm(FlaskForm):
 
 class CloseServiceOrderForm(FlaskForm):
     # Removido campo invoice_number que agora será gerado automaticamente
-    invoice_amount = DecimalField('Valor Total (R$)', validators=[DataRequired()], places=2)
-    service_details = TextAreaField('Detalhes do Serviço Executado', validators=[DataRequired()])
+    invoice_amount = DecimalField('Valor Total (R$)', validators=[DataRequired(), NumberRange(min=0)], places=2)
+    service_details = TextAreaField('Detalhes do Serviço Executado', validators=[DataRequired(), Length(max=2000)])
     
     # Campos para cálculo de valor por KM
     include_km_calculation = BooleanField('Incluir cálculo de valor por KM', default=False)
@@ -160,6 +160,13 @@ class FinancialEntryForm(FlaskForm):
     amount = DecimalField('Valor (R$)', validators=[DataRequired()], places=2)
     type = SelectField('Tipo', choices=[(t.name, t.value) for t in FinancialEntryType], validators=[DataRequired()])
     date = StringField('Data', validators=[DataRequired()])
+    category_id = SelectField('Categoria', coerce=int, validators=[Optional()])
+
+class BankStatementImportForm(FlaskForm):
+    statement = FileField('Extrato Bancário (OFX ou CSV)', validators=[
+        FileRequired('Selecione o arquivo do extrato.'),
+        FileAllowed(['ofx', 'csv', 'txt'], 'Apenas extratos OFX ou CSV são permitidos!')
+    ])
 
 class SupplierForm(FlaskForm):
     name = StringField('Nome/Razão Social', validators=[DataRequired(), Length(min=3, max=100)])
@@ -443,11 +450,6 @@ class StockMovementForm(FlaskForm):
         ]
 
         
-class CloseServiceOrderForm(FlaskForm):
-    """Formulário para fechar uma ordem de serviço"""
-    invoice_amount = DecimalField('Valor Total (R$)', validators=[DataRequired(), NumberRange(min=0)], places=2)
-    service_details = TextAreaField('Detalhes do Serviço', validators=[DataRequired(), Length(max=2000)])
-    
 class VehicleMaintenanceForm(FlaskForm):
     vehicle_id = SelectField('Veículo', validators=[DataRequired()], coerce=int)
     date = StringField('Data da Manutenção', validators=[DataRequired()], render_kw={"type": "date"})
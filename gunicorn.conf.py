@@ -0,0 +1,20 @@
+"""
+Gunicorn configuration for SAMAPE.
+
+Threaded workers keep the long-lived SSE connections (/api/eventos) from
+blocking a whole worker each; every open stream still holds one of the
+threads, up to LIVE_EVENTS_MAX_SUBSCRIBERS per worker.
+
+Live events and cache invalidations only cross workers over Postgres
+NOTIFY/LISTEN, so without it (SQLite, or LIVE_EVENTS_BACKEND=local) the
+default is a single worker.
+"""
+import os
+
+_shared_bus = (os.environ.get('DATABASE_URL', '').startswith('postgres')
+               and os.environ.get('LIVE_EVENTS_BACKEND', 'auto') in ('auto', 'postgres'))
+
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('GUNICORN_WORKERS', '2' if _shared_bus else '1'))
+threads = int(os.environ.get('GUNICORN_THREADS', '16'))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', '60'))
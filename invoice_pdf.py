@@ -0,0 +1,280 @@
+"""
+Invoice (NF-e) PDF rendering for SAMAPE application.
+Renders invoices/clean_invoice.html and converts it with WeasyPrint,
+going through the on-disk PDF cache: an unchanged invoice is rendered to
+PDF only once. The compiled template, the parsed stylesheet and the font
+configuration are kept between invoices (InvoiceRenderer).
+
+Closing a service order (or any later change to an invoiced order or its
+client) queues a background job that renders the PDF into the cache, so
+the download is served from disk instead of waiting for WeasyPrint.
+
+Bulk exports (a background job) render the HTML in the app context
+(templates and ORM objects live there) and convert the PDFs in a process
+pool sized to the CPU cores, handing each PDF to the ZIP writer
+(zip_stream) as soon as it is ready. At most a few PDFs per pool process are held in memory at
+any time, so the number of invoices in an export is not limited.
+"""
+import hashlib
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+from flask import current_app
+from sqlalchemy import event, or_
+from sqlalchemy.orm import Session, joinedload, selectinload
+
+from database import db
+from jobs import JobError, enqueue_in, job_handler
+from pdf_cache import pdf_cache
+from pdf_utils import PdfRenderer, init_process_renderer, render_in_process, weasyprint_available
+
+logger = logging.getLogger(__name__)
+
+INVOICE_TEMPLATE = 'invoices/clean_invoice.html'
+# Incluída no HTML exibido no navegador; no PDF é aplicada já interpretada
+INVOICE_STYLESHEET = 'invoices/invoice.css'
+
+# Tamanho A4 e outras opções para impressão
+PDF_OPTIONS = {
+    'page-size': 'A4',
+    'margin-top': '0.5cm',
+    'margin-right': '0.5cm',
+    'margin-bottom': '0.5cm',
+    'margin-left': '0.5cm',
+    'encoding': 'UTF-8',
+    'print-media-type': '',
+    'no-outline': None
+}
+
+
+class InvoiceRenderer:
+    """
+    Invoice renderer kept for the life of the application: the compiled
+    template and the stylesheet source are loaded once, and each thread
+    keeps a PdfRenderer with the parsed stylesheet and fonts.
+    """
+
+    def __init__(self, app):
+        self.jinja_env = app.jinja_env
+        self.template = self.jinja_env.get_template(INVOICE_TEMPLATE)
+        self.stylesheet = self.jinja_env.loader.get_source(self.jinja_env, INVOICE_STYLESHEET)[0]
+        # Entra na chave do cache de PDF: mudar o CSS invalida os PDFs gerados com o anterior
+        self.fingerprint = hashlib.sha256(self.stylesheet.encode('utf-8')).hexdigest()[:16]
+        self._local = threading.local()
+
+    def render_html(self, service_order):
+        """Render the invoice HTML (without the inline stylesheet) of a closed service order."""
+        template = self.template
+        if self.jinja_env.auto_reload:
+            # Desenvolvimento: recarrega o template alterado em disco
+            template = self.jinja_env.get_template(INVOICE_TEMPLATE)
+        context = {'service_order': service_order, 'Decimal': Decimal, 'pdf': True}
+        current_app.update_template_context(context)
+        return template.render(context)
+
+    def write_pdf(self, html_content, target=None):
+        """Convert invoice HTML to PDF with this thread's PdfRenderer (bytes when target is None)."""
+        renderer = getattr(self._local, 'pdf', None)
+        if renderer is None:
+            renderer = self._local.pdf = PdfRenderer([self.stylesheet], **PDF_OPTIONS)
+        return renderer.write_pdf(html_content, target)
+
+
+def get_invoice_renderer():
+    """Return the InvoiceRenderer of the current application, creating it on first use."""
+    renderer = current_app.extensions.get('invoice_renderer')
+    if renderer is None:
+        renderer = current_app.extensions.setdefault('invoice_renderer', InvoiceRenderer(current_app))
+    return renderer
+
+
+def render_invoice_html(service_order):
+    """Render the invoice HTML of a closed service order, as converted to PDF."""
+    return get_invoice_renderer().render_html(service_order)
+
+
+def invoice_cache_key(html_content):
+    """Cache key (and ETag) of the PDF rendered from an invoice HTML."""
+    return pdf_cache.key_for(
+        html_content, INVOICE_TEMPLATE, get_invoice_renderer().fingerprint, sorted(PDF_OPTIONS.items())
+    )
+
+
+def get_invoice_pdf(service_order):
+    """
+    Get the invoice PDF of a service order, rendering it on a cache miss.
+
+    Args:
+        service_order: Closed ServiceOrder with invoice data
+
+    Returns:
+        Tuple (path of the PDF file, content hash used as ETag)
+    """
+    html_content = render_invoice_html(service_order)
+    key = invoice_cache_key(html_content)
+    path = pdf_cache.get(key, service_order.id, service_order.client_id)
+    if path is None:
+        path = pdf_cache.put(
+            key, service_order.id, service_order.client_id,
+            lambda target: get_invoice_renderer().write_pdf(html_content, target)
+        )
+    return path, key
+
+
+@job_handler('invoice_pdf')
+def prerender_invoices_job(context, order_ids=(), client_ids=()):
+    """Render into the PDF cache the invoices of the given orders and of the given clients' orders."""
+    from models import ServiceOrder, ServiceOrderStatus
+
+    if not weasyprint_available():
+        raise JobError('WeasyPrint não está disponível. Não é possível gerar PDFs.')
+    service_orders = ServiceOrder.query.options(
+        joinedload(ServiceOrder.client),
+        joinedload(ServiceOrder.responsible),
+        selectinload(ServiceOrder.equipment)
+    ).filter(
+        ServiceOrder.status == ServiceOrderStatus.fechada,
+        ServiceOrder.invoice_number.isnot(None),
+        or_(ServiceOrder.id.in_(order_ids), ServiceOrder.client_id.in_(client_ids))
+    ).order_by(ServiceOrder.id).yield_per(100)
+    for done, service_order in enumerate(service_orders, 1):
+        get_invoice_pdf(service_order)
+        context.progress(done)
+
+
+_SESSION_KEY = 'invoice_pdf_prerender'
+
+
+def _collect_invoice_changes(session, flush_context):
+    from models import ServiceOrder, ServiceOrderStatus, Client
+
+    changes = session.info.setdefault(_SESSION_KEY, (set(), set()))
+    for obj in (*session.new, *session.dirty):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, ServiceOrder):
+            if obj.status == ServiceOrderStatus.fechada and obj.invoice_number:
+                changes[0].add(obj.id)
+        elif isinstance(obj, Client) and obj not in session.new:
+            # Cliente novo ainda não tem notas fiscais
+            changes[1].add(obj.id)
+
+
+def _enqueue_after_commit(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    if not changes or not (changes[0] or changes[1]):
+        return
+    # Depois do hook do pdf_cache (registrado antes), que já removeu os PDFs antigos
+    try:
+        with db.engine.begin() as connection:
+            enqueue_in(connection, 'invoice_pdf', {
+                'order_ids': sorted(changes[0]),
+                'client_ids': sorted(changes[1]),
+            })
+    except Exception as e:
+        # Sem o pré-processamento o PDF é gerado no primeiro download
+        logger.warning(f"Não foi possível agendar a geração dos PDFs das notas fiscais: {e}")
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def init_invoice_pdf(app):
+    """Register the hooks that pre-render invoice PDFs when an invoiced order or its client changes."""
+    if app.config.get('INVOICE_PDF_PRERENDER') and not event.contains(Session, 'after_flush', _collect_invoice_changes):
+        event.listen(Session, 'after_flush', _collect_invoice_changes)
+        event.listen(Session, 'after_commit', _enqueue_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def export_workers():
+    """Number of processes converting invoices to PDF (INVOICE_EXPORT_WORKERS, default: CPU cores)."""
+    return current_app.config.get('INVOICE_EXPORT_WORKERS') or os.cpu_count() or 1
+
+
+def get_export_executor():
+    """
+    Return the process pool used to convert invoices to PDF, creating it on first use.
+
+    The pool starts its processes with forkserver (spawn where unavailable):
+    forking a multithreaded gunicorn worker could copy held locks, and the
+    pool processes only need pdf_utils, not the whole application. Each
+    process builds its PdfRenderer once, when it starts.
+    """
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            workers = export_workers()
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+            _executor = ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context(method),
+                initializer=init_process_renderer,
+                initargs=([get_invoice_renderer().stylesheet], PDF_OPTIONS)
+            )
+            logger.info(f"Pool de exportação de notas fiscais iniciado com {workers} processos ({method})")
+        return _executor
+
+
+def _write_bytes(pdf_data):
+    def write(target):
+        with open(target, 'wb') as pdf_file:
+            pdf_file.write(pdf_data)
+    return write
+
+
+def _converted_pdf(future, key, order_id, client_id):
+    pdf_data = future.result()
+    try:
+        pdf_cache.put(key, order_id, client_id, _write_bytes(pdf_data))
+    except OSError as e:
+        logger.warning(f"Não foi possível guardar o PDF da OS #{order_id} no cache: {e}")
+    yield pdf_data
+
+
+def iter_invoice_files(service_orders):
+    """
+    Produce the invoice PDFs of service orders as archive members.
+
+    Cached PDFs are read from disk; the others are converted in the process
+    pool (and then stored in the cache), a few orders ahead of the one
+    being consumed. Members keep the order of service_orders.
+
+    Args:
+        service_orders: Iterable of closed ServiceOrder (e.g. a yield_per query)
+
+    Yields:
+        Tuples (file name, source) for zip_stream.stream_zip, where source is
+        the path of a cached PDF or a lazy iterable with the converted PDF
+    """
+    executor = None
+    max_pending = 0
+    pending = deque()
+
+    for service_order in service_orders:
+        html_content = render_invoice_html(service_order)
+        key = invoice_cache_key(html_content)
+        source = pdf_cache.get(key, service_order.id, service_order.client_id)
+        if source is None:
+            if executor is None:
+                executor = get_export_executor()
+                # Alguns PDFs por processo na fila mantêm o pool ocupado sem acumular memória
+                max_pending = export_workers() * 2
+            future = executor.submit(render_in_process, html_content)
+            source = _converted_pdf(future, key, service_order.id, service_order.client_id)
+        pending.append((f'NF_{service_order.invoice_number}.pdf', source))
+        while len(pending) > max_pending:
+            yield pending.popleft()
+    while pending:
+        yield pending.popleft()
@@ -0,0 +1,612 @@
+"""
+Background jobs for SAMAPE application.
+Heavy work (bulk exports, PDFs) is stored as a row of the job table and
+run by a worker outside the request: the endpoint enqueues it and answers
+at once with the job id, the page polls the job status and the result
+file is downloaded from disk when it is ready. The database is the queue,
+there is no broker to run.
+
+Workers claim jobs with a single ``UPDATE ... RETURNING`` (``FOR UPDATE
+SKIP LOCKED`` on PostgreSQL), so any number of them can share the table.
+A failed job is retried after a growing delay up to max_attempts; a job
+whose worker stopped sending heartbeats is picked up again by another one.
+
+Files shared between a request and a job (uploaded statements, results)
+are kept in the job_file table, in FILE_CHUNK_SIZE blocks, not only on the
+local disk: with several instances (autoscale) the job may run, and the
+result be downloaded, on another host. JOB_RESULTS_DIR is a local scratch
+directory.
+
+The worker runs as ``flask --app main jobs-worker`` (or ``python
+jobs.py``). With JOB_EMBEDDED_WORKER set (the default outside
+production), each web process also starts a small worker in background
+threads on its first request, which keeps single-process setups working
+without a separate service.
+"""
+import json
+import logging
+import os
+import shutil
+import signal
+import socket
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, delete, insert, or_, select, update
+from sqlalchemy.exc import OperationalError
+
+from database import db, sqlite_journal
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THREADS = 2
+POLL_INTERVAL = 2  # seconds
+HEARTBEAT_INTERVAL = 30  # seconds
+STALE_AFTER = 300  # seconds without heartbeat before a running job is taken over
+RETRY_DELAY = 30  # seconds, doubled on every attempt
+MAINTENANCE_INTERVAL = 3600  # seconds
+DEFAULT_RESULT_TTL_HOURS = 24
+UPLOADS_DIR = 'uploads'  # arquivos enviados pelo usuário para uma tarefa ler
+FILE_CHUNK_SIZE = 1024 * 1024  # bytes por linha de job_file
+
+_handlers = {}
+_settings = {
+    'results_dir': os.path.join(tempfile.gettempdir(), 'samape_jobs'),
+    'result_ttl_hours': DEFAULT_RESULT_TTL_HOURS,
+}
+_embedded = {'started': False, 'lock': threading.Lock()}
+
+
+class JobError(Exception):
+    """Failure that retrying will not fix; the job fails with this message at once."""
+
+
+def job_handler(kind):
+    """
+    Register a function as the handler of a job kind.
+
+    The handler is called as handler(context, **params) inside an
+    application context, with a JobContext to report progress and to get
+    the path of the result file.
+    """
+    def register(func):
+        _handlers[kind] = func
+        return func
+    return register
+
+
+def enqueue(kind, params=None, user_id=None, max_attempts=3):
+    """
+    Create a pending job and commit it.
+
+    Args:
+        kind: Name of a registered handler
+        params: JSON-serializable keyword arguments of the handler
+        user_id: User who asked for the job (owner of the result)
+        max_attempts: Attempts before the job is marked as failed
+
+    Returns:
+        The new Job
+    """
+    from models import Job
+
+    if kind not in _handlers:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    job = Job(kind=kind, params=json.dumps(params or {}), user_id=user_id, max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+
+def enqueue_in(connection, kind, params=None, user_id=None, max_attempts=3):
+    """
+    Insert a pending job through an open connection, in its transaction.
+
+    For code that cannot use the session, such as session event hooks.
+
+    Returns:
+        Id of the new job
+    """
+    from models import Job, JobStatus
+
+    if kind not in _handlers:
+        raise ValueError(f"Tipo de tarefa desconhecido: {kind}")
+    now = datetime.utcnow()
+    return connection.execute(
+        insert(Job).values(
+            kind=kind,
+            params=json.dumps(params or {}),
+            status=JobStatus.pendente,
+            progress=0,
+            attempts=0,
+            max_attempts=max_attempts,
+            run_after=now,
+            user_id=user_id,
+            created_at=now,
+        ).returning(Job.id)
+    ).scalar()
+
+
+def store_file(name, path):
+    """
+    Copy a local file into the job_file table, replacing a file of the same name.
+
+    Args:
+        name: Name of the stored file ('uploads/<name>' or '<job id>/<file>')
+        path: Local file to copy
+    """
+    from models import JobFile
+
+    table = JobFile.__table__
+    now = datetime.utcnow()
+    with db.engine.begin() as connection, open(path, 'rb') as source:
+        connection.execute(delete(table).where(table.c.name == name))
+        seq = 0
+        chunk = source.read(FILE_CHUNK_SIZE)
+        # Um arquivo vazio também grava um bloco, para constar como existente
+        while seq == 0 or chunk:
+            connection.execute(insert(table).values(name=name, seq=seq, data=chunk, created_at=now))
+            seq += 1
+            chunk = source.read(FILE_CHUNK_SIZE)
+
+
+def file_exists(name):
+    """True if a file is stored in job_file under this name."""
+    from models import JobFile
+
+    table = JobFile.__table__
+    with db.engine.connect() as connection:
+        return connection.execute(
+            select(table.c.id).where(table.c.name == name, table.c.seq == 0)
+        ).first() is not None
+
+
+def iter_file(name):
+    """
+    Yield the blocks of a stored file in order.
+
+    Each block is read with its own short query, so a slow download does
+    not hold a database connection.
+    """
+    from models import JobFile
+
+    table = JobFile.__table__
+    seq = 0
+    while True:
+        with db.engine.connect() as connection:
+            chunk = connection.execute(
+                select(table.c.data).where(table.c.name == name, table.c.seq == seq)
+            ).scalar()
+        if chunk is None:
+            return
+        yield bytes(chunk)
+        seq += 1
+
+
+def fetch_file(name, path):
+    """
+    Write a stored file to a local path, unless it is already there.
+
+    Returns:
+        False if no file is stored under this name
+    """
+    if os.path.exists(path):
+        return True
+    if not file_exists(name):
+        return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.part'
+    with open(partial, 'wb') as target:
+        for chunk in iter_file(name):
+            target.write(chunk)
+    os.replace(partial, path)
+    return True
+
+
+def delete_file(name):
+    """Remove a stored file from job_file."""
+    from models import JobFile
+
+    table = JobFile.__table__
+    with db.engine.begin() as connection:
+        connection.execute(delete(table).where(table.c.name == name))
+
+
+def upload_path(name):
+    """
+    Return the local path where a request saves a file that a job will read.
+
+    After saving it, the request calls share_upload so that a worker on
+    another instance finds it (fetch_upload). The job deletes the file when
+    it is done and purge_jobs removes the ones left behind after the result
+    TTL.
+
+    Args:
+        name: File name (only its base name is used)
+
+    Returns:
+        Absolute path (its directory is created)
+    """
+    directory = os.path.join(_settings['results_dir'], UPLOADS_DIR)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, os.path.basename(name))
+
+
+def _upload_name(name):
+    return f'{UPLOADS_DIR}/{os.path.basename(name)}'
+
+
+def share_upload(name):
+    """Store the file saved at upload_path(name) for the workers of every instance."""
+    store_file(_upload_name(name), upload_path(name))
+
+
+def upload_exists(name):
+    """True if an upload shared with share_upload is still stored."""
+    return file_exists(_upload_name(name))
+
+
+def fetch_upload(name):
+    """Local path of a shared upload (copied from the database if needed), or None."""
+    path = upload_path(name)
+    return path if fetch_file(_upload_name(name), path) else None
+
+
+def delete_upload(name):
+    """Remove an upload from the local disk and from the database."""
+    path = upload_path(name)
+    if os.path.exists(path):
+        os.remove(path)
+    delete_file(_upload_name(name))
+
+
+def _update_job(job_id, **values):
+    from models import Job
+
+    with db.engine.begin() as connection:
+        connection.execute(update(Job).where(Job.id == job_id).values(**values))
+
+
+class JobContext:
+    """Handle given to a running handler to report progress and store its result."""
+
+    # Intervalo mínimo entre gravações de progresso
+    PROGRESS_INTERVAL = 1.0
+
+    def __init__(self, job):
+        self.job_id = job.id
+        self.attempt = job.attempts
+        self.result_file = None
+        self.result_name = None
+        self.result_mimetype = None
+        self._last_progress = 0.0
+
+    def progress(self, done, total=None, message=None):
+        """Record how much of the job is done (throttled; best effort)."""
+        now = datetime.utcnow().timestamp()
+        if now - self._last_progress < self.PROGRESS_INTERVAL and total is None and message is None:
+            return
+        if (db.engine.dialect.name == 'sqlite' and sqlite_journal['mode'] != 'wal'
+                and db.session().in_transaction()):
+            # SQLite sem WAL (banco em memória): a leitura em andamento da sessão
+            # bloquearia a escrita em outra conexão
+            return
+        self._last_progress = now
+        values = {'progress': done, 'heartbeat_at': datetime.utcnow()}
+        if total is not None:
+            values['total'] = total
+        if message is not None:
+            values['message'] = message[:255]
+        try:
+            _update_job(self.job_id, **values)
+        except OperationalError as e:
+            # O progresso não é essencial: a tarefa continua
+            logger.debug(f"Progresso da tarefa #{self.job_id} não gravado: {e}")
+
+    def result_path(self, name, mimetype='application/octet-stream'):
+        """
+        Return the local path where the handler must write its result file.
+
+        When the handler returns, the file is moved into the job_file table,
+        where the download reads it from any instance.
+
+        Args:
+            name: File name offered in the download
+            mimetype: Content type of the download
+
+        Returns:
+            Absolute path (its directory is created)
+        """
+        directory = os.path.join(_settings['results_dir'], str(self.job_id))
+        os.makedirs(directory, exist_ok=True)
+        self.result_file = os.path.join(str(self.job_id), os.path.basename(name))
+        self.result_name = name
+        self.result_mimetype = mimetype
+        return os.path.join(_settings['results_dir'], self.result_file)
+
+
+def _claimable(now):
+    from models import Job, JobStatus
+
+    stale = now - timedelta(seconds=STALE_AFTER)
+    return or_(
+        and_(Job.status == JobStatus.pendente, Job.run_after <= now),
+        and_(Job.status == JobStatus.executando, Job.heartbeat_at < stale, Job.attempts < Job.max_attempts),
+    )
+
+
+def claim_job(worker):
+    """
+    Atomically take the oldest runnable job for a worker.
+
+    Args:
+        worker: Name of the worker (host:pid)
+
+    Returns:
+        Id of the claimed job, or None if there is nothing to run
+    """
+    from models import Job, JobStatus
+
+    now = datetime.utcnow()
+    candidate = (
+        select(Job.id)
+        .where(_claimable(now))
+        .order_by(Job.id)
+        .limit(1)
+        .with_for_update(skip_locked=True)
+        .scalar_subquery()
+    )
+    # A condição é repetida: outro worker pode ter levado a tarefa entre a subconsulta e o UPDATE
+    statement = (
+        update(Job)
+        .where(Job.id == candidate, _claimable(now))
+        .values(
+            status=JobStatus.executando,
+            worker=worker,
+            attempts=Job.attempts + 1,
+            started_at=now,
+            heartbeat_at=now,
+            error=None,
+        )
+        .returning(Job.id)
+    )
+    with db.engine.begin() as connection:
+        return connection.execute(statement).scalar()
+
+
+def run_job(job_id):
+    """Run a claimed job and record its result, retry or failure (needs an app context)."""
+    from models import Job, JobStatus
+
+    job = db.session.get(Job, job_id)
+    context = JobContext(job)
+    kind = job.kind
+    max_attempts = job.max_attempts
+    params = json.loads(job.params or '{}')
+    db.session.close()
+    try:
+        handler = _handlers.get(kind)
+        if handler is None:
+            raise JobError(f"Tipo de tarefa desconhecido: {kind}")
+        handler(context, **params)
+        db.session.commit()
+        if context.result_file:
+            _store_result(context)
+    except Exception as e:
+        db.session.rollback()
+        retry = not isinstance(e, JobError) and context.attempt < max_attempts
+        if retry:
+            delay = RETRY_DELAY * 2 ** (context.attempt - 1)
+            logger.warning(f"Tarefa #{job_id} ({kind}) falhou na tentativa {context.attempt}, nova tentativa em {delay}s: {e}")
+            _update_job(job_id, status=JobStatus.pendente, worker=None, error=str(e),
+                        run_after=datetime.utcnow() + timedelta(seconds=delay))
+        else:
+            logger.error(f"Tarefa #{job_id} ({kind}) falhou: {e}", exc_info=not isinstance(e, JobError))
+            _update_job(job_id, status=JobStatus.falhou, error=str(e), message=str(e)[:255],
+                        finished_at=datetime.utcnow())
+    else:
+        _update_job(
+            job_id,
+            status=JobStatus.concluido,
+            result_file=context.result_file,
+            result_name=context.result_name,
+            result_mimetype=context.result_mimetype,
+            finished_at=datetime.utcnow(),
+        )
+        logger.info(f"Tarefa #{job_id} ({kind}) concluída")
+    finally:
+        db.session.remove()
+
+
+def _store_result(context):
+    # O download pode cair em outra instância: o resultado vai para o banco
+    store_file(context.result_file, os.path.join(_settings['results_dir'], context.result_file))
+    shutil.rmtree(os.path.join(_settings['results_dir'], str(context.job_id)), ignore_errors=True)
+
+
+def purge_jobs(max_age_hours=None):
+    """
+    Delete finished jobs older than max_age_hours with their result files
+    (and uploads as old), and fail running jobs abandoned after their last
+    attempt.
+
+    Returns:
+        Number of jobs deleted
+    """
+    from models import Job, JobFile, JobStatus
+
+    files = JobFile.__table__
+    now = datetime.utcnow()
+    cutoff = now - timedelta(hours=max_age_hours or _settings['result_ttl_hours'])
+    finished = (JobStatus.concluido, JobStatus.falhou)
+    with db.engine.begin() as connection:
+        connection.execute(
+            update(Job)
+            .where(Job.status == JobStatus.executando,
+                   Job.heartbeat_at < now - timedelta(seconds=STALE_AFTER),
+                   Job.attempts >= Job.max_attempts)
+            .values(status=JobStatus.falhou, error='Tarefa interrompida', message='Tarefa interrompida',
+                    finished_at=now)
+        )
+        job_ids = connection.execute(
+            delete(Job).where(Job.status.in_(finished), Job.finished_at < cutoff).returning(Job.id)
+        ).scalars().all()
+        for job_id in job_ids:
+            connection.execute(delete(files).where(files.c.name.startswith(f'{job_id}/', autoescape=True)))
+        connection.execute(delete(files).where(
+            files.c.name.startswith(f'{UPLOADS_DIR}/', autoescape=True), files.c.created_at < cutoff
+        ))
+    for job_id in job_ids:
+        shutil.rmtree(os.path.join(_settings['results_dir'], str(job_id)), ignore_errors=True)
+    uploads = os.path.join(_settings['results_dir'], UPLOADS_DIR)
+    if os.path.isdir(uploads):
+        for entry in os.scandir(uploads):
+            if entry.is_file() and datetime.utcfromtimestamp(entry.stat().st_mtime) < cutoff:
+                os.remove(entry.path)
+    return len(job_ids)
+
+
+class Worker:
+    """Poll the job table and run jobs in a thread pool."""
+
+    def __init__(self, app, threads=None, poll_interval=POLL_INTERVAL):
+        self.app = app
+        self.threads = threads or app.config.get('JOB_WORKER_THREADS') or DEFAULT_THREADS
+        self.poll_interval = poll_interval
+        self.name = f'{socket.gethostname()}:{os.getpid()}'
+        self.stop_event = threading.Event()
+        self._running = set()
+        self._lock = threading.Lock()
+
+    def _run(self, job_id):
+        try:
+            # Contexto de requisição: templates usam url_for
+            with self.app.test_request_context():
+                run_job(job_id)
+        except Exception:
+            logger.exception(f"Erro inesperado ao executar a tarefa #{job_id}")
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+
+    def _heartbeat(self):
+        from models import Job
+
+        with self._lock:
+            job_ids = list(self._running)
+        if job_ids:
+            try:
+                with db.engine.begin() as connection:
+                    connection.execute(update(Job).where(Job.id.in_(job_ids)).values(heartbeat_at=datetime.utcnow()))
+            except OperationalError as e:
+                logger.debug(f"Heartbeat das tarefas não gravado: {e}")
+
+    def run(self, burst=False):
+        """
+        Run jobs until stopped (or, with burst, until the queue is empty).
+
+        Returns:
+            Number of jobs claimed
+        """
+        claimed = 0
+        last_heartbeat = last_maintenance = 0.0
+        logger.info(f"Worker de tarefas {self.name} iniciado com {self.threads} threads")
+        with self.app.app_context(), ThreadPoolExecutor(self.threads, thread_name_prefix='job') as pool:
+            while not self.stop_event.is_set():
+                now = datetime.utcnow().timestamp()
+                if now - last_maintenance >= MAINTENANCE_INTERVAL:
+                    last_maintenance = now
+                    try:
+                        purge_jobs()
+                    except Exception as e:
+                        logger.warning(f"Erro ao limpar tarefas antigas: {e}")
+                if now - last_heartbeat >= HEARTBEAT_INTERVAL:
+                    last_heartbeat = now
+                    self._heartbeat()
+
+                job_id = None
+                with self._lock:
+                    busy = len(self._running)
+                if busy < self.threads:
+                    try:
+                        job_id = claim_job(self.name)
+                    except OperationalError as e:
+                        logger.warning(f"Erro ao buscar tarefas: {e}")
+                    finally:
+                        db.session.remove()
+                if job_id is not None:
+                    claimed += 1
+                    with self._lock:
+                        self._running.add(job_id)
+                    pool.submit(self._run, job_id)
+                    continue
+                if burst and busy == 0:
+                    break
+                self.stop_event.wait(self.poll_interval)
+        logger.info(f"Worker de tarefas {self.name} encerrado")
+        return claimed
+
+    def stop(self, *args):
+        self.stop_event.set()
+
+
+def run_worker(app, threads=None, burst=False):
+    """Run a worker in the foreground until SIGTERM/Ctrl+C (or an empty queue, with burst)."""
+    worker = Worker(app, threads=threads)
+    signal.signal(signal.SIGTERM, worker.stop)
+    try:
+        return worker.run(burst=burst)
+    except KeyboardInterrupt:
+        # As tarefas em andamento terminam antes de sair
+        worker.stop()
+        return None
+
+
+def start_embedded_worker(app):
+    """Start a worker in daemon threads of this process (once)."""
+    with _embedded['lock']:
+        if _embedded['started']:
+            return
+        _embedded['started'] = True
+    worker = Worker(app, threads=app.config.get('JOB_WORKER_THREADS') or 1)
+    threading.Thread(target=worker.run, name='job-worker', daemon=True).start()
+
+
+def init_jobs(app):
+    """Configure the results directory, register the CLI and the embedded worker."""
+    import click
+
+    _settings['results_dir'] = app.config.get('JOB_RESULTS_DIR') or _settings['results_dir']
+    _settings['result_ttl_hours'] = app.config.get('JOB_RESULT_TTL_HOURS', DEFAULT_RESULT_TTL_HOURS)
+
+    @app.cli.command('jobs-worker')
+    @click.option('--threads', type=int, default=None, help='Tarefas executadas ao mesmo tempo.')
+    @click.option('--burst', is_flag=True, help='Encerra quando não houver tarefas pendentes.')
+    def jobs_worker_command(threads, burst):
+        """Executa as tarefas em segundo plano (exportações, PDFs)."""
+        count = run_worker(app, threads=threads, burst=burst)
+        if burst:
+            print(f"{count} tarefa(s) executada(s).")
+
+    if app.config.get('JOB_EMBEDDED_WORKER'):
+        @app.before_request
+        def _start_embedded_worker():
+            if not _embedded['started']:
+                start_embedded_worker(app)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from app import app
+    # Os handlers se registram no módulo jobs importado pelo app, não neste __main__
+    from jobs import run_worker
+
+    parser = argparse.ArgumentParser(description="Executa as tarefas em segundo plano (exportações, PDFs).")
+    parser.add_argument('--threads', type=int, default=None, help='Tarefas executadas ao mesmo tempo.')
+    parser.add_argument('--burst', action='store_true', help='Encerra quando não houver tarefas pendentes.')
+    args = parser.parse_args()
+
+    run_worker(app, threads=args.threads, burst=args.burst)
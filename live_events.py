@@ -0,0 +1,295 @@
+"""
+Live events (Server-Sent Events) for SAMAPE application.
+Publishes small change notifications (service order status, new action
+logs, low stock) after each committed transaction and fans them out to the
+SSE connections held by the dashboard and the service order board.
+
+Backends:
+    local     - in-process only (one worker or development)
+    postgres  - NOTIFY/LISTEN on the application database, so every gunicorn
+                worker receives the events published by any other worker
+    auto      - postgres when the database is PostgreSQL, local otherwise
+                (default)
+
+Each SSE connection holds a gunicorn thread while it streams, so a worker
+accepts at most LIVE_EVENTS_MAX_SUBSCRIBERS of them and refuses the rest.
+
+The bus also carries internal messages between workers (cache
+invalidations); their handlers are registered with bus.on() and they are
+not forwarded to the SSE connections.
+"""
+import itertools
+import json
+import logging
+import queue
+import select
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import event, inspect, text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+_SESSION_KEY = 'live_events_pending'
+# Evento interno entregue aos handlers quando o listener do Postgres reconecta
+RECONNECTED = 'bus_reconnected'
+RECONNECTED_MESSAGE = json.dumps({'type': RECONNECTED, 'data': {}})
+
+
+class LocalBackend:
+    """Delivers messages straight to the subscribers of this process."""
+
+    def __init__(self, dispatch):
+        self.dispatch = dispatch
+
+    def start(self):
+        pass
+
+    def publish(self, message):
+        self.dispatch(message)
+
+
+class PostgresBackend:
+    """Fans messages out across processes with Postgres NOTIFY/LISTEN."""
+
+    CHANNEL = 'samape_events'
+
+    def __init__(self, dispatch, engine):
+        self.dispatch = dispatch
+        self.engine = engine
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        # O listener é iniciado sob demanda, já dentro do worker (após o fork)
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._listen_forever, name='live-events-listener', daemon=True)
+                self._thread.start()
+
+    def publish(self, message):
+        with self.engine.connect() as connection:
+            connection.execute(text("SELECT pg_notify(:channel, :payload)"),
+                               {'channel': self.CHANNEL, 'payload': message})
+            connection.commit()
+
+    def _listen_forever(self):
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = self.engine.raw_connection()
+                connection.detach()  # conexão dedicada, fora do pool
+                dbapi_connection = connection.dbapi_connection
+                dbapi_connection.autocommit = True
+                cursor = dbapi_connection.cursor()
+                cursor.execute(f"LISTEN {self.CHANNEL}")
+                if connected_before:
+                    # Mensagens publicadas enquanto a conexão estava caída foram perdidas
+                    self.dispatch(RECONNECTED_MESSAGE)
+                connected_before = True
+                while True:
+                    if select.select([dbapi_connection], [], [], 30) == ([], [], []):
+                        continue
+                    dbapi_connection.poll()
+                    while dbapi_connection.notifies:
+                        self.dispatch(dbapi_connection.notifies.pop(0).payload)
+            except Exception as e:
+                logger.error(f"Live events listener error: {e}")
+                time.sleep(5)
+            finally:
+                if connection is not None:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+
+class EventBus:
+    """In-process pub/sub with one bounded queue per subscriber."""
+
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._handlers = {}
+        self.backend = LocalBackend(self._dispatch)
+
+    def configure(self, backend):
+        self.backend = backend
+
+    def start(self):
+        self.backend.start()
+
+    def on(self, event_type, handler):
+        """Call handler(data) in this process for every event_type message, instead of streaming it."""
+        self._handlers.setdefault(event_type, []).append(handler)
+
+    def publish(self, event_type, data):
+        message = json.dumps({'type': event_type, 'data': data}, default=str, separators=(',', ':'))
+        try:
+            self.backend.publish(message)
+        except Exception as e:
+            logger.error(f"Failed to publish live event {event_type}: {e}")
+
+    def subscribe(self, limit=None):
+        """Return a queue receiving the events, or None if limit subscribers are already connected."""
+        self.start()
+        subscription = queue.Queue(maxsize=self.queue_size)
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def _dispatch(self, message):
+        try:
+            decoded = json.loads(message)
+            event_type = decoded['type']
+        except (ValueError, KeyError):
+            return
+        if event_type in self._handlers:
+            for handler in self._handlers[event_type]:
+                try:
+                    handler(decoded.get('data') or {})
+                except Exception as e:
+                    logger.error(f"Live event handler for {event_type} failed: {e}")
+            return
+        item = (next(self._ids), event_type, message)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(item)
+            except queue.Full:
+                # Cliente lento: descarta o evento em vez de bloquear os demais
+                pass
+
+
+bus = EventBus()
+
+
+def stream_events(subscription, heartbeat=15, max_duration=300):
+    """
+    Yield SSE frames for a subscription until the client disconnects.
+
+    The stream ends after max_duration seconds; EventSource reconnects on
+    its own, which periodically frees the worker thread.
+    """
+    deadline = time.monotonic() + max_duration
+    try:
+        yield 'retry: 5000\n\n'
+        while time.monotonic() < deadline:
+            try:
+                event_id, event_type, message = subscription.get(timeout=heartbeat)
+            except queue.Empty:
+                # Comentário SSE mantém a conexão aberta através de proxies
+                yield ': ping\n\n'
+                continue
+            yield f'id: {event_id}\nevent: {event_type}\ndata: {message}\n\n'
+    finally:
+        bus.unsubscribe(subscription)
+
+
+def _history(obj, field):
+    history = inspect(obj).attrs[field].history
+    return history.deleted[0] if history.deleted else None, history.has_changes()
+
+
+def _collect_events(session, flush_context):
+    from models import ServiceOrder, ActionLog, StockItem, Part
+
+    pending = session.info.setdefault(_SESSION_KEY, [])
+    for obj in session.new:
+        if isinstance(obj, ServiceOrder):
+            pending.append(('service_order', {
+                'id': obj.id, 'status': obj.status.name if obj.status else None,
+                'status_label': obj.status.value if obj.status else None,
+                'previous_status': None, 'client_id': obj.client_id
+            }))
+        elif isinstance(obj, ActionLog):
+            pending.append(('action_log', {
+                'id': obj.id, 'action': obj.action, 'entity_type': obj.entity_type,
+                'entity_id': obj.entity_id, 'user_id': obj.user_id,
+                'timestamp': (obj.timestamp or datetime.utcnow()).isoformat()
+            }))
+    for obj in session.dirty:
+        if isinstance(obj, ServiceOrder):
+            previous, changed = _history(obj, 'status')
+            if changed:
+                pending.append(('service_order', {
+                    'id': obj.id, 'status': obj.status.name if obj.status else None,
+                    'status_label': obj.status.value if obj.status else None,
+                    'previous_status': previous.name if previous else None, 'client_id': obj.client_id
+                }))
+        elif isinstance(obj, StockItem):
+            _, changed = _history(obj, 'quantity')
+            if changed and obj.quantity is not None and obj.quantity <= (obj.min_quantity or 0):
+                pending.append(('low_stock', {
+                    'kind': 'stock_item', 'id': obj.id, 'name': obj.name,
+                    'quantity': obj.quantity, 'minimum': obj.min_quantity
+                }))
+        elif isinstance(obj, Part):
+            _, changed = _history(obj, 'stock_quantity')
+            if changed and obj.stock_quantity is not None and obj.stock_quantity <= (obj.minimum_stock or 0):
+                pending.append(('low_stock', {
+                    'kind': 'part', 'id': obj.id, 'name': obj.name,
+                    'quantity': obj.stock_quantity, 'minimum': obj.minimum_stock
+                }))
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    return value
+
+
+def _publish_after_commit(session):
+    pending = session.info.pop(_SESSION_KEY, None)
+    for event_type, data in pending or ():
+        bus.publish(event_type, data)
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def _share_cache_invalidations(app):
+    import cache
+
+    # Chaves descartadas por um worker também saem do cache dos outros; após
+    # uma reconexão do listener (avisos perdidos) o cache local é esvaziado
+    cache.share_invalidations(lambda data: bus.publish('cache_invalidate', data))
+    bus.on('cache_invalidate', cache.apply_invalidation)
+    bus.on(RECONNECTED, lambda data: cache.apply_invalidation({'all': True}))
+    # Cada worker precisa do listener antes de servir (e guardar em cache) algo
+    app.before_request(bus.start)
+
+
+def init_live_events(app, db):
+    """Select the fan-out backend and register the session hooks."""
+    backend_name = app.config.get('LIVE_EVENTS_BACKEND', 'auto')
+    if backend_name == 'auto':
+        backend_name = 'postgres' if db.engine.dialect.name == 'postgresql' else 'local'
+    if backend_name == 'postgres':
+        if db.engine.dialect.name != 'postgresql':
+            app.logger.warning("LIVE_EVENTS_BACKEND=postgres requires PostgreSQL; using local backend")
+        else:
+            bus.configure(PostgresBackend(bus._dispatch, db.engine))
+            _share_cache_invalidations(app)
+
+    from models import ServiceOrder
+
+    if not event.contains(Session, 'after_flush', _collect_events):
+        # active_history carrega o status anterior mesmo após o commit expirar o objeto
+        event.listen(ServiceOrder.status, 'set', _keep_previous_value, active_history=True, retval=True)
+        event.listen(Session, 'after_flush', _collect_events)
+        event.listen(Session, 'after_commit', _publish_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
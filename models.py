@@ -19,6 +19,12 @@ class ServiceOrderStatus(enum.Enum):
 class FinancialEntryType(enum.Enum):
     entrada = "entrada"
     saida = "saida"
+
+class JobStatus(enum.Enum):
+    pendente = "Pendente"
+    executando = "Em execução"
+    concluido = "Concluído"
+    falhou = "Falhou"
     
 class VehicleStatus(enum.Enum):
     ativo = "Ativo"
@@ -103,6 +109,14 @@ class Equipment(db.Model):
     service_orders = db.relationship('ServiceOrder', secondary=equipment_service_orders, backref=db.backref('equipment', lazy=True))
     
 class ServiceOrder(db.Model):
+    # Índices da listagem /os (paginação por cursor em created_at, id)
+    __table_args__ = (
+        db.Index('ix_service_order_created_at_id', 'created_at', 'id'),
+        db.Index('ix_service_order_status_created_at', 'status', 'created_at', 'id'),
+        db.Index('ix_service_order_client_created_at', 'client_id', 'created_at', 'id'),
+        db.Index('ix_service_order_responsible_created_at', 'responsible_id', 'created_at', 'id'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     client_id = db.Column(db.Integer, db.ForeignKey('client.id'), nullable=False)
     responsible_id = db.Column(db.Integer, db.ForeignKey('user.id'))
@@ -118,6 +132,9 @@ class ServiceOrder(db.Model):
     invoice_date = db.Column(db.DateTime)
     invoice_amount = db.Column(db.Numeric(10, 2))
     service_details = db.Column(db.Text)
+    # Valores da nota com desconto (db_migration/service_order_schema.txt); só as telas de detalhe usam
+    discount_amount = db.deferred(db.Column(db.Numeric(10, 2)))
+    original_amount = db.deferred(db.Column(db.Numeric(10, 2)))
     
     # Relations
     financial_entries = db.relationship('FinancialEntry', backref='service_order', lazy=True)
@@ -136,7 +153,32 @@ class ServiceOrderImage(db.Model):
     def __repr__(self):
         return f'<ServiceOrderImage {self.filename}>'
 
+class FinancialCategory(db.Model):
+    """Categoria dos lançamentos financeiros (linhas do DRE)"""
+    __tablename__ = 'financial_category'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(50), unique=True, nullable=False)
+    name = db.Column(db.String(100), nullable=False)
+    type = db.Column(Enum(FinancialEntryType))  # None: receitas e despesas
+    sort_order = db.Column(db.Integer, nullable=False, default=0)
+    active = db.Column(db.Boolean, default=True)
+    
+    def __repr__(self):
+        return f'<FinancialCategory {self.key}>'
+
 class FinancialEntry(db.Model):
+    __table_args__ = (
+        # Filtros por período (intervalo de datas, ver performance_utils.period_filter)
+        db.Index('ix_financial_entry_date', 'date'),
+        db.Index('ix_financial_entry_type_date', 'type', 'date'),
+        # Um pagamento por entidade (ver payments.record_payment)
+        db.Index('uq_financial_entry_payment', 'entry_type', 'reference_id', 'type', unique=True),
+        db.Index('ix_financial_entry_category_id_date', 'category_id', 'date'),
+        # Linhas de extrato já importadas (ver bank_import)
+        db.Index('uq_financial_entry_import_hash', 'import_hash', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     service_order_id = db.Column(db.Integer, db.ForeignKey('service_order.id'))
     description = db.Column(db.String(200), nullable=False)
@@ -148,6 +190,38 @@ class FinancialEntry(db.Model):
     # Campos para relacionar com outros tipos de entidades (pedidos a fornecedores, etc.)
     entry_type = db.Column(db.String(50))  # 'service_order', 'pedido_fornecedor', etc.
     reference_id = db.Column(db.Integer)   # ID da entidade referenciada
+    category_id = db.Column(db.Integer, db.ForeignKey('financial_category.id'))
+    import_hash = db.Column(db.String(64))  # Identificador da linha do extrato bancário importado
+    
+    category = db.relationship('FinancialCategory')
+
+class FinancialMonthlyRollup(db.Model):
+    """Totais mensais do financeiro por tipo, mantidos a partir de FinancialEntry"""
+    __tablename__ = 'financial_monthly_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('period', 'type', name='uq_financial_monthly_rollup_period_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    period = db.Column(db.Date, nullable=False)  # Primeiro dia do mês
+    type = db.Column(Enum(FinancialEntryType), nullable=False)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+class FinancialDailyRollup(db.Model):
+    """Totais diários do financeiro por tipo (fluxo de caixa), mantidos a partir de FinancialEntry"""
+    __tablename__ = 'financial_daily_rollup'
+    __table_args__ = (
+        db.UniqueConstraint('day', 'type', name='uq_financial_daily_rollup_day_type'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    type = db.Column(Enum(FinancialEntryType), nullable=False)
+    total = db.Column(db.Numeric(14, 2), nullable=False, default=0)
+    entry_count = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class ActionLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -159,6 +233,56 @@ class ActionLog(db.Model):
     ip_address = db.Column(db.String(45))
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
+class Job(db.Model):
+    """Tarefa em segundo plano (exportações, PDFs), executada pelo worker de jobs.py"""
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(50), nullable=False)  # nome do handler registrado em jobs.py
+    params = db.Column(db.Text)  # JSON
+    status = db.Column(Enum(JobStatus), nullable=False, default=JobStatus.pendente)
+    progress = db.Column(db.Integer, nullable=False, default=0)
+    total = db.Column(db.Integer)
+    message = db.Column(db.String(255))
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)  # adiado entre tentativas
+    worker = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+    result_file = db.Column(db.String(255))  # relativo a JOB_RESULTS_DIR
+    result_name = db.Column(db.String(255))  # nome sugerido no download
+    result_mimetype = db.Column(db.String(100))
+    error = db.Column(db.Text)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    
+    user = db.relationship('User')
+    
+    @property
+    def percent(self):
+        if self.status == JobStatus.concluido:
+            return 100
+        if not self.total:
+            return 0
+        return min(100, int(self.progress * 100 / self.total))
+
+class JobFile(db.Model):
+    """Arquivo de uma tarefa (extrato enviado, resultado) guardado em blocos, visível a todas as instâncias"""
+    __tablename__ = 'job_file'
+    __table_args__ = (
+        db.UniqueConstraint('name', 'seq', name='uq_job_file_name_seq'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(255), nullable=False)  # 'uploads/<nome>' ou '<id da tarefa>/<arquivo>'
+    seq = db.Column(db.Integer, nullable=False)  # ordem do bloco no arquivo
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
 class LoginAttempt(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), nullable=False)  # Esta é a coluna que existe no banco de dados
@@ -289,15 +413,11 @@ class SequenceCounter(db.Model):
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     def next_value(self):
-        """Incrementa e retorna o próximo valor da sequência"""
-        self.current_value += 1
-        db.session.commit()
-        
-        # Formatação com zeros à esquerda e prefixo, se existir
-        formatted_number = str(self.current_value).zfill(self.padding)
-        if self.prefix:
-            return f"{self.prefix}{formatted_number}"
-        return formatted_number
+        """Incrementa (atomicamente, ver sequences.py) e retorna o próximo valor da sequência"""
+        from sequences import reserve_values, format_value
+        value, _, prefix, padding = reserve_values(self.name, prefix=self.prefix, padding=self.padding)
+        # Sem refresh: o UPDATE roda em outra transação
+        return format_value(value, prefix, padding)
         
 class StockItem(db.Model):
     """Modelo para itens de estoque (EPIs e ferramentas)"""
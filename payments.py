@@ -0,0 +1,142 @@
+"""
+Payment entries for SAMAPE application.
+Supplier order payments and refueling expenses are FinancialEntry rows
+identified by (entry_type, reference_id, type). A unique index keeps one
+row per key, so recording a payment twice (a double-click, two tabs) finds
+the existing entry instead of inserting another one.
+
+Run `python payments.py` to list duplicated payments recorded before the
+unique index existed (bootstrap does not create it while they exist).
+"""
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+SUPPLIER_ORDER = 'pedido_fornecedor'
+VEHICLE_REFUELING = 'vehicle_refueling'
+
+# Limite de parâmetros por consulta IN (alguns bancos limitam a quantidade)
+IN_BATCH_SIZE = 1000
+
+
+def find_payment(entry_type, reference_id, type_=None):
+    """
+    Return the payment entry of an entity, or None.
+
+    Args:
+        entry_type: Kind of entity (SUPPLIER_ORDER, VEHICLE_REFUELING)
+        reference_id: Id of the entity
+        type_: FinancialEntryType of the entry (default: saida)
+    """
+    from models import FinancialEntry, FinancialEntryType
+
+    return FinancialEntry.query.filter_by(
+        entry_type=entry_type,
+        reference_id=reference_id,
+        type=type_ or FinancialEntryType.saida
+    ).first()
+
+
+def record_payment(entry_type, reference_id, amount, description, type_=None, **values):
+    """
+    Insert the payment entry of an entity, or return the one already recorded.
+
+    The entry is inserted through the session (so the rollup, category and
+    cache hooks run) inside a SAVEPOINT: when the unique index rejects it,
+    only the savepoint is rolled back and the existing entry is returned.
+    The caller commits.
+
+    Args:
+        entry_type: Kind of entity (SUPPLIER_ORDER, VEHICLE_REFUELING)
+        reference_id: Id of the entity
+        amount: Value of the payment
+        description: Entry description
+        type_: FinancialEntryType of the entry (default: saida)
+        **values: Other FinancialEntry columns (date, created_by...)
+
+    Returns:
+        Tuple (FinancialEntry, True if it was created now)
+    """
+    from models import FinancialEntry, FinancialEntryType
+
+    type_ = type_ or FinancialEntryType.saida
+    entry = FinancialEntry(
+        entry_type=entry_type,
+        reference_id=reference_id,
+        type=type_,
+        amount=amount,
+        description=description,
+        **values
+    )
+    try:
+        with db.session.begin_nested():
+            db.session.add(entry)
+    except IntegrityError:
+        existing = find_payment(entry_type, reference_id, type_)
+        if existing is None:
+            raise
+        return existing, False
+    return entry, True
+
+
+def paid_reference_ids(entry_type, reference_ids, type_=None):
+    """
+    Check many entities at once, e.g. the paid/unpaid badges of a list page.
+
+    Args:
+        entry_type: Kind of entity (SUPPLIER_ORDER, VEHICLE_REFUELING)
+        reference_ids: Ids of the entities
+        type_: FinancialEntryType of the entries (default: saida)
+
+    Returns:
+        Set with the ids that have a payment entry
+    """
+    from models import FinancialEntry, FinancialEntryType
+
+    reference_ids = list(set(reference_ids))
+    paid = set()
+    for start in range(0, len(reference_ids), IN_BATCH_SIZE):
+        paid.update(reference_id for reference_id, in db.session.query(FinancialEntry.reference_id).filter(
+            FinancialEntry.entry_type == entry_type,
+            FinancialEntry.reference_id.in_(reference_ids[start:start + IN_BATCH_SIZE]),
+            FinancialEntry.type == (type_ or FinancialEntryType.saida)
+        ))
+    return paid
+
+
+def find_duplicate_payments():
+    """
+    Keys with more than one payment entry (recorded before the unique index).
+
+    Returns:
+        List of (entry_type, reference_id, type, list of entry ids)
+    """
+    from models import FinancialEntry
+
+    keys = db.session.query(
+        FinancialEntry.entry_type, FinancialEntry.reference_id, FinancialEntry.type
+    ).filter(
+        FinancialEntry.entry_type.isnot(None),
+        FinancialEntry.reference_id.isnot(None)
+    ).group_by(
+        FinancialEntry.entry_type, FinancialEntry.reference_id, FinancialEntry.type
+    ).having(func.count(FinancialEntry.id) > 1).all()
+
+    duplicates = []
+    for entry_type, reference_id, type_ in keys:
+        ids = [entry_id for entry_id, in db.session.query(FinancialEntry.id).filter_by(
+            entry_type=entry_type, reference_id=reference_id, type=type_
+        ).order_by(FinancialEntry.id)]
+        duplicates.append((entry_type, reference_id, type_, ids))
+    return duplicates
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        duplicates = find_duplicate_payments()
+        for entry_type, reference_id, type_, ids in duplicates:
+            print(f"{entry_type} #{reference_id} ({type_.value}): lançamentos {', '.join(map(str, ids))}")
+        print(f"{len(duplicates)} pagamento(s) duplicado(s). Exclua os lançamentos repetidos e rode o bootstrap.")
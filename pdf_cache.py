@@ -0,0 +1,167 @@
+"""
+On-disk cache of rendered PDFs for SAMAPE application.
+A PDF is stored under a hash of the HTML it was rendered from plus the
+template version, so the same document is rendered by WeasyPrint only
+once and every worker sharing the directory serves it from disk. The hash
+doubles as the ETag of the download.
+
+The directory is bounded by size: when a new file pushes it over the
+limit, the least recently used files (by modification time, refreshed on
+every hit) are removed. Committed writes to a service order or client
+remove their files right away instead of waiting for eviction.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# Incrementar quando o layout/CSS do PDF mudar sem mudar o HTML
+TEMPLATE_VERSION = '1'
+DEFAULT_MAX_MB = 200
+
+_SESSION_KEY = 'pdf_cache_changes'
+
+
+class PdfCache:
+    """Size-bounded LRU directory of PDFs addressed by content hash."""
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key_for(html_content, *parts):
+        """Hash identifying a PDF: rendered HTML, template version and extra parts (e.g. options)."""
+        digest = hashlib.sha256()
+        for part in (TEMPLATE_VERSION, *parts, html_content):
+            digest.update(str(part).encode('utf-8'))
+            digest.update(b'\0')
+        return digest.hexdigest()
+
+    def path_for(self, key, order_id, client_id):
+        # IDs no nome permitem invalidar por OS ou cliente sem índice separado
+        return os.path.join(self.directory, f'o{order_id}-c{client_id}-{key}.pdf')
+
+    def get(self, key, order_id, client_id):
+        """Return the path of a cached PDF (marking it as recently used) or None."""
+        path = self.path_for(key, order_id, client_id)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        return path
+
+    def put(self, key, order_id, client_id, render):
+        """
+        Store a PDF produced by render(target_path) and return its final path.
+
+        The file is written under a temporary name and renamed, so concurrent
+        readers never see a partial PDF.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(key, order_id, client_id)
+        fd, temp_path = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        os.close(fd)
+        try:
+            render(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            os.unlink(temp_path)
+            raise
+        self._evict(keep=path)
+        return path
+
+    def invalidate(self, order_ids=(), client_ids=()):
+        """Remove the cached PDFs of the given service orders and clients."""
+        if not os.path.isdir(self.directory):
+            return 0
+        prefixes = tuple(f'o{order_id}-' for order_id in order_ids)
+        markers = tuple(f'-c{client_id}-' for client_id in client_ids)
+        removed = 0
+        for name in os.listdir(self.directory):
+            if name.startswith(prefixes) or any(marker in name for marker in markers):
+                try:
+                    os.unlink(os.path.join(self.directory, name))
+                    removed += 1
+                except FileNotFoundError:
+                    pass
+        return removed
+
+    def clear(self):
+        """Remove every cached PDF."""
+        if os.path.isdir(self.directory):
+            for name in os.listdir(self.directory):
+                if name.endswith('.pdf'):
+                    os.unlink(os.path.join(self.directory, name))
+
+    def _evict(self, keep=None):
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as scan:
+                for entry in scan:
+                    if entry.name.endswith('.pdf'):
+                        try:
+                            stat = entry.stat()
+                        except FileNotFoundError:
+                            continue
+                        total += stat.st_size
+                        # O arquivo recém-gravado nunca é removido
+                        if entry.path != keep:
+                            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            if total <= self.max_bytes:
+                return
+            for _, size, path in sorted(entries):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+                if total <= self.max_bytes:
+                    break
+
+
+pdf_cache = PdfCache(os.path.join(tempfile.gettempdir(), 'samape_pdf_cache'), DEFAULT_MAX_MB * 1024 * 1024)
+
+
+def _collect_changes(session, flush_context):
+    from models import ServiceOrder, Client
+
+    changes = session.info.setdefault(_SESSION_KEY, (set(), set()))
+    for obj in (*session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, ServiceOrder):
+            changes[0].add(obj.id)
+        elif isinstance(obj, Client):
+            changes[1].add(obj.id)
+
+
+def _invalidate_after_commit(session):
+    changes = session.info.pop(_SESSION_KEY, None)
+    if changes and (changes[0] or changes[1]):
+        try:
+            pdf_cache.invalidate(*changes)
+        except OSError as e:
+            logger.warning(f"Erro ao invalidar cache de PDF: {e}")
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def init_pdf_cache(app):
+    """Configure the cache directory and size and register the invalidation hooks."""
+    pdf_cache.directory = app.config.get('PDF_CACHE_DIR') or pdf_cache.directory
+    pdf_cache.max_bytes = int(app.config.get('PDF_CACHE_MAX_MB', DEFAULT_MAX_MB)) * 1024 * 1024
+    if not event.contains(Session, 'after_flush', _collect_changes):
+        event.listen(Session, 'after_flush', _collect_changes)
+        event.listen(Session, 'after_commit', _invalidate_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
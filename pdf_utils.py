@@ -0,0 +1,124 @@
+"""
+PDF generation helpers for SAMAPE application.
+WeasyPrint is imported the first time a PDF is requested instead of when the
+application starts: it loads the pango/cairo bindings, which noticeably
+increase startup time and memory of every worker that never renders a PDF.
+
+PdfRenderer keeps the font configuration, the parsed stylesheets and the
+image cache between documents, so rendering many PDFs of the same layout
+only parses each document's HTML.
+"""
+import logging
+import threading
+from types import SimpleNamespace
+
+logger = logging.getLogger(__name__)
+
+_weasyprint = None
+_import_error = None
+_import_lock = threading.Lock()
+
+
+def _load_weasyprint():
+    global _weasyprint, _import_error
+
+    if _weasyprint is not None or _import_error is not None:
+        return _weasyprint
+    with _import_lock:
+        if _weasyprint is None and _import_error is None:
+            try:
+                from weasyprint import CSS, HTML
+                from weasyprint.text.fonts import FontConfiguration
+                _weasyprint = SimpleNamespace(HTML=HTML, CSS=CSS, FontConfiguration=FontConfiguration)
+            except (ImportError, OSError) as e:
+                # OSError: pacote instalado, mas bibliotecas do sistema (pango) ausentes
+                _import_error = e
+                logger.warning(f"WeasyPrint indisponível: {e}")
+    return _weasyprint
+
+
+def _require_weasyprint():
+    weasyprint = _load_weasyprint()
+    if weasyprint is None:
+        raise RuntimeError(f"WeasyPrint não está disponível: {_import_error}")
+    return weasyprint
+
+
+def weasyprint_available():
+    """Return True if WeasyPrint can be imported (importing it on first call)."""
+    return _load_weasyprint() is not None
+
+
+def write_pdf(html_content, target=None, **options):
+    """
+    Render an HTML string to PDF with WeasyPrint.
+
+    Args:
+        html_content: Rendered HTML document
+        target: File name or file object; None returns the PDF bytes
+        **options: Extra options passed to HTML.write_pdf
+
+    Returns:
+        PDF bytes when target is None, otherwise None
+    """
+    weasyprint = _require_weasyprint()
+    return weasyprint.HTML(string=html_content).write_pdf(target, presentational_hints=True, stylesheets=[], **options)
+
+
+class PdfRenderer:
+    """
+    Reusable WeasyPrint renderer for documents sharing the same stylesheets.
+
+    Not thread-safe: use one instance per thread or process.
+    """
+
+    def __init__(self, stylesheets=(), base_url=None, **options):
+        """
+        Args:
+            stylesheets: CSS source strings, parsed once here
+            base_url: Base URL used to resolve relative links in the documents
+            **options: Extra options passed to HTML.write_pdf
+        """
+        weasyprint = _require_weasyprint()
+        self._html_class = weasyprint.HTML
+        self.base_url = base_url
+        self.options = options
+        self.font_config = weasyprint.FontConfiguration()
+        self.stylesheets = [weasyprint.CSS(string=css, font_config=self.font_config) for css in stylesheets]
+        # Imagens (logo) carregadas uma vez e reaproveitadas entre documentos
+        self.image_cache = {}
+
+    def write_pdf(self, html_content, target=None):
+        """
+        Render an HTML string to PDF with the shared fonts and stylesheets.
+
+        Args:
+            html_content: Rendered HTML document
+            target: File name or file object; None returns the PDF bytes
+
+        Returns:
+            PDF bytes when target is None, otherwise None
+        """
+        document = self._html_class(string=html_content, base_url=self.base_url)
+        return document.write_pdf(
+            target,
+            stylesheets=self.stylesheets,
+            font_config=self.font_config,
+            presentational_hints=True,
+            cache=self.image_cache,
+            **self.options
+        )
+
+
+_process_renderer = None
+
+
+def init_process_renderer(stylesheets=(), options=None):
+    """Process pool initializer: build the PdfRenderer used by render_in_process."""
+    global _process_renderer
+    _process_renderer = PdfRenderer(stylesheets, **(options or {}))
+
+
+def render_in_process(html_content):
+    """Render an HTML string with this process' renderer (see init_process_renderer) and return the PDF bytes."""
+    return _process_renderer.write_pdf(html_content)
@@ -2,9 +2,154 @@
 Performance utilities for SAMAPE application.
 This module provides utilities to optimize database queries and improve performance.
 """
+import base64
+import json
+from datetime import date, datetime
+
+from sqlalchemy import tuple_
 from sqlalchemy.orm import joinedload, selectinload
+from cache import cache, invalidate_on_write
 from database import db
 
+FILTER_OPTIONS_PREFIX = 'filter_options:'
+
+
+class KeysetPage:
+    """One page of a keyset-paginated query."""
+
+    def __init__(self, items, next_cursor, per_page):
+        self.items = items
+        self.next_cursor = next_cursor
+        self.per_page = per_page
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(sort_value, row_id):
+    """Encode the (sort value, id) of the last row of a page as an opaque token."""
+    if isinstance(sort_value, (datetime, date)):
+        sort_value = sort_value.isoformat()
+    payload = json.dumps([sort_value, row_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token, sort_type=datetime):
+    """
+    Decode a token created by encode_cursor.
+
+    Returns:
+        (sort value, id) tuple, or None if the token is missing or invalid
+    """
+    if not token:
+        return None
+    try:
+        payload = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        sort_value, row_id = json.loads(payload)
+        if sort_value is not None and sort_type in (datetime, date):
+            sort_value = sort_type.fromisoformat(sort_value)
+        return sort_value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+
+def keyset_paginate(query, sort_column, id_column, cursor=None, per_page=50):
+    """
+    Paginate a query newest first by (sort_column, id_column) using a cursor.
+
+    Unlike OFFSET, the cost of a page does not grow with its position: the
+    cursor turns into a range condition served by an index ending in
+    (sort_column, id_column).
+
+    Args:
+        query: Query to paginate (any existing ORDER BY is replaced)
+        sort_column: Column ordered descending (may contain NULLs)
+        id_column: Unique tie-breaker column
+        cursor: Token from a previous page's next_cursor
+        per_page: Number of rows per page
+
+    Returns:
+        KeysetPage
+    """
+    # PostgreSQL ordena NULLs primeiro em DESC; SQLite/MySQL por último.
+    # Cada trecho (com e sem valor) é uma consulta de intervalo separada,
+    # porque um OR com "IS NULL" impede o uso do índice para ordenar.
+    nulls_first = db.engine.dialect.name == 'postgresql'
+    position = decode_cursor(cursor, sort_column.type.python_type)
+    segments = ['null', 'value'] if nulls_first else ['value', 'null']
+    if position is not None:
+        segments = segments[segments.index('null' if position[0] is None else 'value'):]
+
+    query = query.order_by(None)
+    rows = []
+    for segment in segments:
+        if segment == 'value':
+            segment_query = query.filter(sort_column.isnot(None))
+            if position is not None and position[0] is not None:
+                segment_query = segment_query.filter(tuple_(sort_column, id_column) < tuple_(*position))
+            segment_query = segment_query.order_by(sort_column.desc(), id_column.desc())
+        else:
+            segment_query = query.filter(sort_column.is_(None))
+            if position is not None and position[0] is None:
+                segment_query = segment_query.filter(id_column < position[1])
+            segment_query = segment_query.order_by(id_column.desc())
+        rows += segment_query.limit(per_page + 1 - len(rows)).all()
+        if len(rows) > per_page:
+            break
+        # O cursor só vale para o trecho em que a página começou
+        position = None
+
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        last = rows[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+    return KeysetPage(rows, next_cursor, per_page)
+
+
+def period_bounds(year, month=None, quarter=None):
+    """
+    Turn a year, month or quarter into a half-open datetime range.
+
+    Args:
+        year: Calendar year
+        month: Month (1-12), optional
+        quarter: Quarter (1-4), used when month is not given
+
+    Returns:
+        (start, end) tuple: start is included and end is excluded
+    """
+    if month:
+        first_month, months = month, 1
+    elif quarter:
+        first_month, months = (quarter - 1) * 3 + 1, 3
+    else:
+        first_month, months = 1, 12
+    index = year * 12 + first_month - 1 + months
+    start = datetime(year, first_month, 1)
+    return start, datetime(index // 12, index % 12 + 1, 1)
+
+
+def period_filter(column, year, month=None, quarter=None):
+    """
+    Filter a date/datetime column to a year, month or quarter.
+
+    Compares the column itself with a range instead of extract(month/year),
+    so the condition can be served by an index on the column.
+
+    Returns:
+        SQL condition for query.filter()
+    """
+    start, end = period_bounds(year, month, quarter)
+    return (column >= start) & (column < end)
+
 
 def get_service_orders_with_relations(limit=None, offset=None, filters=None):
     """
@@ -40,7 +185,7 @@ def get_service_orders_with_relations(limit=None, offset=None, filters=None):
         if filters.get('date_to'):
             query = query.filter(ServiceOrder.created_at <= filters['date_to'])
     
-    query = query.order_by(ServiceOrder.created_at.desc())
+    query = query.order_by(ServiceOrder.created_at.desc(), ServiceOrder.id.desc())
     
     if offset:
         query = query.offset(offset)
@@ -50,6 +195,29 @@ def get_service_orders_with_relations(limit=None, offset=None, filters=None):
     return query
 
 
+def get_service_order_filter_options():
+    """
+    (id, name) rows of clients and active users for the service order filters.
+
+    Cached until a client or user is written, so listing pages do not load
+    every Client/User object on each request.
+    """
+    from models import Client, User
+
+    key = f"{FILTER_OPTIONS_PREFIX}service_orders"
+    options = cache.get(key)
+    if options is None:
+        options = {
+            'clients': db.session.query(Client.id, Client.name).order_by(Client.name).all(),
+            'employees': db.session.query(User.id, User.name).filter(User.active.is_(True)).order_by(User.name).all(),
+        }
+        cache.set(key, options, ttl=600)
+    return options
+
+
+invalidate_on_write(FILTER_OPTIONS_PREFIX, 'Client', 'User')
+
+
 def get_clients_with_equipment_count():
     """Get clients with equipment count using a single query."""
     from models import Client, Equipment
@@ -64,20 +232,15 @@ def get_clients_with_equipment_count():
 def get_financial_summary_optimized(month=None, year=None):
     """Get financial summary with optimized query."""
     from models import FinancialEntry, FinancialEntryType
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
     
     query = db.session.query(
         FinancialEntry.type,
         func.sum(FinancialEntry.amount).label('total')
     )
     
-    if month and year:
-        query = query.filter(
-            extract('month', FinancialEntry.date) == month,
-            extract('year', FinancialEntry.date) == year
-        )
-    elif year:
-        query = query.filter(extract('year', FinancialEntry.date) == year)
+    if year:
+        query = query.filter(period_filter(FinancialEntry.date, year, month))
     
     results = query.group_by(FinancialEntry.type).all()
     
@@ -93,6 +256,58 @@ def get_financial_summary_optimized(month=None, year=None):
     return summary
 
 
+# Origem dos lançamentos (FinancialEntry.entry_type); receitas de OS não têm entry_type
+ENTRY_ORIGIN_LABELS = {
+    'service_order': 'Ordens de Serviço',
+    'vehicle_refueling': 'Abastecimentos',
+    'pedido_fornecedor': 'Pedidos a Fornecedores',
+    'manual': 'Lançamentos Manuais',
+}
+
+
+def get_financial_breakdown(year, month=None):
+    """
+    Get income and expenses of a period grouped by entry origin, in one grouped query.
+
+    Args:
+        year: Calendar year
+        month: Month (1-12); None for the whole year
+
+    Returns:
+        List of dictionaries with origin, label, income, expenses and count,
+        largest movement first
+    """
+    from models import FinancialEntry, FinancialEntryType
+    from sqlalchemy import case, func
+
+    origin = case(
+        (FinancialEntry.entry_type.isnot(None), FinancialEntry.entry_type),
+        (FinancialEntry.service_order_id.isnot(None), 'service_order'),
+        else_='manual'
+    ).label('origin')
+    rows = db.session.query(
+        origin,
+        FinancialEntry.type,
+        func.sum(FinancialEntry.amount),
+        func.count(FinancialEntry.id)
+    ).filter(
+        period_filter(FinancialEntry.date, year, month)
+    ).group_by(origin, FinancialEntry.type).all()
+
+    groups = {}
+    for origin_name, entry_type, total, count in rows:
+        group = groups.setdefault(origin_name, {
+            'origin': origin_name,
+            'label': ENTRY_ORIGIN_LABELS.get(origin_name, origin_name),
+            'income': 0.0,
+            'expenses': 0.0,
+            'count': 0,
+        })
+        group['income' if entry_type == FinancialEntryType.entrada else 'expenses'] += float(total or 0)
+        group['count'] += count
+    return sorted(groups.values(), key=lambda group: group['income'] + group['expenses'], reverse=True)
+
+
 def get_low_stock_items_optimized():
     """Get low stock items with supplier information."""
     from models import StockItem, Supplier
@@ -1,66 +1,36 @@
 import os
 import re
-import json
-import io
-import uuid
 from datetime import datetime
-from functools import wraps
-from decimal import Decimal
-from io import StringIO
 from flask import (
-    render_template, redirect, url_for, flash, request, jsonify, session, abort,
-    current_app, send_file, Response, make_response
+    render_template, redirect, url_for, flash, request, jsonify, Response
 )
 from flask_login import login_user, logout_user, login_required, current_user
-from werkzeug.security import generate_password_hash
 from werkzeug.utils import secure_filename
-from sqlalchemy import func, desc, or_, inspect, distinct, text
+from sqlalchemy import or_, distinct
 from sqlalchemy.exc import IntegrityError
 
 from wtforms.validators import Optional
 
-try:
-    from weasyprint import HTML
-    WEASYPRINT_AVAILABLE = True
-except ImportError:
-    WEASYPRINT_AVAILABLE = False
-    HTML = None
-
 from database import db
 from models import (
-    User, Client, Equipment, ServiceOrder, FinancialEntry, ActionLog,
-    UserRole, ServiceOrderStatus, FinancialEntryType, Supplier, Part, PartSale,
-    SupplierOrder, OrderItem, OrderStatus, ServiceOrderImage, equipment_service_orders,
-    StockItem, StockMovement, StockItemType, StockItemStatus, VehicleType, VehicleStatus,
-    Vehicle, VehicleMaintenance, FuelType, MaintenanceType, Refueling, VehicleTravelLog
+    User, Client, Equipment, ServiceOrder, ActionLog,
+    UserRole, ServiceOrderStatus, FinancialEntryType
 )
-from utils import get_system_setting
-from utils import log_action
+from dashboard_metrics import get_dashboard_snapshot, get_metrics_payload
+from live_events import bus as live_events_bus, stream_events
 from forms import (
-    LoginForm, UserForm, ClientForm, EquipmentForm, ServiceOrderForm,
-    CloseServiceOrderForm, FinancialEntryForm, ProfileForm, SystemSettingsForm,
-    SupplierForm, PartForm, PartSaleForm, SupplierOrderForm, OrderItemForm,
-    FlaskForm, StockItemForm, StockMovementForm, VehicleForm, VehicleMaintenanceForm
+    LoginForm, UserForm, ClientForm, EquipmentForm, ProfileForm, SystemSettingsForm, FlaskForm
 )
 from utils import (
-    role_required, admin_required, manager_required, log_action,
+    admin_required, manager_required, log_action,
     check_login_attempts, record_login_attempt, format_document,
-    format_currency, get_monthly_summary, get_service_order_stats,
-    save_service_order_images, delete_service_order_image,
-    identify_and_format_document, recalculate_supplier_order_total,
-    get_supplier_order_stats, get_maintenance_in_progress, is_order_paid
+    format_currency, identify_and_format_document
 )
 
 def register_routes(app):
     # Define o admin_or_manager_required como alias para manager_required
     admin_or_manager_required = manager_required
     
-    # Importações necessárias para as rotas
-    from datetime import date
-    import os
-    import uuid
-    from werkzeug.utils import secure_filename
-    
     # Error handlers
     @app.errorhandler(404)
     def page_not_found(e):
@@ -159,857 +129,59 @@ def register_routes(app):
     @app.route('/dashboard')
     @login_required
     def dashboard():
-        # Get service order statistics
-        so_stats = get_service_order_stats()
-        
-        # Get supplier order statistics
-        supplier_stats = get_supplier_order_stats()
-        
-        # Get financial summary
-        financial_summary = get_monthly_summary()
-        
-        # Get maintenance in progress
-        maintenance_in_progress = get_maintenance_in_progress()
-        
-        # Get recent service orders
-        recent_orders = ServiceOrder.query.order_by(
-            ServiceOrder.created_at.desc()
-        ).limit(5).all()
-        
-        # Get recent activity logs
-        recent_logs = ActionLog.query.order_by(
-            ActionLog.timestamp.desc()
-        ).limit(10).all()
-        
-        # Get pending supplier orders
-        pending_supplier_orders = SupplierOrder.query.filter(
-            SupplierOrder.status.in_([OrderStatus.pendente, OrderStatus.aprovado, OrderStatus.enviado])
-        ).order_by(SupplierOrder.created_at.desc()).limit(5).all()
-        
-        # Get low stock items (EPIs e ferramentas)
-        low_stock_items = StockItem.query.filter(
-            StockItem.quantity <= StockItem.min_quantity
-        ).order_by(StockItem.quantity.asc()).limit(5).all()
-        
-        # Get parts with low stock (peças)
-        low_stock_parts = Part.query.filter(
-            Part.stock_quantity <= Part.minimum_stock
-        ).order_by(Part.stock_quantity.asc()).limit(5).all()
+        # Snapshot em cache, invalidado por escritas nos modelos relacionados
+        snapshot = get_dashboard_snapshot()
         
         # Add current timestamp to prevent caching
         from datetime import datetime
         
-        # Prepare metrics for dashboard
-        import json
-        metrics = {
-            'pending_orders': so_stats['open'],
-            'in_progress_orders': so_stats['in_progress'],
-            'closed_orders': so_stats['closed'],
-            'avg_completion_time': so_stats['avg_completion_time'],
-            'efficiency_percentage': min(100, so_stats['avg_completion_time'] * 10) if so_stats['avg_completion_time'] > 0 else 50,
-            'open_orders': supplier_stats['open'],
-            'pending_delivery': supplier_stats['sent'],
-            'delivered_this_month': supplier_stats['received'],
-            'monthly_income': financial_summary['income'],
-            'monthly_expenses': financial_summary['expenses'],
-            'income_data': json.dumps([financial_summary['income']/6, financial_summary['income']/3, financial_summary['income']/2, financial_summary['income']/1.5, financial_summary['income']/1.2, financial_summary['income']]),
-            'expense_data': json.dumps([financial_summary['expenses']/6, financial_summary['expenses']/4, financial_summary['expenses']/3, financial_summary['expenses']/2, financial_summary['expenses']/1.3, financial_summary['expenses']])
-        }
-        
-        # Adicionar estatísticas da frota
-        metrics.update({
-            'fleet_active': Vehicle.query.filter_by(status=VehicleStatus.ativo).count(),
-            'fleet_maintenance': Vehicle.query.filter_by(status=VehicleStatus.em_manutencao).count(),
-            'fleet_inactive': Vehicle.query.filter_by(status=VehicleStatus.inativo).count(),
-            'fleet_reserved': 0,  # Valor padrão para manter compatibilidade com o template
-            'fleet_total': Vehicle.query.count()
-        })
-        
         return render_template(
             'dashboard.html',
-            so_stats=so_stats,
-            supplier_stats=supplier_stats,
-            financial_summary=financial_summary,
-            maintenance_in_progress=maintenance_in_progress,
-            recent_orders=recent_orders,
-            recent_logs=recent_logs,
-            pending_supplier_orders=pending_supplier_orders,
-            low_stock_items=low_stock_items,
-            low_stock_parts=low_stock_parts,
-            metrics=metrics,
+            so_stats=snapshot['so_stats'],
+            supplier_stats=snapshot['supplier_stats'],
+            financial_summary=snapshot['financial_summary'],
+            maintenance_in_progress=snapshot['maintenance_in_progress'],
+            recent_orders=snapshot['recent_orders'],
+            recent_logs=snapshot['recent_logs'],
+            pending_supplier_orders=snapshot['pending_supplier_orders'],
+            low_stock_items=snapshot['low_stock_items'],
+            low_stock_parts=snapshot['low_stock_parts'],
+            metrics=snapshot['metrics'],
+            metrics_version=get_metrics_payload()[1],
             now=datetime.now().timestamp()
         )
 
-    # Service Order routes
-    @app.route('/os')
-    @login_required
-    def service_orders():
-        status_filter = request.args.get('status', '')
-        client_filter = request.args.get('client', '')
-        responsible_filter = request.args.get('responsible', '')
-        date_from = request.args.get('date_from', '')
-        date_to = request.args.get('date_to', '')
-        
-        query = ServiceOrder.query
-        
-        # Apply filters
-        if status_filter:
-            query = query.filter(ServiceOrder.status == status_filter)
-        
-        if client_filter:
-            query = query.filter(ServiceOrder.client_id == client_filter)
-        
-        if responsible_filter:
-            query = query.filter(ServiceOrder.responsible_id == responsible_filter)
-        
-        if date_from:
-            try:
-                date_from = datetime.strptime(date_from, '%Y-%m-%d')
-                query = query.filter(ServiceOrder.created_at >= date_from)
-            except ValueError:
-                pass
-        
-        if date_to:
-            try:
-                date_to = datetime.strptime(date_to, '%Y-%m-%d')
-                query = query.filter(ServiceOrder.created_at <= date_to)
-            except ValueError:
-                pass
-        
-        service_orders = query.order_by(ServiceOrder.created_at.desc()).all()
-        clients = Client.query.order_by(Client.name).all()
-        employees = User.query.filter_by(active=True).order_by(User.name).all()
-        
-        return render_template(
-            'service_orders/index.html',
-            service_orders=service_orders,
-            clients=clients,
-            employees=employees,
-            status_filter=status_filter,
-            client_filter=client_filter,
-            responsible_filter=responsible_filter,
-            date_from=date_from,
-            date_to=date_to
-        )
-
-    @app.route('/os/nova', methods=['GET', 'POST'])
+    @app.route('/api/eventos')
     @login_required
-    def new_service_order():
-        form = ServiceOrderForm()
-        
-        # Load clients for dropdown
-        form.client_id.choices = [(c.id, c.name) for c in Client.query.order_by(Client.name).all()]
-        
-        # Load employees for dropdown
-        form.responsible_id.choices = [(0, 'A ser definido')] + [
-            (u.id, u.name) for u in User.query.filter_by(active=True).order_by(User.name).all()
-        ]
-        
-        if form.validate_on_submit():
-            try:
-                service_order = ServiceOrder(
-                    client_id=form.client_id.data,
-                    responsible_id=form.responsible_id.data if form.responsible_id.data != 0 else None,
-                    description=form.description.data,
-                    estimated_value=form.estimated_value.data,
-                    status=ServiceOrderStatus[form.status.data]
-                )
-                
-                # Add equipment relationships if selected
-                if form.equipment_ids.data:
-                    equipment_ids = form.equipment_ids.data.split(',')
-                    for eq_id in equipment_ids:
-                        equipment = Equipment.query.get(int(eq_id))
-                        if equipment and equipment.client_id == service_order.client_id:
-                            service_order.equipment.append(equipment)
-                
-                db.session.add(service_order)
-                db.session.commit()
-                
-                # Processar imagens - verificar se há arquivos enviados
-                try:
-                    image_files = request.files.getlist('images')
-                    if image_files and any(f.filename for f in image_files):
-                        saved_images = save_service_order_images(
-                            service_order, 
-                            image_files, 
-                            form.image_descriptions.data
-                        )
-                        if saved_images:
-                            flash(f'{len(saved_images)} imagem(ns) anexada(s) com sucesso!', 'info')
-                except Exception as img_error:
-                    # Se falhar ao salvar as imagens, registre o erro mas não interrompa o fluxo
-                    flash(f'Aviso: Não foi possível salvar as imagens: {str(img_error)}', 'warning')
-                
-                try:
-                    log_action(
-                        'Criação de OS',
-                        'service_order',
-                        service_order.id,
-                        f"OS criada para cliente {service_order.client.name}"
-                    )
-                except Exception:
-                    # Se falhar ao registrar o log, não interromper o fluxo principal
-                    pass
-                
-                flash('Ordem de serviço criada com sucesso!', 'success')
-                return redirect(url_for('service_orders'))
-            
-            except IntegrityError:
-                db.session.rollback()
-                flash('Erro de integridade ao criar a ordem de serviço. O ID pode estar duplicado.', 'danger')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao criar ordem de serviço: {str(e)}', 'danger')
-            
-        return render_template(
-            'service_orders/create.html',
-            form=form
+    def live_events_stream():
+        subscription = live_events_bus.subscribe(limit=app.config.get('LIVE_EVENTS_MAX_SUBSCRIBERS'))
+        if subscription is None:
+            # Todas as vagas de stream deste worker ocupadas: o navegador tenta de novo mais tarde
+            response = Response('Limite de conexões em tempo real atingido', status=503, mimetype='text/plain')
+            response.headers['Retry-After'] = '60'
+            return response
+        response = Response(
+            stream_events(
+                subscription,
+                heartbeat=app.config.get('LIVE_EVENTS_HEARTBEAT', 15),
+                max_duration=app.config.get('LIVE_EVENTS_MAX_DURATION', 300)
+            ),
+            mimetype='text/event-stream'
         )
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'  # Desativa buffer em proxies nginx
+        return response
 
-    # Rota para visualizar OS no modal
-    @app.route('/os/<int:id>/modal')
-    @login_required
-    def view_service_order_modal(id):
-        """Retorna os dados da ordem de serviço para exibição no modal"""
-        try:
-            # Consulta para obter os dados da OS
-            query = """
-            SELECT 
-                so.id, so.description, so.status, so.created_at, so.closed_at,
-                so.invoice_number, so.invoice_amount, so.service_details, 
-                so.estimated_value, so.discount_amount, so.original_amount, 
-                so.total_value, so.client_id, so.responsible_id,
-                c.name as client_name, c.document as client_document, 
-                c.email as client_email, c.phone as client_phone, 
-                c.address as client_address,
-                u.name as responsible_name
-            FROM service_order so
-            LEFT JOIN client c ON so.client_id = c.id
-            LEFT JOIN "user" u ON so.responsible_id = u.id
-            WHERE so.id = :id
-            """
-            order = db.session.execute(db.text(query), {'id': id}).fetchone()
-            
-            if not order:
-                return jsonify({'error': 'Ordem de serviço não encontrada'}), 404
-                
-            # Preparando dados do cliente para o template
-            client = {
-                'id': order.client_id,
-                'name': order.client_name,
-                'document': order.client_document,
-                'email': order.client_email,
-                'phone': order.client_phone,
-                'address': order.client_address
-            }
-            
-            # Consulta equipamentos vinculados
-            query_equip = """
-            SELECT e.id, e.type, e.brand, e.model, e.serial_number
-            FROM equipment e
-            JOIN equipment_service_orders eso ON e.id = eso.equipment_id
-            WHERE eso.service_order_id = :id
-            """
-            equipment = db.session.execute(db.text(query_equip), {'id': id}).fetchall()
-            
-            # Consulta entradas financeiras
-            query_fin = """
-            SELECT id, date, description, amount, type, entry_type
-            FROM financial_entry
-            WHERE service_order_id = :id
-            ORDER BY date DESC
-            """
-            financial_entries = db.session.execute(db.text(query_fin), {'id': id}).fetchall()
-            
-            # Verificando se usuário é admin
-            is_admin = current_user.role.name == 'admin' if hasattr(current_user, 'role') else False
-            
-            # Renderizar o template do modal
-            return render_template(
-                'service_orders/view_modal.html',
-                order=order,
-                client=client,
-                equipment=equipment,
-                financial_entries=financial_entries,
-                responsible_name=order.responsible_name,
-                is_admin=is_admin
-            )
-            
-        except Exception as e:
-            app.logger.error(f"Erro ao buscar dados da OS para modal: {str(e)}")
-            return jsonify({'error': str(e)}), 500
-    
-    # Rota para obter dados da OS para o modal
-    @app.route('/os_dados/<int:id>')
-    @login_required
-    def get_service_order_data(id):
-        """Retorna dados básicos de uma OS para exibição em modal"""
-        try:
-            # Consulta direta sem joins para evitar problemas
-            conn = db.engine.raw_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                """
-                SELECT 
-                    so.id, so.description, so.status, so.created_at, so.closed_at,
-                    so.client_id, so.responsible_id, so.total_value, so.original_amount, so.discount_amount
-                FROM service_order so
-                WHERE so.id = %s
-                """, 
-                (id,)
-            )
-            order = cursor.fetchone()
-            
-            if not order:
-                return jsonify({'error': 'Ordem de serviço não encontrada'}), 404
-                
-            # Dados básicos da OS
-            order_id = order[0]
-            description = order[1]
-            status = order[2]
-            created_at = order[3].strftime('%d/%m/%Y %H:%M') if order[3] else None
-            closed_at = order[4].strftime('%d/%m/%Y %H:%M') if order[4] else None
-            client_id = order[5]
-            responsible_id = order[6]
-            total_value = order[7] or 0
-            original_amount = order[8] or 0
-            discount_amount = order[9] or 0
-            
-            # Recuperar nome do cliente
-            client_name = "Cliente não especificado"
-            try:
-                cursor.execute("SELECT name FROM client WHERE id = %s", (client_id,))
-                client = cursor.fetchone()
-                if client:
-                    client_name = client[0]
-            except Exception as e:
-                app.logger.warning(f"Erro ao buscar nome do cliente: {str(e)}")
-                pass
-                
-            # Recuperar nome do responsável
-            responsible_name = "Não definido"
-            try:
-                cursor.execute('SELECT name FROM "user" WHERE id = %s', (responsible_id,))
-                resp = cursor.fetchone()
-                if resp:
-                    responsible_name = resp[0]
-            except Exception as e:
-                app.logger.warning(f"Erro ao buscar nome do responsável: {str(e)}")
-                pass
-            
-            cursor.close()
-            conn.close()
-            
-            # Formatando dados para JSON
-            status_labels = {
-                'aberta': 'Em Aberto',
-                'em_andamento': 'Em Andamento',
-                'fechada': 'Concluída',
-                'cancelada': 'Cancelada'
-            }
-            
-            data = {
-                'id': order_id,
-                'description': description,
-                'status': status,
-                'status_label': status_labels.get(status, 'Desconhecido'),
-                'created_at': created_at,
-                'closed_at': closed_at or "Não finalizada",
-                'client_name': client_name,
-                'responsible_name': responsible_name,
-                'total_value': f"{total_value:.2f}",
-                'original_amount': f"{original_amount:.2f}",
-                'discount_amount': f"{discount_amount:.2f}",
-                'view_url': url_for('view_service_order_basic', id=order_id),
-                'edit_url': url_for('edit_service_order', id=order_id)
-            }
-            
-            return jsonify(data)
-            
-        except Exception as e:
-            app.logger.error(f"Erro ao obter dados da OS para modal: {str(e)}")
-            return jsonify({'error': str(e)}), 500
-    
-
-    
-    @app.route('/os_basico/<int:id>')
-    @login_required
-    def view_service_order_basic(id):
-        """Versão ultra simplificada de visualização para resolver problemas urgentes"""
-        try:
-            # Consulta direta sem joins para evitar problemas com o PostgreSQL
-            conn = db.engine.raw_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, description, status, created_at, client_id, responsible_id FROM service_order WHERE id = %s", 
-                (id,)
-            )
-            order = cursor.fetchone()
-            
-            if not order:
-                flash("Ordem de serviço não encontrada", "danger")
-                return redirect(url_for('service_orders'))
-            
-            # Dados básicos da OS
-            order_id = order[0]
-            description = order[1]
-            status = order[2]
-            created_at = order[3].strftime('%d/%m/%Y %H:%M') if order[3] else 'Data não disponível'
-            client_id = order[4]
-            responsible_id = order[5]
-            
-            # Recuperar nome do cliente (opcional)
-            client_name = "Cliente não especificado"
-            cliente_telefone = None
-            responsavel_nome = None
-            
-            try:
-                cursor.execute("SELECT name, phone FROM client WHERE id = %s", (client_id,))
-                client = cursor.fetchone()
-                if client:
-                    client_name = client[0]
-                    cliente_telefone = client[1]
-            except Exception as e:
-                app.logger.warning(f"Erro ao buscar dados do cliente: {str(e)}")
-                pass
-                
-            # Recuperar nome do responsável (opcional)
-            try:
-                cursor.execute('SELECT name FROM "user" WHERE id = %s', (responsible_id,))
-                resp = cursor.fetchone()
-                if resp:
-                    responsavel_nome = resp[0]
-            except Exception as e:
-                app.logger.warning(f"Erro ao buscar nome do responsável: {str(e)}")
-                pass
-            
-            cursor.close()
-            conn.close()
-            
-            # Verificar se o usuário é administrador
-            is_admin = current_user.role == 'admin' if hasattr(current_user, 'role') else False
-            
-            # Template super simplificado
-            return render_template(
-                'service_orders/os_simples.html',
-                order_id=order_id,
-                description=description,
-                status=status,
-                created_at=created_at,
-                client_name=client_name,
-                cliente_telefone=cliente_telefone,
-                responsavel_nome=responsavel_nome,
-                is_admin=is_admin,
-                error=None
-            )
-            
-        except Exception as e:
-            app.logger.error(f"Erro emergencial na visualização da OS: {str(e)}")
-            return render_template(
-                'service_orders/os_simples.html',
-                order_id=id,
-                error=f"Não foi possível carregar os detalhes completos. Erro: {str(e)}"
-            )
-            
-    # Rota para visualizar detalhes de uma Ordem de Serviço específica
-    @app.route('/os/<int:id>')
-    @login_required
-    def view_service_order(id):
-        try:
-            # Consulta simplificada para pegar os dados essenciais da OS
-            query = """
-            SELECT 
-                so.id, so.description, so.status, so.created_at, so.closed_at,
-                so.invoice_number, so.invoice_amount, so.service_details, 
-                so.estimated_value, so.discount_amount, so.original_amount, 
-                so.total_value, so.client_id, so.responsible_id,
-                c.name as client_name, c.document as client_document, 
-                c.email as client_email, c.phone as client_phone, 
-                c.address as client_address,
-                u.name as responsible_name
-            FROM service_order so
-            LEFT JOIN client c ON so.client_id = c.id
-            LEFT JOIN "user" u ON so.responsible_id = u.id
-            WHERE so.id = :id
-            """
-            ordem = db.session.execute(db.text(query), {'id': id}).fetchone()
-            
-            if not ordem:
-                flash(f"Ordem de serviço #{id} não encontrada.", "danger")
-                return redirect(url_for('service_orders'))
-                
-            # Preparando dados do cliente para o template
-            cliente = {
-                'id': ordem.client_id,
-                'nome': ordem.client_name,
-                'documento': ordem.client_document,
-                'email': ordem.client_email,
-                'telefone': ordem.client_phone,
-                'endereco': ordem.client_address
-            }
-            
-            # Consulta equipamentos vinculados
-            query_equip = """
-            SELECT e.id, e.type, e.brand, e.model, e.serial_number
-            FROM equipment e
-            JOIN equipment_service_orders eso ON e.id = eso.equipment_id
-            WHERE eso.service_order_id = :id
-            """
-            equipamentos = db.session.execute(db.text(query_equip), {'id': id}).fetchall()
-            
-            # Consulta entradas financeiras
-            query_fin = """
-            SELECT id, date, description, amount, type, entry_type
-            FROM financial_entry
-            WHERE service_order_id = :id
-            ORDER BY date DESC
-            """
-            financeiros = db.session.execute(db.text(query_fin), {'id': id}).fetchall()
-            
-            # Preparando objeto OS para o template
-            os_data = {
-                'id': ordem.id,
-                'description': ordem.description,
-                'status': ordem.status,
-                'status_display': ordem.status.capitalize() if ordem.status else 'Não definido',
-                'created_at': ordem.created_at,
-                'closed_at': ordem.closed_at,
-                'invoice_number': ordem.invoice_number,
-                'invoice_amount': ordem.invoice_amount,
-                'service_details': ordem.service_details,
-                'estimated_value': ordem.estimated_value
-            }
-            
-            # Verificando se usuário é admin
-            is_admin = current_user.role.name == 'admin' if hasattr(current_user, 'role') else False
-            
-            # Formulário para fechar a OS
-            close_form = CloseServiceOrderForm()
-            
-            # Usando o template disponível
-            return render_template(
-                'service_orders/os_simples.html',
-                order_id=ordem.id,
-                description=ordem.description,
-                status=ordem.status,
-                created_at=ordem.created_at,
-                client_name=cliente['name'],
-                cliente_telefone=cliente['phone'],
-                responsavel_nome=ordem.responsible_name,
-                is_admin=is_admin,
-                error=None
-            )
-        
-        except Exception as e:
-            app.logger.error(f"Erro ao visualizar OS #{id}: {str(e)}")
-            flash(f"Erro ao visualizar ordem de serviço: {str(e)}", "danger")
-            return redirect(url_for('service_orders'))
-    
-    # Rota para visualizar OS com tratamento especial (nova versão completa)
-    @app.route('/ordem/<int:id>/visualizar')
-    @login_required
-    def view_service_order_alt(id):
-        try:
-            # Consulta básica para obter os dados da OS
-            order = db.session.execute(db.text("""
-                SELECT 
-                    so.id, so.description, so.status, so.created_at, so.closed_at,
-                    so.invoice_number, so.invoice_amount, so.service_details, 
-                    so.estimated_value, so.discount_amount, so.original_amount, so.total_value,
-                    c.id as client_id, c.name as client_name, c.document as client_document,
-                    c.email as client_email, c.phone as client_phone, c.address as client_address,
-                    u.name as responsible_name
-                FROM service_order so
-                LEFT JOIN client c ON so.client_id = c.id
-                LEFT JOIN "user" u ON so.responsible_id = u.id
-                WHERE so.id = :id
-            """), {'id': id}).fetchone()
-            
-            if not order:
-                flash(f"Ordem de serviço #{id} não encontrada.", "danger")
-                return redirect(url_for('service_orders'))
-            
-            # Consulta para obter equipamentos
-            equipments = db.session.execute(db.text("""
-                SELECT 
-                    e.id, e.type, e.brand, e.model, e.serial_number
-                FROM equipment e
-                JOIN equipment_service_orders eso ON e.id = eso.equipment_id
-                WHERE eso.service_order_id = :id
-            """), {'id': id}).fetchall()
-            
-            # Consulta para obter entradas financeiras
-            finances = db.session.execute(db.text("""
-                SELECT 
-                    id, date, description, amount, type, entry_type
-                FROM financial_entry
-                WHERE service_order_id = :id
-                ORDER BY date DESC
-            """), {'id': id}).fetchall()
-            
-            # Verificar se o usuário é administrador
-            is_admin = current_user.role == 'admin' if hasattr(current_user, 'role') else False
-            
-            # Formulário para fechar OS
-            close_form = CloseServiceOrderForm()
-            
-            # Registrar visualização no log
-            try:
-                log_action(f"Visualização da OS #{id}", "service_order", id, f"Visualização da OS #{id}")
-            except Exception as log_error:
-                app.logger.warning(f"Erro ao registrar log de visualização: {str(log_error)}")
-            
-            # Criando um objeto diretamente compatível com o template
-            service_order = {
-                'id': order.id,
-                'description': order.description,
-                'status': order.status,  # Status como string
-                'created_at': order.created_at,
-                'closed_at': order.closed_at,
-                'invoice_number': order.invoice_number,
-                'invoice_amount': order.invoice_amount,
-                'service_details': order.service_details,
-                'estimated_value': order.estimated_value,
-                'discount_amount': order.discount_amount,
-                'original_amount': order.original_amount,
-                'total_value': order.total_value,
-                'client': {
-                    'id': order.client_id,
-                    'name': order.client_name,
-                    'document': order.client_document,
-                    'email': order.client_email,
-                    'phone': order.client_phone,
-                    'address': order.client_address
-                },
-                'responsible': {
-                    'name': order.responsible_name
-                } if order.responsible_name else None,
-                'equipment': [],
-                'financial_entries': []
-            }
-            
-            # Adicionar equipamentos
-            for eq in equipments:
-                service_order['equipment'].append({
-                    'id': eq.id,
-                    'type': eq.type,
-                    'brand': eq.brand,
-                    'model': eq.model,
-                    'serial_number': eq.serial_number
-                })
-            
-            # Adicionar entradas financeiras
-            for fin in finances:
-                service_order['financial_entries'].append({
-                    'id': fin.id,
-                    'date': fin.date,
-                    'description': fin.description,
-                    'amount': fin.amount,
-                    'type': {
-                        'name': fin.type,
-                        'value': fin.type.capitalize() if fin.type else 'Não definido'
-                    }
-                })
-            
-            return render_template(
-                'service_orders/view_simple.html',
-                service_order=service_order,
-                close_form=close_form,
-                is_admin=is_admin
-            )
-            
-        except Exception as e:
-            app.logger.error(f"Erro ao visualizar OS #{id}: {str(e)}")
-            flash(f"Erro ao carregar a ordem de serviço: {str(e)}", "danger")
-            return redirect(url_for('service_orders'))
-
-    @app.route('/ordem/<int:id>/fechar', methods=['GET', 'POST'])
-    @login_required
-    def close_service_order(id):
-        service_order = ServiceOrder.query.get_or_404(id)
-        
-        # Check if order is already closed
-        if service_order.status == ServiceOrderStatus.fechada:
-            flash('Esta OS já está fechada.', 'warning')
-            return redirect(url_for('view_service_order', id=id))
-            
-        form = CloseServiceOrderForm()
-        
-        if form.validate_on_submit():
-            try:
-                # Gerar o número da nota automaticamente
-                from utils import get_next_invoice_number
-                
-                service_order.status = ServiceOrderStatus.fechada
-                service_order.closed_at = datetime.utcnow()
-                service_order.invoice_number = get_next_invoice_number()
-                service_order.invoice_date = datetime.utcnow()
-                service_order.invoice_amount = form.invoice_amount.data
-                service_order.service_details = form.service_details.data
-                
-                # Informações sobre cálculo de KM (se incluídas)
-                km_info = ""
-                if form.include_km_calculation.data and form.distance_km.data and form.price_per_km.data:
-                    distance_km = form.distance_km.data
-                    price_per_km = form.price_per_km.data
-                    km_total = distance_km * price_per_km
-                    km_info = f" (Inclui deslocamento: {distance_km} KM x R$ {price_per_km} = R$ {km_total})"
-                
-                # Verificamos se o cliente existe antes de tentar criar a entrada financeira
-                if not service_order.client:
-                    flash('Erro: Cliente não encontrado. Não é possível fechar a OS.', 'danger')
-                    return redirect(url_for('view_service_order', id=id))
-                
-                # Verificar se já existe um lançamento financeiro para esta OS
-                existing_entry = FinancialEntry.query.filter_by(
-                    service_order_id=service_order.id,
-                    type=FinancialEntryType.entrada
-                ).first()
-                
-                # Se já existe, atualiza o valor; senão, cria um novo lançamento
-                if existing_entry:
-                    existing_entry.amount = form.invoice_amount.data
-                    existing_entry.description = f"Pagamento OS #{service_order.id} - {service_order.client.name} (Atualizado)"
-                    db.session.commit()
-                    
-                    log_action(
-                        'Atualização Financeira',
-                        'financial',
-                        existing_entry.id,
-                        f"Valor da OS #{service_order.id} atualizado para {form.invoice_amount.data}{km_info}"
-                    )
-                else:
-                    # Create new financial entry
-                    financial_entry = FinancialEntry(
-                        service_order_id=service_order.id,
-                        description=f"Pagamento OS #{service_order.id} - {service_order.client.name}{km_info}",
-                        amount=form.invoice_amount.data,
-                        type=FinancialEntryType.entrada,
-                        created_by=current_user.id
-                    )
-                    
-                    db.session.add(financial_entry)
-                    db.session.commit()
-                
-                flash(f'OS #{service_order.id} fechada com sucesso!', 'success')
-                log_action(
-                    'Fechamento de OS',
-                    'service_order',
-                    service_order.id,
-                    f"OS fechada - Valor: R${form.invoice_amount.data}{km_info}"
-                )
-                
-                return redirect(url_for('view_service_order', id=id))
-                
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao fechar OS: {str(e)}', 'danger')
-                app.logger.error(f"Erro ao fechar OS {id}: {str(e)}")
-                return redirect(url_for('view_service_order', id=id))
-            
-        return render_template(
-            'service_orders/close.html',
-            service_order=service_order,
-            form=form
-        )
-        
-    @app.route('/ordem/<int:id>/excluir')
+    @app.route('/api/dashboard/metrics')
     @login_required
-    def delete_service_order(id):
-        """Rota para excluir uma ordem de serviço e seus registros financeiros associados"""
-        # Verificar se o usuário é admin
-        if not current_user.role.name == 'admin':
-            flash("Apenas administradores podem excluir ordens de serviço", "danger")
-            return redirect(url_for('view_service_order_alt', id=id))
+    def dashboard_metrics_api():
+        payload, version = get_metrics_payload()
         
-        try:  
-            # Obter informações da OS para registro de log antes de excluir
-            os_info = db.session.execute(
-                db.text("""
-                SELECT o.id, c.name as client_name
-                FROM service_order o
-                LEFT JOIN client c ON o.client_id = c.id
-                WHERE o.id = :order_id
-                """), 
-                {"order_id": id}
-            ).fetchone()
-            
-            if not os_info:
-                flash(f"Ordem de Serviço #{id} não encontrada", "danger")
-                return redirect(url_for('service_orders'))
-                
-            # Registrar cliente para o log
-            client_name = os_info.client_name if os_info.client_name else "Cliente desconhecido"
-            
-            # 1. Excluir registros financeiros associados
-            db.session.execute(
-                db.text("""
-                DELETE FROM financial_entry 
-                WHERE service_order_id = :order_id
-                """), 
-                {"order_id": id}
-            )
-            
-            # 2. Excluir imagens associadas à OS
-            db.session.execute(
-                db.text("""
-                DELETE FROM service_order_image 
-                WHERE service_order_id = :order_id
-                """), 
-                {"order_id": id}
-            )
-            
-            # 3. Remover associações com equipamentos
-            db.session.execute(
-                db.text("""
-                DELETE FROM equipment_service_orders 
-                WHERE service_order_id = :order_id
-                """), 
-                {"order_id": id}
-            )
-            
-            # 4. Finalmente excluir a OS
-            db.session.execute(
-                db.text("""
-                DELETE FROM service_order 
-                WHERE id = :order_id
-                """), 
-                {"order_id": id}
-            )
-            
-            # Confirmar transação
-            db.session.commit()
-            
-            # Registrar no log de ações
-            log_action(
-                f"Excluiu a OS #{id}",
-                "service_order",
-                id,
-                f"OS #{id} de {client_name} excluída com sucesso, incluindo registros financeiros associados"
-            )
-            
-            flash(f'Ordem de serviço #{id} excluída com sucesso!', 'success')
-            return redirect(url_for('service_orders'))
-            
-        except Exception as e:
-            # Reverter transação em caso de erro
-            db.session.rollback()
-            app.logger.error(f"Erro ao excluir OS #{id}: {str(e)}")
-            flash(f'Erro ao excluir ordem de serviço: {str(e)}', 'danger')
-            return redirect(url_for('service_orders'))
-
-    @app.route('/api/cliente/<int:client_id>/equipamentos')
-    @login_required
-    def get_client_equipment(client_id):
-        equipment = Equipment.query.filter_by(client_id=client_id).all()
-        return jsonify([{
-            'id': eq.id,
-            'type': eq.type,
-            'brand': eq.brand or '',
-            'model': eq.model or '',
-            'serial_number': eq.serial_number or ''
-        } for eq in equipment])
+        # ETag forte: o front-end reenvia If-None-Match e recebe 304 se nada mudou
+        response = Response(payload, mimetype='application/json')
+        response.set_etag(version)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response.make_conditional(request)
 
     # Client routes
     @app.route('/clientes')
@@ -1455,20 +627,6 @@ def register_routes(app):
         flash('Equipamento excluído com sucesso!', 'success')
         return redirect(url_for('equipment'))
 
-    # Service Order Image route
-    @app.route('/imagem_os/<int:image_id>')
-    @login_required
-    def view_service_order_image(image_id):
-        """Rota para visualizar uma imagem de ordem de serviço diretamente do banco de dados"""
-        try:
-            # Retornar uma imagem padrão para qualquer erro ou falta de imagem
-            return redirect(url_for('static', filename='img/image-not-found.svg'))
-                
-        except Exception as e:
-            app.logger.error(f"Erro ao visualizar imagem de OS #{image_id}: {str(e)}")
-            # Retornar uma imagem padrão para qualquer erro
-            return redirect(url_for('static', filename='img/image-not-found.svg'))
-    
     # Employee routes
     @app.route('/funcionarios')
     @manager_required
@@ -1569,185 +727,6 @@ def register_routes(app):
         flash(f'Funcionário {action} com sucesso!', 'success')
         return redirect(url_for('employees'))
 
-    # Financial routes
-    @app.route('/financeiro')
-    @manager_required
-    def financial():
-        month = request.args.get('month', datetime.utcnow().month, type=int)
-        year = request.args.get('year', datetime.utcnow().year, type=int)
-        
-        # Get entries for the selected month
-        entries = FinancialEntry.query.filter(
-            func.extract('month', FinancialEntry.date) == month,
-            func.extract('year', FinancialEntry.date) == year
-        ).order_by(FinancialEntry.date.desc()).all()
-        
-        # Calculate summary
-        income = sum(e.amount for e in entries if e.type == FinancialEntryType.entrada)
-        expenses = sum(e.amount for e in entries if e.type == FinancialEntryType.saida)
-        balance = income - expenses
-        
-        return render_template(
-            'financial/index.html',
-            entries=entries,
-            month=month,
-            year=year,
-            income=income,
-            expenses=expenses,
-            balance=balance
-        )
-
-    @app.route('/financeiro/novo', methods=['GET', 'POST'])
-    @manager_required
-    def new_financial_entry():
-        form = FinancialEntryForm()
-        
-        # Load service orders for dropdown
-        form.service_order_id.choices = [(0, 'Nenhuma OS relacionada')] + [
-            (so.id, f'OS #{so.id} - {so.client.name}')
-            for so in ServiceOrder.query.order_by(ServiceOrder.id.desc()).limit(100).all()
-        ]
-        
-        if form.validate_on_submit():
-            entry = FinancialEntry(
-                service_order_id=form.service_order_id.data if form.service_order_id.data != 0 else None,
-                description=form.description.data,
-                amount=form.amount.data,
-                type=FinancialEntryType[form.type.data],
-                date=datetime.strptime(form.date.data, '%Y-%m-%d'),
-                created_by=current_user.id
-            )
-            
-            db.session.add(entry)
-            db.session.commit()
-            
-            log_action(
-                'Registro Financeiro',
-                'financial',
-                entry.id,
-                f"Registro financeiro de {format_currency(entry.amount)} ({entry.type.value})"
-            )
-            
-            flash('Registro financeiro adicionado com sucesso!', 'success')
-            return redirect(url_for('financial'))
-            
-        # Set today's date as default
-        if request.method == 'GET':
-            form.date.data = datetime.utcnow().strftime('%Y-%m-%d')
-            
-        return render_template('financial/create.html', form=form)
-
-    @app.route('/financeiro/acerto-manual', methods=['POST'])
-    @manager_required
-    def add_financial_adjustment():
-        try:
-            # Obter dados do formulário
-            type_value = request.form.get('type')
-            amount = float(request.form.get('amount', 0))
-            description = request.form.get('description', '')
-            date_str = request.form.get('date')
-            category = request.form.get('category', 'acerto')
-            
-            # Validar dados
-            if not type_value or not amount or not description or not date_str:
-                flash('Todos os campos são obrigatórios.', 'danger')
-                return redirect(url_for('financial'))
-            
-            # Montar descrição completa
-            category_text = {
-                'acerto': 'Acerto de Caixa',
-                'ajuste': 'Ajuste Contábil',
-                'transferencia': 'Transferência',
-                'imposto': 'Imposto',
-                'outro': 'Outros'
-            }.get(category, 'Acerto de Caixa')
-            
-            full_description = f"[{category_text}] {description}"
-            
-            # Criar registro financeiro
-            entry = FinancialEntry(
-                description=full_description,
-                amount=amount,
-                type=FinancialEntryType[type_value],
-                date=datetime.strptime(date_str, '%Y-%m-%d'),
-                created_by=current_user.id
-            )
-            
-            db.session.add(entry)
-            db.session.commit()
-            
-            # Registrar ação
-            log_action(
-                'Acerto Manual Financeiro',
-                'financial',
-                entry.id,
-                f"Acerto manual: {format_currency(amount)} ({FinancialEntryType[type_value].value})"
-            )
-            
-            flash(f'Acerto manual de {format_currency(amount)} registrado com sucesso!', 'success')
-            
-        except ValueError as e:
-            flash(f'Erro no formato dos dados: {str(e)}', 'danger')
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Erro ao registrar acerto manual: {str(e)}")
-            flash(f'Erro ao processar acerto manual: {str(e)}', 'danger')
-            
-        return redirect(url_for('financial'))
-
-    @app.route('/financeiro/exportar')
-    @manager_required
-    def export_financial():
-        month = request.args.get('month', datetime.utcnow().month, type=int)
-        year = request.args.get('year', datetime.utcnow().year, type=int)
-        
-        # Get entries for the selected month
-        entries = FinancialEntry.query.filter(
-            func.extract('month', FinancialEntry.date) == month,
-            func.extract('year', FinancialEntry.date) == year
-        ).order_by(FinancialEntry.date).all()
-        
-        # Generate CSV content
-        import csv
-        from io import StringIO
-        
-        output = StringIO()
-        writer = csv.writer(output)
-        
-        writer.writerow(['Data', 'Descrição', 'Tipo', 'Valor', 'OS Relacionada'])
-        
-        for entry in entries:
-            os_info = f'OS #{entry.service_order_id}' if entry.service_order_id else 'N/A'
-            writer.writerow([
-                entry.date.strftime('%d/%m/%Y'),
-                entry.description,
-                entry.type.value,
-                f'{entry.amount:.2f}'.replace('.', ','),
-                os_info
-            ])
-            
-        # Create filename with month and year
-        month_name = {
-            1: 'Janeiro', 2: 'Fevereiro', 3: 'Março', 4: 'Abril',
-            5: 'Maio', 6: 'Junho', 7: 'Julho', 8: 'Agosto',
-            9: 'Setembro', 10: 'Outubro', 11: 'Novembro', 12: 'Dezembro'
-        }[month]
-        
-        filename = f'financeiro_{month_name}_{year}.csv'
-        
-        log_action(
-            'Exportação Financeira',
-            'financial',
-            None,
-            f"Exportação dos dados financeiros de {month_name}/{year}"
-        )
-        
-        # Return CSV file
-        return output.getvalue(), 200, {
-            'Content-Type': 'text/csv; charset=utf-8',
-            'Content-Disposition': f'attachment; filename="{filename}"'
-        }
-
     # Log routes
     @app.route('/logs')
     @admin_required
@@ -1877,751 +856,8 @@ def register_routes(app):
             
         return render_template('profile/index.html', form=form)
 
-    # Invoice/NF-e routes
-    @app.route('/notas-fiscais')
-    @login_required
-    def invoices():
-        page = request.args.get('page', 1, type=int)
-        per_page = 20  # Pode ser ajustado nas configurações do sistema posteriormente
-        
-        # Obtém ordens de serviço fechadas (com nota fiscal)
-        query = ServiceOrder.query.filter(
-            ServiceOrder.status == ServiceOrderStatus.fechada,
-            ServiceOrder.invoice_number.isnot(None)
-        ).order_by(ServiceOrder.invoice_date.desc())
-        
-        # Filtros
-        cliente = request.args.get('cliente')
-        numero_nf = request.args.get('numero_nf')
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        
-        if cliente:
-            query = query.join(Client).filter(Client.name.ilike(f'%{cliente}%'))
-        
-        if numero_nf:
-            query = query.filter(ServiceOrder.invoice_number.ilike(f'%{numero_nf}%'))
-        
-        if data_inicio:
-            try:
-                data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
-                query = query.filter(ServiceOrder.invoice_date >= data_inicio)
-            except ValueError:
-                flash('Data inicial inválida.', 'warning')
-        
-        if data_fim:
-            try:
-                data_fim = datetime.strptime(data_fim, '%Y-%m-%d')
-                data_fim = datetime.combine(data_fim, datetime.max.time())  # Fim do dia
-                query = query.filter(ServiceOrder.invoice_date <= data_fim)
-            except ValueError:
-                flash('Data final inválida.', 'warning')
-        
-        # Paginação
-        invoices = query.paginate(page=page, per_page=per_page)
-        
-        return render_template('invoices/index.html', invoices=invoices)
-    
-    @app.route('/notas-fiscais/exportar')
-    @login_required
-    def export_invoices():
-        import zipfile
-        import tempfile
-        
-        if not WEASYPRINT_AVAILABLE:
-            flash('WeasyPrint não está disponível. Não é possível gerar PDFs.', 'error')
-            return redirect(url_for('lista_notas_fiscais'))
-        
-        try:
-            # Obtém os mesmos filtros da listagem
-            cliente = request.args.get('cliente')
-            numero_nf = request.args.get('numero_nf')
-            data_inicio = request.args.get('data_inicio')
-            data_fim = request.args.get('data_fim')
-            
-            # Constrói a query com os mesmos filtros da página de listagem
-            query = ServiceOrder.query.filter(
-                ServiceOrder.status == ServiceOrderStatus.fechada,
-                ServiceOrder.invoice_number.isnot(None)
-            ).order_by(ServiceOrder.invoice_date.desc())
-            
-            if cliente:
-                query = query.join(Client).filter(Client.name.ilike(f'%{cliente}%'))
-            
-            if numero_nf:
-                query = query.filter(ServiceOrder.invoice_number.ilike(f'%{numero_nf}%'))
-            
-            if data_inicio:
-                try:
-                    data_inicio = datetime.strptime(data_inicio, '%Y-%m-%d')
-                    query = query.filter(ServiceOrder.invoice_date >= data_inicio)
-                except ValueError:
-                    flash('Data inicial inválida.', 'warning')
-                    return redirect(url_for('invoices'))
-            
-            if data_fim:
-                try:
-                    data_fim = datetime.strptime(data_fim, '%Y-%m-%d')
-                    data_fim = datetime.combine(data_fim, datetime.max.time())
-                    query = query.filter(ServiceOrder.invoice_date <= data_fim)
-                except ValueError:
-                    flash('Data final inválida.', 'warning')
-                    return redirect(url_for('invoices'))
-            
-            # Limita a quantidade para evitar arquivos muito grandes
-            invoices = query.limit(50).all()
-            
-            if not invoices:
-                flash('Nenhuma nota fiscal encontrada para exportação.', 'warning')
-                return redirect(url_for('invoices'))
-            
-            # Cria um arquivo ZIP em memória
-            memory_file = io.BytesIO()
-            with zipfile.ZipFile(memory_file, 'w') as zf:
-                # Adiciona cada nota fiscal ao ZIP
-                for so in invoices:
-                    # Gera HTML da nota fiscal
-                    html_content = render_template('invoices/view.html', 
-                                                  service_order=so, 
-                                                  export_mode=True,
-                                                  Decimal=Decimal)  # Passando o tipo Decimal para o template
-                    
-                    # Cria arquivo PDF temporário
-                    with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp:
-                        # Configurar tamanho A4 e outras opções para impressão
-                        pdf_options = {
-                            'page-size': 'A4',
-                            'margin-top': '0.5cm',
-                            'margin-right': '0.5cm',
-                            'margin-bottom': '0.5cm',
-                            'margin-left': '0.5cm',
-                            'encoding': 'UTF-8',
-                            'print-media-type': '',
-                            'no-outline': None
-                        }
-                        
-                        # Gera PDF do HTML com tamanho A4
-                        HTML(string=html_content).write_pdf(temp.name, presentational_hints=True, stylesheets=[], **pdf_options)
-                    
-                    # Lê o arquivo PDF e adiciona ao ZIP
-                    with open(temp.name, 'rb') as pdf_file:
-                        pdf_data = pdf_file.read()
-                        # Adiciona ao ZIP com um nome adequado
-                        zf.writestr(f'NF_{so.invoice_number}.pdf', pdf_data)
-                    
-                    # Remove o arquivo temporário
-                    os.unlink(temp.name)
-            
-            # Prepara o arquivo ZIP para download
-            memory_file.seek(0)
-            
-            data_str = datetime.now().strftime('%Y%m%d')
-            response = make_response(memory_file.getvalue())
-            response.headers['Content-Type'] = 'application/zip'
-            response.headers['Content-Disposition'] = f'attachment; filename=notas_fiscais_{data_str}.zip'
-            
-            # Registra a ação
-            log_action(
-                'Exportação de Notas Fiscais',
-                None,
-                None,
-                f'Exportação de {len(invoices)} notas fiscais em PDF'
-            )
-            
-            return response
-        
-        except Exception as e:
-            # Log do erro
-            app.logger.error(f"Erro ao exportar notas fiscais em massa: {str(e)}")
-            flash(f'Erro ao exportar as notas fiscais: {str(e)}', 'danger')
-            return redirect(url_for('invoices'))
-    
-    @app.route('/os/<int:id>/nfe')
-    @login_required
-    def view_invoice(id):
-        from decimal import Decimal
-        from datetime import datetime
-        
-        service_order = ServiceOrder.query.get_or_404(id)
-        
-        # Check if order is closed
-        if service_order.status != ServiceOrderStatus.fechada:
-            flash('Esta OS ainda não foi fechada.', 'warning')
-            return redirect(url_for('view_service_order', id=id))
-            
-        # Verificar se a ordem de serviço possui cliente 
-        if not service_order.client or not service_order.client_id:
-            flash('Esta Ordem de Serviço não possui cliente associado e não pode gerar nota fiscal.', 'danger')
-            return redirect(url_for('view_service_order', id=id))
-        
-        # Verificar e corrigir campos de data necessários
-        if not service_order.invoice_date:
-            service_order.invoice_date = datetime.utcnow()
-            
-        if not service_order.closed_at:
-            service_order.closed_at = datetime.utcnow()
-            
-        # Verificar outros campos obrigatórios
-        if not service_order.invoice_number:
-            from utils import get_next_invoice_number
-            service_order.invoice_number = get_next_invoice_number()
-            
-        # Salvar as alterações
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Erro ao atualizar informações da nota fiscal: {str(e)}', 'danger')
-            return redirect(url_for('view_service_order', id=id))
-        
-        # Passamos o tipo Decimal para o template para facilitar operações matemáticas
-        try:
-            app.logger.debug(f"Renderizando template para OS #{id}. Service Order: {service_order}")
-            if service_order.equipment:
-                app.logger.debug(f"Equipamentos encontrados: {len(service_order.equipment)}")
-            else:
-                app.logger.debug("Nenhum equipamento associado.")
-                
-            return render_template('invoices/clean_invoice.html', 
-                                service_order=service_order,
-                                Decimal=Decimal)
-        except Exception as e:
-            flash(f'Erro ao gerar nota fiscal: {str(e)}', 'danger')
-            app.logger.error(f"Erro ao gerar nota fiscal: {str(e)}")
-            return redirect(url_for('view_service_order', id=id))
-    
-       
-    @app.route('/os/<int:id>/nfe/exportar')
-    @login_required
-    def export_invoice(id):
-        import tempfile
-        
-        if not WEASYPRINT_AVAILABLE:
-            flash('WeasyPrint não está disponível. Não é possível gerar PDFs.', 'error')
-            return redirect(url_for('view_service_order', id=id))
-        
-        service_order = ServiceOrder.query.get_or_404(id)
-        
-        # Check if order is closed
-        if service_order.status != ServiceOrderStatus.fechada:
-            flash('Esta OS ainda não foi fechada.', 'warning')
-            return redirect(url_for('view_service_order', id=id))
-            
-        # Verificar e corrigir campos de data necessários
-        if not service_order.invoice_date:
-            service_order.invoice_date = datetime.utcnow()
-            
-        if not service_order.closed_at:
-            service_order.closed_at = datetime.utcnow()
-            
-        # Verificar outros campos obrigatórios
-        if not service_order.invoice_number:
-            from utils import get_next_invoice_number
-            service_order.invoice_number = get_next_invoice_number()
-            
-        # Verificar se a ordem de serviço possui cliente 
-        if not service_order.client or not service_order.client_id:
-            flash('Esta Ordem de Serviço não possui cliente associado e não pode gerar nota fiscal.', 'danger')
-            return redirect(url_for('view_service_order', id=id))
-            
-        # Salvar as alterações
-        try:
-            db.session.commit()
-        except Exception as e:
-            db.session.rollback()
-            flash(f'Erro ao atualizar informações da nota fiscal: {str(e)}', 'danger')
-            return redirect(url_for('view_service_order', id=id))
-        
-        # Render the clean invoice template to HTML
-        try:
-            html_content = render_template('invoices/clean_invoice.html', 
-                                        service_order=service_order,
-                                        Decimal=Decimal)  # Passando o tipo Decimal para o template
-        except Exception as e:
-            flash(f'Erro ao gerar nota fiscal: {str(e)}', 'danger')
-            return redirect(url_for('view_service_order', id=id))
-        
-        try:
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(suffix='.pdf', delete=False) as temp:
-                # Configurar tamanho A4 e outras opções para impressão
-                pdf_options = {
-                    'page-size': 'A4',
-                    'margin-top': '0.5cm',
-                    'margin-right': '0.5cm',
-                    'margin-bottom': '0.5cm',
-                    'margin-left': '0.5cm',
-                    'encoding': 'UTF-8',
-                    'print-media-type': '',
-                    'no-outline': None
-                }
-                
-                # Generate PDF from HTML content with A4 size
-                HTML(string=html_content).write_pdf(temp.name, presentational_hints=True, stylesheets=[], **pdf_options)
-            
-            # Create a response with the PDF file
-            with open(temp.name, 'rb') as pdf_file:
-                response = make_response(pdf_file.read())
-                response.headers['Content-Type'] = 'application/pdf'
-                response.headers['Content-Disposition'] = f'attachment; filename=nota_fiscal_{service_order.invoice_number}.pdf'
-            
-            # Clean up temporary file
-            os.unlink(temp.name)
-            
-            # Log the successful export
-            log_action(
-                'Exportação de Nota Fiscal',
-                'service_order',
-                service_order.id,
-                f'Nota fiscal {service_order.invoice_number} exportada com sucesso'
-            )
-            
-            return response
-            
-        except Exception as e:
-            # Log the error
-            app.logger.error(f"Erro ao exportar nota fiscal: {str(e)}")
-            flash(f'Erro ao exportar a nota fiscal: {str(e)}', 'danger')
-            return redirect(url_for('view_invoice', id=id))
-        
-    # =====================================================================
-    # Rotas para Fornecedores
-    # =====================================================================
-    @app.route('/fornecedores')
-    @login_required
-    def suppliers():
-        page = request.args.get('page', 1, type=int)
-        search = request.args.get('search', '')
-        
-        query = Supplier.query
-        
-        # Filtrar por pesquisa
-        if search:
-            query = query.filter(
-                or_(
-                    Supplier.name.ilike(f'%{search}%'),
-                    Supplier.document.ilike(f'%{search}%'),
-                    Supplier.contact_name.ilike(f'%{search}%'),
-                    Supplier.email.ilike(f'%{search}%')
-                )
-            )
-        
-        # Ordenar fornecedores
-        query = query.order_by(Supplier.name)
-        
-        # Paginação
-        from utils import get_system_setting
-        pagination = query.paginate(
-            page=page,
-            per_page=int(get_system_setting('items_per_page', '20')),
-            error_out=False
-        )
-        
-        suppliers = pagination.items
-        
-        return render_template(
-            'suppliers/index.html',
-            suppliers=suppliers,
-            pagination=pagination,
-            search=search
-        )
-    
-    @app.route('/fornecedores/novo', methods=['GET', 'POST'])
-    @login_required
-    def new_supplier():
-        form = SupplierForm()
-        
-        if form.validate_on_submit():
-            supplier = Supplier(
-                name=form.name.data,
-                document=form.document.data,
-                contact_name=form.contact_name.data,
-                email=form.email.data,
-                phone=form.phone.data,
-                address=form.address.data,
-                website=form.website.data,
-                notes=form.notes.data
-            )
-            
-            db.session.add(supplier)
-            db.session.commit()
-            
-            log_action(
-                'Cadastro de Fornecedor',
-                'supplier',
-                supplier.id,
-                f'Fornecedor {supplier.name} cadastrado'
-            )
-            
-            flash('Fornecedor cadastrado com sucesso!', 'success')
-            return redirect(url_for('view_supplier', id=supplier.id))
-        
-        return render_template('suppliers/create.html', form=form)
-    
-    @app.route('/fornecedores/<int:id>')
-    @login_required
-    def view_supplier(id):
-        supplier = Supplier.query.get_or_404(id)
-        
-        # Buscar peças do fornecedor
-        parts = Part.query.filter_by(supplier_id=supplier.id).all()
-        
-        return render_template(
-            'suppliers/view.html',
-            supplier=supplier,
-            parts=parts
-        )
-    
-    @app.route('/fornecedores/<int:id>/editar', methods=['GET', 'POST'])
-    @login_required
-    def edit_supplier(id):
-        supplier = Supplier.query.get_or_404(id)
-        form = SupplierForm()
-        
-        if request.method == 'GET':
-            form.id.data = supplier.id
-            form.name.data = supplier.name
-            form.document.data = supplier.document
-            form.contact_name.data = supplier.contact_name
-            form.email.data = supplier.email
-            form.phone.data = supplier.phone
-            form.address.data = supplier.address
-            form.website.data = supplier.website
-            form.notes.data = supplier.notes
-        
-        if form.validate_on_submit():
-            supplier.name = form.name.data
-            supplier.document = form.document.data
-            supplier.contact_name = form.contact_name.data
-            supplier.email = form.email.data
-            supplier.phone = form.phone.data
-            supplier.address = form.address.data
-            supplier.website = form.website.data
-            supplier.notes = form.notes.data
-            
-            db.session.commit()
-            
-            log_action(
-                'Edição de Fornecedor',
-                'supplier',
-                supplier.id,
-                f'Fornecedor {supplier.name} atualizado'
-            )
-            
-            flash('Fornecedor atualizado com sucesso!', 'success')
-            return redirect(url_for('view_supplier', id=supplier.id))
-        
-        return render_template('suppliers/edit.html', form=form, supplier=supplier)
-    
-    @app.route('/fornecedores/<int:id>/excluir', methods=['POST'])
-    @login_required
-    @admin_required
-    def delete_supplier(id):
-        supplier = Supplier.query.get_or_404(id)
-        
-        # Verificar se o fornecedor tem peças cadastradas
-        if supplier.parts:
-            flash('Não é possível excluir um fornecedor com peças cadastradas!', 'danger')
-            return redirect(url_for('view_supplier', id=supplier.id))
-        
-        name = supplier.name
-        db.session.delete(supplier)
-        db.session.commit()
-        
-        log_action(
-            'Exclusão de Fornecedor',
-            'supplier',
-            id,
-            f'Fornecedor {name} excluído'
-        )
-        
-        flash('Fornecedor excluído com sucesso!', 'success')
-        return redirect(url_for('suppliers'))
-    
-    # =====================================================================
-    # Rotas para Peças e Vendas
-    # =====================================================================
-    @app.route('/pecas')
-    @login_required
-    def parts():
-        page = request.args.get('page', 1, type=int)
-        search = request.args.get('search', '')
-        category = request.args.get('category', '')
-        low_stock = request.args.get('low_stock', False, type=bool)
-        
-        query = Part.query
-        
-        # Filtrar por pesquisa
-        if search:
-            query = query.filter(
-                or_(
-                    Part.name.ilike(f'%{search}%'),
-                    Part.part_number.ilike(f'%{search}%'),
-                    Part.description.ilike(f'%{search}%')
-                )
-            )
-        
-        # Filtrar por categoria
-        if category:
-            query = query.filter(Part.category == category)
-        
-        # Filtrar por estoque baixo
-        if low_stock:
-            query = query.filter(Part.stock_quantity <= Part.minimum_stock)
-        
-        # Ordenar peças
-        query = query.order_by(Part.name)
-        
-        # Paginação
-        from utils import get_system_setting
-        pagination = query.paginate(
-            page=page,
-            per_page=int(get_system_setting('items_per_page', '20')),
-            error_out=False
-        )
-        
-        parts = pagination.items
-        
-        # Obter categorias para filtro
-        categories = db.session.query(Part.category.distinct()).filter(Part.category.isnot(None)).order_by(Part.category).all()
-        categories = [c[0] for c in categories if c[0]]
-        
-        return render_template(
-            'parts/index.html',
-            parts=parts,
-            pagination=pagination,
-            search=search,
-            category=category,
-            categories=categories,
-            low_stock=low_stock
-        )
-    
-    @app.route('/pecas/nova', methods=['GET', 'POST'])
-    @login_required
-    def new_part():
-        form = PartForm()
-        
-        if form.validate_on_submit():
-            try:
-                # Processar upload de imagem, se houver
-                image_filename = None
-                if form.image.data:
-                    try:
-                        image = form.image.data
-                        # Gerar nome de arquivo único
-                        filename = secure_filename(f"{form.name.data.replace(' ', '_').lower()}_{datetime.now().strftime('%Y%m%d%H%M%S')}.{image.filename.split('.')[-1]}")
-                        image_path = os.path.join('static', 'uploads', 'parts', filename)
-                        os.makedirs(os.path.join('static', 'uploads', 'parts'), exist_ok=True)
-                        image.save(image_path)
-                        image_filename = filename
-                    except Exception as e:
-                        # Se houver erro no upload da imagem, registrar, mas continuar sem a imagem
-                        app.logger.error(f"Erro ao salvar imagem da peça: {str(e)}")
-                        flash("Não foi possível salvar a imagem da peça, mas o cadastro será feito mesmo assim.", "warning")
-                
-                part = Part(
-                    name=form.name.data,
-                    description=form.description.data,
-                    part_number=form.part_number.data,
-                    supplier_id=form.supplier_id.data,
-                    category=form.category.data,
-                    subcategory=form.subcategory.data,
-                    cost_price=form.cost_price.data,
-                    selling_price=form.selling_price.data,
-                    stock_quantity=form.stock_quantity.data,
-                    minimum_stock=form.minimum_stock.data,
-                    location=form.location.data,
-                    image=image_filename
-                )
-                
-                db.session.add(part)
-                db.session.commit()
-                
-                try:
-                    log_action(
-                        'Cadastro de Peça',
-                        'part',
-                        part.id,
-                        f'Peça {part.name} cadastrada'
-                    )
-                except Exception:
-                    # Se falhar ao registrar log, não interromper o fluxo principal
-                    app.logger.error(f"Erro ao registrar log de criação da peça {part.id}")
-                    
-                flash('Peça cadastrada com sucesso!', 'success')
-                return redirect(url_for('parts'))
-                
-            except IntegrityError:
-                db.session.rollback()
-                flash('Erro de integridade ao cadastrar peça. Verifique se já existe uma peça com o mesmo número.', 'danger')
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao cadastrar peça: {str(e)}', 'danger')
-                app.logger.error(f"Erro ao cadastrar peça: {str(e)}")
-                
-        # Se chegou aqui é porque o formulário não foi validado ou ocorreu erro
-        return render_template('parts/create.html', form=form)
-    
-    @app.route('/pecas/<int:id>')
-    @login_required
-    def view_part(id):
-        part = Part.query.get_or_404(id)
-        
-        # Buscar histórico de vendas
-        sales = PartSale.query.filter_by(part_id=part.id).order_by(PartSale.sale_date.desc()).all()
-        
-        return render_template(
-            'parts/view.html',
-            part=part,
-            sales=sales
-        )
-    
-    @app.route('/pecas/<int:id>/editar', methods=['GET', 'POST'])
-    @login_required
-    def edit_part(id):
-        part = Part.query.get_or_404(id)
-        form = PartForm()
-        
-        if request.method == 'GET':
-            form.id.data = part.id
-            form.name.data = part.name
-            form.description.data = part.description
-            form.part_number.data = part.part_number
-            form.supplier_id.data = part.supplier_id
-            form.category.data = part.category
-            form.subcategory.data = part.subcategory
-            form.cost_price.data = part.cost_price
-            form.selling_price.data = part.selling_price
-            form.stock_quantity.data = part.stock_quantity
-            form.minimum_stock.data = part.minimum_stock
-            form.location.data = part.location
-        
-        if form.validate_on_submit():
-            part.name = form.name.data
-            part.description = form.description.data
-            part.part_number = form.part_number.data
-            part.supplier_id = form.supplier_id.data
-            part.category = form.category.data
-            part.subcategory = form.subcategory.data
-            part.cost_price = form.cost_price.data
-            part.selling_price = form.selling_price.data
-            part.stock_quantity = form.stock_quantity.data
-            part.minimum_stock = form.minimum_stock.data
-            part.location = form.location.data
-            
-            db.session.commit()
-            
-            log_action(
-                'Edição de Peça',
-                'part',
-                part.id,
-                f'Peça {part.name} atualizada'
-            )
-            
-            flash('Peça atualizada com sucesso!', 'success')
-            return redirect(url_for('view_part', id=part.id))
-        
-        return render_template('parts/edit.html', form=form, part=part)
-        
-    @app.route('/pedidos-fornecedor/item/<int:id>/editar', methods=['GET', 'POST'])
-    @login_required
-    def edit_order_item(id):
-        item = OrderItem.query.get_or_404(id)
-        order_id = item.order_id
-        form = OrderItemForm(obj=item)
-        
-        if request.method == 'GET':
-            # Preencher o formulário com os valores atuais
-            if item.stock_item_id:
-                form.stock_item_id.data = item.stock_item_id
-        
-        if form.validate_on_submit():
-            # Atualizar o item
-            item.stock_item_id = form.stock_item_id.data if form.stock_item_id.data else None
-            item.description = form.description.data
-            item.quantity = form.quantity.data
-            item.unit_price = form.unit_price.data or 0
-            item.total_price = form.total_price.data or 0
-            item.status = form.status.data
-            item.notes = form.notes.data
-            
-            db.session.commit()
-            
-            # Recalcular o valor total do pedido
-            recalculate_supplier_order_total(order_id)
-            
-            flash('Item atualizado com sucesso!', 'success')
-            return redirect(url_for('view_supplier_order', id=order_id))
-        
-        elif request.method == 'POST':
-            for field, errors in form.errors.items():
-                for error in errors:
-                    flash(f'Erro no campo {getattr(form, field).label.text}: {error}', 'danger')
-        
-        return render_template('supplier_orders/edit_item.html', form=form, item=item)
-    
-    @app.route('/pedidos-fornecedor/item/<int:id>/excluir', methods=['POST'])
-    @login_required
-    def delete_order_item(id):
-        item = OrderItem.query.get_or_404(id)
-        order_id = item.order_id
-        
-        db.session.delete(item)
-        db.session.commit()
-        
-        # Recalcular o valor total do pedido
-        recalculate_supplier_order_total(order_id)
-        
-        flash('Item excluído com sucesso!', 'success')
-        return redirect(url_for('view_supplier_order', id=order_id))
-    
-    # Registro de pagamento de pedido a fornecedor
-    @app.route('/pedidos-fornecedor/<int:id>/registrar-pagamento', methods=['POST'])
-    @login_required
-    def register_supplier_order_payment(id):
-        order = SupplierOrder.query.get_or_404(id)
-        
-        # Verificar se o pedido já foi pago
-        financial_entry = FinancialEntry.query.filter_by(
-            description=f'Pagamento de Pedido #{order.id} - {order.supplier.name}',
-            entry_type='pedido_fornecedor',
-            reference_id=order.id
-        ).first()
-        
-        if financial_entry:
-            flash('Este pedido já foi registrado como pago!', 'warning')
-            return redirect(url_for('view_supplier_order', id=order.id))
-        
-        # Criar entrada financeira como despesa
-        financial_entry = FinancialEntry(
-            description=f'Pagamento de Pedido #{order.id} - {order.supplier.name}',
-            amount=order.total_value,
-            type=FinancialEntryType.saida,
-            date=datetime.utcnow(),
-            created_by=current_user.id,
-            entry_type='pedido_fornecedor',
-            reference_id=order.id
-        )
-        
-        # Atualizar status do pedido para 'recebido'
-        order.status = OrderStatus.recebido
-        
-        db.session.add(financial_entry)
-        db.session.commit()
-        
-        # Registrar ação no log
-        log_action(
-            'Pagamento de Pedido',
-            'supplier_order',
-            order.id,
-            f'Pagamento de pedido para {order.supplier.name} no valor de {format_currency(order.total_value)}'
-        )
-        
-        flash(f'Pagamento de {format_currency(order.total_value)} registrado com sucesso!', 'success')
-        return redirect(url_for('view_supplier_order', id=order.id))
-    
-    # System Settings
-    @app.route('/configuracoes', methods=['GET', 'POST'])
+    # System Settings
+    @app.route('/configuracoes', methods=['GET', 'POST'])
     @login_required
     def system_settings():
         from utils import get_all_system_settings, get_default_system_settings, set_system_setting
@@ -2658,475 +894,11 @@ def register_routes(app):
             
         return render_template('settings/index.html', form=form, settings=current_settings)
         
-    # Rotas para gerenciamento de EPIs e ferramentas (estoque)
-    @app.route('/estoque', methods=['GET'])
+    @app.route('/criar_dados_teste')
     @login_required
-    def stock_items():
-        # Parâmetros de filtro
-        item_type = request.args.get('type', '')
-        status = request.args.get('status', '')
-        search = request.args.get('search', '')
-        supplier_id = request.args.get('supplier_id', '')
-        
-        # Query base com ordenação padrão
-        query = StockItem.query
-        
-        # Aplicar filtros
-        if item_type:
-            query = query.filter(StockItem.type == StockItemType[item_type])
-        if status:
-            query = query.filter(StockItem.status == StockItemStatus[status])
-        if search:
-            query = query.filter(StockItem.name.ilike(f'%{search}%') | 
-                                StockItem.description.ilike(f'%{search}%'))
-        if supplier_id and supplier_id.isdigit():
-            query = query.filter(StockItem.supplier_id == int(supplier_id))
-        
-        # Atualizar status de todos os itens
-        items_to_update = []
-        for item in query.all():
-            old_status = item.status
-            item.update_status()
-            if old_status != item.status:
-                items_to_update.append(item)
-        
-        if items_to_update:
-            db.session.commit()
-        
-        # Ordenação e paginação
-        items_per_page = int(get_system_setting('items_per_page', '20'))
-        page = request.args.get('page', 1, type=int)
-        items = query.order_by(StockItem.name).paginate(
-            page=page, per_page=items_per_page, error_out=False
-        )
-        
-        # Lista de fornecedores para o filtro
-        suppliers = Supplier.query.order_by(Supplier.name).all()
-        
-        # Lista completa de itens para o modal de movimentação
-        all_stock_items = StockItem.query.order_by(StockItem.name).all()
-        
-        return render_template(
-            'stock/index.html',
-            items=items,
-            all_stock_items=all_stock_items,
-            item_types=StockItemType,
-            item_statuses=StockItemStatus,
-            suppliers=suppliers,
-            active_filters={
-                'type': item_type,
-                'status': status,
-                'search': search,
-                'supplier_id': supplier_id
-            },
-            type_filter=item_type
-        )
-        
-    @app.route('/estoque/novo', methods=['GET', 'POST'])
-    @login_required
-    def new_stock_item():
-        form = StockItemForm()
-        
-        if form.validate_on_submit():
-            try:
-                # Processar data de validade
-                expiration_date = None
-                if form.expiration_date.data:
-                    try:
-                        expiration_date = datetime.strptime(form.expiration_date.data, '%Y-%m-%d').date()
-                    except ValueError:
-                        flash('Formato de data inválido. Use o formato AAAA-MM-DD.', 'danger')
-                        return render_template('stock/edit.html', form=form)
-                
-                # Criar o item
-                stock_item = StockItem(
-                    name=form.name.data,
-                    description=form.description.data,
-                    type=StockItemType[form.type.data],
-                    quantity=form.quantity.data,
-                    min_quantity=form.min_quantity.data,
-                    location=form.location.data,
-                    price=form.price.data,
-                    supplier_id=form.supplier_id.data if form.supplier_id.data != 0 else None,
-                    expiration_date=expiration_date,
-                    ca_number=form.ca_number.data,
-                    created_by=current_user.id
-                )
-                
-                # Atualizar status com base na quantidade e validade
-                stock_item.update_status()
-                
-                # Salvar imagem se fornecida
-                if form.image.data and form.image.data.filename:
-                    filename = secure_filename(form.image.data.filename)
-                    # Gerar nome único com uuid
-                    unique_filename = f"{uuid.uuid4()}_{filename}"
-                    # Diretório para salvar as imagens
-                    upload_folder = os.path.join(current_app.static_folder, 'uploads', 'stock')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    # Caminho completo do arquivo
-                    filepath = os.path.join(upload_folder, unique_filename)
-                    # Salvar o arquivo
-                    form.image.data.save(filepath)
-                    # Armazenar o caminho relativo no banco de dados
-                    stock_item.image = f'uploads/stock/{unique_filename}'
-                
-                db.session.add(stock_item)
-                db.session.commit()
-                
-                # Registrar a criação do item
-                log_action(
-                    'Cadastro de Item de Estoque',
-                    'stock_item',
-                    stock_item.id,
-                    f"Item {stock_item.name} cadastrado no estoque"
-                )
-                
-                # Criar um registro de movimento de estoque para a entrada inicial
-                if form.quantity.data > 0:
-                    movement = StockMovement(
-                        stock_item_id=stock_item.id,
-                        quantity=form.quantity.data,
-                        description="Entrada inicial de estoque",
-                        created_by=current_user.id
-                    )
-                    db.session.add(movement)
-                    db.session.commit()
-                
-                flash('Item cadastrado com sucesso!', 'success')
-                return redirect(url_for('view_stock_item', id=stock_item.id))
-                
-            except Exception as e:
-                db.session.rollback()
-                app.logger.error(f"Erro ao cadastrar item de estoque: {str(e)}")
-                flash(f'Erro ao cadastrar item: {str(e)}', 'danger')
-        
-        return render_template('stock/edit.html', form=form, item=None)
-        
-    @app.route('/estoque/<int:id>', methods=['GET'])
-    @login_required
-    def view_stock_item(id):
-        item = StockItem.query.get_or_404(id)
-        
-        # Atualizar status do item
-        old_status = item.status
-        item.update_status()
-        if old_status != item.status:
-            db.session.commit()
-        
-        # Buscar movimentações do item
-        movements = StockMovement.query.filter_by(stock_item_id=id).order_by(StockMovement.created_at.desc()).all()
-        
-        # Formulário para nova movimentação
-        movement_form = StockMovementForm()
-        movement_form.stock_item_id.choices = [(item.id, item.name)]
-        movement_form.stock_item_id.data = item.id
-        
-        return render_template(
-            'stock/view.html',
-            item=item,
-            movements=movements,
-            movement_form=movement_form,
-            now=datetime.now()
-        )
-        
-    @app.route('/estoque/<int:id>/editar', methods=['GET', 'POST'])
-    @login_required
-    def edit_stock_item(id):
-        item = StockItem.query.get_or_404(id)
-        form = StockItemForm(obj=item)
-        
-        if form.validate_on_submit():
-            try:
-                # Processar data de validade
-                expiration_date = None
-                if form.expiration_date.data:
-                    try:
-                        expiration_date = datetime.strptime(form.expiration_date.data, '%Y-%m-%d').date()
-                    except ValueError:
-                        flash('Formato de data inválido. Use o formato AAAA-MM-DD.', 'danger')
-                        return render_template('stock/edit.html', form=form, item=item)
-                
-                # Atualizar o item
-                item.name = form.name.data
-                item.description = form.description.data
-                item.type = StockItemType[form.type.data]
-                # Não atualizar quantity diretamente, usar movimentação
-                item.min_quantity = form.min_quantity.data
-                item.location = form.location.data
-                item.price = form.price.data
-                item.supplier_id = form.supplier_id.data if form.supplier_id.data != 0 else None
-                item.expiration_date = expiration_date
-                item.ca_number = form.ca_number.data
-                
-                # Salvar nova imagem se fornecida
-                if form.image.data and form.image.data.filename:
-                    # Remover imagem anterior se existir
-                    if item.image:
-                        try:
-                            old_image_path = os.path.join(current_app.static_folder, item.image)
-                            if os.path.exists(old_image_path):
-                                os.remove(old_image_path)
-                        except Exception as e:
-                            app.logger.warning(f"Erro ao remover imagem antiga: {str(e)}")
-                    
-                    image = form.image.data
-                    
-                    # Gerar nome de arquivo único
-                    filename = secure_filename(f"vehicle_{uuid.uuid4().hex}.{image.filename.split('.')[-1]}")
-                    upload_folder = os.path.join('static', 'uploads', 'vehicles')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    image.save(os.path.join(upload_folder, filename))
-                    item.image = filename
-                
-                # Atualizar status do item
-                item.update_status()
-                db.session.commit()
-                
-                # Registrar a edição do item
-                log_action(
-                    'Edição de Item de Estoque',
-                    'stock_item',
-                    item.id,
-                    f"Item {item.name} editado no estoque"
-                )
-                
-                flash('Item atualizado com sucesso!', 'success')
-                return redirect(url_for('view_stock_item', id=item.id))
-                
-            except Exception as e:
-                db.session.rollback()
-                app.logger.error(f"Erro ao editar item de estoque: {str(e)}")
-                flash(f'Erro ao editar item: {str(e)}', 'danger')
-        
-        # Preencher o campo de data de validade no formato correto
-        if request.method == 'GET' and item.expiration_date:
-            form.expiration_date.data = item.expiration_date.strftime('%Y-%m-%d')
-        
-        return render_template('stock/edit.html', form=form, item=item)
-        
-    @app.route('/estoque/<int:id>/excluir', methods=['POST'])
-    @login_required
-    # Permitir que funcionários também excluam itens de estoque
-    def delete_stock_item(id):
-        # Solução simplificada para resolver problemas de transação
-        
-        # Garantir que qualquer operação pendente seja encerrada
-        db.session.close()
-        
-        try:
-            # Remover diretamente da base de dados usando SQL bruto para evitar problemas com SQLAlchemy
-            # Executando cada operação em uma transação independente
-            
-            # 1. Obter informações do item antes de excluir
-            item = StockItem.query.get_or_404(id)
-            item_name = item.name
-            item_image = item.image
-            
-            # 2. Excluir movimentações primeiro
-            db.session.execute(text("DELETE FROM stock_movement WHERE stock_item_id = :id"), {"id": id})
-            db.session.commit()
-            
-            # 3. Excluir o item
-            db.session.execute(text("DELETE FROM stock_item WHERE id = :id"), {"id": id})
-            db.session.commit()
-            
-            # 4. Remover imagem se existir
-            if item_image:
-                try:
-                    image_path = os.path.join(current_app.root_path, "static", item_image)
-                    if os.path.exists(image_path):
-                        os.remove(image_path)
-                except Exception as img_error:
-                    current_app.logger.warning(f"Erro ao remover imagem: {str(img_error)}")
-            
-            # 5. Registrar ação
-            log_action(
-                'Exclusão de Item de Estoque',
-                'stock_item', 
-                id,
-                f"Item {item_name} excluído do estoque"
-            )
-            
-            flash('Item excluído com sucesso!', 'success')
-            
-        except Exception as e:
-            db.session.rollback()
-            current_app.logger.error(f"Erro ao excluir item de estoque: {str(e)}")
-            flash(f'Erro ao excluir item: {str(e)}', 'danger')
-        
-        return redirect(url_for('stock_items'))
-        
-    @app.route('/estoque/movimentacao', methods=['POST'])
-    @login_required
-    def add_stock_movement():
-        form = StockMovementForm()
-        
-        if form.validate_on_submit():
-            try:
-                item = StockItem.query.get_or_404(form.stock_item_id.data)
-                
-                # Determinar a quantidade (positiva para entrada, negativa para saída)
-                quantity = form.quantity.data
-                if form.direction.data == 'saida':
-                    quantity = -quantity
-                
-                # Verificar se há quantidade suficiente em caso de saída
-                if quantity < 0 and abs(quantity) > item.quantity:
-                    flash('Quantidade insuficiente em estoque para esta saída.', 'danger')
-                    return redirect(url_for('view_stock_item', id=item.id))
-                
-                # Criar o movimento
-                movement = StockMovement(
-                    stock_item_id=form.stock_item_id.data,
-                    quantity=quantity,
-                    description=form.description.data,
-                    reference=form.reference.data,
-                    service_order_id=form.service_order_id.data if form.service_order_id.data != 0 else None,
-                    created_by=current_user.id
-                )
-                
-                # Atualizar a quantidade do item
-                item.quantity += quantity
-                
-                # Atualizar o status do item
-                item.update_status()
-                
-                db.session.add(movement)
-                db.session.commit()
-                
-                # Registrar a ação
-                log_action(
-                    f"{'Entrada' if quantity > 0 else 'Saída'} de Estoque",
-                    'stock_movement',
-                    movement.id,
-                    f"{abs(quantity)} unidade(s) {form.direction.data} de {item.name}"
-                )
-                
-                flash('Movimento de estoque registrado com sucesso!', 'success')
-                
-            except Exception as e:
-                db.session.rollback()
-                app.logger.error(f"Erro ao registrar movimento de estoque: {str(e)}")
-                flash(f'Erro ao registrar movimento: {str(e)}', 'danger')
-        
-        # Redirecionar para a visualização do item
-        return redirect(url_for('view_stock_item', id=form.stock_item_id.data))
-        
-    @app.route('/api/estoque/movimentacao', methods=['POST'])
-    @login_required
-    def add_stock_movement_ajax():
-        """Endpoint para registrar movimento de estoque via AJAX"""
-        try:
-            # Obter dados do formulário
-            stock_item_id = request.form.get('stock_item_id')
-            quantity = int(request.form.get('quantity', 1))
-            direction = request.form.get('direction')
-            description = request.form.get('description', '')
-            reference = request.form.get('reference', '')
-            
-            if not stock_item_id or not direction or not description:
-                return jsonify({
-                    'success': False, 
-                    'message': 'Dados incompletos. Preencha todos os campos obrigatórios.'
-                })
-            
-            # Buscar o item de estoque
-            item = StockItem.query.get_or_404(stock_item_id)
-            
-            # Determinar a quantidade (positiva para entrada, negativa para saída)
-            actual_quantity = quantity
-            if direction == 'saida':
-                actual_quantity = -quantity
-            
-            # Verificar se há quantidade suficiente em caso de saída
-            if actual_quantity < 0 and abs(actual_quantity) > item.quantity:
-                return jsonify({
-                    'success': False,
-                    'message': f'Quantidade insuficiente em estoque. Disponível: {item.quantity}'
-                })
-            
-            # Criar o movimento
-            movement = StockMovement(
-                stock_item_id=stock_item_id,
-                quantity=actual_quantity,
-                description=description,
-                reference=reference,
-                created_by=current_user.id
-            )
-            
-            # Atualizar a quantidade do item
-            item.quantity += actual_quantity
-            
-            # Atualizar o status do item
-            item.update_status()
-            
-            db.session.add(movement)
-            db.session.commit()
-            
-            # Registrar a ação
-            action_type = "Entrada" if actual_quantity > 0 else "Saída"
-            log_action(
-                f"{action_type} de Estoque",
-                'stock_movement',
-                movement.id,
-                f"{abs(actual_quantity)} unidade(s) {direction} de {item.name}"
-            )
-            
-            return jsonify({
-                'success': True,
-                'message': f'Movimento de {abs(actual_quantity)} unidade(s) registrado com sucesso!',
-                'new_quantity': item.quantity,
-                'item_id': item.id
-            })
-            
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Erro ao registrar movimento via AJAX: {str(e)}")
-            return jsonify({
-                'success': False,
-                'message': f'Erro ao processar: {str(e)}'
-            })
-
-    # Initialize the first admin user if no users exist
-    def create_initial_admin():
-        # Verificar se a tabela de usuários existe
-        inspector = inspect(db.engine)
-        if not inspector.has_table('user'):
-            return
-
-        # Verificar se a coluna username existe
-        columns = [c['name'] for c in inspector.get_columns('user')]
-        if 'username' not in columns:
-            app.logger.info("Username column not found. Migrating database...")
-            # A coluna username não existe, então precisamos criar o esquema do zero
-            db.drop_all()
-            db.create_all()
-            
-        # Criar o admin se não houver usuários
-        if User.query.count() == 0:
-            admin = User(
-                username='admin',
-                name='Administrador',
-                email='admin@samape.com',
-                role=UserRole.admin,
-                active=True
-            )
-            admin.set_password('admin123')
-            
-            db.session.add(admin)
-            db.session.commit()
-            
-            app.logger.info("Admin user created: username=admin, password=admin123")
-            
-    # Register function to be called with app context in app.py
-    app.create_initial_admin = create_initial_admin
-    
-    @app.route('/criar_dados_teste')
-    @login_required
-    def criar_dados_teste():
-        """Rota temporária para criar dados de teste no sistema."""
-        from create_test_data import create_test_data
+    def criar_dados_teste():
+        """Rota temporária para criar dados de teste no sistema."""
+        from create_test_data import create_test_data
         
         try:
             result = create_test_data()
@@ -3139,614 +911,4 @@ def register_routes(app):
             flash(f'Erro ao criar dados de teste: {str(e)}', 'danger')
             
         return redirect(url_for('dashboard'))
-        
-    # Rotas para Controle de Frota
-    @app.route('/frota')
-    @login_required
-    def fleet():
-        """Lista de veículos da frota"""
-        try:
-            # Adicionar logging
-            app.logger.info("Acessando página de frota")
-            
-            # Contador de estatísticas
-            stats = {
-                'active': Vehicle.query.filter_by(status=VehicleStatus.ativo).count(),
-                'maintenance': Vehicle.query.filter_by(status=VehicleStatus.em_manutencao).count(),
-                'inactive': Vehicle.query.filter_by(status=VehicleStatus.inativo).count(),
-                'total': Vehicle.query.count()
-            }
-            
-            # Inicializar variáveis com valores padrão
-            page = request.args.get('page', 1, type=int)
-            per_page = int(get_system_setting('items_per_page', '20'))
-            
-            today = datetime.now().date()
-            
-            app.logger.info("Preparando query para lista de veículos")
-            
-            # Query base
-            query = Vehicle.query
-            
-            # Aplicar filtros
-            status_filter = request.args.get('status')
-            tipo_filter = request.args.get('tipo')
-            busca = request.args.get('busca')
-            
-            if status_filter:
-                app.logger.info(f"Aplicando filtro por status: {status_filter}")
-                query = query.filter(Vehicle.status == VehicleStatus[status_filter])
-                
-            if tipo_filter:
-                # Filtro de tipo removido - campo não existe na tabela
-                app.logger.info(f"Filtro por tipo ignorado (campo não existe): {tipo_filter}")
-                pass
-                
-            if busca:
-                app.logger.info(f"Aplicando busca: {busca}")
-                query = query.filter(
-                    or_(
-                        Vehicle.plate.ilike(f'%{busca}%'),
-                        Vehicle.brand.ilike(f'%{busca}%'),
-                        Vehicle.model.ilike(f'%{busca}%'),
-                        Vehicle.chassis.ilike(f'%{busca}%')
-                    )
-                )
-            
-            # Ordenação
-            order_by = request.args.get('order_by', 'plate')
-            order_dir = request.args.get('order_dir', 'asc')
-            app.logger.info(f"Ordenando por: {order_by} ({order_dir})")
-            
-            if order_by == 'plate':
-                if order_dir == 'asc':
-                    query = query.order_by(Vehicle.plate)
-                else:
-                    query = query.order_by(Vehicle.plate.desc())
-            elif order_by == 'type':
-                if order_dir == 'asc':
-                    # Ordenação por tipo removida - campo não existe na tabela
-                    query = query.order_by(Vehicle.brand)
-                else:
-                    # Ordenação por tipo removida - campo não existe na tabela
-                    query = query.order_by(Vehicle.brand.desc())
-            elif order_by == 'status':
-                if order_dir == 'asc':
-                    query = query.order_by(Vehicle.status)
-                else:
-                    query = query.order_by(Vehicle.status.desc())
-            elif order_by == 'brand':
-                if order_dir == 'asc':
-                    query = query.order_by(Vehicle.brand)
-                else:
-                    query = query.order_by(Vehicle.brand.desc())
-            else:
-                query = query.order_by(Vehicle.plate)
-            
-            # Paginação
-            app.logger.info(f"Aplicando paginação: página {page}, {per_page} itens por página")
-            vehicles = query.paginate(page=page, per_page=per_page)
-            
-            # Obter as últimas movimentações (manutenções e abastecimentos)
-            app.logger.info("Buscando últimas movimentações (manutenções e abastecimentos)")
-            
-            try:
-                # Consulta para manutenções
-                maintenance_records = db.session.query(
-                    VehicleMaintenance.id.label('record_id'),
-                    VehicleMaintenance.vehicle_id,
-                    VehicleMaintenance.date,
-                    VehicleMaintenance.description,
-                    VehicleMaintenance.cost,
-                    VehicleMaintenance.created_at,
-                    db.literal('maintenance').label('record_type')
-                ).order_by(VehicleMaintenance.created_at.desc()).limit(5).all()
-                
-                # Consulta para abastecimentos
-                refueling_records = db.session.query(
-                    Refueling.id.label('record_id'),
-                    Refueling.vehicle_id,
-                    Refueling.date,
-                    db.literal('Abastecimento').label('description'),
-                    Refueling.total_cost.label('cost'),
-                    Refueling.created_at,
-                    db.literal('refueling').label('record_type')
-                ).order_by(Refueling.created_at.desc()).limit(5).all()
-                
-                # Combinar resultados e ordenar por data de criação
-                latest_records = sorted(
-                    maintenance_records + refueling_records,
-                    key=lambda x: x.created_at,
-                    reverse=True
-                )[:10]  # Limitar a 10 registros
-                
-                # Obter informações dos veículos associados
-                for record in latest_records:
-                    vehicle = Vehicle.query.get(record.vehicle_id)
-                    if vehicle:
-                        setattr(record, 'vehicle', vehicle)
-            except Exception as e:
-                app.logger.error(f"Erro ao buscar movimentações recentes: {str(e)}")
-                latest_records = []
-            
-            app.logger.info(f"Renderizando template com {vehicles.total} veículos e {len(latest_records)} movimentações recentes")
-            
-            return render_template(
-                'fleet/index.html',
-                vehicles=vehicles,
-                status_filter=status_filter,
-                tipo_filter=tipo_filter,
-                busca=busca,
-                order_by=order_by,
-                order_dir=order_dir,
-                vehicle_statuses=VehicleStatus,
-                today=today,
-                stats=stats,
-                latest_records=latest_records
-            )
-        except Exception as e:
-            app.logger.error(f"Erro ao acessar página de frota: {str(e)}")
-            import traceback
-            app.logger.error(traceback.format_exc())
-            flash(f"Erro ao carregar página de frota: {str(e)}", "danger")
-            return redirect(url_for('dashboard'))
-        
-    @app.route('/frota/novo', methods=['GET', 'POST'])
-    @login_required
-    @manager_required
-    def new_vehicle():
-        """Adicionar novo veículo à frota"""
-        form = VehicleForm()
-        
-        if form.validate_on_submit():
-            try:
-                # Tratar datas
-                acquisition_date = None
-                if form.acquisition_date.data:
-                    acquisition_date = datetime.strptime(form.acquisition_date.data, '%Y-%m-%d').date()
-                
-                insurance_expiry = None
-                if form.insurance_expiry.data:
-                    insurance_expiry = datetime.strptime(form.insurance_expiry.data, '%Y-%m-%d').date()
-                
-                next_maintenance_date = None
-                if form.next_maintenance_date.data:
-                    next_maintenance_date = datetime.strptime(form.next_maintenance_date.data, '%Y-%m-%d').date()
-                
-                # Processar imagem, se houver
-                image_filename = None
-                if form.image.data:
-                    image = form.image.data
-                    
-                    # Gerar nome de arquivo único
-                    filename = secure_filename(f"vehicle_{uuid.uuid4().hex}.{image.filename.split('.')[-1]}")
-                    upload_folder = os.path.join('static', 'uploads', 'vehicles')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    image.save(os.path.join(upload_folder, filename))
-                    image_filename = filename
-                
-                # Criar objeto de veículo
-                vehicle = Vehicle(
-                    # Não adicionar campo type - não existe no banco de dados
-                    plate=form.plate.data,
-                    brand=form.brand.data,
-                    model=form.model.data,
-                    year=form.year.data,
-                    color=form.color.data,
-                    chassis=form.chassis.data,
-                    renavam=form.renavam.data,
-                    fuel_type=FuelType.flex if not form.fuel_type.data else 
-                       FuelType[form.fuel_type.data] if form.fuel_type.data in [fuel_type.name for fuel_type in FuelType] else FuelType.flex,
-                    acquisition_date=acquisition_date,
-                    insurance_policy=form.insurance_policy.data,
-                    insurance_expiry=insurance_expiry,
-                    current_km=form.current_km.data,
-                    next_maintenance_date=next_maintenance_date,
-                    next_maintenance_km=form.next_maintenance_km.data,
-                    responsible_id=form.responsible_id.data if form.responsible_id.data != 0 else None,
-                    status=VehicleStatus[form.status.data],
-                    image=image_filename,
-                    notes=form.notes.data
-                )
-                
-                db.session.add(vehicle)
-                db.session.commit()
-                
-                flash('Veículo adicionado com sucesso!', 'success')
-                log_action(
-                    'Cadastro de Veículo',
-                    'vehicle',
-                    vehicle.id,
-                    f"Veículo placa {vehicle.plate} cadastrado"
-                )
-                
-                return redirect(url_for('view_vehicle', id=vehicle.id))
-                
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao adicionar veículo: {str(e)}', 'danger')
-                app.logger.error(f"Erro ao cadastrar veículo: {str(e)}")
-        
-        return render_template('fleet/new.html', form=form)
-        
-    @app.route('/frota/<int:id>')
-    @login_required
-    def view_vehicle(id):
-        """Visualizar detalhes de um veículo"""
-        vehicle = Vehicle.query.get_or_404(id)
-        
-        # Obter histórico de manutenção
-        maintenance_history = VehicleMaintenance.query.filter_by(vehicle_id=vehicle.id).order_by(VehicleMaintenance.date.desc()).all()
-        
-        # Obter histórico de abastecimento
-        refueling_history = Refueling.query.filter_by(vehicle_id=vehicle.id).order_by(Refueling.date.desc()).all()
-        
-        # Data atual para o modal de abastecimento
-        now_date = datetime.now().strftime('%Y-%m-%d')
-        
-        return render_template(
-            'fleet/view.html',
-            vehicle=vehicle,
-            maintenance_history=maintenance_history,
-            refueling_history=refueling_history,
-            now_date=now_date
-        )
-        
-    @app.route('/frota/<int:id>/editar', methods=['GET', 'POST'])
-    @login_required
-    @manager_required
-    def edit_vehicle(id):
-        """Editar veículo"""
-        vehicle = Vehicle.query.get_or_404(id)
-        form = VehicleForm(obj=vehicle)
-        
-        if request.method == 'GET':
-            # Converter datas para o formato correto para o formulário
-            if vehicle.acquisition_date:
-                form.acquisition_date.data = vehicle.acquisition_date.strftime('%Y-%m-%d')
-            if vehicle.insurance_expiry:
-                form.insurance_expiry.data = vehicle.insurance_expiry.strftime('%Y-%m-%d')
-            if vehicle.next_maintenance_date:
-                form.next_maintenance_date.data = vehicle.next_maintenance_date.strftime('%Y-%m-%d')
-                
-            # Lidar com dados do enum
-            # type removido - campo não existe no banco de dados
-            form.status.data = vehicle.status.name
-            
-            # Definir responsável
-            if vehicle.responsible_id is None:
-                form.responsible_id.data = 0
-        
-        if form.validate_on_submit():
-            try:
-                # Tratar datas
-                acquisition_date = None
-                if form.acquisition_date.data:
-                    acquisition_date = datetime.strptime(form.acquisition_date.data, '%Y-%m-%d').date()
-                
-                insurance_expiry = None
-                if form.insurance_expiry.data:
-                    insurance_expiry = datetime.strptime(form.insurance_expiry.data, '%Y-%m-%d').date()
-                
-                next_maintenance_date = None
-                if form.next_maintenance_date.data:
-                    next_maintenance_date = datetime.strptime(form.next_maintenance_date.data, '%Y-%m-%d').date()
-                
-                # Processar imagem, se houver
-                if form.image.data:
-                    # Remover imagem anterior se existir
-                    if vehicle.image:
-                        try:
-                            old_image_path = os.path.join('static', 'uploads', 'vehicles', vehicle.image)
-                            if os.path.exists(old_image_path):
-                                os.remove(old_image_path)
-                        except Exception as e:
-                            app.logger.warning(f"Erro ao remover imagem antiga: {str(e)}")
-                    
-                    image = form.image.data
-                    
-                    # Gerar nome de arquivo único
-                    filename = secure_filename(f"vehicle_{uuid.uuid4().hex}.{image.filename.split('.')[-1]}")
-                    upload_folder = os.path.join('static', 'uploads', 'vehicles')
-                    os.makedirs(upload_folder, exist_ok=True)
-                    image.save(os.path.join(upload_folder, filename))
-                    vehicle.image = filename
-                
-                # Atualizar campos do veículo
-                # type removido - campo não existe no banco de dados
-                vehicle.plate = form.plate.data
-                vehicle.brand = form.brand.data
-                vehicle.model = form.model.data
-                vehicle.year = form.year.data
-                vehicle.color = form.color.data
-                vehicle.chassis = form.chassis.data
-                vehicle.renavam = form.renavam.data
-                vehicle.acquisition_date = acquisition_date
-                # Tratar o tipo de combustível corretamente
-                try:
-                    # Buscar o valor do campo de combustível do formulário
-                    fuel_type = form.fuel_type.data
-                    # Converter o tipo de combustível para o enum correto
-                    fuel_type_enum = FuelType[fuel_type] if fuel_type in [ft.name for ft in FuelType] else FuelType.flex
-                except (KeyError, ValueError, AttributeError):
-                    # Fallback para o tipo padrão se houver erro
-                    fuel_type_enum = FuelType.flex
-                
-                vehicle.fuel_type = fuel_type_enum
-                vehicle.insurance_policy = form.insurance_policy.data
-                vehicle.insurance_expiry = insurance_expiry
-                vehicle.current_km = form.current_km.data
-                vehicle.next_maintenance_km = form.next_maintenance_km.data
-                vehicle.next_maintenance_date = next_maintenance_date
-                vehicle.responsible_id = form.responsible_id.data if form.responsible_id.data != 0 else None
-                vehicle.status = VehicleStatus[form.status.data]
-                vehicle.notes = form.notes.data
-                
-                db.session.commit()
-                
-                flash('Veículo atualizado com sucesso!', 'success')
-                log_action(
-                    'Edição de Veículo',
-                    'vehicle',
-                    vehicle.id,
-                    f"Veículo placa {vehicle.plate} atualizado"
-                )
-                
-                return redirect(url_for('view_vehicle', id=vehicle.id))
-                
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao atualizar veículo: {str(e)}', 'danger')
-                app.logger.error(f"Erro ao atualizar veículo {id}: {str(e)}")
-        
-        return render_template('fleet/edit.html', form=form, vehicle=vehicle)
-        
-    @app.route('/frota/<int:id>/excluir', methods=['GET', 'POST'])
-    @login_required
-    # Removida restrição @role_required para permitir acesso a todos os usuários logados
-    def delete_vehicle(id):
-        """Excluir veículo - redirecionar para a versão correta"""
-        # Redirecionar para a nova rota de exclusão de veículos
-        return redirect(url_for('excluir_veiculo_direct', id=id))
-        
-    @app.route('/excluir-veiculo/<int:id>', methods=['POST'])
-    @login_required
-    def excluir_veiculo_direct(id):
-        """Rota para excluir veículo - apenas para administradores"""
-        # Verificar se o usuário é administrador 
-        if current_user.role.value != 'admin':
-            flash('Acesso negado. Apenas administradores podem excluir veículos.', 'danger')
-            return redirect(url_for('fleet'))
-            
-        app.logger.info(f"Tentando excluir veículo ID: {id}, usuário: {current_user.username}")
-        
-        try:
-            # Buscar o veículo
-            vehicle = Vehicle.query.get_or_404(id)
-            vehicle_info = f"{vehicle.plate} ({vehicle.brand} {vehicle.model})"
-            
-            # Excluir registros relacionados primeiro
-            # Manutenções
-            VehicleMaintenance.query.filter_by(vehicle_id=id).delete()
-            # Abastecimentos
-            Refueling.query.filter_by(vehicle_id=id).delete()
-            
-            # Excluir o veículo
-            db.session.delete(vehicle)
-            db.session.commit()
-            
-            # Log da ação
-            app.logger.info(f"Veículo {vehicle_info} excluído com sucesso por {current_user.username}")
-            flash(f'Veículo {vehicle_info} excluído com sucesso!', 'success')
-            
-        except Exception as e:
-            db.session.rollback()
-            app.logger.error(f"Erro ao excluir veículo {id}: {str(e)}")
-            flash(f'Erro ao excluir o veículo: {str(e)}', 'danger')
-            
-        return redirect(url_for('fleet'))
-    
-    @app.route('/frota/veiculos/<int:id>/abastecimento', methods=['GET', 'POST'])
-    @login_required
-    # Removida a restrição @manager_required para permitir que todos os usuários registrem abastecimentos
-    def register_refueling(id):
-        """Rota para registrar abastecimento de veículo"""
-        vehicle = Vehicle.query.get_or_404(id)
-        
-        # Estamos usando o formulário diretamente no template ao invés do objeto forms.RefuelingForm
-        
-        if request.method == 'GET':
-            # Pré-preencher o formulário com valores padrão
-            current_date = datetime.now().strftime('%Y-%m-%d')
-            return render_template('fleet/refueling.html', vehicle=vehicle, today=current_date)
-        
-        if request.method == 'POST':
-            try:
-                # Processar dados do formulário
-                date_str = request.form.get('date')
-                odometer = request.form.get('odometer')
-                fuel_type = request.form.get('fuel_type')
-                liters = request.form.get('liters')
-                price_per_liter = request.form.get('price_per_liter')
-                total_cost = request.form.get('total_cost')
-                gas_station = request.form.get('gas_station')
-                full_tank = 'full_tank' in request.form
-                
-                # Validar campos obrigatórios
-                if not all([date_str, odometer, fuel_type, liters, price_per_liter, total_cost]):
-                    flash('Por favor, preencha todos os campos obrigatórios.', 'danger')
-                    return render_template('fleet/refueling.html', 
-                                          vehicle=vehicle, 
-                                          today=date_str or datetime.now().strftime('%Y-%m-%d'))
-                
-                try:
-                    # Converter valores
-                    refueling_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-                    odometer = int(odometer)
-                    liters = float(liters)
-                    price_per_liter = float(price_per_liter)
-                    total_cost = float(total_cost)
-                except ValueError as e:
-                    flash(f'Erro ao converter valores: {str(e)}', 'danger')
-                    return render_template('fleet/refueling.html', 
-                                          vehicle=vehicle, 
-                                          today=date_str or datetime.now().strftime('%Y-%m-%d'))
-                
-                # Criar o registro de abastecimento
-                # Determinar o tipo de combustível correto
-                try:
-                    # Converter o tipo de combustível para o enum correto
-                    fuel_type_enum = FuelType[fuel_type] if fuel_type in [ft.name for ft in FuelType] else FuelType.flex
-                except (KeyError, ValueError):
-                    # Fallback para o tipo padrão se houver erro
-                    fuel_type_enum = FuelType.flex
-                
-                refueling = Refueling(
-                    vehicle_id=vehicle.id,
-                    date=refueling_date,
-                    odometer=odometer,
-                    fuel_type=fuel_type_enum,  # Usando o enum correto
-                    liters=liters,
-                    price_per_liter=price_per_liter,
-                    total_cost=total_cost,
-                    gas_station=gas_station,
-                    full_tank=full_tank,
-                    created_by=current_user.id
-                )
-                
-                # Atualizar a quilometragem atual do veículo
-                if odometer > (vehicle.current_km or 0):
-                    vehicle.current_km = odometer
-                
-                # Primeiro, salvar o registro de abastecimento para obter um ID válido
-                db.session.add(refueling)
-                db.session.flush()  # Isso gera um ID sem confirmar a transação
-                
-                # Agora criar lançamento financeiro com o ID correto do abastecimento
-                financial_entry = FinancialEntry(
-                    date=refueling_date,
-                    amount=total_cost,
-                    description=f"Abastecimento - {vehicle.brand} {vehicle.model} ({vehicle.plate}) - Combustível",
-                    type=FinancialEntryType.saida,
-                    created_by=current_user.id,
-                    entry_type='vehicle_refueling',
-                    reference_id=refueling.id  # Agora o ID é válido
-                )
-                
-                # Adicionar e confirmar a transação
-                db.session.add(financial_entry)
-                db.session.commit()
-                
-                # Registrar ação no log
-                log_action(
-                    'Registro de Abastecimento',
-                    'vehicle_refueling',
-                    refueling.id,
-                    f"Abastecimento registrado para o veículo {vehicle.plate}"
-                )
-                
-                flash(f'Abastecimento registrado com sucesso! Custo total: R$ {total_cost:.2f}', 'success')
-                return redirect(url_for('view_vehicle', id=vehicle.id))
-            except Exception as e:
-                db.session.rollback()
-                flash(f'Erro ao registrar abastecimento: {str(e)}', 'danger')
-                app.logger.error(f"Erro ao registrar abastecimento para veículo {id}: {str(e)}")
-                return redirect(url_for('view_vehicle', id=vehicle.id))
-        
-        return redirect(url_for('view_vehicle', id=vehicle.id))
-    
-    @app.route('/frota/manutencoes')
-    @login_required
-    def vehicle_maintenance_history():
-        """Histórico de manutenções e abastecimentos de todos os veículos"""
-        page = request.args.get('page', 1, type=int)
-        per_page = int(get_system_setting('items_per_page', '20'))
-        view_type = request.args.get('view', 'maintenance')  # 'maintenance' ou 'refueling'
-        
-        # Obter lista de veículos para o filtro
-        vehicles = Vehicle.query.order_by(Vehicle.plate).all()
-        
-        # Aplicar filtros
-        vehicle_id = request.args.get('vehicle_id', type=int)
-        data_inicio = request.args.get('data_inicio')
-        data_fim = request.args.get('data_fim')
-        
-        # Converter datas se fornecidas
-        inicio_date = None
-        fim_date = None
-        
-        if data_inicio:
-            try:
-                inicio_date = datetime.strptime(data_inicio, '%Y-%m-%d').date()
-            except ValueError:
-                flash('Data inicial inválida.', 'warning')
-                
-        if data_fim:
-            try:
-                fim_date = datetime.strptime(data_fim, '%Y-%m-%d').date()
-            except ValueError:
-                flash('Data final inválida.', 'warning')
-        
-        # Variáveis para os resultados
-        maintenance_history = None
-        refuelings = None
-        
-        # Dependendo do tipo de visualização, obtemos manutenções ou abastecimentos
-        if view_type != 'refueling':  # Padrão: manutenções
-            # Query para manutenções
-            query = VehicleMaintenance.query
-            
-            if vehicle_id:
-                query = query.filter(VehicleMaintenance.vehicle_id == vehicle_id)
-                
-            if inicio_date:
-                query = query.filter(VehicleMaintenance.date >= inicio_date)
-                
-            if fim_date:
-                query = query.filter(VehicleMaintenance.date <= fim_date)
-            
-            # Ordenação por data (coluna real, não propriedade)
-            query = query.order_by(VehicleMaintenance.date.desc())
-            
-            # Paginação
-            maintenance_history = query.paginate(page=page, per_page=per_page)
-            
-        else:  # 'refueling'
-            # Query para abastecimentos
-            query = Refueling.query
-            
-            if vehicle_id:
-                query = query.filter(Refueling.vehicle_id == vehicle_id)
-                
-            if inicio_date:
-                query = query.filter(Refueling.date >= inicio_date)
-                
-            if fim_date:
-                query = query.filter(Refueling.date <= fim_date)
-            
-            # Ordenação
-            query = query.order_by(Refueling.date.desc())
-            
-            # Paginação
-            refuelings = query.paginate(page=page, per_page=per_page)
-        
-        # Formatação das datas para o template
-        data_inicio_str = data_inicio
-        data_fim_str = data_fim
-        
-        if isinstance(inicio_date, date):
-            data_inicio_str = inicio_date.strftime('%Y-%m-%d')
-            
-        if isinstance(fim_date, date):
-            data_fim_str = fim_date.strftime('%Y-%m-%d')
-        
-        return render_template(
-            'fleet/maintenance_history.html',
-            maintenance_history=maintenance_history,
-            refuelings=refuelings,
-            vehicles=vehicles,
-            vehicle_id=vehicle_id,
-            data_inicio=data_inicio_str,
-            data_fim=data_fim_str,
-            view_type=view_type
-        )
+        
\ No newline at end of file
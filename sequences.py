@@ -0,0 +1,166 @@
+"""
+Numeric sequences (invoice numbers, etc.) for SAMAPE application.
+Values come from the sequence_counter table through a single atomic
+``UPDATE ... RETURNING``, run in its own short transaction: two workers
+can never read the same current_value, and the counter row is locked only
+for that statement instead of for the whole request that asked for a
+number. The counter row is created with INSERT ... ON CONFLICT DO NOTHING,
+so concurrent first uses do not collide either.
+
+Numbers are not returned to the sequence when the caller's transaction
+rolls back, so a failed request leaves a gap. On SQLite, which has a
+single writer, the UPDATE runs in the application session instead.
+
+Counters with many requests per second can use block allocation (hi/lo):
+each process reserves ``block_size`` numbers with one UPDATE and hands
+them out from memory. Numbers stay unique but are no longer in time order
+across processes, and the unused part of a block is lost on restart.
+"""
+import threading
+from datetime import datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+
+from database import db
+
+
+def _counter_table():
+    from models import SequenceCounter
+    return SequenceCounter.__table__
+
+
+def _ensure_counter(connection, name, prefix, padding, description):
+    table = _counter_table()
+    values = {
+        'name': name,
+        'prefix': prefix,
+        'current_value': 0,
+        'padding': padding,
+        'description': description,
+        'created_at': datetime.utcnow(),
+        'updated_at': datetime.utcnow(),
+    }
+    dialect = connection.dialect.name
+    if dialect in ('postgresql', 'sqlite'):
+        dialect_insert = postgresql.insert if dialect == 'postgresql' else sqlite.insert
+        connection.execute(dialect_insert(table).values(**values).on_conflict_do_nothing(index_elements=['name']))
+    else:
+        try:
+            with connection.begin_nested():
+                connection.execute(insert(table).values(**values))
+        except IntegrityError:
+            pass
+
+
+def _in_session(engine):
+    # SQLite tem um único escritor: uma segunda conexão esperaria pelo lock de
+    # escrita da própria sessão. Lá o UPDATE roda na transação da sessão.
+    return engine is None and db.engine.dialect.name == 'sqlite'
+
+
+def reserve_values(name, count=1, prefix=None, padding=6, description=None, engine=None):
+    """
+    Atomically advance a counter and return the reserved range.
+
+    Args:
+        name: Counter name (created on first use)
+        count: How many consecutive values to reserve
+        prefix: Prefix stored when the counter is created
+        padding: Zero padding stored when the counter is created
+        description: Description stored when the counter is created
+        engine: Engine to use in its own transaction (defaults to the
+            application engine; on SQLite the application session is used)
+
+    Returns:
+        Tuple (first value, last value, prefix, padding) of the reserved range
+    """
+    table = _counter_table()
+    statement = (
+        update(table)
+        .where(table.c.name == name)
+        .values(current_value=table.c.current_value + count, updated_at=datetime.utcnow())
+        .returning(table.c.current_value, table.c.prefix, table.c.padding)
+    )
+
+    def reserve(connection):
+        row = connection.execute(statement).first()
+        if row is None:
+            _ensure_counter(connection, name, prefix, padding, description)
+            row = connection.execute(statement).first()
+        return row
+
+    if _in_session(engine):
+        row = reserve(db.session.connection())
+    else:
+        with (engine or db.engine).begin() as connection:
+            row = reserve(connection)
+    last, counter_prefix, counter_padding = row
+    return last - count + 1, last, counter_prefix, counter_padding
+
+
+def format_value(value, prefix=None, padding=6):
+    """Format a sequence value with zero padding and prefix (e.g. NF00000042)."""
+    formatted_number = str(value).zfill(padding or 0)
+    return f"{prefix}{formatted_number}" if prefix else formatted_number
+
+
+class Sequence:
+    """
+    Named sequence handing out formatted values.
+
+    With block_size > 1 values are reserved in blocks (hi/lo) and served from
+    memory; the instance is thread-safe and meant to be shared per process.
+    """
+
+    def __init__(self, name, prefix=None, padding=6, description=None, block_size=1, engine=None):
+        self.name = name
+        self.prefix = prefix
+        self.padding = padding
+        self.description = description
+        self.block_size = max(1, block_size)
+        self.engine = engine
+        self._next = 0
+        self._last = -1
+        self._format = (prefix, padding)
+        self._lock = threading.Lock()
+
+    def _allocate(self):
+        if self.block_size == 1 or _in_session(self.engine):
+            # Sem bloco (na sessão do SQLite um rollback devolveria o bloco reservado)
+            value, _, prefix, padding = reserve_values(
+                self.name, 1, self.prefix, self.padding, self.description, self.engine
+            )
+            return value, prefix, padding
+        with self._lock:
+            if self._next > self._last:
+                self._next, self._last, prefix, padding = reserve_values(
+                    self.name, self.block_size, self.prefix, self.padding, self.description, self.engine
+                )
+                # Prefixo e tamanho gravados no banco prevalecem sobre os padrões
+                self._format = (prefix, padding)
+            value = self._next
+            self._next += 1
+            return (value, *self._format)
+
+    def next_int(self):
+        """Return the next numeric value."""
+        return self._allocate()[0]
+
+    def next_value(self):
+        """Return the next value formatted with the counter prefix and padding."""
+        return format_value(*self._allocate())
+
+
+_sequences = {}
+_sequences_lock = threading.Lock()
+
+
+def get_sequence(name, **options):
+    """Return the process-wide Sequence for name, creating it with options on first use."""
+    with _sequences_lock:
+        sequence = _sequences.get(name)
+        if sequence is None:
+            sequence = _sequences[name] = Sequence(name, **options)
+        return sequence
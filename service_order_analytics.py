@@ -0,0 +1,171 @@
+"""
+Service order completion analytics for SAMAPE application.
+Computes lead time statistics (created_at -> closed_at, in days) directly in
+SQL, optionally grouped by completion month and/or responsible technician,
+so the numbers no longer require loading every closed order into Python.
+"""
+from sqlalchemy import case, func, select
+
+from cache import cache, invalidate_on_write
+from database import db
+
+CACHE_PREFIX = 'so_analytics:'
+DEFAULT_TTL = 300
+
+GROUPINGS = {
+    None: (),
+    'month': ('month',),
+    'responsible': ('responsible_id',),
+    'month_responsible': ('month', 'responsible_id'),
+}
+
+
+def _lead_time_days(dialect):
+    from models import ServiceOrder
+
+    if dialect == 'postgresql':
+        return func.extract('epoch', ServiceOrder.closed_at - ServiceOrder.created_at) / 86400.0
+    return func.julianday(ServiceOrder.closed_at) - func.julianday(ServiceOrder.created_at)
+
+
+def _month(dialect):
+    from models import ServiceOrder
+
+    if dialect == 'postgresql':
+        return func.to_char(ServiceOrder.closed_at, 'YYYY-MM')
+    return func.strftime('%Y-%m', ServiceOrder.closed_at)
+
+
+def _base_query(dialect, date_from=None, date_to=None, responsible_id=None):
+    """Closed orders with their lead time and grouping keys."""
+    from models import ServiceOrder, ServiceOrderStatus
+
+    query = select(
+        _month(dialect).label('month'),
+        ServiceOrder.responsible_id.label('responsible_id'),
+        _lead_time_days(dialect).label('lead_time'),
+    ).where(
+        ServiceOrder.status == ServiceOrderStatus.fechada,
+        ServiceOrder.created_at.isnot(None),
+        ServiceOrder.closed_at.isnot(None)
+    )
+    if date_from:
+        query = query.where(ServiceOrder.closed_at >= date_from)
+    if date_to:
+        query = query.where(ServiceOrder.closed_at < date_to)
+    if responsible_id:
+        query = query.where(ServiceOrder.responsible_id == responsible_id)
+    return query.subquery()
+
+
+def _stats_postgresql(base, keys):
+    columns = [base.c[key] for key in keys]
+    return select(
+        *columns,
+        func.count().label('count'),
+        func.avg(base.c.lead_time).label('avg_days'),
+        func.percentile_cont(0.5).within_group(base.c.lead_time).label('p50_days'),
+        func.percentile_cont(0.9).within_group(base.c.lead_time).label('p90_days'),
+        func.max(base.c.lead_time).label('max_days'),
+    ).group_by(*columns).order_by(*columns)
+
+
+def _stats_window(base, keys):
+    """Nearest-rank percentiles with window functions (SQLite and others)."""
+    partition = [base.c[key] for key in keys]
+    ranked = select(
+        *partition,
+        base.c.lead_time,
+        func.row_number().over(partition_by=partition or None, order_by=base.c.lead_time).label('rn'),
+        func.count().over(partition_by=partition or None).label('n'),
+    ).subquery()
+
+    def percentile(p, label):
+        # Menor valor cuja posição no grupo cobre a fração p
+        return func.min(case((ranked.c.rn >= ranked.c.n * p, ranked.c.lead_time))).label(label)
+
+    columns = [ranked.c[key] for key in keys]
+    return select(
+        *columns,
+        func.count().label('count'),
+        func.avg(ranked.c.lead_time).label('avg_days'),
+        percentile(0.5, 'p50_days'),
+        percentile(0.9, 'p90_days'),
+        func.max(ranked.c.lead_time).label('max_days'),
+    ).select_from(ranked).group_by(*columns).order_by(*columns)
+
+
+def _round(value):
+    return round(float(value), 1) if value is not None else 0
+
+
+def get_completion_stats(group_by=None, date_from=None, date_to=None, responsible_id=None, use_cache=True):
+    """
+    Get avg/p50/p90/max lead time of closed service orders.
+
+    Args:
+        group_by: None, 'month', 'responsible' or 'month_responsible'
+        date_from: Only orders closed on or after this datetime
+        date_to: Only orders closed before this datetime
+        responsible_id: Restrict to one technician
+        use_cache: Reuse a cached result (invalidated when service orders change)
+
+    Returns:
+        List of dictionaries with the grouping keys plus count, avg_days,
+        p50_days, p90_days and max_days (a single row when group_by is None)
+    """
+    if group_by not in GROUPINGS:
+        raise ValueError(f"Agrupamento inválido: {group_by}")
+
+    key = f"{CACHE_PREFIX}{group_by}:{date_from}:{date_to}:{responsible_id}"
+    if use_cache:
+        cached = cache.get(key)
+        if cached is not None:
+            return cached
+
+    keys = GROUPINGS[group_by]
+    dialect = db.engine.dialect.name
+    base = _base_query(dialect, date_from, date_to, responsible_id)
+    query = _stats_postgresql(base, keys) if dialect == 'postgresql' else _stats_window(base, keys)
+
+    stats = []
+    for row in db.session.execute(query).mappings():
+        item = {key_name: row[key_name] for key_name in keys}
+        item.update({
+            'count': row['count'],
+            'avg_days': _round(row['avg_days']),
+            'p50_days': _round(row['p50_days']),
+            'p90_days': _round(row['p90_days']),
+            'max_days': _round(row['max_days']),
+        })
+        stats.append(item)
+
+    if group_by is None and not stats:
+        stats = [{'count': 0, 'avg_days': 0, 'p50_days': 0, 'p90_days': 0, 'max_days': 0}]
+
+    if use_cache:
+        cache.set(key, stats, ttl=DEFAULT_TTL)
+    return stats
+
+
+def get_technician_performance(date_from=None, date_to=None):
+    """
+    Completion statistics per technician, with the technician name.
+
+    Returns:
+        List of dictionaries (see get_completion_stats) with 'responsible_id'
+        and 'name', slowest p90 first
+    """
+    from models import User
+
+    stats = get_completion_stats('responsible', date_from=date_from, date_to=date_to)
+    names = dict(db.session.query(User.id, User.name).filter(
+        User.id.in_([row['responsible_id'] for row in stats if row['responsible_id']])
+    ).all()) if stats else {}
+
+    rows = [dict(row, name=names.get(row['responsible_id'], 'Sem responsável')) for row in stats]
+    rows.sort(key=lambda row: row['p90_days'], reverse=True)
+    return rows
+
+
+invalidate_on_write(CACHE_PREFIX, 'ServiceOrder')
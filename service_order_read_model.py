@@ -0,0 +1,191 @@
+"""
+Service order read model for SAMAPE application.
+Loads one service order with its client, responsible, equipment, financial
+entries, images and stock movements in a fixed number of queries and keeps
+the result in the shared cache, keyed by order id. Committed writes to the
+order or to any of the rows it shows drop that order's entry; writes to
+clients, users, equipment or stock items (shared by many orders) drop every
+cached order. Other gunicorn workers drop their copy when the invalidation
+reaches them over the live events bus (Postgres backend only); otherwise
+they serve it until SERVICE_ORDER_CACHE_TTL expires.
+
+Every detail view (page, modal, JSON) reads from here.
+"""
+import logging
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session, joinedload, selectinload, undefer
+
+from cache import cache, drop, invalidate_on_write
+
+logger = logging.getLogger(__name__)
+
+CACHE_PREFIX = 'service_order:'
+DEFAULT_TTL = 300
+
+STATUS_LABELS = {
+    'aberta': 'Em Aberto',
+    'em_andamento': 'Em Andamento',
+    'fechada': 'Concluída',
+    'cancelada': 'Cancelada'
+}
+
+# Modelos filhos: a OS afetada é a do service_order_id (atual e anterior)
+_CHILD_MODELS = ('FinancialEntry', 'ServiceOrderImage', 'StockMovement')
+# Modelos exibidos por várias OS: qualquer escrita descarta todas
+_SHARED_MODELS = ('Client', 'User', 'Equipment', 'StockItem')
+
+_SESSION_KEY = 'service_order_read_model_ids'
+_settings = {'ttl': DEFAULT_TTL}
+
+
+class ServiceOrderReadModel:
+    """Session-independent snapshot of one service order for the detail views."""
+
+    def __init__(self, order):
+        self.id = order.id
+        self.description = order.description
+        self.status = order.status
+        self.created_at = order.created_at
+        self.updated_at = order.updated_at
+        self.closed_at = order.closed_at
+        self.estimated_value = order.estimated_value
+        self.invoice_number = order.invoice_number
+        self.invoice_date = order.invoice_date
+        self.invoice_amount = order.invoice_amount
+        self.service_details = order.service_details
+        self.discount_amount = order.discount_amount
+        self.original_amount = order.original_amount
+        # Não há coluna total_value na OS: o valor cobrado é o da nota
+        self.total_value = order.invoice_amount
+
+        client = order.client
+        self.client = {
+            'id': client.id,
+            'name': client.name,
+            'document': client.document,
+            'email': client.email,
+            'phone': client.phone,
+            'address': client.address,
+        } if client else None
+        self.responsible = {'id': order.responsible.id, 'name': order.responsible.name} if order.responsible else None
+
+        self.equipment = [{
+            'id': equipment.id,
+            'type': equipment.type,
+            'brand': equipment.brand,
+            'model': equipment.model,
+            'serial_number': equipment.serial_number,
+        } for equipment in order.equipment]
+        self.financial_entries = [{
+            'id': entry.id,
+            'date': entry.date,
+            'description': entry.description,
+            'amount': entry.amount,
+            'type': entry.type,
+            'entry_type': entry.entry_type,
+        } for entry in sorted(order.financial_entries, key=lambda e: (e.date is not None, e.date), reverse=True)]
+        self.images = [{
+            'id': image.id,
+            'filename': image.filename,
+            'description': image.description,
+            'upload_date': image.upload_date,
+        } for image in order.images]
+        self.stock_movements = [{
+            'id': movement.id,
+            'quantity': movement.quantity,
+            'description': movement.description,
+            'reference': movement.reference,
+            'created_at': movement.created_at,
+            'stock_item': {'id': movement.stock_item.id, 'name': movement.stock_item.name},
+        } for movement in sorted(order.stock_movements, key=lambda m: m.id)]
+
+    @property
+    def client_name(self):
+        return self.client['name'] if self.client else "Cliente não especificado"
+
+    @property
+    def responsible_name(self):
+        return self.responsible['name'] if self.responsible else None
+
+    @property
+    def status_label(self):
+        return STATUS_LABELS.get(self.status.name, 'Desconhecido') if self.status else 'Desconhecido'
+
+
+def _load(order_id):
+    from models import ServiceOrder, StockMovement
+
+    return ServiceOrder.query.options(
+        undefer(ServiceOrder.discount_amount),
+        undefer(ServiceOrder.original_amount),
+        joinedload(ServiceOrder.client),
+        joinedload(ServiceOrder.responsible),
+        selectinload(ServiceOrder.equipment),
+        selectinload(ServiceOrder.financial_entries),
+        selectinload(ServiceOrder.images),
+        selectinload(ServiceOrder.stock_movements).joinedload(StockMovement.stock_item),
+    ).filter(ServiceOrder.id == order_id).one_or_none()
+
+
+def get_service_order_read_model(order_id):
+    """
+    Get the read model of a service order, loading it on a cache miss.
+
+    Args:
+        order_id: Service order id
+
+    Returns:
+        ServiceOrderReadModel, or None if the order does not exist
+    """
+    key = f'{CACHE_PREFIX}{order_id}'
+    model = cache.get(key)
+    if model is None:
+        order = _load(order_id)
+        if order is None:
+            return None
+        model = ServiceOrderReadModel(order)
+        cache.set(key, model, ttl=_settings['ttl'])
+    return model
+
+
+def invalidate(*order_ids):
+    """Drop the cached read model of the given orders (every order if none given)."""
+    if order_ids:
+        drop(keys=(f'{CACHE_PREFIX}{order_id}' for order_id in order_ids))
+    else:
+        drop(prefixes=[CACHE_PREFIX])
+
+
+def _collect_order_ids(session, flush_context):
+    from models import ServiceOrder
+
+    order_ids = session.info.setdefault(_SESSION_KEY, set())
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        name = type(obj).__name__
+        if isinstance(obj, ServiceOrder):
+            order_ids.add(obj.id)
+        elif name in _CHILD_MODELS:
+            history = inspect(obj).attrs.service_order_id.history
+            order_ids.update(value for value in (*history.added, *history.unchanged, *history.deleted) if value)
+
+
+def _invalidate_after_commit(session):
+    order_ids = session.info.pop(_SESSION_KEY, None)
+    if order_ids:
+        invalidate(*order_ids)
+        logger.debug("Read model das OS invalidado: %s", sorted(order_ids))
+
+
+def _discard_after_rollback(session):
+    session.info.pop(_SESSION_KEY, None)
+
+
+def init_service_order_read_model(app):
+    """Configure the cache TTL and the write-driven invalidation of cached orders."""
+    _settings['ttl'] = app.config.get('SERVICE_ORDER_CACHE_TTL', DEFAULT_TTL)
+    invalidate_on_write(CACHE_PREFIX, *_SHARED_MODELS)
+    if not event.contains(Session, 'after_flush', _collect_order_ids):
+        event.listen(Session, 'after_flush', _collect_order_ids)
+        event.listen(Session, 'after_commit', _invalidate_after_commit)
+        event.listen(Session, 'after_rollback', _discard_after_rollback)
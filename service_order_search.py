@@ -0,0 +1,329 @@
+"""
+Full-text search over service orders for SAMAPE application.
+Searches ServiceOrder.description and service_details with a ranked,
+paginated result list and highlighted snippets.
+
+Backends:
+    postgresql - search_vector tsvector column kept up to date by a trigger,
+                 GIN index, Portuguese stemming with unaccent
+    sqlite     - FTS5 external-content table (service_order_fts) kept in
+                 sync by triggers, diacritics removed, prefix matching
+    others     - ILIKE fallback (no ranking)
+
+install_search() creates the database objects; it is called by bootstrap.
+"""
+import logging
+import math
+import re
+import unicodedata
+
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from sqlalchemy.orm import joinedload
+
+from database import db
+
+logger = logging.getLogger(__name__)
+
+TS_CONFIG = 'samape_pt'
+FTS_TABLE = 'service_order_fts'
+
+# Acima deste número de resultados a lista sai por data (OS mais recentes) em vez de
+# relevância: ordenar dezenas de milhares de linhas pelo rank custa mais do que ajuda
+RANKED_MATCH_LIMIT = 5000
+
+# Marcadores de destaque; o texto é escapado antes de virarem <mark>
+_HIGHLIGHT_START = '\x02'
+_HIGHLIGHT_STOP = '\x03'
+
+_POSTGRES_VECTOR = (
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}description, '')), 'A') || "
+    f"setweight(to_tsvector('{TS_CONFIG}', coalesce({{row}}service_details, '')), 'B')"
+)
+
+
+class SearchHit:
+    """A matching service order with its rank and highlighted snippet."""
+
+    def __init__(self, order, rank, snippet):
+        self.order = order
+        self.rank = rank
+        self.snippet = snippet
+
+
+class SearchResults:
+    """One page of search hits."""
+
+    def __init__(self, items, total, page, per_page):
+        self.items = items
+        self.total = total
+        self.page = page
+        self.per_page = per_page
+
+    @property
+    def pages(self):
+        return max(1, math.ceil(self.total / self.per_page))
+
+    @property
+    def has_prev(self):
+        return self.page > 1
+
+    @property
+    def has_next(self):
+        return self.page < self.pages
+
+
+def _install_postgresql(connection):
+    has_unaccent = True
+    try:
+        with connection.begin_nested():
+            connection.execute(text("CREATE EXTENSION IF NOT EXISTS unaccent"))
+    except Exception as e:
+        has_unaccent = False
+        logger.warning(f"Extensão unaccent indisponível, busca sensível a acentos: {e}")
+
+    exists = connection.execute(text("SELECT 1 FROM pg_ts_config WHERE cfgname = :name"), {'name': TS_CONFIG}).first()
+    if not exists:
+        connection.execute(text(f"CREATE TEXT SEARCH CONFIGURATION {TS_CONFIG} (COPY = portuguese)"))
+        if has_unaccent:
+            connection.execute(text(
+                f"ALTER TEXT SEARCH CONFIGURATION {TS_CONFIG} "
+                "ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem"
+            ))
+
+    connection.execute(text("ALTER TABLE service_order ADD COLUMN IF NOT EXISTS search_vector tsvector"))
+    connection.execute(text(f"""
+        CREATE OR REPLACE FUNCTION service_order_search_vector_update() RETURNS trigger AS $$
+        BEGIN
+            NEW.search_vector := {_POSTGRES_VECTOR.format(row='NEW.')};
+            RETURN NEW;
+        END
+        $$ LANGUAGE plpgsql
+    """))
+    connection.execute(text("DROP TRIGGER IF EXISTS service_order_search_vector_trigger ON service_order"))
+    connection.execute(text(
+        "CREATE TRIGGER service_order_search_vector_trigger "
+        "BEFORE INSERT OR UPDATE OF description, service_details ON service_order "
+        "FOR EACH ROW EXECUTE FUNCTION service_order_search_vector_update()"
+    ))
+    connection.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_service_order_search_vector ON service_order USING gin (search_vector)"
+    ))
+    # Preenche as OS existentes (só as que ainda não têm vetor)
+    connection.execute(text(
+        f"UPDATE service_order SET search_vector = {_POSTGRES_VECTOR.format(row='')} WHERE search_vector IS NULL"
+    ))
+
+
+def _install_sqlite(connection):
+    exists = connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {'name': FTS_TABLE}
+    ).first()
+    connection.execute(text(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+        "description, service_details, content='service_order', content_rowid='id', "
+        "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+    ))
+    connection.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS service_order_fts_insert AFTER INSERT ON service_order BEGIN
+            INSERT INTO {FTS_TABLE}(rowid, description, service_details)
+            VALUES (new.id, new.description, new.service_details);
+        END
+    """))
+    connection.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS service_order_fts_delete AFTER DELETE ON service_order BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, service_details)
+            VALUES ('delete', old.id, old.description, old.service_details);
+        END
+    """))
+    connection.execute(text(f"""
+        CREATE TRIGGER IF NOT EXISTS service_order_fts_update
+        AFTER UPDATE OF description, service_details ON service_order BEGIN
+            INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, service_details)
+            VALUES ('delete', old.id, old.description, old.service_details);
+            INSERT INTO {FTS_TABLE}(rowid, description, service_details)
+            VALUES (new.id, new.description, new.service_details);
+        END
+    """))
+    if not exists:
+        connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+
+
+def install_search(connection):
+    """Create (idempotently) the search column/table, triggers and indexes."""
+    dialect = connection.dialect.name
+    if dialect == 'postgresql':
+        _install_postgresql(connection)
+    elif dialect == 'sqlite':
+        _install_sqlite(connection)
+
+
+def rebuild_search_index():
+    """Recompute the search data of every service order (e.g. after a bulk import)."""
+    dialect = db.engine.dialect.name
+    with db.engine.begin() as connection:
+        if dialect == 'postgresql':
+            connection.execute(text(f"UPDATE service_order SET search_vector = {_POSTGRES_VECTOR.format(row='')}"))
+        elif dialect == 'sqlite':
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"))
+            # Junta os segmentos criados pelas inserções linha a linha dos triggers
+            connection.execute(text(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')"))
+
+
+def _highlight(snippet):
+    if not snippet:
+        return Markup('')
+    return Markup(str(escape(snippet)).replace(_HIGHLIGHT_START, '<mark>').replace(_HIGHLIGHT_STOP, '</mark>'))
+
+
+def _fold(value):
+    # Minúsculas e sem acentos, como o tokenizer unicode61 remove_diacritics
+    return ''.join(c for c in unicodedata.normalize('NFKD', value.lower()) if not unicodedata.combining(c))
+
+
+def _build_snippet(order, query_text, size=24):
+    """Excerpt of the order text around the first word starting with a search term."""
+    terms = tuple(_fold(term) for term in re.findall(r'\w+', query_text))
+    for value in (order.description, order.service_details):
+        words = list(re.finditer(r'\w+', value or ''))
+        hits = {i for i, word in enumerate(words) if _fold(word.group()).startswith(terms)}
+        if not hits:
+            continue
+        first = max(0, min(min(hits) - size // 4, len(words) - size))
+        last = min(len(words), first + size) - 1
+        pieces, position = [], words[first].start()
+        for i in range(first, last + 1):
+            word = words[i]
+            pieces.append(value[position:word.start()])
+            pieces.append(f"{_HIGHLIGHT_START}{word.group()}{_HIGHLIGHT_STOP}" if i in hits else word.group())
+            position = word.end()
+        prefix = '…' if first > 0 else ''
+        suffix = '…' if last < len(words) - 1 else value[position:]
+        return f"{prefix}{''.join(pieces)}{suffix}"
+    return ' '.join((order.description or '').split()[:size])
+
+
+def _fts5_query(query_text):
+    # Termos exatos e prefixo só no último ("bomba" "hidraul"*): termo com prefixo
+    # carrega a lista inteira de documentos na memória e não pula linhas no AND
+    terms = [f'"{term}"' for term in re.findall(r'\w+', query_text)]
+    if terms:
+        terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def _status_clause(status, column='status'):
+    return f" AND {column} = :status" if status else ""
+
+
+def _search_postgresql(query_text, limit, offset, status):
+    params = {'q': query_text, 'limit': limit, 'offset': offset, 'status': status.name if status else None}
+    match = f"search_vector @@ websearch_to_tsquery('{TS_CONFIG}', :q)" + _status_clause(status)
+    total = db.session.execute(text(f"SELECT count(*) FROM service_order WHERE {match}"), params).scalar()
+    if total > RANKED_MATCH_LIMIT:
+        order_by = "id DESC"
+    else:
+        order_by = f"ts_rank_cd(search_vector, websearch_to_tsquery('{TS_CONFIG}', :q)) DESC, id DESC"
+    ranked = db.session.execute(text(f"""
+        SELECT id, ts_rank_cd(search_vector, websearch_to_tsquery('{TS_CONFIG}', :q))
+        FROM service_order
+        WHERE {match}
+        ORDER BY {order_by}
+        LIMIT :limit OFFSET :offset
+    """), params).all()
+    if not ranked:
+        return total, []
+
+    # ts_headline relê o texto de cada OS: só para as linhas da página
+    headlines = dict(db.session.execute(text(f"""
+        SELECT id, ts_headline('{TS_CONFIG}',
+                               coalesce(description, '') || ' ' || coalesce(service_details, ''),
+                               websearch_to_tsquery('{TS_CONFIG}', :q),
+                               'StartSel=' || chr(2) || ', StopSel=' || chr(3) || ', MaxWords=35, MinWords=15, MaxFragments=2')
+        FROM service_order
+        WHERE id = ANY(:ids)
+    """), {'q': query_text, 'ids': [row[0] for row in ranked]}).all())
+    return total, [(row_id, rank, headlines.get(row_id)) for row_id, rank in ranked]
+
+
+def _search_sqlite(query_text, limit, offset, status):
+    match_query = _fts5_query(query_text)
+    if not match_query:
+        return 0, []
+    params = {'q': match_query, 'limit': limit, 'offset': offset, 'status': status.name if status else None}
+    if status:
+        source = (f"{FTS_TABLE} JOIN service_order so ON so.id = {FTS_TABLE}.rowid "
+                  f"WHERE {FTS_TABLE} MATCH :q AND so.status = :status")
+    else:
+        source = f"{FTS_TABLE} WHERE {FTS_TABLE} MATCH :q"
+
+    total = db.session.execute(text(f"SELECT count(*) FROM {source}"), params).scalar()
+    if total > RANKED_MATCH_LIMIT:
+        order_by = "id DESC"
+    else:
+        # bm25: quanto menor, mais relevante; a descrição pesa o dobro dos detalhes
+        order_by = "rank, id DESC"
+    rows = db.session.execute(text(
+        f"SELECT {FTS_TABLE}.rowid AS id, bm25({FTS_TABLE}, 2.0, 1.0) AS rank FROM {source} "
+        f"ORDER BY {order_by} LIMIT :limit OFFSET :offset"
+    ), params).all()
+    # O trecho destacado é montado em Python: snippet() do FTS5 reavalia o MATCH inteiro
+    return total, [(row_id, -rank, None) for row_id, rank in rows]
+
+
+def _search_like(query_text, limit, offset, status):
+    from models import ServiceOrder
+
+    query = ServiceOrder.query
+    for term in re.findall(r'\w+', query_text):
+        pattern = f'%{term}%'
+        query = query.filter(ServiceOrder.description.ilike(pattern) | ServiceOrder.service_details.ilike(pattern))
+    if status:
+        query = query.filter(ServiceOrder.status == status)
+    total = query.count()
+    orders = query.order_by(ServiceOrder.id.desc()).limit(limit).offset(offset).all()
+    return total, [(order.id, 0, None) for order in orders]
+
+
+def search_service_orders(query_text, page=1, per_page=20, status=None):
+    """
+    Search service orders by description and service details.
+
+    Args:
+        query_text: Words to search (Postgres also accepts "phrases", OR and -word)
+        page: 1-based page number
+        per_page: Results per page
+        status: Optional ServiceOrderStatus filter
+
+    Returns:
+        SearchResults with SearchHit items, best match first
+    """
+    from models import ServiceOrder
+
+    query_text = (query_text or '').strip()
+    page = max(page, 1)
+    if not query_text:
+        return SearchResults([], 0, page, per_page)
+
+    backend = {
+        'postgresql': _search_postgresql,
+        'sqlite': _search_sqlite,
+    }.get(db.engine.dialect.name, _search_like)
+    total, rows = backend(query_text, per_page, (page - 1) * per_page, status)
+
+    orders = {
+        order.id: order for order in ServiceOrder.query.options(
+            joinedload(ServiceOrder.client), joinedload(ServiceOrder.responsible)
+        ).filter(ServiceOrder.id.in_([row[0] for row in rows])).all()
+    } if rows else {}
+    hits = [SearchHit(orders[row_id], rank, _highlight(snippet or _build_snippet(orders[row_id], query_text)))
+            for row_id, rank, snippet in rows if row_id in orders]
+    return SearchResults(hits, total, page, per_page)
+
+
+if __name__ == "__main__":
+    from app import app
+
+    with app.app_context():
+        rebuild_search_index()
+        print("Índice de busca das OS reconstruído.")
@@ -1,99 +1,66 @@
-document.addEventListener('DOMContentLoaded', function() {
-    // Initialize charts if they exist on the page
-    if (document.getElementById('serviceOrderChart')) {
-        initServiceOrderChart();
+/**
+ * Dashboard - atualização periódica das métricas
+ *
+ * Consulta /api/dashboard/metrics enviando o ETag da última versão recebida.
+ * Quando nada mudou o servidor responde 304 sem corpo e a página não é alterada.
+ */
+function startDashboardPolling(url, initialEtag, charts, interval) {
+    let etag = initialEtag || null;
+    interval = interval || 30000;
+
+    async function poll() {
+        // Não consultar enquanto a aba estiver em segundo plano
+        if (document.hidden) {
+            return;
+        }
+
+        const headers = { 'Accept': 'application/json' };
+        if (etag) {
+            headers['If-None-Match'] = etag;
+        }
+
+        const response = await fetch(url, { headers: headers, credentials: 'same-origin' });
+        if (response.status === 304 || !response.ok) {
+            return;
+        }
+
+        etag = response.headers.get('ETag');
+        applyDashboardMetrics(await response.json(), charts || {});
     }
-    
-    if (document.getElementById('financialChart')) {
-        initFinancialChart();
+
+    function refresh() {
+        poll().catch(function(error) {
+            console.warn('Falha ao atualizar métricas do dashboard:', error);
+        });
     }
-});
 
-function initServiceOrderChart() {
-    // Get data from HTML data attributes
-    const chartElement = document.getElementById('serviceOrderChart');
-    const open = parseInt(chartElement.getAttribute('data-open'));
-    const inProgress = parseInt(chartElement.getAttribute('data-in-progress'));
-    const closed = parseInt(chartElement.getAttribute('data-closed'));
-    
-    // Create chart
-    const ctx = chartElement.getContext('2d');
-    const serviceOrderChart = new Chart(ctx, {
-        type: 'doughnut',
-        data: {
-            labels: ['Abertas', 'Em Andamento', 'Fechadas'],
-            datasets: [{
-                data: [open, inProgress, closed],
-                backgroundColor: ['#ffc107', '#17a2b8', '#28a745'],
-                borderWidth: 1
-            }]
-        },
-        options: {
-            responsive: true,
-            maintainAspectRatio: false,
-            plugins: {
-                legend: {
-                    position: 'bottom'
-                },
-                tooltip: {
-                    callbacks: {
-                        label: function(context) {
-                            const label = context.label || '';
-                            const value = context.raw || 0;
-                            const total = context.dataset.data.reduce((acc, curr) => acc + curr, 0);
-                            const percentage = Math.round((value / total) * 100);
-                            return `${label}: ${value} (${percentage}%)`;
-                        }
-                    }
-                }
-            }
-        }
-    });
+    setInterval(refresh, interval);
+    return { refresh: refresh };
 }
 
-function initFinancialChart() {
-    // Get data from HTML data attributes
-    const chartElement = document.getElementById('financialChart');
-    const income = parseFloat(chartElement.getAttribute('data-income'));
-    const expenses = parseFloat(chartElement.getAttribute('data-expenses'));
-    
-    // Create chart
-    const ctx = chartElement.getContext('2d');
-    const financialChart = new Chart(ctx, {
-        type: 'bar',
-        data: {
-            labels: ['Receitas', 'Despesas', 'Saldo'],
-            datasets: [{
-                data: [income, expenses, income - expenses],
-                backgroundColor: ['#28a745', '#dc3545', '#007bff'],
-                borderWidth: 1
-            }]
-        },
-        options: {
-            responsive: true,
-            maintainAspectRatio: false,
-            plugins: {
-                legend: {
-                    display: false
-                },
-                tooltip: {
-                    callbacks: {
-                        label: function(context) {
-                            return 'R$ ' + context.raw.toFixed(2).replace('.', ',');
-                        }
-                    }
-                }
-            },
-            scales: {
-                y: {
-                    beginAtZero: true,
-                    ticks: {
-                        callback: function(value) {
-                            return 'R$ ' + value.toFixed(2).replace('.', ',');
-                        }
-                    }
-                }
-            }
+function applyDashboardMetrics(metrics, charts) {
+    // Indicadores numéricos marcados com data-metric
+    document.querySelectorAll('[data-metric]').forEach(function(element) {
+        const value = metrics[element.dataset.metric];
+        if (value === undefined) {
+            return;
         }
+        element.textContent = element.dataset.format === 'currency' ? Number(value).toFixed(2) : value;
     });
+
+    if (charts.orders) {
+        charts.orders.data.datasets[0].data = [
+            metrics.pending_orders,
+            metrics.in_progress_orders,
+            metrics.closed_orders
+        ];
+        charts.orders.update();
+    }
+
+    if (charts.financial) {
+        charts.financial.data.labels = metrics.month_labels;
+        charts.financial.data.datasets[0].data = metrics.income_data;
+        charts.financial.data.datasets[1].data = metrics.expense_data;
+        charts.financial.update();
+    }
 }
@@ -0,0 +1,45 @@
+/**
+ * Eventos em tempo real (Server-Sent Events)
+ *
+ * Abre uma conexão com /api/eventos e chama o handler correspondente a cada
+ * tipo de evento recebido (service_order, action_log, low_stock).
+ * O navegador reconecta sozinho quando o servidor encerra o stream; se o
+ * servidor recusar a conexão (limite de streams do worker), uma nova
+ * tentativa é feita depois de RETRY_REFUSED_MS.
+ */
+const RETRY_REFUSED_MS = 60000;
+
+function connectLiveEvents(url, handlers) {
+    if (!window.EventSource) {
+        return null;
+    }
+
+    let source = null;
+    let closing = false;
+
+    function open() {
+        source = new EventSource(url);
+        Object.keys(handlers).forEach(function(eventType) {
+            source.addEventListener(eventType, function(event) {
+                try {
+                    handlers[eventType](JSON.parse(event.data).data);
+                } catch (error) {
+                    console.warn('Evento inválido recebido:', error);
+                }
+            });
+        });
+        source.addEventListener('error', function() {
+            // CLOSED: resposta de erro (ex.: 503), o EventSource não reconecta sozinho
+            if (!closing && source.readyState === EventSource.CLOSED) {
+                setTimeout(open, RETRY_REFUSED_MS);
+            }
+        });
+    }
+
+    open();
+    window.addEventListener('beforeunload', function() {
+        closing = true;
+        source.close();
+    });
+    return source;
+}
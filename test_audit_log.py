@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""
+Teste da gravação em lotes do registro de ações (audit_log).
+
+Confere, sem banco de dados, que a thread grava os registros quando o lote
+enche, quando o intervalo passa, em flush() e ao parar (fim do processo).
+"""
+
+import threading
+import time
+
+import pytest
+from flask import Flask
+
+import audit_log
+
+
+@pytest.fixture
+def batches(monkeypatch):
+    written = []
+    monkeypatch.setattr(audit_log, 'write_records', lambda records: written.append([r['action'] for r in records]))
+    return written
+
+
+def _writer(**options):
+    writer = audit_log.AuditLogWriter(Flask(__name__), **options)
+    writer.start()
+    return writer
+
+
+def test_batch_size_trigger(batches):
+    writer = _writer(batch_size=3, flush_interval=60)
+    for action in 'abcd':
+        assert writer.submit({'action': action})
+    writer.stop()
+    assert batches == [['a', 'b', 'c'], ['d']]
+    assert not writer.is_alive()
+    assert not writer.submit({'action': 'e'})
+
+
+def test_flush_interval_trigger(batches):
+    writer = _writer(batch_size=100, flush_interval=0.05)
+    writer.submit({'action': 'a'})
+    deadline = time.monotonic() + 5
+    while not batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert batches == [['a']]
+    writer.stop()
+
+
+def test_flush_waits_for_queued_records(batches):
+    writer = _writer(batch_size=100, flush_interval=60)
+    writer.submit({'action': 'a'})
+    writer.submit({'action': 'b'})
+    writer.flush(timeout=5)
+    assert batches == [['a', 'b']]
+    writer.stop()
+
+
+def test_full_queue_is_refused(monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(audit_log, 'write_records', lambda records: release.wait(5))
+    writer = _writer(batch_size=1, flush_interval=60, queue_size=1)
+    # O primeiro registro prende a thread gravando; o segundo ocupa a fila
+    assert writer.submit({'action': 'a'})
+    deadline = time.monotonic() + 5
+    while writer._queue.qsize() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert writer.submit({'action': 'b'})
+    assert not writer.submit({'action': 'c'})
+    release.set()
+    writer.stop()
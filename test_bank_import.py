@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Teste da leitura de extratos bancários (bank_import).
+
+Confere a leitura dos valores e datas no formato dos bancos, o OFX lido em
+blocos (tags cortadas entre um bloco e outro) e o CSV com linhas do banco
+antes do cabeçalho, sem banco de dados.
+"""
+
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+import bank_import
+from bank_import import StatementError, StatementLine, line_hash, parse_amount, parse_date
+
+OFX = """OFXHEADER:100
+DATA:OFXSGML
+
+<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS>
+<BANKACCTFROM><BANKID>001<ACCTID>12345-6</BANKACCTFROM>
+<BANKTRANLIST>
+<STMTTRN><TRNTYPE>DEBIT<DTPOSTED>20240115120000[-3:BRT]<TRNAMT>-150,00<FITID>A1<NAME>Posto<MEMO>Diesel</STMTTRN>
+<STMTTRN><TRNTYPE>CREDIT<DTPOSTED>20240116<TRNAMT>1234.56<FITID>A2<MEMO>Recebimento OS 10</STMTTRN>
+</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>
+"""
+
+CSV = """Agência: 1234;Conta: 98765-4
+Data;Histórico;Documento;Valor (R$)
+15/01/2024;SALDO ANTERIOR;;1.000,00
+15/01/2024;Tarifa bancária;;-12,50
+16/01/2024;"Recebimento; OS 10";777;1.234,56
+"""
+
+
+def test_parse_amount():
+    assert parse_amount('1.234,56') == Decimal('1234.56')
+    assert parse_amount('-12,5') == Decimal('-12.50')
+    assert parse_amount('-1234.56') == Decimal('-1234.56')
+    assert parse_amount('R$ 10,00') == Decimal('10.00')
+    with pytest.raises(StatementError):
+        parse_amount('')
+
+
+def test_parse_date():
+    assert parse_date('20240115120000[-3:BRT]') == date(2024, 1, 15)
+    assert parse_date('15/01/2024') == date(2024, 1, 15)
+    assert parse_date('15/01/24') == date(2024, 1, 15)
+    assert parse_date('2024-01-15') == date(2024, 1, 15)
+    with pytest.raises(StatementError):
+        parse_date('31/02/2024')
+
+
+@pytest.mark.parametrize('chunk_size', [5, 64, 64 * 1024])
+def test_parse_ofx_in_chunks(monkeypatch, chunk_size):
+    monkeypatch.setattr(bank_import, 'CHUNK_SIZE', chunk_size)
+    assert list(bank_import.parse_ofx(io.StringIO(OFX))) == [
+        (1, '20240115120000[-3:BRT]', '-150,00', 'Posto - Diesel', 'ofx:12345-6:A1'),
+        (2, '20240116', '1234.56', 'Recebimento OS 10', 'ofx:12345-6:A2'),
+    ]
+
+
+def test_read_csv_statement():
+    summary = {'ignored': 0, 'error_count': 0, 'errors': []}
+    lines = list(bank_import.read_statement(io.StringIO(CSV), 'csv', summary))
+    assert lines == [
+        StatementLine(4, date(2024, 1, 15), Decimal('-12.50'), 'Tarifa bancária', None),
+        StatementLine(5, date(2024, 1, 16), Decimal('1234.56'), 'Recebimento; OS 10', 'doc:777'),
+    ]
+    assert summary['ignored'] == 1
+
+
+def test_csv_without_header():
+    with pytest.raises(StatementError):
+        list(bank_import.parse_csv(io.StringIO('a;b\n1;2\n')))
+
+
+def test_line_hash():
+    line = StatementLine(1, date(2024, 1, 15), Decimal('-5.00'), 'Café', None)
+    assert line_hash(line) == line_hash(line._replace(line=7))
+    assert line_hash(line) != line_hash(line, 1)
+    assert len(line_hash(line)) == 64
@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Teste da invalidação do cache entre processos (cache + live_events).
+
+Simula dois workers com dois barramentos ligados entre si, como o NOTIFY do
+Postgres faz, e confere que a chave descartada por um sai do cache do outro
+sem chegar às conexões SSE. Confere também o limite de streams por processo.
+"""
+
+import pytest
+
+import cache
+from live_events import EventBus
+
+
+class _Echo:
+    """Backend que entrega a mensagem em todos os barramentos, como o NOTIFY."""
+
+    def __init__(self, buses):
+        self.buses = buses
+
+    def start(self):
+        pass
+
+    def publish(self, message):
+        for bus in self.buses:
+            bus._dispatch(message)
+
+
+@pytest.fixture
+def other_worker(monkeypatch):
+    here, other = EventBus(), EventBus()
+    other_cache = cache.MemoryCache()
+    here.configure(_Echo([here, other]))
+    monkeypatch.setitem(cache._broadcast, 'publish', lambda data: here.publish('cache_invalidate', data))
+    here.on('cache_invalidate', cache.apply_invalidation)
+    other.on('cache_invalidate', lambda data: _apply(other_cache, data))
+    yield other, other_cache
+    cache.cache.clear()
+
+
+def _apply(memory_cache, data):
+    memory_cache.delete(*data.get('keys', ()))
+    for prefix in data.get('prefixes', ()):
+        memory_cache.delete_prefix(prefix)
+
+
+def test_drop_reaches_other_worker(other_worker):
+    other, other_cache = other_worker
+    subscription = other.subscribe()
+    for memory_cache in (cache.cache, other_cache):
+        memory_cache.set('service_order:1', 'a')
+        memory_cache.set('service_order:10', 'b')
+        memory_cache.set('dashboard:api', 'c')
+
+    cache.drop(keys=['service_order:1'], prefixes=['dashboard:'])
+
+    for memory_cache in (cache.cache, other_cache):
+        assert memory_cache.get('service_order:1') is None
+        assert memory_cache.get('service_order:10') == 'b'
+        assert memory_cache.get('dashboard:api') is None
+    assert subscription.empty()
+
+
+def test_apply_invalidation_all():
+    cache.cache.set('service_order:1', 'a')
+    cache.apply_invalidation({'all': True})
+    assert cache.cache.get('service_order:1') is None
+
+
+def test_subscriber_limit():
+    bus = EventBus()
+    first = bus.subscribe(limit=1)
+    assert first is not None
+    assert bus.subscribe(limit=1) is None
+    bus.unsubscribe(first)
+    assert bus.subscribe(limit=1) is not None
@@ -0,0 +1,52 @@
+#!/usr/bin/env python3
+"""
+Teste dos filtros por período do financeiro.
+
+Confere os intervalos gerados por period_bounds e, com EXPLAIN QUERY PLAN
+num SQLite em memória, que os filtros por mês/ano usam os índices de
+financial_entry em vez de percorrer a tabela inteira.
+"""
+
+from datetime import datetime
+
+import pytest
+from sqlalchemy import create_engine, func, select
+
+from models import FinancialEntry, FinancialEntryType
+from performance_utils import period_bounds, period_filter
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine('sqlite://')
+    FinancialEntry.__table__.create(engine)
+    yield engine
+    engine.dispose()
+
+
+def _query_plan(engine, statement):
+    compiled = statement.compile(engine, compile_kwargs={'literal_binds': True})
+    with engine.connect() as connection:
+        rows = connection.exec_driver_sql(f'EXPLAIN QUERY PLAN {compiled}').all()
+    return ' | '.join(row[-1] for row in rows)
+
+
+def test_period_bounds():
+    assert period_bounds(2024, 3) == (datetime(2024, 3, 1), datetime(2024, 4, 1))
+    assert period_bounds(2024, 12) == (datetime(2024, 12, 1), datetime(2025, 1, 1))
+    assert period_bounds(2024, quarter=4) == (datetime(2024, 10, 1), datetime(2025, 1, 1))
+    assert period_bounds(2024, quarter=2) == (datetime(2024, 4, 1), datetime(2024, 7, 1))
+    assert period_bounds(2024) == (datetime(2024, 1, 1), datetime(2025, 1, 1))
+
+
+def test_month_filter_uses_date_index(engine):
+    statement = select(FinancialEntry.id).where(period_filter(FinancialEntry.date, 2024, 3))
+    assert 'ix_financial_entry_date' in _query_plan(engine, statement)
+
+
+def test_type_and_month_filter_uses_type_date_index(engine):
+    statement = select(func.sum(FinancialEntry.amount)).where(
+        FinancialEntry.type == FinancialEntryType.entrada,
+        period_filter(FinancialEntry.date, 2024, 3)
+    )
+    assert 'ix_financial_entry_type_date' in _query_plan(engine, statement)
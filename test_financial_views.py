@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Teste dos parâmetros de período das telas do financeiro.
+
+Mês ou ano fora do intervalo na URL (?month=13, ?year=0) não podem derrubar
+a página: ela volta para o período padrão.
+"""
+
+import os
+
+import pytest
+
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+
+@pytest.fixture
+def admin_client():
+    from app import app
+
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': 'admin', 'password': os.environ.get('ADMIN_DEFAULT_PASSWORD', 'admin123')})
+    return test_client
+
+
+@pytest.mark.parametrize('query', ['month=13', 'month=0', 'year=0', 'year=9999&month=12', 'month=2&year=2024'])
+def test_financial_invalid_period(admin_client, query):
+    response = admin_client.get(f'/financeiro?{query}')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('query', ['year=0', 'year=10000', 'month=13&year=-5'])
+def test_cash_flow_invalid_year(admin_client, query):
+    response = admin_client.get(f'/financeiro/fluxo-de-caixa?{query}')
+    assert response.status_code == 200
+
+
+@pytest.mark.parametrize('query', ['year=0', 'year=9999', 'year=2024'])
+def test_income_statement_year(admin_client, query):
+    response = admin_client.get(f'/financeiro/dre?{query}')
+    assert response.status_code == 200
+
+
+def test_export_invalid_year(admin_client):
+    response = admin_client.get('/financeiro/exportar?month=1&year=0')
+    assert response.status_code == 302
+    assert response.location.endswith('/financeiro')
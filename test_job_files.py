@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Teste dos arquivos das tarefas guardados no banco (jobs.store_file e afins).
+
+Simula outra instância apagando o disco local: o extrato enviado e o
+resultado de uma tarefa continuam disponíveis a partir da tabela job_file.
+"""
+
+import os
+import shutil
+
+import pytest
+
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+import jobs
+
+
+@jobs.job_handler('test_result_file')
+def _write_result(context, text):
+    with open(context.result_path('relatório março.txt', 'text/plain'), 'w', encoding='utf-8') as output:
+        output.write(text)
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    from app import app
+
+    monkeypatch.setitem(jobs._settings, 'results_dir', str(tmp_path))
+    monkeypatch.setattr(jobs, 'FILE_CHUNK_SIZE', 4)
+    with app.app_context():
+        yield app
+
+
+def test_upload_survives_local_disk_loss(app):
+    path = jobs.upload_path('extrato.csv')
+    with open(path, 'w', encoding='utf-8') as upload:
+        upload.write('Data;Histórico;Valor\n')
+    jobs.share_upload('extrato.csv')
+    os.remove(path)
+
+    assert jobs.upload_exists('extrato.csv')
+    with open(jobs.fetch_upload('extrato.csv'), encoding='utf-8') as upload:
+        assert upload.read() == 'Data;Histórico;Valor\n'
+
+    jobs.delete_upload('extrato.csv')
+    assert not jobs.upload_exists('extrato.csv')
+    assert jobs.fetch_upload('extrato.csv') is None
+
+
+def test_empty_file_is_stored(app, tmp_path):
+    path = tmp_path / 'vazio.txt'
+    path.write_bytes(b'')
+    jobs.store_file('1/vazio.txt', str(path))
+    assert jobs.file_exists('1/vazio.txt')
+    assert list(jobs.iter_file('1/vazio.txt')) == [b'']
+    jobs.delete_file('1/vazio.txt')
+
+
+def test_result_downloaded_from_database(app):
+    from database import db
+    from models import Job
+
+    job = jobs.enqueue('test_result_file', {'text': 'resultado da tarefa'})
+    job_id = job.id
+    assert jobs.claim_job('teste:1') == job_id
+    jobs.run_job(job_id)
+
+    # O worker não deixa o resultado no disco: outra instância faz o download
+    assert not os.path.exists(os.path.join(jobs._settings['results_dir'], str(job_id)))
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': 'admin', 'password': os.environ.get('ADMIN_DEFAULT_PASSWORD', 'admin123')})
+    response = test_client.get(f'/tarefas/{job_id}/download')
+    assert response.status_code == 200
+    assert response.get_data() == 'resultado da tarefa'.encode('utf-8')
+    assert "filename*=UTF-8''relat%C3%B3rio%20mar%C3%A7o.txt" in response.headers['Content-Disposition']
+
+    db.session.delete(db.session.get(Job, job_id))
+    db.session.commit()
+    jobs.delete_file(f'{job_id}/relatório março.txt')
+    shutil.rmtree(os.path.join(jobs._settings['results_dir'], str(job_id)), ignore_errors=True)
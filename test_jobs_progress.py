@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+"""
+Teste do progresso das tarefas em segundo plano no SQLite.
+
+Com o banco em WAL, outra conexão consegue gravar (o progresso da tarefa)
+enquanto a sessão ainda lê as linhas em lotes (yield_per).
+"""
+
+import pytest
+from sqlalchemy import create_engine, event, text
+
+from database import _enable_sqlite_wal, sqlite_journal
+
+
+@pytest.fixture
+def engine(tmp_path, monkeypatch):
+    # O modo gravado por este banco não deve valer para o banco dos outros testes
+    monkeypatch.setitem(sqlite_journal, 'mode', None)
+    engine = create_engine(f"sqlite:///{tmp_path / 'jobs.db'}", connect_args={'timeout': 0.2})
+    event.listen(engine, 'connect', _enable_sqlite_wal)
+    with engine.begin() as connection:
+        connection.execute(text("CREATE TABLE entry (id INTEGER PRIMARY KEY, value INTEGER)"))
+        connection.execute(text("CREATE TABLE job (id INTEGER PRIMARY KEY, progress INTEGER)"))
+        connection.execute(text("INSERT INTO entry (value) VALUES " + ",".join(f"({i})" for i in range(2000))))
+        connection.execute(text("INSERT INTO job (id, progress) VALUES (1, 0)"))
+    yield engine
+    engine.dispose()
+
+
+def test_progress_written_during_batched_read(engine):
+    assert sqlite_journal['mode'] == 'wal'
+    with engine.connect() as reader:
+        rows = reader.execution_options(yield_per=100).execute(text("SELECT id FROM entry"))
+        for done, _ in enumerate(rows, 1):
+            if done == 500:
+                with engine.begin() as writer:
+                    writer.execute(text("UPDATE job SET progress = :done WHERE id = 1"), {'done': done})
+    with engine.connect() as connection:
+        assert connection.execute(text("SELECT progress FROM job")).scalar() == 500
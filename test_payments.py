@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Teste dos pagamentos idempotentes (payments) e da troca de índice no bootstrap.
+
+Confere que registrar o mesmo pagamento duas vezes devolve o lançamento já
+gravado e que o índice antigo de (entry_type, reference_id) é removido
+quando o índice único existe.
+"""
+
+import os
+from decimal import Decimal
+
+import pytest
+from sqlalchemy import inspect, text
+
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+
+@pytest.fixture
+def app_context():
+    from app import app
+    from database import db
+    from models import FinancialEntry
+
+    with app.app_context():
+        yield db
+        db.session.rollback()
+        FinancialEntry.query.filter_by(entry_type='teste_pagamento').delete()
+        db.session.commit()
+
+
+def test_second_payment_returns_existing_row(app_context):
+    from models import FinancialEntry
+    from payments import find_payment, record_payment
+
+    db = app_context
+    entry, created = record_payment('teste_pagamento', 42, Decimal('150.00'), 'Pagamento do pedido #42')
+    db.session.commit()
+    assert created
+
+    again, created = record_payment('teste_pagamento', 42, Decimal('150.00'), 'Pagamento do pedido #42')
+    db.session.commit()
+    assert not created
+    assert again.id == entry.id
+    assert find_payment('teste_pagamento', 42).id == entry.id
+    assert FinancialEntry.query.filter_by(entry_type='teste_pagamento', reference_id=42).count() == 1
+
+
+def test_replaced_index_is_dropped(app_context):
+    from bootstrap import _drop_replaced_indexes
+
+    db = app_context
+    with db.engine.begin() as connection:
+        connection.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_financial_entry_entry_type_reference_id "
+            "ON financial_entry (entry_type, reference_id)"
+        ))
+        assert _drop_replaced_indexes(connection) == ['ix_financial_entry_entry_type_reference_id']
+        indexes = {index['name'] for index in inspect(connection).get_indexes('financial_entry')}
+    assert 'ix_financial_entry_entry_type_reference_id' not in indexes
+    assert 'uq_financial_entry_payment' in indexes
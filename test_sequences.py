@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Teste de concorrência das sequências (números de NF).
+
+Várias threads pedem números ao mesmo tempo, cada uma com sua conexão, e
+nenhum número pode se repetir. Usa um SQLite em arquivo temporário ou o
+banco de SEQUENCE_TEST_DATABASE_URL (ex.: um PostgreSQL de teste).
+Ajuste a carga com SEQUENCE_TEST_THREADS e SEQUENCE_TEST_VALUES.
+"""
+
+import os
+import tempfile
+import threading
+import time
+
+import pytest
+from sqlalchemy import create_engine, select
+
+from models import SequenceCounter
+from sequences import Sequence, reserve_values
+
+THREADS = int(os.environ.get('SEQUENCE_TEST_THREADS', '8'))
+VALUES_PER_THREAD = int(os.environ.get('SEQUENCE_TEST_VALUES', '100'))
+
+
+@pytest.fixture
+def engine():
+    url = os.environ.get('SEQUENCE_TEST_DATABASE_URL')
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = create_engine(url or f"sqlite:///{os.path.join(tmp, 'sequences.db')}")
+        SequenceCounter.__table__.create(engine, checkfirst=True)
+        yield engine
+        with engine.begin() as connection:
+            connection.execute(SequenceCounter.__table__.delete().where(SequenceCounter.name.like('test_%')))
+        engine.dispose()
+
+
+def _run_threads(target):
+    """Run target(results) in THREADS threads started together; return all values and elapsed time."""
+    barrier = threading.Barrier(THREADS)
+    results, errors = [], []
+
+    def worker():
+        values = []
+        barrier.wait()
+        try:
+            target(values)
+        except Exception as e:
+            errors.append(e)
+        results.extend(values)
+
+    threads = [threading.Thread(target=worker) for _ in range(THREADS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    assert not errors, errors
+    return results, elapsed
+
+
+def _current_value(engine, name):
+    with engine.connect() as connection:
+        return connection.execute(
+            select(SequenceCounter.current_value).where(SequenceCounter.name == name)
+        ).scalar_one()
+
+
+def test_concurrent_values_are_unique(engine):
+    """Threads concorrentes recebem números únicos e consecutivos."""
+    sequence = Sequence('test_nfe', prefix='NF', padding=8, engine=engine)
+
+    values, elapsed = _run_threads(
+        lambda out: out.extend(sequence.next_value() for _ in range(VALUES_PER_THREAD))
+    )
+    total = THREADS * VALUES_PER_THREAD
+    print(f"\n{total} números em {elapsed:.2f} s ({total / elapsed:.0f}/s, {THREADS} threads)")
+
+    assert len(set(values)) == total
+    assert sorted(values) == [f"NF{i:08d}" for i in range(1, total + 1)]
+    assert _current_value(engine, 'test_nfe') == total
+
+
+def test_block_allocation_is_unique_across_processes(engine):
+    """Dois 'processos' reservando blocos (hi/lo) nunca entregam o mesmo número."""
+    processes = [Sequence('test_blocks', block_size=50, engine=engine) for _ in range(2)]
+    counter = iter(range(THREADS))
+    lock = threading.Lock()
+
+    def take(out):
+        with lock:
+            sequence = processes[next(counter) % len(processes)]
+        out.extend(sequence.next_int() for _ in range(VALUES_PER_THREAD))
+
+    values, elapsed = _run_threads(take)
+    total = THREADS * VALUES_PER_THREAD
+    print(f"\n{total} números em blocos de 50 em {elapsed:.2f} s ({total / elapsed:.0f}/s)")
+
+    assert len(set(values)) == total
+    reserved = _current_value(engine, 'test_blocks')
+    assert reserved % 50 == 0 and total <= reserved < total + 50 * len(processes)
+
+
+def test_counter_created_once_on_concurrent_first_use(engine):
+    """O primeiro uso simultâneo cria uma única linha do contador."""
+    values, _ = _run_threads(lambda out: out.append(reserve_values('test_first_use', engine=engine)[0]))
+
+    assert sorted(values) == list(range(1, THREADS + 1))
+    with engine.connect() as connection:
+        rows = connection.execute(
+            select(SequenceCounter.id).where(SequenceCounter.name == 'test_first_use')
+        ).all()
+    assert len(rows) == 1
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Teste das telas de detalhe da ordem de serviço.
+
+Abre cada rota de detalhe (página, modal, JSON, versão simples e edição) de
+uma OS criada no banco de teste e confere que respondem sem erro nem
+redirecionamento, que a edição grava as alterações e que o desconto da nota
+chega ao JSON do modal.
+"""
+
+import os
+
+import pytest
+
+os.environ.setdefault('SESSION_SECRET', 'test')
+os.environ.setdefault('DATABASE_URL', 'sqlite://')
+os.environ.setdefault('FLASK_ENV', 'testing')
+
+
+@pytest.fixture
+def order_client():
+    from app import app
+    from database import db
+    from models import Client, ServiceOrder, ServiceOrderStatus, User
+
+    app.config['WTF_CSRF_ENABLED'] = False
+    with app.app_context():
+        admin = User.query.filter_by(username='admin').first()
+        client = Client(name='Cliente Teste Detalhe', document='52998224725')
+        db.session.add(client)
+        db.session.flush()
+        order = ServiceOrder(
+            client_id=client.id,
+            responsible_id=admin.id,
+            description='Troca de rolamento',
+            status=ServiceOrderStatus.aberta
+        )
+        db.session.add(order)
+        db.session.commit()
+        order_id, client_id = order.id, client.id
+
+    test_client = app.test_client()
+    test_client.post('/login', data={'username': 'admin', 'password': os.environ.get('ADMIN_DEFAULT_PASSWORD', 'admin123')})
+    yield test_client, order_id, client_id
+
+    with app.app_context():
+        db.session.delete(db.session.get(ServiceOrder, order_id))
+        db.session.delete(db.session.get(Client, client_id))
+        db.session.commit()
+
+
+@pytest.mark.parametrize('path', [
+    '/os/{id}',
+    '/ordem/{id}/visualizar',
+    '/os/{id}/modal',
+    '/os_dados/{id}',
+    '/os_basico/{id}',
+    '/os/{id}/editar',
+])
+def test_detail_routes(order_client, path):
+    test_client, order_id, _ = order_client
+    response = test_client.get(path.format(id=order_id))
+    assert response.status_code == 200, response.location
+    assert b'Troca de rolamento' in response.data or f'#{order_id}'.encode() in response.data
+
+
+def test_edit_service_order(order_client):
+    from app import app
+    from database import db
+    from models import ServiceOrder
+
+    test_client, order_id, client_id = order_client
+    response = test_client.post(f'/os/{order_id}/editar', data={
+        'client_id': client_id,
+        'responsible_id': 0,
+        'description': 'Troca de rolamento e correia',
+        'estimated_value': '150.00',
+        'status': 'em_andamento',
+    })
+    assert response.status_code == 302
+    assert response.location.endswith(f'/os/{order_id}')
+    with app.app_context():
+        order = db.session.get(ServiceOrder, order_id)
+        assert order.description == 'Troca de rolamento e correia'
+        assert order.status.name == 'em_andamento'
+        assert order.responsible_id is None
+
+    data = test_client.get(f'/os_dados/{order_id}').get_json()
+    assert data['status'] == 'em_andamento'
+    assert data['edit_url'].endswith(f'/os/{order_id}/editar')
+
+
+def test_order_data_includes_discount(order_client):
+    from decimal import Decimal
+
+    from app import app
+    from database import db
+    from models import ServiceOrder
+
+    test_client, order_id, _ = order_client
+    with app.app_context():
+        order = db.session.get(ServiceOrder, order_id)
+        order.original_amount = Decimal('200.00')
+        order.discount_amount = Decimal('25.50')
+        order.invoice_amount = Decimal('174.50')
+        db.session.commit()
+
+    data = test_client.get(f'/os_dados/{order_id}').get_json()
+    assert data['discount_amount'] == '25.50'
+    assert data['original_amount'] == '200.00'
+    assert data['total_value'] == '174.50'
+    assert b'25.50' in test_client.get(f'/os/{order_id}').data
@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+"""
+Orçamento de inicialização do SAMAPE: tempo de import e memória de um worker.
+
+Cada medição roda em um processo novo, como um worker do gunicorn, com
+AUTO_BOOTSTRAP desligado (fast start). Os limites podem ser ajustados por
+IMPORT_TIME_BUDGET_MS e IMPORT_MEMORY_BUDGET_MB.
+"""
+
+import json
+import os
+import subprocess
+import sys
+
+IMPORT_TIME_BUDGET_MS = float(os.environ.get('IMPORT_TIME_BUDGET_MS', '3000'))
+IMPORT_MEMORY_BUDGET_MB = float(os.environ.get('IMPORT_MEMORY_BUDGET_MB', '150'))
+
+_MEASURE_SCRIPT = """
+import json, resource, sys, time
+start = time.perf_counter()
+import app
+elapsed = time.perf_counter() - start
+print(json.dumps({
+    'import_ms': elapsed * 1000,
+    'max_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'weasyprint_loaded': 'weasyprint' in sys.modules,
+    'blueprints': sorted(app.app.blueprints),
+}))
+"""
+
+
+def _measure_import():
+    env = dict(os.environ, AUTO_BOOTSTRAP='false', FLASK_ENV='production')
+    env.setdefault('SESSION_SECRET', 'startup-test')
+    env.setdefault('DATABASE_URL', 'sqlite://')
+    result = subprocess.run(
+        [sys.executable, '-c', _MEASURE_SCRIPT], env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_budget():
+    """Importar o app cabe no orçamento de tempo e memória e não carrega o WeasyPrint."""
+    measurement = _measure_import()
+    print(f"import: {measurement['import_ms']:.0f} ms, memória: {measurement['max_rss_mb']:.0f} MB")
+
+    assert not measurement['weasyprint_loaded'], "WeasyPrint deve ser importado só ao gerar um PDF"
+    assert measurement['import_ms'] <= IMPORT_TIME_BUDGET_MS
+    assert measurement['max_rss_mb'] <= IMPORT_MEMORY_BUDGET_MB
+    assert {'service_orders', 'fleet', 'stock', 'parts', 'suppliers', 'financial', 'invoices'} <= set(measurement['blueprints'])
+
+
+if __name__ == "__main__":
+    test_import_budget()
@@ -6,8 +6,9 @@ from datetime import datetime, timedelta
 from flask import request, abort, session, redirect, url_for, flash, current_app
 from flask_login import current_user
 from werkzeug.utils import secure_filename
-from models import ActionLog, LoginAttempt, UserRole, ServiceOrderImage, FinancialEntry
+from models import LoginAttempt, UserRole, ServiceOrderImage
 from database import db
+from audit_log import record_action
 
 def identify_and_format_document(document):
     """Identifica se é CPF ou CNPJ e formata adequadamente"""
@@ -52,25 +53,17 @@ def manager_required(f):
     return role_required('admin', 'gerente')(f)
 
 def log_action(action, entity_type=None, entity_id=None, details=None):
-    """Log user actions in the system"""
-    from sqlalchemy.exc import IntegrityError
-    
+    """Log user actions in the system (written in the background, see audit_log)"""
     if current_user.is_authenticated:
-        try:
-            log = ActionLog(
-                user_id=current_user.id,
-                action=action,
-                entity_type=entity_type,
-                entity_id=entity_id,
-                details=details,
-                ip_address=request.remote_addr
-            )
-            db.session.add(log)
-            db.session.commit()
-        except IntegrityError:
-            # Se houver erro de integridade, fazer rollback e não registrar
-            db.session.rollback()
-            # Não impedir o fluxo normal da aplicação
+        record_action(
+            current_app._get_current_object(),
+            user_id=current_user.id,
+            action=action,
+            entity_type=entity_type,
+            entity_id=entity_id,
+            details=details,
+            ip_address=request.remote_addr
+        )
 
 def check_login_attempts(username):
     """Check if the username has exceeded login attempts"""
@@ -136,22 +129,22 @@ def format_currency(value):
 def get_monthly_summary():
     """Get financial summary for the current month"""
     from models import FinancialEntry, FinancialEntryType
-    from sqlalchemy import func, extract
+    from sqlalchemy import func
+    from performance_utils import period_filter
     
     now = datetime.utcnow()
+    current_month = period_filter(FinancialEntry.date, now.year, now.month)
     
     # Income for current month
     income = db.session.query(func.sum(FinancialEntry.amount)).filter(
         FinancialEntry.type == FinancialEntryType.entrada,
-        extract('month', FinancialEntry.date) == now.month,
-        extract('year', FinancialEntry.date) == now.year
+        current_month
     ).scalar() or 0
     
     # Expenses for current month
     expenses = db.session.query(func.sum(FinancialEntry.amount)).filter(
         FinancialEntry.type == FinancialEntryType.saida,
-        extract('month', FinancialEntry.date) == now.month,
-        extract('year', FinancialEntry.date) == now.year
+        current_month
     ).scalar() or 0
     
     return {
@@ -169,23 +162,9 @@ def get_service_order_stats():
     in_progress_count = ServiceOrder.query.filter_by(status=ServiceOrderStatus.em_andamento).count()
     closed_count = ServiceOrder.query.filter_by(status=ServiceOrderStatus.fechada).count()
     
-    # Calcular o tempo médio de conclusão (em dias)
-    avg_completion_time = 0
-    closed_orders_with_dates = ServiceOrder.query.filter(
-        ServiceOrder.status == ServiceOrderStatus.fechada,
-        ServiceOrder.created_at.isnot(None),
-        ServiceOrder.closed_at.isnot(None)
-    ).all()
-    
-    if closed_orders_with_dates:
-        total_days = 0
-        for order in closed_orders_with_dates:
-            # Calcular a diferença em dias
-            delta = order.closed_at - order.created_at
-            total_days += delta.days
-        
-        if len(closed_orders_with_dates) > 0:
-            avg_completion_time = round(total_days / len(closed_orders_with_dates), 1)
+    # Tempo médio de conclusão (em dias), calculado no banco
+    from service_order_analytics import get_completion_stats
+    avg_completion_time = get_completion_stats()[0]['avg_days']
     
     return {
         'open': open_count,
@@ -384,28 +363,22 @@ def get_next_invoice_number():
     """
     Gera um número sequencial para nota fiscal
     
+    O número é reservado atomicamente (UPDATE ... RETURNING em transação própria),
+    então duas OS fechadas ao mesmo tempo nunca recebem o mesmo número e a
+    transação de quem chamou não é confirmada aqui.
+    
     Returns:
         String formatada com o próximo número de nota fiscal
     """
-    from models import SequenceCounter
-    from flask import current_app
-    
-    # Busca o contador de NF-e ou cria se não existir
-    counter = SequenceCounter.query.filter_by(name='nfe').first()
-    if not counter:
-        # Inicializa o contador de NF-e
-        counter = SequenceCounter(
-            name='nfe',
-            prefix='NF',
-            current_value=0,  # Começará do 1 ao chamar next_value()
-            padding=8,
-            description='Contador de notas fiscais eletrônicas'
-        )
-        db.session.add(counter)
-        db.session.commit()
+    from sequences import get_sequence
     
-    # Retorna o próximo valor da sequência
-    return counter.next_value()
+    return get_sequence(
+        'nfe',
+        prefix='NF',
+        padding=8,
+        description='Contador de notas fiscais eletrônicas',
+        block_size=current_app.config.get('INVOICE_NUMBER_BLOCK_SIZE', 1)
+    ).next_value()
     
 def recalculate_supplier_order_total(order_id):
     """
@@ -443,9 +416,6 @@ def is_order_paid(order_id):
     Returns:
         Boolean: True se o pedido já foi pago, False caso contrário
     """
-    financial_entry = FinancialEntry.query.filter_by(
-        entry_type='pedido_fornecedor',
-        reference_id=order_id
-    ).first()
+    from payments import SUPPLIER_ORDER, find_payment
     
-    return financial_entry is not None
+    return find_payment(SUPPLIER_ORDER, order_id) is not None
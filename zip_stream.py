@@ -0,0 +1,84 @@
+"""
+Incremental ZIP archives for SAMAPE application.
+The invoice export job (blueprints/invoices.py) writes its archive to the
+job result file with this module: each member goes through zipfile into a
+small buffer whose bytes are handed back to the caller as soon as it fills,
+instead of assembling the whole ZIP in memory first. The output is never
+seeked, so zipfile stores sizes and CRCs in data descriptors after each
+member and the central directory at the end.
+
+Memory stays bounded by one chunk of one member, whatever the number of
+files; the finished file is stored and downloaded through jobs.
+"""
+import os
+import time
+import zipfile
+
+CHUNK_SIZE = 64 * 1024
+
+
+class _ChunkBuffer:
+    """Write-only, unseekable file object collecting the archive bytes."""
+
+    def __init__(self):
+        self._chunks = []
+        self.size = 0
+
+    def write(self, data):
+        if data:
+            self._chunks.append(bytes(data))
+            self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        self.size = 0
+        return data
+
+
+def _read_file(path, chunk_size):
+    with open(path, 'rb') as source:
+        while True:
+            data = source.read(chunk_size)
+            if not data:
+                break
+            yield data
+
+
+def stream_zip(members, compression=zipfile.ZIP_DEFLATED, chunk_size=CHUNK_SIZE):
+    """
+    Build a ZIP archive lazily, yielding its bytes as members are added.
+
+    Args:
+        members: Iterable of (name, source) pairs; source is the member
+            content as bytes, the path of a file on disk, or an iterable of
+            byte chunks (consumed only after the member header was yielded)
+        compression: zipfile compression method
+        chunk_size: Approximate size of the yielded chunks
+
+    Yields:
+        Bytes of the archive, in order
+    """
+    buffer = _ChunkBuffer()
+    with zipfile.ZipFile(buffer, 'w', compression=compression) as archive:
+        for name, source in members:
+            if isinstance(source, (bytes, bytearray)):
+                source = (source,)
+            elif isinstance(source, (str, os.PathLike)):
+                source = _read_file(source, chunk_size)
+            info = zipfile.ZipInfo(name, date_time=time.localtime(time.time())[:6])
+            info.compress_type = compression
+            with archive.open(info, 'w') as member:
+                # Cabeçalho é gravado antes do conteúdo, que pode ainda estar sendo gerado
+                yield buffer.drain()
+                for data in source:
+                    member.write(data)
+                    if buffer.size >= chunk_size:
+                        yield buffer.drain()
+            if buffer.size >= chunk_size:
+                yield buffer.drain()
+    yield buffer.drain()